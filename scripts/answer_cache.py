@@ -0,0 +1,340 @@
+"""
+Semantic answer cache for the guide Q&A pipeline.
+
+Pilots keep asking the same few questions about break periods and norms in
+slightly different words. Each one costs an embedding call, a vector search
+and an LLM completion. AnswerCache sits in front of search + completion:
+
+  - exact repeats (same text after normalize_text) are found by a dict
+    lookup, before the question is even embedded
+  - near repeats are found by cosine similarity of the normalized question
+    embedding against every cached question (one matrix-vector product),
+    accepted only at or above `threshold`
+  - eviction is LRU with a TTL
+  - every answer remembers the content hashes of the sections (chunks) it was
+    built from; update_sections() drops answers whose sources changed or
+    disappeared
+
+main() replays a question log through the local pipeline model with and
+without the cache and reports hit rate, wrong-answer hits and latency.
+
+Usage:
+    python scripts/answer_cache.py
+    python scripts/answer_cache.py --threshold 0.95 --requests 5000 --json
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import guide_retrieval
+
+DEFAULT_THRESHOLD = 0.9
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+
+def content_hash(text):
+    """Stable hash of a section's text (whitespace/case-insensitive)."""
+    return hashlib.sha256(guide_retrieval.normalize_text(text).encode('utf-8')).hexdigest()[:16]
+
+
+def section_hashes(chunks):
+    """{section_id: content hash} for {'document', 'text'} chunk rows."""
+    hashes = {}
+    counters = {}
+    for chunk in chunks:
+        n = counters.get(chunk['document'], 0)
+        counters[chunk['document']] = n + 1
+        hashes[f"{chunk['document']}#{n}"] = content_hash(chunk['text'])
+    return hashes
+
+
+class AnswerCache:
+    """
+    LRU + TTL cache of answers keyed by question embedding.
+
+    Vectors live in one preallocated (max_entries, dims) float32 matrix;
+    free slots are zero rows, which can never reach a positive threshold.
+    """
+
+    def __init__(self, dims, threshold=DEFAULT_THRESHOLD, max_entries=DEFAULT_MAX_ENTRIES,
+                 ttl_seconds=DEFAULT_TTL_SECONDS, clock=time.monotonic):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.vectors = np.zeros((max_entries, dims), dtype=np.float32)
+        self.entries = OrderedDict()    # slot -> entry, least recently used first
+        self.by_text = {}               # normalized question -> slot
+        self.by_section = {}            # section id -> {slots}
+        self.free = list(range(max_entries - 1, -1, -1))
+        self.stats = {'exact_hits': 0, 'semantic_hits': 0, 'misses': 0,
+                      'expired': 0, 'evicted': 0, 'invalidated': 0}
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def normalize(question):
+        return guide_retrieval.normalize_text(question).rstrip('?!. ')
+
+    def _drop(self, slot, reason):
+        entry = self.entries.pop(slot)
+        self.vectors[slot] = 0
+        if self.by_text.get(entry['key']) == slot:
+            del self.by_text[entry['key']]
+        for section in entry['sections']:
+            slots = self.by_section.get(section)
+            if slots is not None:
+                slots.discard(slot)
+                if not slots:
+                    del self.by_section[section]
+        self.free.append(slot)
+        self.stats[reason] += 1
+
+    def _fresh(self, slot):
+        entry = self.entries[slot]
+        if self.clock() - entry['created'] > self.ttl_seconds:
+            self._drop(slot, 'expired')
+            return False
+        return True
+
+    def _hit(self, slot, kind, similarity):
+        self.entries.move_to_end(slot)
+        self.stats[kind] += 1
+        entry = self.entries[slot]
+        return {'answer': entry['answer'], 'sources': entry['sources'],
+                'question': entry['question'], 'similarity': similarity}
+
+    def lookup_text(self, question):
+        """Exact (normalized) repeat - no embedding needed. None on miss."""
+        slot = self.by_text.get(self.normalize(question))
+        if slot is not None and self._fresh(slot):
+            return self._hit(slot, 'exact_hits', 1.0)
+        return None
+
+    def lookup(self, question, vector):
+        """Exact or near repeat of `question` (its unit-length embedding)."""
+        found = self.lookup_text(question)
+        if found is not None:
+            return found
+        if self.entries:
+            similarities = self.vectors @ np.asarray(vector, dtype=np.float32).reshape(-1)
+            slot = int(np.argmax(similarities))
+            if similarities[slot] >= self.threshold and slot in self.entries and self._fresh(slot):
+                return self._hit(slot, 'semantic_hits', float(similarities[slot]))
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, question, vector, answer, sources=None, sections=None):
+        """
+        Cache an answer.
+
+        `sections` is {section_id: content_hash} of the chunks the answer was
+        built from; the answer is invalidated when any of them changes.
+        """
+        key = self.normalize(question)
+        if key in self.by_text:
+            self._drop(self.by_text[key], 'evicted')
+        if not self.free:
+            self._drop(next(iter(self.entries)), 'evicted')
+        slot = self.free.pop()
+        self.vectors[slot] = np.asarray(vector, dtype=np.float32).reshape(-1)
+        sections = dict(sections or {})
+        self.entries[slot] = {'key': key, 'question': question, 'answer': answer,
+                              'sources': sources or [], 'sections': sections,
+                              'created': self.clock()}
+        self.by_text[key] = slot
+        for section in sections:
+            self.by_section.setdefault(section, set()).add(slot)
+
+    def update_sections(self, current):
+        """
+        Drop answers built from sections that changed or no longer exist.
+
+        `current` is the full {section_id: content_hash} map after
+        re-ingestion. Returns the number of answers invalidated.
+        """
+        stale = set()
+        for section, slots in self.by_section.items():
+            new_hash = current.get(section)
+            for slot in slots:
+                if self.entries[slot]['sections'][section] != new_hash:
+                    stale.add(slot)
+        for slot in stale:
+            self._drop(slot, 'invalidated')
+        return len(stale)
+
+    def clear(self):
+        for slot in list(self.entries):
+            self._drop(slot, 'evicted')
+
+
+# --- Replay benchmark -------------------------------------------------------
+
+# Ways people re-ask the same thing; applied to the curated benchmark questions.
+_PREFIXES = ['', '', '', 'Підкажіть, ', 'Скажіть будь ласка, ', 'Питання: ']
+_SUFFIXES = ['', '', '?', ' ?', '??']
+
+# Simulated edit of one norm during the replay.
+AMENDMENT = ('ПВП ДАУ', 'не більше 10 годин на добу', 'не більше 9 годин на добу')
+
+
+def _variant(question, rng):
+    text = question.rstrip('?')
+    if rng.random() < 0.3:
+        text = text.lower()
+    prefix = rng.choice(_PREFIXES)
+    if prefix:
+        text = prefix + text[0].lower() + text[1:]
+    return text + rng.choice(_SUFFIXES)
+
+
+def build_question_log(questions, requests=2000, days=30, zipf=1.2, seed=7):
+    """
+    Synthetic log of (seconds, question_id, text): a few popular questions
+    dominate (Zipf), each re-asked with small wording changes.
+    """
+    rng = random.Random(seed)
+    weights = [1.0 / (rank ** zipf) for rank in range(1, len(questions) + 1)]
+    order = questions[:]
+    rng.shuffle(order)
+    times = sorted(rng.uniform(0, days * 24 * 3600) for _ in range(requests))
+    log = []
+    for t in times:
+        q = rng.choices(order, weights)[0]
+        log.append((t, q['id'], _variant(q['question'], rng)))
+    return log
+
+
+class _ReplayClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def replay(log, documents, threshold, embed_ms, llm_ms, ttl_seconds,
+           max_entries, change_at=0.5, amendment=AMENDMENT):
+    """
+    Replay the log through embed -> search -> (LLM) with and without a cache.
+
+    Remote calls are not made: `embed_ms` / `llm_ms` model their latency and
+    are added to the measured local time. Halfway through (`change_at`) the
+    `amendment` (title, old text, new text) is applied and the documents are
+    re-ingested, to exercise invalidation.
+    """
+    embedder = guide_retrieval.HashingEmbedder()
+    chunks = guide_retrieval.build_chunks(documents)
+    index = guide_retrieval.ChunkIndex.build(chunks, embedder)
+    hashes = section_hashes(chunks)
+    chunk_ids = list(hashes)
+
+    clock = _ReplayClock()
+    cache = AnswerCache(embedder.dims, threshold, max_entries, ttl_seconds, clock)
+    change_index = int(len(log) * change_at)
+    invalidated = 0
+    wrong_hits = 0
+    cached_ms = []
+    uncached_ms = []
+
+    for i, (t, qid, text) in enumerate(log):
+        clock.now = t
+        if i == change_index:
+            title, old, new = amendment
+            documents = [(t, body.replace(old, new) if t == title else body) for t, body in documents]
+            chunks = guide_retrieval.build_chunks(documents)
+            index = guide_retrieval.ChunkIndex.build(chunks, embedder)
+            hashes = section_hashes(chunks)
+            chunk_ids = list(hashes)
+            invalidated += cache.update_sections(hashes)
+
+        # Without cache: always embed, search, complete.
+        started = time.perf_counter()
+        vector = embedder.embed([text])
+        index.search(vector, 15)
+        uncached_ms.append((time.perf_counter() - started) * 1000 + embed_ms + llm_ms)
+
+        # With cache.
+        started = time.perf_counter()
+        remote_ms = 0.0
+        hit = cache.lookup_text(text)
+        if hit is None:
+            vector = embedder.embed([cache.normalize(text)])
+            remote_ms += embed_ms
+            hit = cache.lookup(text, vector[0])
+        if hit is None:
+            results = index.search(vector, 15)
+            remote_ms += llm_ms
+            used = {chunk_ids[idx]: hashes[chunk_ids[idx]] for idx, _ in results[:5]}
+            cache.put(text, vector[0], answer=qid, sections=used)
+        elif hit['answer'] != qid:
+            wrong_hits += 1
+        cached_ms.append((time.perf_counter() - started) * 1000 + remote_ms)
+
+    n = len(log)
+    hits = cache.stats['exact_hits'] + cache.stats['semantic_hits']
+    return {
+        'requests': n,
+        'distinct_questions': len({qid for _, qid, _ in log}),
+        'threshold': threshold,
+        'hit_rate': round(hits / n, 4),
+        'exact_hit_rate': round(cache.stats['exact_hits'] / n, 4),
+        'semantic_hit_rate': round(cache.stats['semantic_hits'] / n, 4),
+        'wrong_hits': wrong_hits,
+        'invalidated_on_change': invalidated,
+        'stats': cache.stats,
+        'entries': len(cache),
+        'uncached_mean_ms': round(float(np.mean(uncached_ms)), 1),
+        'cached_mean_ms': round(float(np.mean(cached_ms)), 1),
+        'cached_p50_ms': round(float(np.percentile(cached_ms, 50)), 2),
+        'uncached_p50_ms': round(float(np.percentile(uncached_ms, 50)), 2),
+        'saved_llm_calls': hits,
+    }
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Semantic answer cache replay benchmark")
+    parser.add_argument('--questions', default=None, help="question set (default: retrieval_questions.json)")
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--ttl-hours', type=float, default=DEFAULT_TTL_SECONDS / 3600)
+    parser.add_argument('--max-entries', type=int, default=DEFAULT_MAX_ENTRIES)
+    parser.add_argument('--embed-ms', type=float, default=150.0, help="modelled embedding API latency")
+    parser.add_argument('--llm-ms', type=float, default=2500.0, help="modelled completion latency")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    import retrieval_bench
+    questions = retrieval_bench.load_questions(args.questions or retrieval_bench.QUESTIONS_FILE)
+    documents = guide_retrieval.load_documents()
+    log = build_question_log(questions, args.requests, args.days)
+    result = replay(log, documents, args.threshold, args.embed_ms, args.llm_ms,
+                    args.ttl_hours * 3600, args.max_entries)
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+
+    print(f"Replayed {result['requests']} requests ({result['distinct_questions']} distinct questions), "
+          f"threshold {result['threshold']}")
+    print(f"  hit rate       {result['hit_rate']:.1%} "
+          f"(exact {result['exact_hit_rate']:.1%}, semantic {result['semantic_hit_rate']:.1%})")
+    print(f"  wrong hits     {result['wrong_hits']}")
+    print(f"  invalidated    {result['invalidated_on_change']} answers after document change")
+    print(f"  mean latency   {result['uncached_mean_ms']} ms -> {result['cached_mean_ms']} ms")
+    print(f"  LLM calls saved {result['saved_llm_calls']}")
+
+
+if __name__ == "__main__":
+    main()
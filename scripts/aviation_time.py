@@ -0,0 +1,255 @@
+"""
+Flight-time arithmetic shared by the import, aggregation and report scripts.
+
+Durations travel as Postgres interval text ("HH:MM:SS") and are re-parsed on
+every read: parseMin() in FlightSummary.js, displayToMinutes() in
+TimeCalculator.js, and per script here. This module keeps them as int32
+minute arrays:
+
+  - parse_minutes()     interval column -> int32 minutes, with parseMin()
+                        semantics (trimmed "H+:MM[:SS]", seconds dropped,
+                        anything else 0); strings are parsed without
+                        regexes, as one fixed-width code-point matrix:
+                        "HH:MM:SS" rows in a single vector step, the rest
+                        through a column-at-a-time state machine
+  - format_minutes()    minutes -> "HH:MM" (fmtMin; negative values get a
+                        leading "-" like TimeCalculator)
+  - day_night_totals()  minutes split by time_of_day ('Н' = night), per
+                        group when group codes are given
+  - to_seconds() / format_interval() / cell_minutes()  scalar conversions
+                        for Excel cells and Postgres interval text
+
+Usage:
+    python scripts/aviation_time.py            # parser benchmark
+    python scripts/aviation_time.py --rows 1000000
+"""
+
+import argparse
+import datetime
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+MINUTES_PER_DAY = 1440
+
+_DURATION_RE = re.compile(r'^(\d+):(\d{2})(?::(\d{2}))?$')
+_ZERO = ord('0')
+
+# Code point classes (code points above 255 are clamped to 255: other).
+_PAD, _SPACE, _DIGIT, _COLON, _OTHER = range(5)
+_CLASS = np.full(256, _OTHER, dtype=np.int8)
+_CLASS[0] = _PAD
+_CLASS[[9, 10, 11, 12, 13, 32, 160]] = _SPACE
+_CLASS[ord('0'):ord('9') + 1] = _DIGIT
+_CLASS[ord(':')] = _COLON
+
+# Parser states and transitions [state, class] for "  H+:MM[:SS]  ".
+_LEAD, _HOURS, _MINUTES, _SECONDS, _TRAIL, _INVALID = range(6)
+_NEXT_STATE = np.full((6, 5), _INVALID, dtype=np.int8)
+_NEXT_STATE[:, _PAD] = [_LEAD, _TRAIL, _TRAIL, _TRAIL, _TRAIL, _INVALID]
+_NEXT_STATE[:, _SPACE] = [_LEAD, _TRAIL, _TRAIL, _TRAIL, _TRAIL, _INVALID]
+_NEXT_STATE[_LEAD, _DIGIT] = _HOURS
+_NEXT_STATE[_HOURS, _DIGIT] = _HOURS
+_NEXT_STATE[_MINUTES, _DIGIT] = _MINUTES
+_NEXT_STATE[_SECONDS, _DIGIT] = _SECONDS
+_NEXT_STATE[_HOURS, _COLON] = _MINUTES
+_NEXT_STATE[_MINUTES, _COLON] = _SECONDS
+
+
+def parse_minutes(values):
+    """
+    Interval column -> int32 minutes (parseMin semantics).
+
+    Accepts a sequence of str / None (None and anything unparsable give 0),
+    or of timedelta as psycopg2 returns interval columns.
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'U':
+        return _parse_strings(values.ravel())
+    obj = np.asarray(values, dtype=object).ravel()
+    if not len(obj):
+        return np.zeros(0, dtype=np.int32)
+    first = next((v for v in obj if v is not None), None)
+    if isinstance(first, datetime.timedelta):
+        seconds = pd.to_timedelta(obj).total_seconds().to_numpy()
+        return np.where(np.isnan(seconds), 0, seconds // 60).astype(np.int32)
+    # None -> "None", NaN -> "nan": both fail to parse and give 0.
+    return _parse_strings(obj.astype(str))
+
+
+def _parse_strings(strings):
+    """
+    'U'-dtype array -> int32 minutes.
+
+    The array is viewed as a (rows, width) matrix of code points, classified
+    through a lookup table and run through a small state machine one column
+    at a time, so the work is `width` vector steps over all rows.
+    """
+    n = len(strings)
+    width = strings.dtype.itemsize // 4
+    if width == 0:
+        return np.zeros(n, dtype=np.int32)
+    codes = np.ascontiguousarray(strings).view(np.uint32).reshape(n, width)
+    cls = _CLASS[np.minimum(codes, 255)]
+    digit = (codes - _ZERO).astype(np.int8)
+
+    # Fast path: exactly "HH:MM:SS", the form Postgres returns intervals in.
+    out = np.zeros(n, dtype=np.int32)
+    if width >= 8:
+        canonical = ((cls[:, [0, 1, 3, 4, 6, 7]] == _DIGIT).all(axis=1)
+                     & (cls[:, 2] == _COLON) & (cls[:, 5] == _COLON))
+        if width > 8:
+            canonical &= cls[:, 8] == _PAD
+        d = digit[canonical].astype(np.int32)
+        out[canonical] = (d[:, 0] * 10 + d[:, 1]) * 60 + d[:, 3] * 10 + d[:, 4]
+        rest = ~canonical
+        if not rest.any():
+            return out
+        cls, digit = cls[rest], digit[rest]
+        n = len(cls)
+    else:
+        rest = slice(None)
+
+    state = np.zeros(n, dtype=np.int8)
+    hours = np.zeros(n, dtype=np.int64)
+    mins = np.zeros(n, dtype=np.int32)
+    mcount = np.zeros(n, dtype=np.int8)
+    scount = np.zeros(n, dtype=np.int8)
+    has_seconds = np.zeros(n, dtype=bool)
+    for j in range(width):
+        c = cls[:, j]
+        d = digit[:, j]
+        is_digit = c == _DIGIT
+        in_hours = is_digit & (state <= _HOURS)
+        hours = np.where(in_hours, hours * 10 + d, hours)
+        in_mins = is_digit & (state == _MINUTES)
+        mins = np.where(in_mins, mins * 10 + d, mins)
+        mcount += in_mins
+        scount += is_digit & (state == _SECONDS)
+        state = _NEXT_STATE[state, c]
+        # A second colon is only valid after exactly two minute digits.
+        state[(state == _SECONDS) & (mcount != 2)] = _INVALID
+        has_seconds |= state == _SECONDS
+    # After a second colon the seconds need both digits ("3:48:" is invalid).
+    ok = (state != _INVALID) & (mcount == 2) & (~has_seconds | (scount == 2))
+    out[rest] = np.where(ok, hours * 60 + mins, 0)
+    return out
+
+
+def format_minutes(minutes):
+    """Minutes (scalar or array) -> "HH:MM" (hours may exceed 24)."""
+    arr = np.asarray(minutes, dtype=np.int64)
+    absolute = np.abs(arr)
+    hours = np.char.zfill((absolute // 60).astype(str), 2)
+    mins = np.char.zfill((absolute % 60).astype(str), 2)
+    text = np.char.add(np.char.add(np.where(arr < 0, '-', ''), hours), np.char.add(':', mins))
+    return str(text) if text.ndim == 0 else text
+
+
+def day_night_totals(minutes, time_of_day, codes=None, n=None):
+    """
+    (day, night) minute totals as int64; per group if `codes` (0..n-1) are
+    given, else overall.
+    """
+    minutes = np.asarray(minutes, dtype=np.int64)
+    night = np.asarray(time_of_day, dtype=object) == 'Н'
+    if codes is None:
+        total = int(minutes.sum())
+        night_total = int(minutes[night].sum())
+        return total - night_total, night_total
+    codes = np.asarray(codes)
+    n = n if n is not None else int(codes.max()) + 1 if len(codes) else 0
+    night_total = np.bincount(codes, weights=minutes * night, minlength=n).astype(np.int64)
+    total = np.bincount(codes, weights=minutes, minlength=n).astype(np.int64)
+    return total - night_total, night_total
+
+
+# --- Scalar conversions -------------------------------------------------------
+
+def to_seconds(value):
+    """Duration cell -> seconds. Accepts timedelta, time, day fractions and "H:MM[:SS]"."""
+    if value is None or value == '':
+        return 0
+    if isinstance(value, datetime.timedelta):
+        return int(round(value.total_seconds()))
+    if isinstance(value, datetime.time):
+        return value.hour * 3600 + value.minute * 60 + value.second
+    if isinstance(value, (int, float)):
+        return int(round(value * 86400))
+    m = _DURATION_RE.match(str(value).strip())
+    if not m:
+        raise ValueError(f"bad duration: {value!r}")
+    return int(m.group(1)) * 3600 + int(m.group(2)) * 60 + int(m.group(3) or 0)
+
+
+def format_interval(seconds):
+    """Seconds -> Postgres interval text "HH:MM:SS" (hours may exceed 24)."""
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def cell_minutes(value):
+    """Excel duration cell (timedelta, time or day fraction) -> minutes as float."""
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds() / 60
+    if isinstance(value, datetime.time):
+        return value.hour * 60 + value.minute + value.second / 60
+    if isinstance(value, (int, float)):
+        return value * MINUTES_PER_DAY
+    return 0.0
+
+
+# --- Benchmark ----------------------------------------------------------------
+
+def _regex_parse(values):
+    """The previous pandas path: str.extract with a regex."""
+    parts = pd.Series(values, dtype='string').str.extract(r'^\s*(\d+):(\d{2})(?::\d{2})?\s*$')
+    hours = pd.to_numeric(parts[0], errors='coerce').fillna(0)
+    minutes = pd.to_numeric(parts[1], errors='coerce').fillna(0)
+    return (hours * 60 + minutes).astype(np.int32).to_numpy()
+
+
+def _loop_parse(values):
+    """parseMin() per value."""
+    out = []
+    for v in values:
+        m = _DURATION_RE.match(str(v).strip()) if v else None
+        out.append(int(m.group(1)) * 60 + int(m.group(2)) if m else 0)
+    return np.array(out, dtype=np.int32)
+
+
+def bench(rows):
+    rng = np.random.default_rng(1)
+    minutes = rng.integers(0, 600, rows)
+    values = np.array([format_interval(int(m) * 60 + int(s)) for m, s in zip(minutes, rng.integers(0, 60, rows))],
+                      dtype=object)
+    odd = rng.random(rows) < 0.01
+    values[odd] = rng.choice(np.array(['', ' 1:05 ', '12:5', 'н/д', None, '100:00:00', '1:2:3'], dtype=object),
+                             odd.sum())
+
+    results = {}
+    as_text = values.astype(str)
+    for name, fn in (('parse_minutes', parse_minutes), ('  str array', lambda _: parse_minutes(as_text)),
+                     ('regex (pandas)', _regex_parse),
+                     ('parseMin loop', _loop_parse)):
+        t0 = time.perf_counter()
+        results[name] = fn(values)
+        elapsed = time.perf_counter() - t0
+        print(f"  {name:15}: {elapsed * 1e6 / rows * 1000:9.0f} us per 1000 rows")
+    assert (results['parse_minutes'] == results['parseMin loop']).all(), "parser disagrees with parseMin"
+    day, night = day_night_totals(results['parse_minutes'], np.where(rng.random(rows) < 0.2, 'Н', 'Д'))
+    print(f"  {rows} rows, total {format_minutes(day + night)} (day {format_minutes(day)}, "
+          f"night {format_minutes(night)})")
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Interval parser benchmark")
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+    bench(args.rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,848 @@
+"""
+Break (перерва) expiry engine: every pilot x condition x aircraft at once.
+
+getBreaksDataFromSupabase(pib) in supabaseData.js runs nine queries per pilot
+and works the MU/LP expiries out in nested loops; check-deadlines repeats the
+arithmetic with its own rules. This module loads users.military_class,
+break_periods_mu, break_periods_lp, mu_break_dates, lp_break_dates,
+aircraft_kbp_mapping (plus user_aircraft and aircraft_types for the pilot's
+aircraft list) once and computes, as datetime64[D] arrays in one pass:
+
+  - training expiry   last_date + break period (MU: days for the pilot's
+                      class; LP: months * 30)
+  - control expiry    last_control_date + CONTROL_DAYS
+  - expiry            the later of the two
+  - status            gray (no dates) / red (expired, days_left <= 0) /
+                      yellow (days_left <= WARN_DAYS) / green
+
+It follows the client rules, so the grid is what the Перерви page shows:
+
+  - MU: the six MU_TYPES x every aircraft the pilot has mu_break_dates for;
+    no military_class means class 2, a missing period means no training
+    expiry
+  - LP: the pilot's aircraft (user_aircraft, else the MU history) are mapped
+    to KBP documents through aircraft_kbp_mapping (one document, or the
+    is_primary one; aircraft with several and no primary join the documents
+    their other aircraft activated); break_periods_lp rows of the pilot's
+    class or of no class, and legacy rows without a document go to the first
+    active KBP; per-aircraft dates fall back to the old aircraft-less rows
+  - бз_нц_* conditions take the worst status of the conditions they depend on
+
+КЛПВ-only sections and the secondary КЛПВ expiry are display extras and
+stay in the client.
+
+The tables are encoded once into integer codes (users, aircraft, conditions
+and KBPs each share one code space) and the grid is built with sorted-key
+joins on numpy arrays; pandas appears only at the edges, reading the tables
+and returning the frame. --bench checks the result cell by cell against a
+per-pilot loop with dict lookups (the client's algorithm). The engine's
+fixed cost is a few milliseconds, so it overtakes that loop from roughly
+150-200 pilots.
+
+check_deadlines_frame() reproduces the check-deadlines rules (class 3 and
+30 days / 6 months defaults, calendar months for LP, control dates ignored)
+and compare() lists the cells where the two paths disagree.
+
+Connection for --db: SUPABASE_DB_URL (postgresql://...) from the environment.
+
+Usage:
+    python scripts/break_engine.py --bench 400
+    python scripts/break_engine.py --db --pilot "Кошель С.М."
+    python scripts/break_engine.py --db --compare
+"""
+
+import argparse
+import collections
+import datetime
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+MU_TYPES = ['ДПМУ', 'ДСМУ', 'ДВМП', 'НПМУ', 'НСМУ', 'НВМП']
+KBP_ORDER = ['КБП ВА', 'КБП БА/РА', 'КБПВ']
+LP_DEPENDENCIES = {
+    'бз_нц_прості': ['малі_висоти'],
+    'бз_нц_складні': ['малі_висоти', 'складний_пілотаж_мв'],
+}
+
+CONTROL_DAYS = 10           # a control flight extends the break by 10 days
+WARN_DAYS = 15              # yellow from 15 days before expiry
+DAYS_PER_MONTH = 30         # LP periods: months * 30 in the client
+DEFAULT_CLASS = 2           # client: military_class || 2
+
+GRAY, RED, YELLOW, GREEN = range(4)
+STATUS_NAMES = np.array(['gray', 'red', 'yellow', 'green'])
+
+NAT = np.datetime64('NaT', 'D')
+
+USERS_SQL = "SELECT id::text, name, military_class FROM users"
+AIRCRAFT_SQL = "SELECT id::text, name FROM aircraft_types"
+USER_AIRCRAFT_SQL = "SELECT user_id::text, aircraft_type_id::text FROM user_aircraft"
+KBP_MAPPING_SQL = "SELECT aircraft_type_id::text, kbp_document, is_primary FROM aircraft_kbp_mapping"
+MU_PERIODS_SQL = "SELECT mu_condition, military_class, days FROM break_periods_mu"
+LP_PERIODS_SQL = """
+    SELECT lp_type, lp_type_normalized, kbp_document, military_class, months, time_of_day, sort_order
+    FROM break_periods_lp
+"""
+MU_DATES_SQL = """
+    SELECT user_id::text, aircraft_type_id::text, mu_condition, last_date, last_control_date
+    FROM mu_break_dates
+"""
+LP_DATES_SQL = """
+    SELECT user_id::text, aircraft_type_id::text, lp_type, last_date, last_control_date
+    FROM lp_break_dates
+"""
+
+TABLES = {
+    'users': (USERS_SQL, ['user_id', 'name', 'military_class']),
+    'aircraft': (AIRCRAFT_SQL, ['aircraft_type_id', 'aircraft']),
+    'user_aircraft': (USER_AIRCRAFT_SQL, ['user_id', 'aircraft_type_id']),
+    'kbp_mapping': (KBP_MAPPING_SQL, ['aircraft_type_id', 'kbp_document', 'is_primary']),
+    'mu_periods': (MU_PERIODS_SQL, ['condition', 'military_class', 'days']),
+    'lp_periods': (LP_PERIODS_SQL, ['lp_type', 'condition', 'kbp_document', 'military_class', 'months',
+                                    'time_of_day', 'sort_order']),
+    'mu_dates': (MU_DATES_SQL, ['user_id', 'aircraft_type_id', 'condition', 'last_date', 'last_control_date']),
+    'lp_dates': (LP_DATES_SQL, ['user_id', 'aircraft_type_id', 'condition', 'last_date', 'last_control_date']),
+}
+
+
+class BreakTables:
+    """The reference and break-date tables, one DataFrame each (see TABLES)."""
+
+    def __init__(self, **frames):
+        for name, (_, columns) in TABLES.items():
+            frame = frames.get(name)
+            setattr(self, name, frame if frame is not None else pd.DataFrame(columns=columns))
+        for frame in (self.mu_dates, self.lp_dates):
+            for col in ('last_date', 'last_control_date'):
+                frame[col] = _days(frame[col])
+        self._codes = None
+
+    @classmethod
+    def load(cls, cur):
+        frames = {}
+        for name, (sql, columns) in TABLES.items():
+            cur.execute(sql)
+            frames[name] = pd.DataFrame.from_records(cur.fetchall(), columns=columns)
+        return cls(**frames)
+
+    def pilot_classes(self, default=DEFAULT_CLASS):
+        """user_id -> military class (missing or 0 -> default)."""
+        classes = pd.to_numeric(self.users['military_class'], errors='coerce').fillna(0).astype(int)
+        return pd.Series(np.where(classes > 0, classes, default), index=self.users['user_id'].to_numpy())
+
+    def codes(self):
+        """The tables as integer-coded arrays (built once, see Codes)."""
+        if self._codes is None:
+            self._codes = Codes(self)
+        return self._codes
+
+
+def _days(values):
+    """Dates / date strings / None -> datetime64[D] array (NaT for missing)."""
+    return pd.to_datetime(pd.Series(values, dtype=object), errors='coerce').to_numpy().astype('datetime64[D]')
+
+
+# --- Integer codes ------------------------------------------------------------
+#
+# The grid is built with numpy joins over integer codes rather than pandas
+# merges: on a few thousand cells each merge costs a millisecond of fixed
+# overhead, while a sorted-key join costs microseconds.
+
+def _factorize(*columns, first=()):
+    """Shared codes (-1 for missing) for several columns; `first` values get codes 0, 1, ..."""
+    arrays = [np.asarray(first, dtype=object)] + [np.asarray(c, dtype=object) for c in columns]
+    codes, uniques = pd.factorize(np.concatenate(arrays))
+    return np.split(codes.astype(np.int64), np.cumsum([len(a) for a in arrays])[:-1])[1:], pd.Index(uniques)
+
+
+def _numbers(values):
+    return pd.to_numeric(values, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+
+def _key(*parts):
+    """Composite int64 key of code arrays; parts are (codes, cardinality)."""
+    key = np.zeros(len(parts[0][0]), dtype=np.int64)
+    for codes, size in parts:
+        key = key * (size + 1) + (codes + 1)
+    return key
+
+
+def _last_index(table, query):
+    """Row of each query key's last occurrence in `table`, -1 if absent."""
+    uniq, first = np.unique(table[::-1], return_index=True)
+    if not len(uniq):
+        return np.full(len(query), -1)
+    pos = np.searchsorted(uniq, query).clip(max=len(uniq) - 1)
+    return np.where(uniq[pos] == query, len(table) - 1 - first[pos], -1)
+
+
+def _first_rows(keys):
+    """Rows holding the first occurrence of each key, in row order."""
+    return np.sort(np.unique(keys, return_index=True)[1])
+
+
+def _join(left, right):
+    """Inner join on keys: (left rows, right rows), left order kept, right order within a key."""
+    order = np.argsort(right, kind='stable')
+    ordered = right[order]
+    start = np.searchsorted(ordered, left, 'left')
+    counts = np.searchsorted(ordered, left, 'right') - start
+    rows = np.repeat(np.arange(len(left)), counts)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return rows, order[np.repeat(start, counts) + offsets]
+
+
+def _take(values, rows, missing):
+    """values[rows] with `missing` where rows is -1."""
+    if not len(values):
+        return np.full(len(rows), missing)
+    return np.where(rows >= 0, values[rows.clip(min=0)], missing)
+
+
+class Codes:
+    """Integer codes of the break tables: users, aircraft, conditions and KBPs share one code space each."""
+
+    def __init__(self, t):
+        (self.user_ids, ua_users, self.mu_users, self.lp_users), users = _factorize(
+            t.users['user_id'], t.user_aircraft['user_id'], t.mu_dates['user_id'], t.lp_dates['user_id'])
+        (self.aircraft_ids, self.ua_aircraft, self.map_aircraft, self.mu_aircraft, self.lp_aircraft), aircraft = \
+            _factorize(t.aircraft['aircraft_type_id'], t.user_aircraft['aircraft_type_id'],
+                       t.kbp_mapping['aircraft_type_id'], t.mu_dates['aircraft_type_id'],
+                       t.lp_dates['aircraft_type_id'])
+        dependencies = list(LP_DEPENDENCIES) + [d for deps in LP_DEPENDENCIES.values() for d in deps]
+        (self.mu_period_conditions, self.lp_period_conditions, self.mu_conditions, self.lp_conditions,
+         _), conditions = _factorize(t.mu_periods['condition'], t.lp_periods['condition'],
+                                     t.mu_dates['condition'], t.lp_dates['condition'], dependencies,
+                                     first=MU_TYPES)
+        (self.map_kbp, self.lp_period_kbp), kbps = _factorize(
+            t.kbp_mapping['kbp_document'], t.lp_periods['kbp_document'], first=KBP_ORDER + ['КЛПВ'])
+        self.ua_users = ua_users
+        self.users, self.aircraft, self.conditions, self.kbps = users, aircraft, conditions, kbps
+        self.n_users, self.n_aircraft, self.n_conditions, self.n_kbps = \
+            len(users), len(aircraft), len(conditions), len(kbps)
+        self.condition_code = {c: i for i, c in enumerate(conditions)}
+
+        self.user_class = np.full(self.n_users, DEFAULT_CLASS, dtype=np.int64)
+        classes = np.nan_to_num(_numbers(t.users['military_class'])).astype(np.int64)
+        self.user_class[self.user_ids] = np.where(classes > 0, classes, DEFAULT_CLASS)
+        self.user_names = np.full(self.n_users, None, dtype=object)
+        self.user_names[self.user_ids] = t.users['name'].to_numpy(dtype=object)
+        self.user_names = pd.Index(self.user_names)
+        self.aircraft_names = np.full(self.n_aircraft, None, dtype=object)
+        self.aircraft_names[self.aircraft_ids] = t.aircraft['aircraft'].to_numpy(dtype=object)
+        self.aircraft_names = pd.Index(self.aircraft_names)
+        self.lp_types = pd.Index(t.lp_periods['lp_type'])
+        self.lp_times = pd.Index(t.lp_periods['time_of_day'])
+        self.status_names = pd.Index(STATUS_NAMES)
+        self.known_aircraft = np.zeros(self.n_aircraft, dtype=bool)
+        self.known_aircraft[self.aircraft_ids] = True
+        # Users sorted by id, missing last (the client's row order).
+        self.user_rank = np.empty(self.n_users, dtype=np.int64)
+        self.user_rank[np.argsort(users.astype(str), kind='stable')] = np.arange(self.n_users)
+
+        self.mu_period_class = _numbers(t.mu_periods['military_class'])
+        self.mu_period_days = np.nan_to_num(_numbers(t.mu_periods['days'])).astype(np.int64)
+        self.lp_period_class = _numbers(t.lp_periods['military_class'])
+        self.lp_period_months = _numbers(t.lp_periods['months'])
+        self.lp_period_sort = _numbers(t.lp_periods['sort_order'])
+        self.map_primary = t.kbp_mapping['is_primary'].fillna(False).astype(bool).to_numpy()
+        self.map_kept = t.kbp_mapping['kbp_document'].to_numpy(dtype=object) != 'КЛПВ'
+        for kind in ('mu', 'lp'):
+            frame = getattr(t, f'{kind}_dates')
+            setattr(self, f'{kind}_last', frame['last_date'].to_numpy(dtype='datetime64[D]'))
+            setattr(self, f'{kind}_control', frame['last_control_date'].to_numpy(dtype='datetime64[D]'))
+
+    @staticmethod
+    def decode(values, codes):
+        """values[codes] as a column (NaN for -1); a take on the Index, no per-cell conversion."""
+        return values.take(codes, allow_fill=True, fill_value=np.nan).array
+
+    def class_key(self, conditions, classes):
+        """Key of (condition, integer class); rows with a non-integer class get key -1."""
+        valid = np.isfinite(classes) & (classes == np.round(classes))
+        whole = np.where(valid, classes, 0).astype(np.int64)
+        return np.where(valid, (conditions + 1) * 2 ** 20 + (whole + 2 ** 19), -1)
+
+
+# --- Vectorized core ----------------------------------------------------------
+
+def expiry_dates(last_date, allowed_days, last_control_date, control_days=CONTROL_DAYS):
+    """(training, control, effective) expiry arrays; NaT where there is no date or period."""
+    last = np.asarray(last_date, dtype='datetime64[D]')
+    allowed = np.asarray(allowed_days, dtype=np.int64)
+    training = np.where(allowed > 0, last + allowed.astype('timedelta64[D]'), NAT)
+    control = np.asarray(last_control_date, dtype='datetime64[D]') + np.timedelta64(control_days, 'D')
+    return training, control, np.fmax(training, control)
+
+
+def status_codes(expiry, today):
+    """(days_left as float, NaN for no expiry; status code) for an expiry array."""
+    expiry = np.asarray(expiry, dtype='datetime64[D]')
+    missing = np.isnat(expiry)
+    left = np.where(missing, 0, (expiry - np.datetime64(today, 'D')).astype(np.int64))
+    status = np.select([missing, left <= 0, left <= WARN_DAYS], [GRAY, RED, YELLOW], GREEN).astype(np.int8)
+    return np.where(missing, np.nan, left), status
+
+
+def _finish(cells, today):
+    """Add expiries and status to a dict of cell arrays."""
+    training, control, expiry = expiry_dates(cells['last_date'], cells['allowed_days'],
+                                             cells['last_control_date'])
+    cells['training_expiry'] = training
+    cells['control_expiry'] = control
+    cells['expiry'] = expiry
+    cells['days_left'], cells['status'] = status_codes(expiry, today)
+    return cells
+
+
+# Cell arrays only one kind has, and their value for the other kind.
+_LP_ONLY = {'kbp': -1, 'period': -1, 'months': np.nan, 'sort_order': np.nan}
+
+
+def _frame(t, parts):
+    """Decode coded cell arrays, [(kind, cells)], into one grid DataFrame."""
+    c = t.codes()
+    kinds = pd.Index([kind for kind, _ in parts])
+    sizes = [len(cells['user']) for _, cells in parts]
+    cells = {name: np.concatenate([part.get(name, np.full(size, _LP_ONLY.get(name)))
+                                   for (_, part), size in zip(parts, sizes)])
+             for name in parts[0][1].keys() | _LP_ONLY.keys()}
+    user, aircraft, period = cells.pop('user'), cells.pop('aircraft'), cells.pop('period')
+    out = {'kind': c.decode(kinds, np.repeat(np.arange(len(parts)), sizes)),
+           'user_id': c.decode(c.users, user), 'aircraft_type_id': c.decode(c.aircraft, aircraft),
+           'condition': c.decode(c.conditions, cells.pop('condition')),
+           'kbp_document': c.decode(c.kbps, cells.pop('kbp')),
+           'lp_type': c.decode(c.lp_types, period), 'time_of_day': c.decode(c.lp_times, period)}
+    out.update((name, cells[name]) for name in (
+        'military_class', 'months', 'sort_order', 'allowed_days', 'last_date', 'last_control_date',
+        'training_expiry', 'control_expiry', 'expiry', 'days_left', 'status'))
+    out['pilot'] = c.decode(c.user_names, user)
+    out['aircraft'] = c.decode(c.aircraft_names, aircraft)
+    out['color'] = c.decode(c.status_names, out['status'].astype(np.int64))
+    return pd.DataFrame(out)
+
+
+# --- MU -----------------------------------------------------------------------
+
+def _mu_cells(t, today):
+    c = t.codes()
+    dims = (c.n_users, c.n_aircraft, c.n_conditions)
+    table = _key(*zip((c.mu_users, c.mu_aircraft, c.mu_conditions), dims))
+    # The aircraft of each pilot's mu_break_dates, in the order rows first appear.
+    latest = np.sort(len(table) - 1 - np.unique(table[::-1], return_index=True)[1])
+    pairs = latest[_first_rows(_key((c.mu_users[latest], c.n_users), (c.mu_aircraft[latest], c.n_aircraft)))]
+    n_types = len(MU_TYPES)
+    user = np.repeat(c.mu_users[pairs], n_types)
+    aircraft = np.repeat(c.mu_aircraft[pairs], n_types)
+    condition = np.tile(np.arange(n_types), len(pairs))
+
+    rows = _last_index(table, _key(*zip((user, aircraft, condition), dims)))
+    military_class = _take(c.user_class, user, DEFAULT_CLASS)
+    period = _last_index(c.class_key(c.mu_period_conditions, c.mu_period_class),
+                         c.class_key(condition, military_class.astype(float)))
+    cells = {'user': user, 'aircraft': aircraft, 'condition': condition,
+             'last_date': _take(c.mu_last, rows, NAT), 'last_control_date': _take(c.mu_control, rows, NAT),
+             'military_class': military_class, 'allowed_days': _take(c.mu_period_days, period, 0)}
+    return _finish(cells, today)
+
+
+def mu_grid(t, today):
+    """MU_TYPES x the aircraft of each pilot's mu_break_dates, with expiries."""
+    return _frame(t, [('mu', _mu_cells(t, np.datetime64(today, 'D')))])
+
+
+# --- LP -----------------------------------------------------------------------
+
+def _pilot_kbp_aircraft(c):
+    """(user, kbp, aircraft) code arrays the pilot flies under each active KBP, plus the active (user, kbp) keys."""
+    ua = _first_rows(_key((c.ua_users, c.n_users), (c.ua_aircraft, c.n_aircraft)))
+    history = np.flatnonzero(~np.isin(c.mu_users, c.ua_users))
+    history = history[_first_rows(_key((c.mu_users[history], c.n_users), (c.mu_aircraft[history], c.n_aircraft)))]
+    user = np.concatenate([c.ua_users[ua], c.mu_users[history]])
+    aircraft = np.concatenate([c.ua_aircraft[ua], c.mu_aircraft[history]])
+    known = (aircraft >= 0) & _take(c.known_aircraft, aircraft, False).astype(bool)
+    user, aircraft = user[known], aircraft[known]
+
+    m_aircraft, m_kbp, m_primary = (c.map_aircraft[c.map_kept], c.map_kbp[c.map_kept],
+                                    c.map_primary[c.map_kept])
+    mapped = m_aircraft >= 0
+    size = np.bincount(m_aircraft[mapped], minlength=c.n_aircraft)
+    first_kbp = np.full(c.n_aircraft, -1)
+    named = np.flatnonzero(mapped & (m_kbp >= 0))
+    first = named[np.unique(m_aircraft[named], return_index=True)[1]]
+    first_kbp[m_aircraft[first]] = m_kbp[first]
+    primary_kbp = np.full(c.n_aircraft, -1)
+    primary = np.flatnonzero(mapped & m_primary)
+    primary_kbp[m_aircraft[primary]] = m_kbp[primary]          # later rows win
+    count = size[aircraft]
+    kbp = np.where(count == 1, first_kbp[aircraft], primary_kbp[aircraft])
+
+    direct = (count > 0) & (kbp >= 0)
+    d_user, d_kbp, d_aircraft = user[direct], kbp[direct], aircraft[direct]
+    active = _key((d_user, c.n_users), (d_kbp, c.n_kbps))
+    dependent = np.flatnonzero((count > 1) & (kbp < 0))
+    rows, docs = _join(aircraft[dependent], m_aircraft)
+    e_user, e_kbp, e_aircraft = user[dependent][rows], m_kbp[docs], aircraft[dependent][rows]
+    keep = np.isin(_key((e_user, c.n_users), (e_kbp, c.n_kbps)), active)
+
+    user = np.concatenate([d_user, e_user[keep]])
+    kbp = np.concatenate([d_kbp, e_kbp[keep]])
+    aircraft = np.concatenate([d_aircraft, e_aircraft[keep]])
+    unique = _first_rows(_key((user, c.n_users), (kbp, c.n_kbps), (aircraft, c.n_aircraft)))
+    unique = unique[kbp[unique] < len(KBP_ORDER)]
+    return user[unique], kbp[unique], aircraft[unique]
+
+
+def pilot_kbp_aircraft(t):
+    """(user_id, kbp_document, aircraft_type_id) the pilot flies under each active KBP."""
+    c = t.codes()
+    user, kbp, aircraft = _pilot_kbp_aircraft(c)
+    return pd.DataFrame({'user_id': c.decode(c.users, user), 'kbp_document': c.decode(c.kbps, kbp),
+                         'aircraft_type_id': c.decode(c.aircraft, aircraft)})
+
+
+def _pilot_lp_periods(c, user, kbp):
+    """(user codes, break_periods_lp rows) each pilot sees, with the KBP section they appear in."""
+    pilots = user[_first_rows(user)]
+    pilot_class = _take(c.user_class, pilots, DEFAULT_CLASS)
+    has_class = ~np.isnan(c.lp_period_class)
+    by_class, rows = _join(pilot_class.astype(float), np.where(has_class, c.lp_period_class, np.nan))
+    classless = np.flatnonzero(~has_class)
+    p_user = np.concatenate([pilots[by_class], np.repeat(pilots, len(classless))])
+    p_row = np.concatenate([rows, np.tile(classless, len(pilots))])
+
+    # Legacy rows without a document go to the pilot's first active KBP.
+    first_active = np.full(c.n_users + 1, -1)                  # the extra slot is user -1 (missing id)
+    order = np.argsort(-kbp, kind='stable')                    # lowest KBP rank written last
+    first_active[user[order]] = kbp[order]
+    p_kbp = c.lp_period_kbp[p_row]
+    p_kbp = np.where(p_kbp < 0, first_active[p_user], p_kbp)
+    active = np.unique(_key((user, c.n_users), (kbp, c.n_kbps)))
+    keep = (p_kbp >= 0) & np.isin(_key((p_user, c.n_users), (p_kbp, c.n_kbps)), active)
+    return p_user[keep], p_row[keep], p_kbp[keep]
+
+
+def _lp_cells(t, today):
+    c = t.codes()
+    a_user, a_kbp, a_aircraft = _pilot_kbp_aircraft(c)
+    p_user, p_row, p_kbp = _pilot_lp_periods(c, a_user, a_kbp)
+    left, right = _join(_key((p_user, c.n_users), (p_kbp, c.n_kbps)),
+                        _key((a_user, c.n_users), (a_kbp, c.n_kbps)))
+    user, row, kbp, aircraft = p_user[left], p_row[left], p_kbp[left], a_aircraft[right]
+    condition = c.lp_period_conditions[row]
+    months = c.lp_period_months[row]
+    sort_order = c.lp_period_sort[row]
+
+    # Per-aircraft dates, else the old rows stored without an aircraft.
+    dims = (c.n_users, c.n_conditions, c.n_aircraft)
+    exact = np.flatnonzero(c.lp_aircraft >= 0)
+    legacy = np.flatnonzero(c.lp_aircraft < 0)
+    found = _last_index(_key(*zip((c.lp_users[exact], c.lp_conditions[exact], c.lp_aircraft[exact]), dims)),
+                        _key(*zip((user, condition, aircraft), dims)))
+    fallback = _last_index(_key((c.lp_users[legacy], c.n_users), (c.lp_conditions[legacy], c.n_conditions)),
+                           _key((user, c.n_users), (condition, c.n_conditions)))
+    rows = np.where(found >= 0, _take(exact, found, -1), _take(legacy, fallback, -1))
+
+    order = np.lexsort((np.nan_to_num(months, nan=np.inf), np.nan_to_num(sort_order, nan=np.inf), kbp,
+                        _take(c.user_rank, user, c.n_users)))
+    user, row, kbp, aircraft, condition, rows = (a[order] for a in (user, row, kbp, aircraft, condition, rows))
+    cells = {'user': user, 'aircraft': aircraft, 'condition': condition, 'kbp': kbp,
+             'period': row,
+             'military_class': _take(c.user_class, user, DEFAULT_CLASS),
+             'months': months[order],
+             'sort_order': sort_order[order],
+             'allowed_days': np.nan_to_num(months[order]).astype(np.int64) * DAYS_PER_MONTH,
+             'last_date': _take(c.lp_last, rows, NAT), 'last_control_date': _take(c.lp_control, rows, NAT)}
+    _finish(cells, today)
+    _apply_dependencies(c, cells)
+    return cells
+
+
+def lp_grid(t, today):
+    """LP conditions x the pilot's aircraft of each active KBP, with expiries."""
+    return _frame(t, [('lp', _lp_cells(t, np.datetime64(today, 'D')))])
+
+
+def _apply_dependencies(c, cells):
+    """бз_нц_* status: the worst of the conditions it depends on (gray if one is absent)."""
+    user, aircraft, condition, status = cells['user'], cells['aircraft'], cells['condition'], cells['status']
+    pair = _key((user, c.n_users), (aircraft, c.n_aircraft))
+    for name, deps in LP_DEPENDENCIES.items():
+        target = np.flatnonzero(condition == c.condition_code[name])
+        if not len(target):
+            continue
+        worst = np.full(len(target), GREEN, dtype=np.int8)
+        for dep in deps:
+            section = np.flatnonzero(condition == c.condition_code[dep])
+            first = section[_first_rows(pair[section])]
+            dep_status = np.maximum(_take(status[first], _last_index(pair[first], pair[target]), RED), RED)
+            dep_status = np.where(np.isin(user[target], user[section]), dep_status, GRAY).astype(np.int8)
+            worst = np.where((worst == GRAY) | (dep_status == GRAY), GRAY, np.minimum(worst, dep_status))
+        status[target] = worst
+
+
+def compute(t, today=None):
+    """MU and LP grids in one frame (kind 'mu' / 'lp'), with aircraft and pilot names."""
+    today = np.datetime64(today or datetime.date.today(), 'D')
+    return _frame(t, [('mu', _mu_cells(t, today)), ('lp', _lp_cells(t, today))])
+
+
+# --- check-deadlines rules ----------------------------------------------------
+
+def add_months(dates, months):
+    """Date + months the way JS setMonth() does it (Jan 31 + 1 -> Mar 3)."""
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    month_start = dates.astype('datetime64[M]')
+    day = (dates - month_start.astype('datetime64[D]')).astype('timedelta64[D]')
+    return (month_start + np.asarray(months, dtype=np.int64)).astype('datetime64[D]') + day
+
+
+def check_deadlines_frame(t, today=None):
+    """Expiry and status per mu/lp_break_dates row as check-deadlines computes them."""
+    today = np.datetime64(today or datetime.date.today(), 'D')
+    classes = t.pilot_classes(default=3)
+    frames = []
+    for kind, dates, periods, value, default in (
+            ('mu', t.mu_dates, t.mu_periods, 'days', 30),
+            ('lp', t.lp_dates, t.lp_periods, 'months', 6)):
+        rows = dates.dropna(subset=['last_date', 'user_id']).copy()
+        rows['military_class'] = rows['user_id'].map(classes).fillna(3).astype(int)
+        lookup = periods.assign(military_class=pd.to_numeric(periods['military_class'], errors='coerce')
+                                .fillna(3).astype(int))
+        lookup = lookup.drop_duplicates(['condition', 'military_class'], keep='last')
+        rows = rows.merge(lookup[['condition', 'military_class', value]], how='left',
+                          on=['condition', 'military_class'])
+        period = pd.to_numeric(rows[value], errors='coerce').fillna(0).astype(np.int64).to_numpy()
+        period = np.where(period > 0, period, default)
+        last = rows['last_date'].to_numpy()
+        if kind == 'mu':
+            expiry = last + period.astype('timedelta64[D]')
+        else:
+            expiry = add_months(last, period)
+        rows['expiry'] = expiry
+        rows['days_left'], rows['status'] = status_codes(expiry, today)
+        rows.insert(0, 'kind', kind)
+        frames.append(rows[['kind', 'user_id', 'condition', 'aircraft_type_id', 'expiry', 'days_left', 'status']])
+    return pd.concat(frames, ignore_index=True)
+
+
+def compare(grid, deadlines):
+    """
+    Cells where check-deadlines and the engine disagree on expiry or status.
+
+    Rows only one side has (check-deadlines skips rows without last_date; the
+    client skips aircraft outside the pilot's KBPs) are reported with the
+    other side empty.
+    """
+    key = ['kind', 'user_id', 'condition', 'aircraft_type_id']
+    engine = grid.dropna(subset=['last_date'])[key + ['expiry', 'status', 'pilot', 'aircraft']]
+    engine = engine.drop_duplicates(key)
+    both = engine.merge(deadlines[key + ['expiry', 'status']], how='outer', on=key,
+                        suffixes=('', '_deadlines'), indicator=True)
+    differs = (both['_merge'] != 'both') | (both['expiry'] != both['expiry_deadlines']) | \
+              (both['status'] != both['status_deadlines'])
+    out = both[differs].copy()
+    for col in ('status', 'status_deadlines'):
+        codes = out[col].fillna(GRAY).astype(int).to_numpy()
+        out[col] = np.where(out[col].isna(), '', STATUS_NAMES[codes])
+    return out.rename(columns={'_merge': 'present'})
+
+
+# --- Benchmark ----------------------------------------------------------------
+
+def synthetic_tables(pilots, seed=5, today=None):
+    """Tables shaped like the production ones: 4 aircraft types, 3 KBPs, a few years of dates."""
+    rng = np.random.default_rng(seed)
+    today = np.datetime64(today or datetime.date.today(), 'D')
+    aircraft = pd.DataFrame({'aircraft_type_id': ['a1', 'a2', 'a3', 'a4'],
+                             'aircraft': ['Су-27', 'Су-24', 'Ми-8', 'Л-39']})
+    kbp_mapping = pd.DataFrame({'aircraft_type_id': ['a1', 'a2', 'a3', 'a4', 'a4', 'a1'],
+                                'kbp_document': ['КБП ВА', 'КБП БА/РА', 'КБПВ', 'КБП ВА', 'КБП БА/РА', 'КЛПВ'],
+                                'is_primary': [True, True, True, False, False, False]})
+    users = pd.DataFrame({'user_id': [f'u{i}' for i in range(pilots)],
+                          'name': [f'Пілот {i}' for i in range(pilots)],
+                          'military_class': rng.choice([1, 2, 3, None], pilots)})
+    fleet = rng.integers(0, 3, pilots)
+    user_aircraft = pd.DataFrame({'user_id': users['user_id'], 'aircraft_type_id': aircraft['aircraft_type_id'][fleet]
+                                  .to_numpy()})
+    trainer = users[rng.random(pilots) < 0.3]
+    user_aircraft = pd.concat([user_aircraft, trainer[['user_id']].assign(aircraft_type_id='a4')], ignore_index=True)
+
+    mu_periods = pd.DataFrame([(c, k, d) for c in MU_TYPES for k, d in ((1, 45), (2, 30), (3, 20))],
+                              columns=['condition', 'military_class', 'days'])
+    lp_rows = []
+    for kbp, prefix in (('КБП ВА', 'ва'), ('КБП БА/РА', 'ба'), ('КБПВ', 'в')):
+        for i in range(12):
+            lp_rows.append((f'ЛП {prefix} {i}', f'{prefix}_{i}', kbp, None, 3 + i % 10, None, i))
+    lp_rows += [('Малі висоти', 'малі_висоти', 'КБПВ', None, 6, None, 20),
+                ('Складний пілотаж МВ', 'складний_пілотаж_мв', 'КБПВ', None, 6, None, 21),
+                ('БЗ НЦ прості', 'бз_нц_прості', 'КБПВ', None, 6, None, 22),
+                ('Старий вид', 'старий_вид', None, 2, 4, None, None)]
+    lp_periods = pd.DataFrame(lp_rows, columns=TABLES['lp_periods'][1])
+
+    def dates(n, span):
+        last = today - rng.integers(0, span, n).astype('timedelta64[D]')
+        last = np.where(rng.random(n) < 0.1, NAT, last)
+        control = np.where(rng.random(n) < 0.2, last + 3, NAT)
+        return last, control
+
+    mu = user_aircraft.merge(pd.DataFrame({'condition': MU_TYPES}), how='cross')
+    mu = mu[rng.random(len(mu)) < 0.8].reset_index(drop=True)
+    mu['last_date'], mu['last_control_date'] = dates(len(mu), 90)
+    lp = user_aircraft.merge(lp_periods[['condition']].drop_duplicates(), how='cross')
+    lp = lp[rng.random(len(lp)) < 0.15].reset_index(drop=True)
+    lp.loc[rng.random(len(lp)) < 0.1, 'aircraft_type_id'] = None
+    lp['last_date'], lp['last_control_date'] = dates(len(lp), 500)
+    return BreakTables(users=users, aircraft=aircraft, user_aircraft=user_aircraft, kbp_mapping=kbp_mapping,
+                       mu_periods=mu_periods, lp_periods=lp_periods, mu_dates=mu, lp_dates=lp)
+
+
+def _records(t):
+    """The tables as lists of plain rows (dates as datetime.date), as the client receives them."""
+    def rows(frame):
+        return [tuple(None if v is None or v is pd.NaT or v != v else v for v in row)
+                for row in frame.astype(object).itertuples(index=False)]
+
+    out = {name: rows(getattr(t, name)) for name in TABLES}
+    for name in ('mu_dates', 'lp_dates'):
+        out[name] = [(u, a, c, pd.Timestamp(last).date() if last else None,
+                      pd.Timestamp(control).date() if control else None) for u, a, c, last, control in out[name]]
+    return out
+
+
+def _loop_grid(r, today):
+    """
+    The whole grid pilot by pilot with dict lookups, as getBreaksDataFromSupabase
+    builds it: [(kind, user_id, aircraft_type_id, condition, kbp_document, color)].
+    """
+    today = pd.Timestamp(today).date()
+
+    def color(last, allowed, control):
+        training = last + datetime.timedelta(days=allowed) if last and allowed > 0 else None
+        control = control + datetime.timedelta(days=CONTROL_DAYS) if control else None
+        expiry = max(training, control) if training and control else training or control
+        if expiry is None:
+            return GRAY
+        remaining = (expiry - today).days
+        return RED if remaining <= 0 else YELLOW if remaining <= WARN_DAYS else GREEN
+
+    def whole(value):
+        return int(value) if value is not None and float(value) == int(value) else None
+
+    classes = {u: int(k) if k and int(k) > 0 else DEFAULT_CLASS for u, _, k in r['users']}
+    known = {a for a, _ in r['aircraft']}
+    cells = []
+
+    # MU
+    latest = {}
+    for i, (u, a, c, last, control) in enumerate(r['mu_dates']):
+        latest[(u, a, c)] = i
+    mu_dates = {key: r['mu_dates'][i][3:] for key, i in latest.items()}
+    pairs = dict.fromkeys(r['mu_dates'][i][:2] for i in sorted(latest.values()))
+    mu_days = {(c, whole(k)): int(d or 0) for c, k, d in r['mu_periods']}
+    for u, a in pairs:
+        for c in MU_TYPES:
+            last, control = mu_dates.get((u, a, c), (None, None))
+            cells.append(('mu', u, a, c, None, color(last, mu_days.get((c, classes.get(u, DEFAULT_CLASS)), 0),
+                                                     control)))
+
+    # LP: the pilot's aircraft mapped to KBP documents
+    own = {}
+    for u, a in r['user_aircraft']:
+        own.setdefault(u, {}).setdefault(a)
+    history = {}
+    for u, a, *_ in r['mu_dates']:
+        if u not in own:
+            history.setdefault(u, {}).setdefault(a)
+    docs, primary = {}, {}
+    for a, k, is_primary in r['kbp_mapping']:
+        if k == 'КЛПВ':
+            continue
+        docs.setdefault(a, []).append(k)
+        if is_primary:
+            primary[a] = k
+    sections = {}
+    for u, fleet in list(own.items()) + list(history.items()):
+        direct, dependent = {}, []
+        for a in fleet:
+            if a not in known or a not in docs:
+                continue
+            names = [k for k in docs[a] if k is not None]
+            kbp = (names[0] if names else None) if len(docs[a]) == 1 else primary.get(a)
+            if kbp is not None:
+                direct.setdefault(kbp, []).append(a)
+            elif len(docs[a]) > 1:
+                dependent.append(a)
+        for a in dependent:
+            for kbp in docs[a]:
+                if kbp in direct and a not in direct[kbp]:
+                    direct[kbp].append(a)
+        sections[u] = {k: fleet for k, fleet in direct.items() if k in KBP_ORDER}
+
+    lp_dates, legacy = {}, {}
+    for u, a, c, last, control in r['lp_dates']:
+        if a is None:
+            legacy[(u, c)] = (last, control)
+        else:
+            lp_dates[(u, c, a)] = (last, control)
+    lp = []
+    for u, active in sections.items():
+        if not active:
+            continue
+        k_class = classes.get(u, DEFAULT_CLASS)
+        first_active = min(active, key=KBP_ORDER.index)
+        for lp_type, c, kbp, k, months, _, sort_order in (
+                [p for p in r['lp_periods'] if p[3] is not None and whole(p[3]) == k_class] +
+                [p for p in r['lp_periods'] if p[3] is None]):
+            kbp = kbp or first_active
+            for a in active.get(kbp, ()):
+                last, control = lp_dates.get((u, c, a)) or legacy.get((u, c), (None, None))
+                lp.append(((u, KBP_ORDER.index(kbp), sort_order, months),
+                           ['lp', u, a, c, kbp, color(last, int(months or 0) * DAYS_PER_MONTH, control)]))
+    lp.sort(key=lambda item: tuple(float('inf') if v is None else v for v in item[0]))
+    lp = [cell for _, cell in lp]
+
+    # бз_нц_*: the worst status of the conditions they depend on
+    for condition, deps in LP_DEPENDENCIES.items():
+        status = {}
+        for _, u, a, c, _, code in lp:
+            if c in deps:
+                status.setdefault((c, u), {}).setdefault(a, code)
+        for cell in lp:
+            if cell[3] != condition:
+                continue
+            worst = GREEN
+            for dep in deps:
+                per_aircraft = status.get((dep, cell[1]))
+                dep_status = GRAY if per_aircraft is None else max(per_aircraft.get(cell[2], RED), RED)
+                worst = GRAY if GRAY in (worst, dep_status) else min(worst, dep_status)
+            cell[5] = worst
+    return cells + [tuple(cell) for cell in lp]
+
+
+def _loop_cells(grid, today):
+    """Per-cell expiry and color, as the nested loops in supabaseData.js do it."""
+    today = pd.Timestamp(today).date()
+    colors = []
+    for last, allowed, control in zip(grid['last_date'], grid['allowed_days'], grid['last_control_date']):
+        training = last + datetime.timedelta(days=int(allowed)) if pd.notna(last) and allowed else None
+        control = control + datetime.timedelta(days=CONTROL_DAYS) if pd.notna(control) else None
+        expiry = max(training, control) if training and control else training or control
+        if expiry is None:
+            colors.append('gray')
+            continue
+        remaining = (expiry - today).days
+        colors.append('red' if remaining <= 0 else 'yellow' if remaining <= WARN_DAYS else 'green')
+    return np.array(colors)
+
+
+def _best_of(runs, fn):
+    """(result, best wall time in seconds) over `runs` calls."""
+    best = None
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def bench(pilots, runs=3):
+    today = np.datetime64(datetime.date.today(), 'D')
+    t = synthetic_tables(pilots, today=today)
+
+    def engine_run():
+        t._codes = None                                       # encode the tables every run
+        return compute(t, today)
+
+    grid, engine_time = _best_of(runs, engine_run)
+    t1 = time.perf_counter()
+    deadlines = check_deadlines_frame(t, today)
+    diff = compare(grid, deadlines)
+    t2 = time.perf_counter()
+
+    records = _records(t)
+    loop, loop_time = _best_of(runs, lambda: _loop_grid(records, today))
+    engine = zip(grid['kind'], grid['user_id'], grid['aircraft_type_id'], grid['condition'],
+                 grid['kbp_document'].astype(object).where(grid['kbp_document'].notna(), None), grid['status'])
+    assert collections.Counter(loop) == collections.Counter(engine), "engine disagrees with the loop"
+
+    # The expiry arithmetic alone, on the same cells.
+    cells = grid.assign(last_date=pd.Series(grid['last_date']).dt.date,
+                        last_control_date=pd.Series(grid['last_control_date']).dt.date)
+    t5 = time.perf_counter()
+    status_codes(expiry_dates(grid['last_date'].to_numpy(), grid['allowed_days'].to_numpy(),
+                              grid['last_control_date'].to_numpy())[2], today)
+    t6 = time.perf_counter()
+    colors = _loop_cells(cells, today)
+    t7 = time.perf_counter()
+    independent = ~grid['condition'].isin(list(LP_DEPENDENCIES)).to_numpy()
+    assert (colors[independent] == grid['color'].to_numpy()[independent]).all(), "engine disagrees with the loop"
+
+    mu = (grid['kind'] == 'mu').sum()
+    print(f"{pilots} pilots: {mu} MU cells, {len(grid) - mu} LP cells")
+    print(f"  queries               : {len(TABLES)} (client: {9 * pilots}, nine per pilot)")
+    print(f"  engine (all pilots)   : {engine_time * 1000:8.1f} ms (codes, grid, expiries, frame; best of {runs})")
+    print(f"  per-pilot loop        : {loop_time * 1000:8.1f} ms (same grid from dict lookups, cells match)")
+    print(f"  expiry step           : {(t6 - t5) * 1000:8.1f} ms vectorized, {(t7 - t6) * 1000:.1f} ms per cell")
+    print(f"  check-deadlines diff  : {(t2 - t1) * 1000:8.1f} ms, {len(diff)} cells disagree")
+    print(grid.groupby(['kind', 'color']).size().unstack(fill_value=0).to_string())
+
+
+# --- Main ---------------------------------------------------------------------
+
+def _print_pilot(grid, name):
+    rows = grid[grid['pilot'] == name]
+    if rows.empty:
+        print(f"Пілота '{name}' не знайдено або немає даних про перерви")
+        return
+    for kind, part in rows.groupby('kind', sort=False):
+        print(f"\n{kind.upper()}:")
+        view = part[['kbp_document', 'condition', 'aircraft', 'last_date', 'expiry', 'days_left', 'color']]
+        print(view.to_string(index=False))
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Break expiry engine")
+    parser.add_argument('--bench', type=int, metavar='PILOTS', help="run on synthetic data for PILOTS pilots")
+    parser.add_argument('--db', action='store_true', help="read the break tables from the database")
+    parser.add_argument('--pilot', help="print one pilot's grid")
+    parser.add_argument('--compare', action='store_true', help="list cells where check-deadlines disagrees")
+    parser.add_argument('--today', type=datetime.date.fromisoformat, default=datetime.date.today())
+    args = parser.parse_args()
+
+    if args.bench or not args.db:
+        bench(args.bench or 400)
+        return
+
+    import psycopg2
+    dsn = os.environ.get('SUPABASE_DB_URL')
+    if not dsn:
+        raise SystemExit("SUPABASE_DB_URL is not set")
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn, conn.cursor() as cur:
+            t = BreakTables.load(cur)
+    finally:
+        conn.close()
+
+    grid = compute(t, args.today)
+    pd.set_option('display.width', 160)
+    print(f"Перерви на {args.today}: {grid['user_id'].nunique()} пілотів, {len(grid)} клітинок")
+    print(grid.groupby(['kind', 'color']).size().unstack(fill_value=0).to_string())
+    if args.pilot:
+        _print_pilot(grid, args.pilot)
+    if args.compare:
+        diff = compare(grid, check_deadlines_frame(t, args.today))
+        print(f"\ncheck-deadlines розходиться у {len(diff)} клітинках")
+        if len(diff):
+            print(diff.head(50).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
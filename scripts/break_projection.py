@@ -0,0 +1,305 @@
+"""
+What-if projection of break (перерва) status under a draft flying schedule.
+
+BreaksMU / BreaksLP show today's status one pilot at a time. This module
+takes the current cells from break_engine.compute() and a planned schedule
+of (pilot, date, aircraft, MU condition, exercises / LP types, flight type)
+and projects every pilot x condition x aircraft cell over the next N days:
+
+  - planned flights become renewal events on a (day, cell) grid: the MU
+    condition of the flight (time_of_day + weather_conditions, e.g. 'ДПМУ')
+    and the LP types of its exercises (exercises.lp_types); the flight type
+    decides whether it renews the full period or only adds the control
+    10 days, as getExtensionType() in Main.js ('У складі екіпажу' renews
+    nothing)
+  - last_date / last_control_date are propagated down the day axis with
+    np.maximum.accumulate, so the dense (day x cell) expiry and status
+    matrices come out of a handful of array operations
+  - first_lapse() is the first day each cell turns red; pilot_matrix() is
+    the worst status per pilot and day
+
+Planned flights only renew cells that exist today (the pilot's aircraft
+and KBP sections); бз_нц_* dependencies are not re-derived per day.
+
+Schedule CSV columns: pilot, date, aircraft, mu, flight_type, document,
+exercises ("12, 14(2)") and/or lp (normalized LP types, comma-separated),
+and optionally instructor (non-empty when an instructor flies along; makes
+'На випробування' / 'За методиками ЛВ' control flights, as in Main.js).
+
+Connection for --db: SUPABASE_DB_URL (postgresql://...) from the environment.
+
+Usage:
+    python scripts/break_projection.py --bench 120
+    python scripts/break_projection.py --db --schedule plan.csv --days 90
+"""
+
+import argparse
+import csv
+import datetime
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import break_engine
+from break_engine import GRAY, GREEN, RED, STATUS_NAMES, WARN_DAYS, YELLOW
+from flight_bulk_import import name_keys, normalize_name, parse_exercise_refs
+
+DEFAULT_DAYS = 90
+NONE = np.iinfo(np.int64).min // 2     # "no date" in day-number arrays
+
+# getExtensionType() in Main.js: what a flight of this type renews; the
+# test types depend on whether an instructor flew (extension_type()).
+EXTENSION = {
+    'Контрольний': 'control',
+    'Тренувальний': 'full',
+    'За інструктора': 'full',
+    'У складі екіпажу': 'none',
+}
+WITH_INSTRUCTOR = {
+    'На випробування': 'control',
+    'За методиками ЛВ': 'control',
+}
+_NO = {'', '0', 'ні', 'no', 'false', '-'}
+
+EXERCISES_SQL = "SELECT document, number::text, lp_types FROM exercises"
+
+SCHEDULE_COLUMNS = ['user_id', 'date', 'aircraft_type_id', 'mu', 'lp', 'extension']
+
+
+def _day_numbers(values):
+    """datetime64 array -> int64 day numbers, NONE for NaT."""
+    values = np.asarray(values, dtype='datetime64[D]')
+    return np.where(np.isnat(values), NONE, values.astype(np.int64))
+
+
+def schedule_events(cells, schedule, start, days):
+    """
+    (day index, cell index, is control) for every planned renewal inside the
+    horizon, and the number of planned renewals that match no cell.
+    """
+    if schedule.empty:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=bool), 0
+    plan = schedule[schedule['extension'] != 'none'].copy()
+    plan['day'] = (np.asarray(plan['date'], dtype='datetime64[D]') - np.datetime64(start, 'D')).astype(np.int64)
+    plan = plan[(plan['day'] >= 0) & (plan['day'] <= days)]
+    mu = plan.dropna(subset=['mu']).assign(kind='mu', condition=lambda f: f['mu'])
+    lp = plan.explode('lp').dropna(subset=['lp']).assign(kind='lp', condition=lambda f: f['lp'])
+    wanted = pd.concat([mu, lp], ignore_index=True)[['kind', 'user_id', 'condition', 'aircraft_type_id', 'day',
+                                                     'extension']]
+    keys = cells[['kind', 'user_id', 'condition', 'aircraft_type_id']].reset_index().rename(
+        columns={'index': 'cell'})
+    matched = wanted.merge(keys, on=['kind', 'user_id', 'condition', 'aircraft_type_id'], how='left')
+    unmatched = int(matched['cell'].isna().sum())
+    matched = matched.dropna(subset=['cell'])
+    return (matched['day'].to_numpy(np.int64), matched['cell'].to_numpy(np.int64),
+            (matched['extension'] == 'control').to_numpy(), unmatched)
+
+
+class Projection:
+    """Dense (day x cell) expiry and status over the horizon."""
+
+    def __init__(self, cells, schedule, start, days=DEFAULT_DAYS):
+        self.cells = cells.reset_index(drop=True)
+        self.start = np.datetime64(start, 'D')
+        self.dates = self.start + np.arange(days + 1)
+        n = len(self.cells)
+        day_numbers = self.dates.astype(np.int64)
+
+        train = np.full((days + 1, n), NONE, dtype=np.int64)
+        control = np.full((days + 1, n), NONE, dtype=np.int64)
+        train[0] = _day_numbers(self.cells['last_date'].to_numpy())
+        control[0] = _day_numbers(self.cells['last_control_date'].to_numpy())
+        ev_day, ev_cell, ev_control, self.unmatched = schedule_events(self.cells, schedule, start, days)
+        flown = day_numbers[ev_day]
+        np.maximum.at(train, (ev_day[~ev_control], ev_cell[~ev_control]), flown[~ev_control])
+        np.maximum.at(control, (ev_day[ev_control], ev_cell[ev_control]), flown[ev_control])
+        np.maximum.accumulate(train, axis=0, out=train)
+        np.maximum.accumulate(control, axis=0, out=control)
+
+        allowed = self.cells['allowed_days'].to_numpy(np.int64)
+        training_expiry = np.where((train > NONE) & (allowed > 0), train + allowed, NONE)
+        control_expiry = np.where(control > NONE, control + break_engine.CONTROL_DAYS, NONE)
+        self.expiry = np.maximum(training_expiry, control_expiry)
+        self.renewals = len(ev_day)
+
+        missing = self.expiry == NONE
+        left = np.where(missing, 0, self.expiry - day_numbers[:, None])
+        self.status = np.select([missing, left <= 0, left <= WARN_DAYS], [GRAY, RED, YELLOW],
+                                GREEN).astype(np.int8)
+
+    def first_lapse(self):
+        """Per cell: first red day in the horizon (NaT if it stays valid or has no dates)."""
+        red = self.status == RED
+        first = red.argmax(axis=0)
+        return np.where(red.any(axis=0), self.dates[first], np.datetime64('NaT', 'D'))
+
+    def lapses(self):
+        """Cells that are valid today and lapse within the horizon, soonest first."""
+        first = self.first_lapse()
+        valid_now = (self.status[0] == GREEN) | (self.status[0] == YELLOW)
+        mask = valid_now & ~np.isnat(first)
+        cols = [c for c in ('pilot', 'kind', 'kbp_document', 'condition', 'aircraft', 'expiry') if c in self.cells]
+        out = self.cells.loc[mask, cols].rename(columns={'expiry': 'expiry_today'})
+        out['lapses_on'] = first[mask]
+        return out.sort_values(['lapses_on', 'pilot']).reset_index(drop=True)
+
+    def pilot_matrix(self):
+        """Worst status per day (rows) and pilot (columns), gray cells ignored; -1 = no dated cells."""
+        codes, pilots = pd.factorize(self.cells['user_id'])
+        order = np.argsort(codes, kind='stable')
+        bounds = np.r_[0, np.flatnonzero(np.diff(codes[order])) + 1]
+        ranked = np.where(self.status[:, order] == GRAY, GREEN + 1, self.status[:, order])
+        worst = np.minimum.reduceat(ranked, bounds, axis=1)
+        worst = np.where(worst > GREEN, -1, worst)
+        names = self.cells['pilot'].groupby(codes).first().reindex(range(len(pilots))).to_numpy()
+        names = np.where(pd.isna(names), pilots, names)
+        return pd.DataFrame(worst, index=pd.Index(self.dates, name='date'), columns=names)
+
+
+# --- Schedule -----------------------------------------------------------------
+
+def _split(value):
+    return [v.strip() for v in str(value or '').split(',') if v.strip()]
+
+
+def extension_type(flight_type, has_instructor=False):
+    """getExtensionType() in Main.js: 'full', 'control' or 'none'."""
+    flight_type = (flight_type or '').strip()
+    if has_instructor and flight_type in WITH_INSTRUCTOR:
+        return WITH_INSTRUCTOR[flight_type]
+    return EXTENSION.get(flight_type, 'full')
+
+
+def load_schedule(path, t, exercises=None):
+    """
+    Schedule CSV -> frame of SCHEDULE_COLUMNS and a list of rows that could
+    not be resolved. `exercises` maps (document, number) -> lp_types.
+    """
+    users = {}
+    for user_id, name in zip(t.users['user_id'], t.users['name']):
+        for key in name_keys(name or ''):
+            users[key] = user_id if users.get(key, user_id) == user_id else None
+    aircraft = {normalize_name(n): a for a, n in zip(t.aircraft['aircraft_type_id'], t.aircraft['aircraft']) if n}
+    rows, issues = [], []
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        for i, rec in enumerate(csv.DictReader(f), start=2):
+            ids = {users.get(k) for k in name_keys(rec.get('pilot') or '')} - {None}
+            type_id = aircraft.get(normalize_name(rec.get('aircraft') or ''))
+            if len(ids) != 1 or type_id is None:
+                issues.append(f"row {i}: pilot {rec.get('pilot')!r} or aircraft {rec.get('aircraft')!r} not found")
+                continue
+            lp = _split(rec.get('lp'))
+            for number, _ in parse_exercise_refs(rec.get('exercises')):
+                lp.extend((exercises or {}).get((normalize_name(rec.get('document') or ''), number), []))
+            rows.append((ids.pop(), datetime.date.fromisoformat(rec['date'].strip()), type_id,
+                         (rec.get('mu') or '').strip() or None, sorted(set(lp)),
+                         extension_type(rec.get('flight_type'),
+                                        (rec.get('instructor') or '').strip().lower() not in _NO)))
+    return pd.DataFrame(rows, columns=SCHEDULE_COLUMNS), issues
+
+
+def load_exercises(cur):
+    cur.execute(EXERCISES_SQL)
+    return {(normalize_name(doc or ''), str(number).strip().lower()): list(lp_types or [])
+            for doc, number, lp_types in cur.fetchall()}
+
+
+# --- Benchmark ----------------------------------------------------------------
+
+def synthetic_schedule(cells, start, days, per_week=2, seed=9):
+    """Roughly `per_week` flights per pilot per week on the pilot's own cells."""
+    rng = np.random.default_rng(seed)
+    pilots = cells.drop_duplicates(['user_id', 'aircraft_type_id'])[['user_id', 'aircraft_type_id']]
+    n = int(len(pilots) * days / 7 * per_week)
+    pick = pilots.iloc[rng.integers(0, len(pilots), n)].reset_index(drop=True)
+    lp_by_pair = cells[cells['kind'] == 'lp'].groupby(['user_id', 'aircraft_type_id'])['condition'].agg(list)
+    lp = [rng.choice(c, min(2, len(c)), replace=False).tolist() if isinstance(c, list) and c else []
+          for c in lp_by_pair.reindex(pd.MultiIndex.from_frame(pick)).tolist()]
+    return pd.DataFrame({
+        'user_id': pick['user_id'],
+        'date': np.datetime64(start, 'D') + rng.integers(0, days + 1, n),
+        'aircraft_type_id': pick['aircraft_type_id'],
+        'mu': rng.choice(break_engine.MU_TYPES, n),
+        'lp': lp,
+        'extension': rng.choice(['full', 'full', 'full', 'control', 'none'], n),
+    })
+
+
+def bench(pilots, days=DEFAULT_DAYS):
+    today = np.datetime64(datetime.date.today(), 'D')
+    t = break_engine.synthetic_tables(pilots, today=today)
+    t0 = time.perf_counter()
+    cells = break_engine.compute(t, today)
+    t1 = time.perf_counter()
+    schedule = synthetic_schedule(cells, today, days)
+    t2 = time.perf_counter()
+    projection = Projection(cells, schedule, today, days)
+    lapses = projection.lapses()
+    matrix = projection.pilot_matrix()
+    t3 = time.perf_counter()
+    baseline = Projection(cells, schedule.iloc[:0], today, days).lapses()
+
+    print(f"{pilots} pilots, {len(cells)} cells, {len(schedule)} planned flights, {days} days")
+    print(f"  current status (break_engine): {(t1 - t0) * 1000:7.1f} ms")
+    print(f"  projection + lapses + matrix : {(t3 - t2) * 1000:7.1f} ms "
+          f"({projection.status.shape[0]} x {projection.status.shape[1]} statuses, {projection.renewals} renewals)")
+    print(f"  lapses without the plan: {len(baseline)}, with it: {len(lapses)}")
+    reds = (matrix == RED).sum(axis=1)
+    print(f"  pilots with a lapsed condition: day 0 {reds.iloc[0]}, day {days} {reds.iloc[-1]}")
+
+
+# --- Main ---------------------------------------------------------------------
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Break status projection for a planned schedule")
+    parser.add_argument('--bench', type=int, metavar='PILOTS', help="run on synthetic data for PILOTS pilots")
+    parser.add_argument('--db', action='store_true', help="read the break tables from the database")
+    parser.add_argument('--schedule', help="planned flights CSV")
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS)
+    parser.add_argument('--start', type=datetime.date.fromisoformat, default=datetime.date.today())
+    parser.add_argument('--out', help="write the per-pilot status matrix to this CSV")
+    args = parser.parse_args()
+
+    if args.bench or not args.db:
+        bench(args.bench or 120, args.days)
+        return
+
+    import psycopg2
+    dsn = os.environ.get('SUPABASE_DB_URL')
+    if not dsn:
+        raise SystemExit("SUPABASE_DB_URL is not set")
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn, conn.cursor() as cur:
+            t = break_engine.BreakTables.load(cur)
+            exercises = load_exercises(cur)
+    finally:
+        conn.close()
+
+    cells = break_engine.compute(t, args.start)
+    schedule, issues = (load_schedule(args.schedule, t, exercises) if args.schedule
+                        else (pd.DataFrame(columns=SCHEDULE_COLUMNS), []))
+    for issue in issues:
+        print(f"  ! {issue}")
+    projection = Projection(cells, schedule, args.start, args.days)
+    lapses = projection.lapses()
+    pd.set_option('display.width', 160)
+    print(f"Прогноз на {args.days} дн. від {args.start}: {len(schedule)} запланованих польотів, "
+          f"{projection.renewals} продовжень, {projection.unmatched} без відповідної клітинки")
+    print(f"Випадуть: {len(lapses)}")
+    if len(lapses):
+        print(lapses.to_string(index=False))
+    if args.out:
+        matrix = projection.pilot_matrix()
+        names = np.append(STATUS_NAMES, '')
+        matrix.apply(lambda col: names[col.to_numpy()]).to_csv(args.out, encoding='utf-8-sig')
+        print(f"Матриця статусів: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
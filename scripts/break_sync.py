@@ -0,0 +1,126 @@
+"""
+Incremental job keeping mu_break_dates / lp_break_dates in step with flights
+(supabase/migrations/2026101906_flight_break_sync.sql).
+
+A break date is the latest qualifying flight of its (pilot, MU condition or
+LP type, aircraft) key. Recomputing it from the pilot's whole history after
+every edit is what made historical edits and deletions expensive; instead
+each flight keeps its contributions in flight_break_contributions, indexed
+by key and date, and each run, in one transaction:
+
+  1. takes the flights touched since the last run - new or corrected rows
+     in flight_updates_log, flights whose changed_at moved (exercises and
+     crew changes touch it too), and flights recorded in flight_deletions
+  2. passes them to fn_apply_flight_breaks(), which replaces their
+     contributions and rewrites only the keys they had before or have now,
+     each key's last_date / last_control_date being an index max over its
+     contributions (idempotent)
+  3. advances the watermarks in break_sync_state and prunes the
+     flight_deletions rows every job has passed (flight_sync.py, shared
+     with flight_rollups.py)
+
+Dates entered by hand are kept as contributions without a flight, so a
+deleted flight never erases them; every write to the break tables except
+fn_apply_flight_breaks' own (app.break_sync on) counts as one
+(2026101910_break_dates_manual_flag.sql). Flights purged by flight_archive.py are
+not recorded as deletions, so their contributions stay. Changes newer than
+--settle seconds are left for the next run (flight_exercises and the log
+row arrive right after the flight). `verify` recomputes every key from the contributions and lists
+break rows that differ.
+
+Connection: SUPABASE_DB_URL (postgresql://...) from the environment.
+
+Usage:
+    python scripts/break_sync.py sync
+    python scripts/break_sync.py sync --every 60
+    python scripts/break_sync.py verify
+"""
+
+import argparse
+import datetime
+import sys
+import time
+
+from flight_sync import connect, sync_changes
+
+CHUNK = 1000
+DEFAULT_SETTLE_SECONDS = 60
+
+VERIFY_SQL = """
+    WITH expected AS (
+        SELECT user_id, kind, condition, aircraft_type_id,
+               max(flight_date) FILTER (WHERE extension = 'full') AS last_date,
+               max(flight_date) FILTER (WHERE extension = 'control') AS last_control_date
+        FROM flight_break_contributions
+        GROUP BY 1, 2, 3, 4
+    ), actual AS (
+        SELECT user_id, 'mu' AS kind, mu_condition AS condition, aircraft_type_id, last_date, last_control_date
+        FROM mu_break_dates
+        UNION ALL
+        SELECT user_id, 'lp', lp_type, aircraft_type_id, last_date, last_control_date FROM lp_break_dates
+    )
+    SELECT COALESCE(e.user_id, a.user_id)::text, COALESCE(e.kind, a.kind), COALESCE(e.condition, a.condition),
+           COALESCE(e.aircraft_type_id, a.aircraft_type_id)::text,
+           e.last_date, e.last_control_date, a.last_date, a.last_control_date
+    FROM expected e
+    FULL JOIN actual a
+      ON a.user_id = e.user_id AND a.kind = e.kind AND a.condition = e.condition
+     AND a.aircraft_type_id IS NOT DISTINCT FROM e.aircraft_type_id
+    WHERE (e.last_date, e.last_control_date) IS DISTINCT FROM (a.last_date, a.last_control_date)
+      AND (e.user_id IS NOT NULL OR a.last_date IS NOT NULL OR a.last_control_date IS NOT NULL)
+"""
+
+
+def _apply(cur, flight_ids):
+    keys = 0
+    for i in range(0, len(flight_ids), CHUNK):
+        cur.execute("SELECT fn_apply_flight_breaks(%s::uuid[])", (flight_ids[i:i + CHUNK],))
+        keys += cur.fetchone()[0]
+    return keys
+
+
+def sync(conn, settle_seconds=DEFAULT_SETTLE_SECONDS):
+    """Apply all settled changes since the last run. Returns (flights, keys)."""
+    return sync_changes(conn, 'break_sync_state', _apply, settle_seconds)
+
+
+def verify(conn):
+    """Break rows that differ from their contributions: [(user, kind, condition, aircraft, expected, actual)]."""
+    with conn, conn.cursor() as cur:
+        cur.execute(VERIFY_SQL)
+        return [(user, kind, cond, aircraft, (e_last, e_control), (a_last, a_control))
+                for user, kind, cond, aircraft, e_last, e_control, a_last, a_control in cur.fetchall()]
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Keep break dates in step with flights")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_sync = sub.add_parser('sync', help="apply changes since the last run")
+    p_sync.add_argument('--every', type=int, help="repeat every N seconds")
+    p_sync.add_argument('--settle', type=int, default=DEFAULT_SETTLE_SECONDS)
+    sub.add_parser('verify', help="compare break tables with flight contributions")
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        if args.command == 'verify':
+            diffs = verify(conn)
+            for user, kind, cond, aircraft, expected, actual in diffs[:50]:
+                print(f"  {user} {kind} {cond} {aircraft or '-'}: очікується {expected}, у таблиці {actual}")
+            print(f"Розбіжностей: {len(diffs)}")
+        else:
+            while True:
+                t0 = time.perf_counter()
+                flights, keys = sync(conn, args.settle)
+                print(f"{datetime.datetime.now():%H:%M:%S} {flights} flights, {keys} keys recomputed "
+                      f"in {(time.perf_counter() - t0) * 1000:.0f} ms")
+                if not args.every:
+                    break
+                time.sleep(args.every)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
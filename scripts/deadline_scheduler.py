@@ -0,0 +1,409 @@
+"""
+Deadline warning scheduler: notifications 15, 7, 3 and 1 days before a
+deadline and on the day it expires, without polling every deadline.
+
+check-deadlines runs once a day and warns once (at 15 days). This service
+keeps every pending threshold of every deadline_index row
+(supabase/migrations/2026101902_deadline_index.sql) in a day-granular timing
+wheel:
+
+  - arming a deadline puts one entry per future threshold into the bucket
+    of its fire day - O(1) per change (five dict appends); a threshold that
+    has already passed when a date changes fires the most urgent one at once
+  - a date change is a new deadline_index row (the old one is deleted);
+    cancel() only drops the key from the version map, stale entries are
+    skipped when their bucket comes up, and compact() rebuilds the wheel when they
+    pile up
+  - advancing a day pops one bucket, so each fired alert is O(1); buckets
+    are a dict keyed by day ordinal, so the horizon is unbounded without a
+    hierarchy of wheels
+
+The wheel is re-armed incrementally: updateLpBreakDateInSupabase,
+updateAnnualCheckDateInSupabase, updateCommissionDateInSupabase and the
+other date writers go through the deadline_index triggers, and
+2026101903_deadline_scheduler.sql NOTIFYs the service of every inserted or
+deleted row. deadline_scheduler_state is the checkpoint: the last day whose
+alerts were sent (written in the same transaction as the notifications) and
+the last change applied. After a restart, the most urgent threshold past
+the checkpoint day is sent for each deadline (the skipped ones are not
+sent late), and rows changed while the service was down are re-armed
+with catch-up.
+
+Alerts use the check-deadlines types and metadata (plus 'threshold') and
+go out through notification_fanout.fan_out() - deduplicated by key and
+collapsed into one digest per user per day - and advance
+deadline_index.notified_stage. check-deadlines claims the same keys in the
+notification_alerts ledger, so a 15-day warning or expiry notice is sent
+by one of the two services only, whichever runs first.
+
+Connection: SUPABASE_DB_URL (postgresql://...) from the environment.
+
+Usage:
+    python scripts/deadline_scheduler.py --bench 100000
+    python scripts/deadline_scheduler.py run
+    python scripts/deadline_scheduler.py run --once
+"""
+
+import argparse
+import collections
+import datetime
+import heapq
+import json
+import os
+import select
+import sys
+import time
+
+import numpy as np
+
+from notification_fanout import CHUNK, Alert, fan_out, prune
+
+THRESHOLDS = (15, 7, 3, 1, 0)   # days before expiry; 0 - expired
+NOTIFY_HOUR = 8                 # alerts for a day go out from 08:00
+CHANNEL = 'deadline_index'
+COMPACT_RATIO = 2               # rebuild when stale entries outnumber live ones this much
+
+TITLES = {
+    'mu': ('Термін МУ закінчується', 'Термін МУ закінчився'),
+    'lp': ('Термін ЛП закінчується', 'Термін ЛП закінчився'),
+    'commission': ('Термін комісії закінчується', 'Термін комісії закінчився'),
+    'check': ('Термін перевірки закінчується', 'Термін перевірки закінчився'),
+}
+
+Deadline = collections.namedtuple('Deadline', 'id user_id source subject_name aircraft_name expiry metadata')
+
+
+class DeadlineWheel:
+    """
+    Timing wheel with one bucket per day (date ordinals).
+
+    `day` is the last day already fired; arming only fills buckets after it.
+    Entries are (key, threshold, version); an entry is live while its version
+    is the key's current one.
+    """
+
+    def __init__(self, day):
+        self.day = day
+        self.buckets = collections.defaultdict(list)
+        self.due = []
+        self.versions = {}
+        self.entries = 0
+
+    def __len__(self):
+        return len(self.versions)
+
+    def arm(self, key, expiry, catch_up=True):
+        """(Re-)arm `key` for an expiry day ordinal; a passed threshold fires on the next advance if catch_up."""
+        version = self.versions.get(key, 0) + 1
+        self.versions[key] = version
+        left = expiry - self.day
+        passed = None
+        for threshold in THRESHOLDS:
+            if threshold < left:
+                self.buckets[expiry - threshold].append((key, threshold, version))
+                self.entries += 1
+            elif passed is None or threshold < passed:
+                passed = threshold
+        if catch_up and passed is not None:
+            self.due.append((key, passed, version))
+            self.entries += 1
+        if self.entries > COMPACT_RATIO * len(THRESHOLDS) * max(len(self.versions), 512):
+            self.compact()
+
+    def cancel(self, key):
+        """Forget `key`; its entries become stale."""
+        self.versions.pop(key, None)
+
+    def advance(self, day):
+        """
+        Fire everything up to `day` inclusive: [(fire day, key, threshold)].
+
+        A key fires once per advance, with its most urgent threshold: after
+        downtime the 15/7/3-day warnings of a deadline that is now one day
+        away are not all sent at once, only the 1-day one.
+        """
+        fired = {}
+        for key, threshold, version in self.due:
+            if self.versions.get(key) == version:
+                fired[key] = (max(self.day, day), threshold)
+        self.entries -= len(self.due)
+        self.due = []
+        for d in range(self.day + 1, day + 1):
+            bucket = self.buckets.pop(d, None)
+            if not bucket:
+                continue
+            self.entries -= len(bucket)
+            for key, threshold, version in bucket:
+                if self.versions.get(key) == version and threshold < fired.get(key, (d, threshold + 1))[1]:
+                    fired[key] = (d, threshold)
+        self.day = max(self.day, day)
+        return [(d, key, threshold) for key, (d, threshold) in fired.items()]
+
+    def compact(self):
+        """Drop stale entries from every bucket."""
+        live = 0
+        for d in list(self.buckets):
+            bucket = [e for e in self.buckets[d] if self.versions.get(e[0]) == e[2]]
+            if bucket:
+                self.buckets[d] = bucket
+                live += len(bucket)
+            else:
+                del self.buckets[d]
+        self.due = [e for e in self.due if self.versions.get(e[0]) == e[2]]
+        self.entries = live + len(self.due)
+
+
+# --- Database -----------------------------------------------------------------
+
+DEADLINE_COLUMNS = "id, user_id::text, source, subject_name, aircraft_name, expiry_date, metadata"
+
+LOAD_SQL = f"""
+    SELECT {DEADLINE_COLUMNS}, updated_at > %(last_change_at)s
+    FROM deadline_index
+    WHERE notified_stage < 2 AND (expiry_date > %(last_day)s OR updated_at > %(last_change_at)s)
+"""
+
+
+def connect(dsn=None):
+    import psycopg2
+    dsn = dsn or os.environ.get('SUPABASE_DB_URL')
+    if not dsn:
+        raise SystemExit("SUPABASE_DB_URL is not set")
+    return psycopg2.connect(dsn)
+
+
+def _deadline(row):
+    metadata = row[6] if isinstance(row[6], dict) else json.loads(row[6])
+    return Deadline(row[0], row[1], row[2], row[3], row[4], row[5], metadata)
+
+
+def alert_day(now=None):
+    """The last day whose alerts are due at `now` (today from NOTIFY_HOUR, else yesterday)."""
+    now = now or datetime.datetime.now()
+    day = now.date() if now.hour >= NOTIFY_HOUR else now.date() - datetime.timedelta(days=1)
+    return day.toordinal()
+
+
+def notification(deadline, threshold, day):
+    """(type, title, body, metadata) as check-deadlines words them."""
+    expired = threshold == 0
+    warning_title, expired_title = TITLES.get(deadline.source, TITLES['check'])
+    subject = deadline.subject_name + (f" ({deadline.aircraft_name})" if deadline.aircraft_name else '')
+    until = deadline.expiry.strftime('%d.%m.%Y')
+    if expired:
+        body = f"{subject} - термін закінчився {until}"
+    else:
+        body = f"{subject} - залишилось {deadline.expiry.toordinal() - day} дн. (до {until})"
+    metadata = dict(deadline.metadata, threshold=threshold)
+    return (f"{deadline.source}_{'expired' if expired else 'warning'}",
+            expired_title if expired else warning_title, body, metadata)
+
+
+def already_sent(threshold, notified_stage):
+    """
+    Whether check-deadlines has sent this alert already: it warns once, at
+    15 days (stage 1), and once on expiry (stage 2).
+    """
+    if threshold == 0:
+        return notified_stage >= 2
+    return threshold >= 15 and notified_stage >= 1
+
+
+class DeadlineScheduler:
+    """The wheel bound to deadline_index, notifications and the checkpoint."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.deadlines = {}
+        # LISTEN before loading, so no change falls between the two.
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {CHANNEL}")
+        conn.autocommit = False
+        with conn, conn.cursor() as cur:
+            cur.execute("SELECT last_day, last_change_at FROM deadline_scheduler_state WHERE id = 1")
+            last_day, self.last_change_at = cur.fetchone()
+            self.wheel = DeadlineWheel(last_day.toordinal())
+            cur.execute(LOAD_SQL, {'last_day': last_day, 'last_change_at': self.last_change_at})
+            for row in cur.fetchall():
+                self._arm(_deadline(row[:7]), catch_up=row[7])
+            cur.execute("SELECT now()")
+            self.last_change_at = cur.fetchone()[0]
+
+    def _arm(self, deadline, catch_up=True):
+        self.deadlines[deadline.id] = deadline
+        self.wheel.arm(deadline.id, deadline.expiry.toordinal(), catch_up=catch_up)
+
+    def _cancel(self, deadline_id):
+        self.deadlines.pop(deadline_id, None)
+        self.wheel.cancel(deadline_id)
+
+    def apply_changes(self, payloads):
+        """Re-arm for NOTIFY payloads ({'op': 'upsert'|'delete', 'id': ...})."""
+        upserts = set()
+        for payload in payloads:
+            change = json.loads(payload)
+            if change['op'] == 'delete':
+                self._cancel(change['id'])
+                upserts.discard(change['id'])
+            else:
+                upserts.add(change['id'])
+        if not upserts:
+            return 0
+        with self.conn, self.conn.cursor() as cur:
+            cur.execute(f"SELECT {DEADLINE_COLUMNS} FROM deadline_index WHERE id = ANY(%s)", (list(upserts),))
+            for row in cur.fetchall():
+                self._arm(_deadline(row))
+            cur.execute("SELECT now()")
+            self.last_change_at = cur.fetchone()[0]
+        return len(upserts)
+
+    def fire(self, day=None):
+        """
+        Send every alert up to `day` and move the checkpoint, in one transaction.
+
+        Alerts check-deadlines has already sent are skipped (already_sent);
+        the stages are read under lock when firing, since check-deadlines
+        may have run after the deadline was armed. After downtime each
+        deadline gets one alert, for its most urgent passed threshold
+        (DeadlineWheel.advance), counted from the day it is sent, and its
+        notified_stage moves past the thresholds skipped on the way.
+        Once a day the notification_alerts ledger is pruned (prune()).
+        """
+        day = day or alert_day()
+        if day <= self.wheel.day and not self.wheel.due:
+            return 0
+        day_changed = day > self.wheel.day
+        fired = [entry for entry in self.wheel.advance(day) if entry[1] in self.deadlines]
+        from psycopg2.extras import execute_values
+        with self.conn, self.conn.cursor() as cur:
+            cur.execute("SELECT id, notified_stage FROM deadline_index WHERE id = ANY(%s) FOR UPDATE",
+                        (list({deadline_id for _, deadline_id, _ in fired}),))
+            notified = dict(cur.fetchall())
+            alerts, stages = [], {}
+            for _, deadline_id, threshold in fired:
+                deadline = self.deadlines[deadline_id]
+                stage = 2 if threshold == 0 else 1
+                if threshold == 0:
+                    self._cancel(deadline_id)
+                if already_sent(threshold, notified.get(deadline_id, 0)):
+                    continue
+                alerts.append(Alert(deadline.user_id, *notification(deadline, threshold, self.wheel.day)))
+                stages[deadline_id] = max(stages.get(deadline_id, 0), stage)
+            sent, _, _ = fan_out(cur, alerts, datetime.date.fromordinal(self.wheel.day))
+            if day_changed:
+                prune(cur, datetime.date.fromordinal(self.wheel.day))
+            if stages:
+                execute_values(cur, "UPDATE deadline_index d SET notified_stage = GREATEST(d.notified_stage, v.stage) "
+                               "FROM (VALUES %s) AS v(id, stage) WHERE d.id = v.id",
+                               list(stages.items()), page_size=CHUNK)
+            cur.execute("UPDATE deadline_scheduler_state SET last_day = %s, last_change_at = %s, updated_at = now() "
+                        "WHERE id = 1", (datetime.date.fromordinal(self.wheel.day), self.last_change_at))
+        return sent
+
+    def run(self, once=False, poll_seconds=60):
+        """Apply deadline_index changes as they are NOTIFYed and fire alerts as days pass."""
+        while True:
+            self.conn.poll()
+            payloads = [n.payload for n in self.conn.notifies]
+            self.conn.notifies.clear()
+            changed = self.apply_changes(payloads)
+            sent = self.fire()
+            if changed or sent:
+                print(f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} re-armed {changed}, sent {sent}, "
+                      f"tracking {len(self.wheel)}")
+            if once:
+                return
+            select.select([self.conn], [], [], poll_seconds)
+
+
+# --- Benchmark ----------------------------------------------------------------
+
+def _heap_run(keys, expiry, changes, new_expiry, start, days):
+    """The same workload on a binary heap with lazy deletion (O(log n) per entry)."""
+    heap, versions = [], {}
+
+    def arm(key, exp, day, catch_up=True):
+        versions[key] = versions.get(key, 0) + 1
+        passed = [t for t in THRESHOLDS if exp - t <= day]
+        for threshold in THRESHOLDS:
+            if exp - threshold > day:
+                heapq.heappush(heap, (exp - threshold, key, threshold, versions[key]))
+        if catch_up and passed:
+            heapq.heappush(heap, (day, key, min(passed), versions[key]))
+
+    t0 = time.perf_counter()
+    for key, exp in zip(keys, expiry):
+        arm(key, exp, start, catch_up=False)
+    t1 = time.perf_counter()
+    for key, exp in zip(changes, new_expiry):
+        arm(key, exp, start)
+    t2 = time.perf_counter()
+    fired = 0
+    for day in range(start + 1, start + days + 1):
+        keys_fired = set()
+        while heap and heap[0][0] <= day:
+            _, key, _, version = heapq.heappop(heap)
+            if versions[key] == version:
+                keys_fired.add(key)
+        fired += len(keys_fired)
+    return t1 - t0, t2 - t1, time.perf_counter() - t2, fired
+
+
+def bench(pairs, changes=None, days=400, seed=3):
+    changes = changes if changes is not None else pairs // 10
+    rng = np.random.default_rng(seed)
+    start = datetime.date.today().toordinal()
+    keys = list(range(pairs))
+    expiry = (start + rng.integers(1, 365, pairs)).tolist()
+    changed = rng.choice(pairs, changes, replace=False).tolist()
+    new_expiry = (start + rng.integers(1, 365, changes)).tolist()
+
+    wheel = DeadlineWheel(start)
+    t0 = time.perf_counter()
+    for key, exp in zip(keys, expiry):
+        wheel.arm(key, exp, catch_up=False)
+    t1 = time.perf_counter()
+    for key, exp in zip(changed, new_expiry):
+        wheel.arm(key, exp)
+    t2 = time.perf_counter()
+    fired = 0
+    for day in range(start + 1, start + days + 1):
+        fired += len(wheel.advance(day))
+    t3 = time.perf_counter()
+    heap_load, heap_change, heap_fire, heap_fired = _heap_run(keys, expiry, changed, new_expiry, start, days)
+    assert fired == heap_fired, f"wheel fired {fired}, heap {heap_fired}"
+
+    print(f"{pairs} pilot-condition pairs, {changes} date changes, {days} days, {fired} alerts")
+    print(f"  {'':14} {'wheel':>10} {'heap':>10}")
+    print(f"  {'arm (per pair)':14} {(t1 - t0) / pairs * 1e6:8.2f}us {heap_load / pairs * 1e6:8.2f}us")
+    print(f"  {'re-arm':14} {(t2 - t1) / changes * 1e6:8.2f}us {heap_change / changes * 1e6:8.2f}us")
+    print(f"  {'per alert':14} {(t3 - t2) / fired * 1e6:8.2f}us {heap_fire / fired * 1e6:8.2f}us")
+    print(f"  daily scan of all pairs would touch {pairs * days} rows over the same period")
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Deadline warning scheduler")
+    parser.add_argument('--bench', type=int, metavar='PAIRS', help="benchmark on PAIRS simulated deadlines")
+    sub = parser.add_subparsers(dest='command')
+    run = sub.add_parser('run', help="listen for changes and send alerts")
+    run.add_argument('--once', action='store_true', help="apply pending changes, send due alerts and exit")
+    run.add_argument('--poll', type=int, default=60, help="seconds between day checks")
+    args = parser.parse_args()
+
+    if args.bench or args.command != 'run':
+        bench(args.bench or 100000)
+        return
+
+    conn = connect()
+    try:
+        scheduler = DeadlineScheduler(conn)
+        print(f"Tracking {len(scheduler.wheel)} deadlines from {datetime.date.fromordinal(scheduler.wheel.day)}")
+        scheduler.run(once=args.once, poll_seconds=args.poll)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Document alias resolution for guide questions.
+
+Users name the document they mean in many ways - "в КБП ВА", "у ВА",
+"КБП БА", "КБП-В", "по ПВП"... The `ask` prompt used to ask the model to drop
+fragments from other documents after retrieval. Here the aliases are compiled
+once into an Aho-Corasick automaton, so one pass over the question finds every
+document it names and retrieval can be restricted to those partitions.
+
+Matching works on normalize_alias() text (lowercase, '/', '.' and runs of
+whitespace folded to one space) and only accepts matches on word
+boundaries; overlapping matches resolve leftmost-longest. '-' is kept: the
+helicopter course is named only in its hyphenated or fused forms ("КБП-В",
+"КБПВ"), since "кбп в" is also "КБП" followed by the preposition "в".
+"""
+
+import re
+import sys
+from collections import deque
+
+# Document family -> title prefix used in `documents.title` / guide_retrieval,
+# and the alias forms that refer to it.
+DOCUMENT_ALIASES = {
+    'КБП ВА': {
+        'title_prefix': 'КБП ВА',
+        'aliases': ['кбп ва 2022', 'кбп ва', 'кбпва', 'ва'],
+    },
+    'КБП БА/РА': {
+        'title_prefix': 'КБП БА/РА',
+        'aliases': ['кбп ба/ра 2021', 'кбп ба/ра', 'кбп ба', 'кбп ра', 'ба/ра'],
+    },
+    'КБП-В': {
+        'title_prefix': 'КБП-В-2018',
+        'aliases': ['кбп-в-2018', 'кбп-в', 'кбпв-18', 'кбпв'],
+    },
+    'КЛПВ': {
+        'title_prefix': 'КЛПВ-24',
+        'aliases': ['клпв-24', 'клпв'],
+    },
+    'ПЛВР': {
+        'title_prefix': 'ПЛВР',
+        'aliases': ['плвр', 'положення про лвр', 'положення про льотно-випробувальну роботу'],
+    },
+    'ПВП ДАУ': {
+        'title_prefix': 'ПВП ДАУ',
+        'aliases': ['пвп дау', 'пвп', 'правила виконання польотів державної авіації'],
+    },
+}
+
+_FOLD_RE = re.compile(r'[\s/.]+')
+
+# Questions and the families they must resolve to (empty: none named).
+ALIAS_CASES = [
+    ("Які перерви на складний пілотаж в КБП ВА?", ['КБП ВА']),
+    ("Що каже КБП-В про висіння?", ['КБП-В']),
+    ("Вимоги КБП-В-2018 до висіння", ['КБП-В']),
+    ("Порівняй КБП БА та КЛПВ щодо групової злітаності", ['КБП БА/РА', 'КЛПВ']),
+    ("Які перерви по КБП в умовах ночі?", []),
+    ("Що сказано в КБП в розділі 3?", []),
+    ("Скільки триває відпустка?", []),
+]
+
+
+def normalize_alias(text):
+    """Fold case and separators so "КБП ВА", "кбп  ва" and "КБП / ВА" compare equal."""
+    return _FOLD_RE.sub(' ', text.lower()).strip()
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == '_'
+
+
+class AliasMatcher:
+    """Aho-Corasick automaton over every alias form of every document."""
+
+    def __init__(self, aliases=DOCUMENT_ALIASES):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]  # state -> [(pattern length, family)]
+        for family, cfg in aliases.items():
+            for alias in cfg['aliases']:
+                self._add(normalize_alias(alias), family)
+        self._link()
+
+    def _add(self, pattern, family):
+        state = 0
+        for ch in pattern:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = nxt
+        self.output[state].append((len(pattern), family))
+
+    def _link(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def find(self, text):
+        """Return [(start, end, family)] word-boundary matches, leftmost-longest."""
+        text = normalize_alias(text)
+        candidates = []
+        state = 0
+        for pos, ch in enumerate(text):
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            for length, family in self.output[state]:
+                start, end = pos - length + 1, pos + 1
+                if start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                if end < len(text) and _is_word_char(text[end]):
+                    continue
+                candidates.append((start, end, family))
+
+        candidates.sort(key=lambda m: (m[0], -(m[1] - m[0])))
+        matches = []
+        last_end = -1
+        for start, end, family in candidates:
+            if start >= last_end:
+                matches.append((start, end, family))
+                last_end = end
+        return matches
+
+    def families(self, text):
+        """Document families named in the text, in order of first mention."""
+        seen = []
+        for _, _, family in self.find(text):
+            if family not in seen:
+                seen.append(family)
+        return seen
+
+
+_default_matcher = None
+
+
+def default_matcher():
+    global _default_matcher
+    if _default_matcher is None:
+        _default_matcher = AliasMatcher()
+    return _default_matcher
+
+
+def resolve_documents(question, titles, matcher=None):
+    """
+    Map a question to the document titles it restricts search to.
+
+    Returns None when no document is named (search everything).
+    """
+    matcher = matcher or default_matcher()
+    families = matcher.families(question)
+    if not families:
+        return None
+    prefixes = [DOCUMENT_ALIASES[f]['title_prefix'] for f in families]
+    selected = [t for t in titles if any(t.startswith(p) for p in prefixes)]
+    return selected or None
+
+
+def check(matcher=None):
+    """ALIAS_CASES that resolve to the wrong families: [(question, expected, got)]."""
+    matcher = matcher or default_matcher()
+    return [(q, expected, matcher.families(q)) for q, expected in ALIAS_CASES if matcher.families(q) != expected]
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    if sys.argv[1:] == ['--check']:
+        failures = check()
+        for q, expected, got in failures:
+            print(f"FAIL {q}\n  expected {expected or 'усі документи'}, got {got or 'усі документи'}")
+        print(f"{len(ALIAS_CASES) - len(failures)}/{len(ALIAS_CASES)} alias cases pass")
+        sys.exit(1 if failures else 0)
+    samples = sys.argv[1:] or [
+        "Які перерви на складний пілотаж в КБП ВА?",
+        "а у ВА для 3 класу?",
+        "Що каже КБП-В про висіння?",
+        "Порівняй КБП БА та КЛПВ щодо групової злітаності",
+        "Норми нальоту за ПВП",
+        "Скільки триває відпустка?",
+    ]
+    matcher = default_matcher()
+    for q in samples:
+        print(f"{q}\n  -> {matcher.families(q) or 'усі документи'}")
+
+
+if __name__ == "__main__":
+    main()
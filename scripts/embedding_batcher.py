@@ -0,0 +1,340 @@
+"""
+Token-aware embedding batcher.
+
+generateEmbeddings() in ingest-docs.mjs sends fixed batches of 50 chunks one
+after another with a 500 ms sleep in between: batches of long chunks can hit
+the per-request token limit while batches of short ones waste requests. Here
+chunks are packed into requests by token budget, several requests run at once
+under token/request rate limits (token buckets), 429 and 5xx responses are
+retried with jittered exponential backoff (honouring Retry-After), and results
+come back in input order.
+
+Token counts use tiktoken when it is installed, otherwise a conservative
+estimate from the UTF-8 length (over-counting only makes batches smaller).
+
+main() starts a local fake embeddings server and compares the fixed-batch
+loop with the batcher in chunks/sec:
+
+    python scripts/embedding_batcher.py
+    python scripts/embedding_batcher.py --concurrency 8 --fail-rate 0.1
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+OPENAI_EMBEDDINGS_URL = "https://api.openai.com/v1/embeddings"
+MODEL = "text-embedding-3-small"
+
+# OpenAI limits for text-embedding-3-small.
+MAX_INPUT_TOKENS = 8191
+MAX_REQUEST_INPUTS = 2048
+MAX_REQUEST_TOKENS = 300_000
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_encoding = None
+
+
+def count_tokens(text):
+    """Token count of `text` (tiktoken if available, else an upper estimate)."""
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        return len(_encoding.encode(text))
+    # cl100k needs at least ~1 token per 3 UTF-8 bytes for Cyrillic and Latin.
+    return len(text.encode('utf-8')) // 3 + 1
+
+
+def pack_batches(token_counts, max_tokens=MAX_REQUEST_TOKENS // 4, max_inputs=MAX_REQUEST_INPUTS):
+    """
+    Split inputs into contiguous batches of at most `max_tokens` tokens and
+    `max_inputs` inputs. Returns [(start, end)] index ranges.
+    """
+    batches = []
+    start = 0
+    tokens = 0
+    for i, n in enumerate(token_counts):
+        if n > MAX_INPUT_TOKENS:
+            raise ValueError(f"input {i} has {n} tokens, model limit is {MAX_INPUT_TOKENS}")
+        if i > start and (tokens + n > max_tokens or i - start >= max_inputs):
+            batches.append((start, i))
+            start = i
+            tokens = 0
+        tokens += n
+    if start < len(token_counts):
+        batches.append((start, len(token_counts)))
+    return batches
+
+
+class TokenBucket:
+    """Async token bucket: `rate` units per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount):
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            self._refill()
+            while self.level < amount:
+                await asyncio.sleep((amount - self.level) / self.rate)
+                self._refill()
+            self.level -= amount
+
+
+class EmbeddingError(Exception):
+    pass
+
+
+class EmbeddingBatcher:
+    """
+    Embed many texts with concurrent, rate-limited, retried batch requests.
+
+    `tokens_per_minute` / `requests_per_minute` should match the account's
+    limits; the buckets start full, like OpenAI's.
+    """
+
+    def __init__(self, api_key, url=OPENAI_EMBEDDINGS_URL, model=MODEL, concurrency=4,
+                 tokens_per_minute=1_000_000, requests_per_minute=3000,
+                 max_batch_tokens=MAX_REQUEST_TOKENS // 4, max_batch_inputs=MAX_REQUEST_INPUTS,
+                 max_retries=6, base_delay=0.5, max_delay=30.0, timeout=60.0):
+        self.api_key = api_key
+        self.url = url
+        self.model = model
+        self.concurrency = concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_inputs = max_batch_inputs
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.stats = {'requests': 0, 'retries': 0, 'tokens': 0}
+
+    def _post(self, texts):
+        """Blocking HTTP call; returns (status, headers, body)."""
+        body = json.dumps({'model': self.model, 'input': texts}).encode('utf-8')
+        req = urllib.request.Request(self.url, data=body, method='POST', headers={
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json',
+        })
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as res:
+                return res.status, res.headers, res.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+
+    def _backoff(self, attempt, headers):
+        retry_after = headers.get('Retry-After') if headers else None
+        if retry_after:
+            try:
+                return min(self.max_delay, float(retry_after))
+            except ValueError:
+                pass
+        # Full jitter: spreads retries of concurrent requests apart.
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _embed_batch(self, texts, tokens, semaphore, token_bucket, request_bucket):
+        for attempt in range(self.max_retries + 1):
+            await request_bucket.acquire(1)
+            await token_bucket.acquire(tokens)
+            async with semaphore:
+                self.stats['requests'] += 1
+                try:
+                    status, headers, body = await asyncio.to_thread(self._post, texts)
+                except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+                    status, headers, body = None, None, str(e).encode('utf-8')
+
+            if status == 200:
+                data = json.loads(body)['data']
+                self.stats['tokens'] += tokens
+                return [d['embedding'] for d in sorted(data, key=lambda d: d['index'])]
+            if status is not None and status not in RETRY_STATUSES:
+                raise EmbeddingError(f"embeddings API error: {status} — {body[:500].decode('utf-8', 'replace')}")
+            if attempt == self.max_retries:
+                break
+            self.stats['retries'] += 1
+            await asyncio.sleep(self._backoff(attempt, headers))
+        raise EmbeddingError(f"embeddings API error after {self.max_retries} retries: {status}")
+
+    async def embed_async(self, texts, progress=None):
+        """Embeddings for `texts`, in the same order."""
+        token_counts = [count_tokens(t) for t in texts]
+        batches = pack_batches(token_counts, self.max_batch_tokens, self.max_batch_inputs)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        token_bucket = TokenBucket(self.tokens_per_minute / 60, self.tokens_per_minute)
+        request_bucket = TokenBucket(self.requests_per_minute / 60, self.requests_per_minute)
+        results = [None] * len(texts)
+        done = 0
+
+        async def run(start, end):
+            nonlocal done
+            vectors = await self._embed_batch(texts[start:end], sum(token_counts[start:end]),
+                                              semaphore, token_bucket, request_bucket)
+            results[start:end] = vectors
+            done += end - start
+            if progress:
+                progress(done, len(texts))
+
+        await asyncio.gather(*(run(start, end) for start, end in batches))
+        return results
+
+    def embed(self, texts, progress=None):
+        return asyncio.run(self.embed_async(texts, progress))
+
+
+# --- Fake server and benchmark ----------------------------------------------
+
+def fake_embedding(text, dims):
+    """Deterministic vector derived from the text, so order can be checked."""
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:4], 'little')
+    rng = random.Random(seed)
+    return [round(rng.uniform(-1, 1), 4) for _ in range(dims)]
+
+
+def start_fake_server(dims=16, base_latency=0.05, per_1k_tokens=0.004, fail_rate=0.0,
+                      max_request_tokens=MAX_REQUEST_TOKENS, max_parallel=None, seed=1):
+    """
+    Local stand-in for the embeddings endpoint, on a free port.
+
+    Latency grows with the request's tokens; `fail_rate` of requests get a
+    random 429/503, requests above `max_request_tokens` a 400, and more than
+    `max_parallel` concurrent requests a 429. Returns (server, url).
+    """
+    rng = random.Random(seed)
+    state = {'active': 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, payload, headers=()):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            texts = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['input']
+            tokens = sum(count_tokens(t) for t in texts)
+            with lock:
+                state['active'] += 1
+                busy = max_parallel is not None and state['active'] > max_parallel
+                failure = rng.random() < fail_rate
+            try:
+                if tokens > max_request_tokens:
+                    return self._reply(400, {'error': {'message': f'{tokens} tokens > {max_request_tokens}'}})
+                if busy:
+                    return self._reply(429, {'error': {'message': 'rate limited'}}, [('Retry-After', '0.2')])
+                if failure:
+                    return self._reply(rng.choice([429, 503]), {'error': {'message': 'try again'}})
+                time.sleep(base_latency + per_1k_tokens * tokens / 1000)
+                data = [{'index': i, 'embedding': fake_embedding(t, dims)} for i, t in enumerate(texts)]
+                self._reply(200, {'data': data, 'usage': {'total_tokens': tokens}})
+            finally:
+                with lock:
+                    state['active'] -= 1
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/v1/embeddings"
+
+
+def fixed_batches(texts, url, batch_size=50, pause=0.5):
+    """The current ingest-docs.mjs loop: fixed batches, sequential, sleep between."""
+    batcher = EmbeddingBatcher('test', url)
+    out = []
+    for i in range(0, len(texts), batch_size):
+        status, _, body = batcher._post(texts[i:i + batch_size])
+        if status != 200:
+            raise EmbeddingError(f"embeddings API error: {status}")
+        out.extend(d['embedding'] for d in sorted(json.loads(body)['data'], key=lambda d: d['index']))
+        if i + batch_size < len(texts):
+            time.sleep(pause)
+    return out
+
+
+def load_texts(max_chars=2000, overlap=300):
+    import guide_retrieval
+    return [c['text'] for c in guide_retrieval.build_chunks(guide_retrieval.load_documents(), max_chars, overlap)]
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Embedding batcher benchmark against a fake server")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--batch-tokens', type=int, default=MAX_REQUEST_TOKENS // 4)
+    parser.add_argument('--tpm', type=int, default=5_000_000, help="account tokens per minute limit")
+    parser.add_argument('--rpm', type=int, default=3000, help="requests per minute limit")
+    parser.add_argument('--fail-rate', type=float, default=0.05, help="share of requests the server fails")
+    parser.add_argument('--pause', type=float, default=0.5, help="sleep between fixed batches (s)")
+    args = parser.parse_args()
+
+    texts = load_texts()
+    tokens = sum(count_tokens(t) for t in texts)
+    print(f"{len(texts)} chunks, ~{tokens} tokens (tiktoken: {'yes' if tiktoken else 'no'})")
+    expected = [fake_embedding(t, 16) for t in texts]
+
+    server, url = start_fake_server()
+    try:
+        t0 = time.perf_counter()
+        result = fixed_batches(texts, url, pause=args.pause)
+        elapsed = time.perf_counter() - t0
+        assert result == expected
+        print(f"  fixed batches of 50: {len(texts) / elapsed:8.1f} chunks/s "
+              f"({math.ceil(len(texts) / 50)} requests, {elapsed:.2f} s)")
+    finally:
+        server.shutdown()
+
+    server, url = start_fake_server(fail_rate=args.fail_rate, max_parallel=args.concurrency)
+    try:
+        batcher = EmbeddingBatcher(os.environ.get('OPENAI_API_KEY', 'test'), url,
+                                   concurrency=args.concurrency, tokens_per_minute=args.tpm,
+                                   requests_per_minute=args.rpm, max_batch_tokens=args.batch_tokens,
+                                   base_delay=0.1)
+        t0 = time.perf_counter()
+        result = batcher.embed(texts)
+        elapsed = time.perf_counter() - t0
+        assert result == expected, "batcher returned vectors out of order"
+        print(f"  token-aware batcher: {len(texts) / elapsed:8.1f} chunks/s "
+              f"({batcher.stats['requests']} requests, {batcher.stats['retries']} retries, "
+              f"{elapsed:.2f} s, fail rate {args.fail_rate:.0%})")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Compact storage formats for document_chunks embeddings.
+
+ingest-docs.mjs stores every text-embedding-3-small vector (1536 dims) as a
+JSON.stringify'd array - roughly 30 KB of text per chunk that has to be sent,
+stored and parsed again on every load. This module encodes the same vectors in
+one of several compact formats and measures how much retrieval quality is lost:
+
+  float32  - reference, 4 bytes per dimension
+  float16  - 2 bytes per dimension (2x smaller than float32)
+  int8     - 1 byte per dimension + one float32 scale per vector (~4x)
+  pcaN     - project onto the top N principal components first, then store
+             as int8 (e.g. pca768 is ~8x smaller than float32)
+
+Packed rows are base64 strings, so they fit into a text/bytea column and a
+PostgREST response without a schema change on the client side.
+
+Usage:
+    python scripts/embedding_quant.py --embeddings chunks.json [--queries questions.json]
+    python scripts/embedding_quant.py --synthetic 5000
+"""
+
+import argparse
+import base64
+import json
+import struct
+import sys
+
+import numpy as np
+
+DIMS = 1536
+FORMATS = ['float32', 'float16', 'int8', 'pca768', 'pca384']
+
+_FORMAT_CODES = {'float32': 0, 'float16': 1, 'int8': 2}
+
+
+def normalize(vectors):
+    """L2-normalize rows so that inner product equals cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def parse_format(fmt):
+    """Split a format name into (storage dtype, PCA dims or None)."""
+    if fmt.startswith('pca'):
+        return 'int8', int(fmt[3:])
+    if fmt not in _FORMAT_CODES:
+        raise ValueError(f"Unknown embedding format: {fmt}")
+    return fmt, None
+
+
+# --- PCA ---
+
+def fit_pca(vectors, dims):
+    """Fit a PCA projection (mean + top `dims` components) on the corpus."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    mean = vectors.mean(axis=0)
+    # Components come from the covariance eigenvectors; cheaper than a full
+    # SVD of the data matrix when there are more chunks than dimensions.
+    centered = vectors - mean
+    cov = centered.T @ centered
+    eigvals, eigvecs = np.linalg.eigh(cov)
+    order = np.argsort(eigvals)[::-1][:dims]
+    components = eigvecs[:, order].T.astype(np.float32)
+    return {'mean': mean.astype(np.float32), 'components': components}
+
+
+def project(vectors, pca):
+    """Project vectors onto the PCA subspace (centered by the corpus mean)."""
+    return (np.asarray(vectors, dtype=np.float32) - pca['mean']) @ pca['components'].T
+
+
+# --- Encoding ---
+
+def quantize_int8(vectors):
+    """Symmetric per-vector int8 quantization: x ~= codes * scale."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def encode(vectors, fmt, pca=None):
+    """
+    Encode a matrix of (normalized) embeddings into an index payload.
+
+    The payload is a dict holding only the compact arrays, so its memory use
+    is what the index would actually keep resident.
+    """
+    dtype, pca_dims = parse_format(fmt)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if pca_dims:
+        if pca is None:
+            pca = fit_pca(vectors, pca_dims)
+        vectors = project(vectors, pca)
+
+    index = {'format': fmt, 'pca': pca}
+    if dtype == 'float32':
+        index['data'] = vectors.astype(np.float32)
+    elif dtype == 'float16':
+        index['data'] = vectors.astype(np.float16)
+    else:
+        index['data'], index['scales'] = quantize_int8(vectors)
+    return index
+
+
+def decode(index):
+    """Reconstruct float32 vectors (in the stored space) from an index payload."""
+    data = index['data'].astype(np.float32)
+    if 'scales' in index:
+        data *= index['scales'][:, None]
+    return data
+
+
+def index_nbytes(index):
+    """Resident bytes of the stored vectors (PCA basis excluded - it is shared)."""
+    total = index['data'].nbytes
+    if 'scales' in index:
+        total += index['scales'].nbytes
+    return total
+
+
+def score(index, queries, block=4096):
+    """
+    Inner-product scores of float32 queries against an encoded index.
+
+    Stored vectors are widened block by block so the full float32 matrix is
+    never materialized.
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    if index['pca'] is not None:
+        queries = project(queries, index['pca'])
+
+    data = index['data']
+    scales = index.get('scales')
+    scores = np.empty((queries.shape[0], data.shape[0]), dtype=np.float32)
+    for start in range(0, data.shape[0], block):
+        part = data[start:start + block].astype(np.float32)
+        if scales is not None:
+            part *= scales[start:start + block, None]
+        scores[:, start:start + block] = queries @ part.T
+    return scores
+
+
+def top_k(scores, k):
+    """Row-wise indices of the k highest scores, best first."""
+    scores = np.atleast_2d(scores)
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def search(index, queries, k=10):
+    """Top-k inner-product search over an encoded index."""
+    return top_k(score(index, queries), k)
+
+
+# --- Row packing (for the document_chunks column) ---
+
+def pack_row(vector, fmt):
+    """Pack one vector as a base64 string: 1 format byte + payload."""
+    dtype, pca_dims = parse_format(fmt)
+    if pca_dims:
+        raise ValueError("PCA rows must be projected first and packed as int8")
+    vector = np.asarray(vector, dtype=np.float32)
+    header = struct.pack('<B', _FORMAT_CODES[dtype])
+    if dtype == 'float32':
+        body = vector.tobytes()
+    elif dtype == 'float16':
+        body = vector.astype(np.float16).tobytes()
+    else:
+        codes, scales = quantize_int8(vector[None, :])
+        body = struct.pack('<f', float(scales[0])) + codes[0].tobytes()
+    return base64.b64encode(header + body).decode('ascii')
+
+
+def unpack_row(packed):
+    """Inverse of pack_row(); returns a float32 vector."""
+    raw = base64.b64decode(packed)
+    code = raw[0]
+    if code == _FORMAT_CODES['float32']:
+        return np.frombuffer(raw, dtype=np.float32, offset=1).copy()
+    if code == _FORMAT_CODES['float16']:
+        return np.frombuffer(raw, dtype=np.float16, offset=1).astype(np.float32)
+    if code == _FORMAT_CODES['int8']:
+        (scale,) = struct.unpack_from('<f', raw, 1)
+        return np.frombuffer(raw, dtype=np.int8, offset=5).astype(np.float32) * scale
+    raise ValueError(f"Unknown packed embedding format code: {code}")
+
+
+# --- Evaluation ---
+
+def recall_at_k(exact_ids, approx_ids):
+    """Mean fraction of the exact top-k found in the approximate top-k."""
+    hits = [len(set(e) & set(a)) / len(e) for e, a in zip(exact_ids, approx_ids)]
+    return float(np.mean(hits)) if hits else 0.0
+
+
+def json_row_bytes(vectors, sample=50):
+    """Average size of the current JSON.stringify storage, measured on a sample."""
+    rows = vectors[:sample]
+    return float(np.mean([len(json.dumps([float(x) for x in row], separators=(',', ':'))) for row in rows]))
+
+
+def compare_formats(base, queries, formats=FORMATS, k=10):
+    """Measure storage size and recall@k of each format against float32 search."""
+    base = normalize(base)
+    queries = normalize(queries)
+    exact = search(encode(base, 'float32'), queries, k)
+    float32_bytes = base.shape[1] * 4
+
+    results = []
+    for fmt in formats:
+        index = encode(base, fmt)
+        approx = search(index, queries, k)
+        per_vector = index_nbytes(index) / base.shape[0]
+        results.append({
+            'format': fmt,
+            'bytes_per_vector': round(per_vector, 1),
+            'compression_vs_float32': round(float32_bytes / per_vector, 2),
+            f'recall@{k}': round(recall_at_k(exact, approx), 4),
+        })
+    return results
+
+
+def load_embeddings(path):
+    """
+    Load embeddings from .npy or JSON.
+
+    JSON may be a list of vectors, or a list of document_chunks rows whose
+    `embedding` field is either a list or the JSON string ingest-docs.mjs writes.
+    """
+    if path.endswith('.npy'):
+        return np.load(path).astype(np.float32)
+    with open(path, 'r', encoding='utf-8') as f:
+        rows = json.load(f)
+    vectors = []
+    for row in rows:
+        if isinstance(row, dict):
+            row = row.get('embedding')
+            if isinstance(row, str):
+                row = json.loads(row)
+        vectors.append(row)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def synthetic_corpus(n, dims=DIMS, topics=64, seed=0):
+    """Clustered random vectors that roughly mimic topical chunk embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(topics, dims)).astype(np.float32)
+    labels = rng.integers(0, topics, size=n)
+    return normalize(centers[labels] + 0.6 * rng.normal(size=(n, dims)).astype(np.float32))
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Compare compact embedding formats against float32")
+    parser.add_argument('--embeddings', help=".npy or JSON export of document_chunks embeddings")
+    parser.add_argument('--queries', help=".npy or JSON with question embeddings")
+    parser.add_argument('--synthetic', type=int, default=0, help="use N synthetic vectors instead of a file")
+    parser.add_argument('--formats', default=','.join(FORMATS))
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help="print machine-readable results")
+    args = parser.parse_args()
+
+    if args.embeddings:
+        base = load_embeddings(args.embeddings)
+    elif args.synthetic:
+        base = synthetic_corpus(args.synthetic)
+    else:
+        parser.error("pass --embeddings or --synthetic")
+
+    if args.queries:
+        queries = load_embeddings(args.queries)
+    else:
+        # No question set - perturbed corpus vectors stand in for questions.
+        rng = np.random.default_rng(1)
+        picks = rng.choice(base.shape[0], size=min(200, base.shape[0]), replace=False)
+        queries = base[picks] + 0.05 * rng.normal(size=(len(picks), base.shape[1])).astype(np.float32)
+
+    formats = [f.strip() for f in args.formats.split(',') if f.strip()]
+    results = compare_formats(base, queries, formats, args.k)
+
+    if args.json:
+        print(json.dumps({'vectors': int(base.shape[0]), 'queries': int(len(queries)),
+                          'json_bytes_per_vector': json_row_bytes(normalize(base)),
+                          'results': results}, ensure_ascii=False, indent=2))
+        return
+
+    print(f"Vectors: {base.shape[0]} x {base.shape[1]}, queries: {len(queries)}")
+    print(f"Current JSON text storage: ~{json_row_bytes(normalize(base)):.0f} bytes per vector")
+    print(f"\n{'format':<10} {'bytes/vec':>10} {'vs f32':>8} {'recall@' + str(args.k):>10}")
+    for r in results:
+        print(f"{r['format']:<10} {r['bytes_per_vector']:>10.0f} {r['compression_vs_float32']:>7.2f}x "
+              f"{r[f'recall@{args.k}']:>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Vectorized flight-time aggregation - the Підсумки sheet and the app's
+FlightSummary categories, for every pilot and aircraft type at once.
+
+Flights are loaded into a DataFrame with integer-minute durations (parseMin
+semantics: "HH:MM:SS" -> minutes, seconds dropped). Every report is one
+groupby over masked value columns:
+
+  sheet_summary()    - the Підсумки columns per (pilot,) aircraft type:
+                       period flights/minutes/combat, since-year-start
+                       flights/minutes/combat and test flights (with МЛВ)
+  category_summary() - FlightSummary.categorize(): control / training /
+                       crew / test counts and minutes, split day/night
+
+verify_workbook() rebuilds Підсумки from the Main sheet (period dates from
+D4/E4, year from the group label, columns found by header_schema) and
+compares it cell by cell. The year columns add opening balances typed into
+the formulas ("=SUMIFS(...)+112"); they are read from the formulas. A
+mismatch in a cell whose formula deviates from the rest of its column is
+reported as a workbook error, anything else as an engine error.
+
+Usage:
+    python scripts/flight_aggregates.py              # verify against the workbook
+    python scripts/flight_aggregates.py --bench 60000
+"""
+
+import argparse
+import re
+import sys
+import time
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from openpyxl.utils import get_column_letter
+
+import aviation_time
+import flight_log_import
+import header_schema
+
+WORKBOOK = header_schema.WORKBOOK
+
+# Flight types the Підсумки formulas count as test flights, and МЛВ among them.
+TEST_FLIGHT_TYPES = ('Випробувальний', 'За методиками')
+MLV_FLIGHT_TYPE = 'За методиками'
+
+CATEGORIES = ('control', 'training', 'crew', 'test')
+
+# Підсумки metric -> (metric label, group label, subgroup label) for header_schema.find().
+SHEET_COLUMNS = {
+    'period_flights': ('польотів', 'в період', ''),
+    'period_minutes': ('наліт', 'в період', ''),
+    'period_combat': ('бой заст', 'в період', ''),
+    'year_flights': ('польотів', 'з початку', ''),
+    'year_minutes': ('наліт', 'з початку', ''),
+    'year_combat': ('бой заст', 'з початку', ''),
+    'test_flights': ('польотів', 'з початку', 'випроб'),
+    'test_minutes': ('наліт', 'з початку', 'випроб'),
+    'mlv_flights': ('пол.млв', 'з початку', 'випроб'),
+    'mlv_minutes': ('наліт млв', 'з початку', 'випроб'),
+}
+MINUTE_METRICS = {m for m in SHEET_COLUMNS if m.endswith('_minutes')}
+
+
+def load_flights(records):
+    """
+    Flights DataFrame from flights-shaped dicts (flight_log_import records or
+    rows of the flights table).
+
+    Expects date, aircraft_type, flight_type, flight_time, flights_count,
+    combat_applications and optionally user_name, time_of_day, is_control
+    (any exercise of the flight has is_control).
+    """
+    df = pd.DataFrame.from_records(list(records))
+    out = pd.DataFrame({
+        'date': pd.to_datetime(df['date']),
+        'pilot': df.get('user_name', pd.Series(index=df.index, dtype=object)).fillna(''),
+        'aircraft_type': df['aircraft_type'].fillna(''),
+        'time_of_day': df.get('time_of_day', pd.Series(index=df.index, dtype=object)).fillna('Д'),
+        'flight_type': df['flight_type'].fillna(''),
+        'flights': pd.to_numeric(df['flights_count'], errors='coerce').fillna(0).astype(np.int32),
+        'minutes': aviation_time.parse_minutes(df['flight_time'].to_numpy()),
+        'combat': pd.to_numeric(df['combat_applications'], errors='coerce').fillna(0).astype(np.int32),
+        'is_control': df['is_control'].fillna(False).astype(bool) if 'is_control' in df else False,
+    })
+    for col in ('pilot', 'aircraft_type', 'time_of_day', 'flight_type'):
+        out[col] = out[col].astype('category')
+    return out
+
+
+def _between(dates, start, end):
+    mask = np.ones(len(dates), dtype=bool)
+    if start is not None:
+        mask &= (dates >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        mask &= (dates <= pd.Timestamp(end)).to_numpy()
+    return mask
+
+
+def sheet_summary(df, start, end, year_start, by=('aircraft_type',), opening=None):
+    """
+    Підсумки metrics grouped by `by` (aircraft_type, or pilot + aircraft_type).
+
+    Period = [start, end]; year = [year_start, end]. `opening` is an optional
+    DataFrame of opening balances indexed like the result (added to the year
+    and test columns).
+    """
+    period = _between(df['date'], start, end)
+    year = _between(df['date'], year_start, end)
+    flight_type = df['flight_type'].astype(str).to_numpy()
+    test = year & np.isin(flight_type, TEST_FLIGHT_TYPES)
+    mlv = year & (flight_type == MLV_FLIGHT_TYPE)
+    flights = df['flights'].to_numpy()
+    minutes = df['minutes'].to_numpy()
+    combat = df['combat'].to_numpy()
+
+    values = pd.DataFrame({
+        'period_flights': flights * period,
+        'period_minutes': minutes * period,
+        'period_combat': combat * period,
+        'year_flights': flights * year,
+        'year_minutes': minutes * year,
+        'year_combat': combat * year,
+        'test_flights': flights * test,
+        'test_minutes': minutes * test,
+        'mlv_flights': flights * mlv,
+        'mlv_minutes': minutes * mlv,
+    })
+    keys = [df[k] for k in by]
+    result = values.groupby(keys, observed=True).sum()
+    if opening is not None:
+        result = result.add(opening.reindex(columns=result.columns, fill_value=0), fill_value=0)
+    return result.astype(np.int64)
+
+
+def category_summary(df, start, end, by=('pilot', 'aircraft_type')):
+    """
+    FlightSummary.categorize() totals: (count, minutes) per category and
+    day/night, grouped by `by`. Like the app, a missing flights_count counts
+    as one flight.
+    """
+    period = _between(df['date'], start, end)
+    flight_type = df['flight_type'].astype(str).to_numpy()
+    category = np.select(
+        [flight_type == 'Випробувальний', flight_type == 'У складі екіпажу', df['is_control'].to_numpy()],
+        ['test', 'crew', 'control'], default='training')
+    night = (df['time_of_day'].astype(str).to_numpy() == 'Н')
+    part = np.where(night, 'night', 'day')
+
+    flights = np.where(df['flights'].to_numpy() > 0, df['flights'].to_numpy(), 1)
+    values = pd.DataFrame({'count': flights * period, 'minutes': df['minutes'].to_numpy() * period})
+    keys = [df[k] for k in by] + [pd.Series(part, name='part'), pd.Series(category, name='category')]
+    grouped = values.groupby(keys, observed=True).sum()
+    table = grouped.unstack(['part', 'category'], fill_value=0)
+    full = pd.MultiIndex.from_product([('count', 'minutes'), ('day', 'night'), CATEGORIES])
+    return table.reindex(columns=full, fill_value=0).astype(np.int64)
+
+
+# --- Verification against the workbook ---------------------------------------
+
+_TRAILING_CONST_RE = re.compile(r'\+\s*(\d+(?:\.\d+)?)\s*$')
+_YEAR_RE = re.compile(r'(\d{4})')
+
+
+def _formula_pattern(formula, row):
+    """Formula with its own row number and trailing constant removed."""
+    text = _TRAILING_CONST_RE.sub('', formula or '')
+    return re.sub(rf'(?<![\d:]){row}(?!\d)', '{r}', text)
+
+
+def read_summary_sheet(path=WORKBOOK, sheet=header_schema.SHEET):
+    """(schema, rows) where rows are (row number, type, values, formulas) per aircraft type."""
+    schema = header_schema.load_schema(path, sheet)
+    type_col = schema.find('тип пс')
+    width = len(schema.labels)
+    values_wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    formulas_wb = openpyxl.load_workbook(path, read_only=True)
+    try:
+        values = values_wb[sheet].iter_rows(min_row=schema.first_data_row, max_col=width, values_only=True)
+        formulas = formulas_wb[sheet].iter_rows(min_row=schema.first_data_row, max_col=width, values_only=True)
+        rows = []
+        for row_idx, (vals, forms) in enumerate(zip(values, formulas), start=schema.first_data_row):
+            if vals[type_col] is None:
+                break
+            rows.append((row_idx, str(vals[type_col]).strip(), vals, forms))
+    finally:
+        values_wb.close()
+        formulas_wb.close()
+    return schema, rows
+
+
+def opening_balances(schema, rows):
+    """Constants added to the year/test formulas, per aircraft type (minutes for times)."""
+    data = {}
+    for _, aircraft, _, forms in rows:
+        balances = {}
+        for metric, spec in SHEET_COLUMNS.items():
+            if metric.startswith('period_'):
+                continue
+            m = _TRAILING_CONST_RE.search(str(forms[schema.find(*spec)] or ''))
+            if m:
+                value = float(m.group(1))
+                if metric in MINUTE_METRICS:
+                    value *= aviation_time.MINUTES_PER_DAY
+                balances[metric] = round(value)
+        data[aircraft] = balances
+    return pd.DataFrame.from_dict(data, orient='index').fillna(0).rename_axis('aircraft_type')
+
+
+def verify_workbook(path=WORKBOOK, tolerance_minutes=1.0):
+    """
+    Rebuild Підсумки from Main and compare every metric cell.
+
+    Returns (mismatches, checked) where each mismatch is a dict with the cell,
+    both values and whether the cell's formula deviates from its column.
+    """
+    schema, rows = read_summary_sheet(path)
+    period_start, period_end = [pd.Timestamp(v) for v in schema.params['В період'][:2]]
+    year_label = schema.labels[schema.find('польотів', 'з початку', '')][0]
+    year_start = pd.Timestamp(int(_YEAR_RE.search(year_label).group(1)), 1, 1)
+
+    df = load_flights(flight_log_import.iter_flights(path))
+    opening = opening_balances(schema, rows)
+    report = sheet_summary(df, period_start, period_end, year_start, opening=opening)
+
+    mismatches = []
+    checked = 0
+    for metric, spec in SHEET_COLUMNS.items():
+        col = schema.find(*spec)
+        patterns = {}
+        for row_idx, _, _, forms in rows:
+            pattern = _formula_pattern(str(forms[col] or ''), row_idx)
+            patterns[pattern] = patterns.get(pattern, 0) + 1
+        usual = max(patterns, key=patterns.get)
+
+        for row_idx, aircraft, vals, forms in rows:
+            expected = report.at[aircraft, metric] if aircraft in report.index else 0
+            cell = vals[col]
+            if metric in MINUTE_METRICS:
+                actual = aviation_time.cell_minutes(cell)
+                ok = abs(actual - expected) <= tolerance_minutes
+            else:
+                actual = cell or 0
+                ok = actual == expected
+            checked += 1
+            if not ok:
+                mismatches.append({
+                    'cell': f"{get_column_letter(col + 1)}{row_idx}",
+                    'aircraft_type': aircraft,
+                    'metric': metric,
+                    'workbook': actual,
+                    'engine': int(expected),
+                    'formula': forms[col],
+                    'formula_deviates': _formula_pattern(str(forms[col] or ''), row_idx) != usual,
+                })
+    return mismatches, checked
+
+
+# --- Benchmark ---------------------------------------------------------------
+
+def synthetic_flights(n, pilots=40, seed=3):
+    """n flights spread over a year for a unit of `pilots` pilots."""
+    rng = np.random.default_rng(seed)
+    types = np.array(['Ми-8', 'Л-39', 'МіГ-29', 'Су-27', 'Су-24'])
+    kinds = np.array(['Учбово-тренув.', 'Бойовий', 'Випробувальний', 'За методиками', 'У складі екіпажу'])
+    minutes = rng.integers(10, 240, n)
+    return pd.DataFrame({
+        'date': pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 365, n), unit='D'),
+        'pilot': pd.Categorical(rng.integers(0, pilots, n).astype(str)),
+        'aircraft_type': pd.Categorical(types[rng.integers(0, len(types), n)]),
+        'time_of_day': pd.Categorical(np.where(rng.random(n) < 0.2, 'Н', 'Д')),
+        'flight_type': pd.Categorical(kinds[rng.integers(0, len(kinds), n)]),
+        'flights': rng.integers(1, 4, n).astype(np.int32),
+        'minutes': minutes.astype(np.int32),
+        'combat': rng.integers(0, 2, n).astype(np.int32),
+        'is_control': rng.random(n) < 0.1,
+    })
+
+
+def bench(n):
+    df = synthetic_flights(n)
+    t0 = time.perf_counter()
+    sheet = sheet_summary(df, '2025-12-01', '2025-12-31', '2025-01-01', by=('pilot', 'aircraft_type'))
+    t1 = time.perf_counter()
+    cats = category_summary(df, '2025-01-01', '2025-12-31')
+    t2 = time.perf_counter()
+    print(f"{n} flights, {df['pilot'].nunique()} pilots")
+    print(f"  sheet_summary    : {(t1 - t0) * 1000:7.1f} ms ({len(sheet)} pilot/type rows)")
+    print(f"  category_summary : {(t2 - t1) * 1000:7.1f} ms ({len(cats)} pilot/type rows)")
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Підсумки aggregation engine")
+    parser.add_argument('--workbook', default=WORKBOOK)
+    parser.add_argument('--bench', type=int, metavar='N', help="time reports over N synthetic flights")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args.bench)
+        return
+
+    mismatches, checked = verify_workbook(args.workbook)
+    engine_errors = [m for m in mismatches if not m['formula_deviates']]
+    print(f"Checked {checked} cells: {checked - len(mismatches)} match")
+    for m in mismatches:
+        kind = "workbook formula deviates" if m['formula_deviates'] else "ENGINE MISMATCH"
+        print(f"  {m['cell']} {m['aircraft_type']} {m['metric']}: workbook {m['workbook']}, "
+              f"engine {m['engine']} - {kind}\n      {m['formula']}")
+    if engine_errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+"""
+Columnar archive of closed flight years, with a small query layer.
+
+FlightSummary (last_year) and MyRecords reach multi-year history through the
+row-oriented flights table over PostgREST, pulling every column of every row.
+This exporter moves closed years into Parquet:
+
+    <root>/flights/year=2024/unit_id=<uuid>/part-0.parquet
+    <root>/flight_exercises/year=2024/unit_id=<uuid>/...
+    <root>/flight_crew/year=2024/unit_id=<uuid>/...
+
+  - partitioned by flight year and the pilot's unit (users.unit_id), so a
+    year-over-year query opens only the years/units it filters on
+  - columnar and zstd-compressed; flight_time is stored as int32 seconds and
+    repeated strings are dictionary-encoded, so a sum over flight time reads
+    one small column
+  - rows are streamed from a server-side cursor in batches, so exporting a
+    year does not load it into memory
+  - flights that have fuel_records are not archived: they stay online
+    after a purge, so a query over the archive plus the online tables
+    counts each flight once
+  - re-exporting a year replaces the year's directory (idempotent, and a
+    unit that no longer has flights leaves no stale partition), unless the
+    year has been purged (<root>/_purged/<year>)
+
+With --purge the exported year is deleted from the online tables after the
+archive's row counts have been checked against the database, in one
+transaction. Years inside the app's query window (APP_QUERY_YEARS: the
+current and the previous year) are never purged; older purged years are
+no longer shown by MyRecords or custom FlightSummary periods. The purged flights'
+flight_rollup_contributions rows are dropped first, so flight_rollups.py
+keeps the archived months in flight_monthly_rollups instead of subtracting
+them. Their flight_deletions rows are dropped in the same transaction, so
+break_sync.py keeps the break dates they contributed (an incremental
+flight_time_index.py refresh keeps them too; a full load covers the online
+flights only).
+
+The query layer (yearly_totals, year_over_year) uses pyarrow.dataset:
+partition filters prune directories, and only the requested columns are
+read.
+
+Connection: SUPABASE_DB_URL (postgresql://...) from the environment.
+
+Usage:
+    python scripts/flight_archive.py export --root archive --year 2024
+    python scripts/flight_archive.py export --root archive --year 2024 --purge
+    python scripts/flight_archive.py query --root archive --user <uuid>
+    python scripts/flight_archive.py bench --flights 2000000
+"""
+
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv
+import pyarrow.dataset as ds
+
+BATCH_ROWS = 50000
+# Years the app reads from flights over PostgREST: FlightSummary's "this
+# year" / "last year" periods. MyRecords and custom periods read the same
+# table with no archive path, so purging is limited to older years.
+APP_QUERY_YEARS = 2
+PARTITIONING = ds.partitioning(pa.schema([('year', pa.int16()), ('unit_id', pa.string())]), flavor='hive')
+
+FLIGHTS_SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('user_id', pa.string()),
+    ('date', pa.date32()),
+    ('aircraft_type_id', pa.string()),
+    ('time_of_day', pa.string()),
+    ('weather_conditions', pa.string()),
+    ('flight_type', pa.string()),
+    ('test_flight_topic', pa.string()),
+    ('document_source', pa.string()),
+    ('flight_seconds', pa.int32()),
+    ('flights_count', pa.int32()),
+    ('combat_applications', pa.int32()),
+    ('flight_purpose', pa.string()),
+    ('notes', pa.string()),
+    ('year', pa.int16()),
+    ('unit_id', pa.string()),
+])
+EXERCISES_SCHEMA = pa.schema([
+    ('flight_id', pa.string()),
+    ('exercise_id', pa.string()),
+    ('year', pa.int16()),
+    ('unit_id', pa.string()),
+])
+CREW_SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('flight_id', pa.string()),
+    ('role', pa.string()),
+    ('user_id', pa.string()),
+    ('custom_name', pa.string()),
+    ('year', pa.int16()),
+    ('unit_id', pa.string()),
+])
+
+# Archivable flights of one year with the pilot's unit; child tables join to
+# it. Flights with fuel_records stay online and are left out.
+_YEAR_FLIGHTS = """
+    SELECT f.*, u.unit_id AS pilot_unit_id
+    FROM flights f
+    LEFT JOIN users u ON u.id = f.user_id
+    WHERE f.date >= make_date(%(year)s, 1, 1) AND f.date < make_date(%(year)s + 1, 1, 1)
+      AND NOT EXISTS (SELECT 1 FROM fuel_records fr WHERE fr.flight_id = f.id)
+"""
+
+TABLES = {
+    'flights': (FLIGHTS_SCHEMA, f"""
+        WITH yf AS ({_YEAR_FLIGHTS})
+        SELECT id::text, user_id::text, date, aircraft_type_id::text, time_of_day, weather_conditions,
+               flight_type, test_flight_topic, document_source,
+               COALESCE(extract(epoch FROM flight_time), 0)::int, flights_count, combat_applications,
+               flight_purpose, notes, %(year)s, pilot_unit_id::text
+        FROM yf
+    """),
+    'flight_exercises': (EXERCISES_SCHEMA, f"""
+        WITH yf AS ({_YEAR_FLIGHTS})
+        SELECT fe.flight_id::text, fe.exercise_id::text, %(year)s, yf.pilot_unit_id::text
+        FROM flight_exercises fe JOIN yf ON yf.id = fe.flight_id
+    """),
+    'flight_crew': (CREW_SCHEMA, f"""
+        WITH yf AS ({_YEAR_FLIGHTS})
+        SELECT fc.id::text, fc.flight_id::text, fc.role, fc.user_id::text, fc.custom_name,
+               %(year)s, yf.pilot_unit_id::text
+        FROM flight_crew fc JOIN yf ON yf.id = fc.flight_id
+    """),
+}
+
+
+def write_partitions(root, table, schema, batches):
+    """Write record batches under root/table, replacing the partitions they touch."""
+    ds.write_dataset(
+        batches, os.path.join(root, table), schema=schema, format='parquet',
+        partitioning=PARTITIONING, existing_data_behavior='delete_matching',
+        file_options=ds.ParquetFileFormat().make_write_options(compression='zstd'),
+        max_rows_per_group=256 * 1024,
+    )
+
+
+def _cursor_batches(conn, name, sql, params, schema):
+    with conn.cursor(name=name) as cur:
+        cur.itersize = BATCH_ROWS
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(BATCH_ROWS)
+            if not rows:
+                break
+            columns = list(zip(*rows))
+            yield pa.RecordBatch.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema)
+
+
+def export_year(conn, root, year):
+    """Archive one year of flights, flight_exercises and flight_crew. Returns row counts."""
+    if os.path.exists(purged_marker(root, year)):
+        # Re-exporting would replace the archive with the flights left online.
+        raise RuntimeError(f"{year} was purged from the online tables - not re-exporting")
+    counts = {}
+    with conn:
+        for table, (schema, sql) in TABLES.items():
+            counted = [0]
+
+            def batches(table=table, schema=schema, sql=sql):
+                for batch in _cursor_batches(conn, f'archive_{table}', sql, {'year': year}, schema):
+                    counted[0] += batch.num_rows
+                    yield batch
+
+            # A unit with no flights left would keep its old partition.
+            shutil.rmtree(os.path.join(root, table, f'year={year}'), ignore_errors=True)
+            write_partitions(root, table, schema, batches())
+            counts[table] = counted[0]
+    return counts
+
+
+def purgeable(year, today=None):
+    """True if `year` is older than the years the app reads from flights."""
+    today = today or datetime.date.today()
+    return year <= today.year - APP_QUERY_YEARS
+
+
+def purged_marker(root, year):
+    return os.path.join(root, '_purged', str(year))
+
+
+def archived_count(root, table, year):
+    path = os.path.join(root, table)
+    if not os.path.isdir(path):
+        return 0
+    return ds.dataset(path, format='parquet', partitioning=PARTITIONING).count_rows(filter=ds.field('year') == year)
+
+
+def purge_year(conn, root, year):
+    """
+    Delete an archived year from the online tables.
+
+    Refuses years inside the app's query window (see purgeable) and unless
+    the archive holds as many rows as the database for every table. The purge marker is written before the commit, so a failed
+    commit can only block a re-export, never allow one over a purged year.
+    Returns the number of flights deleted.
+    """
+    if not purgeable(year):
+        raise RuntimeError(f"{year} is still read by the app (last {APP_QUERY_YEARS} years) - not purging")
+    with conn, conn.cursor() as cur:
+        for table, (_, sql) in TABLES.items():
+            cur.execute(f"SELECT count(*) FROM ({sql}) t", {'year': year})
+            online = cur.fetchone()[0]
+            archived = archived_count(root, table, year)
+            if online != archived:
+                raise RuntimeError(f"{table} {year}: {online} rows online, {archived} archived - not purging")
+
+        cur.execute(f"CREATE TEMP TABLE purge_ids ON COMMIT DROP AS SELECT id FROM ({_YEAR_FLIGHTS}) t",
+                    {'year': year})
+        cur.execute("DELETE FROM flight_rollup_contributions WHERE flight_id IN (SELECT id FROM purge_ids)")
+        cur.execute("DELETE FROM flight_exercises WHERE flight_id IN (SELECT id FROM purge_ids)")
+        cur.execute("DELETE FROM flight_crew WHERE flight_id IN (SELECT id FROM purge_ids)")
+        cur.execute("DELETE FROM flights WHERE id IN (SELECT id FROM purge_ids)")
+        deleted = cur.rowcount
+        cur.execute("DELETE FROM flight_deletions WHERE flight_id IN (SELECT id FROM purge_ids)")
+        os.makedirs(os.path.dirname(purged_marker(root, year)), exist_ok=True)
+        with open(purged_marker(root, year), 'w') as f:
+            f.write(f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} {deleted} flights\n")
+        return deleted
+
+
+# --- Query layer --------------------------------------------------------------
+
+def open_flights(root):
+    return ds.dataset(os.path.join(root, 'flights'), format='parquet', partitioning=PARTITIONING)
+
+
+def _filter(years=None, unit_ids=None, user_id=None):
+    expr = None
+    parts = []
+    if years is not None:
+        parts.append(ds.field('year').isin(list(years)))
+    if unit_ids is not None:
+        parts.append(ds.field('unit_id').isin(list(unit_ids)))
+    if user_id is not None:
+        parts.append(ds.field('user_id') == user_id)
+    for part in parts:
+        expr = part if expr is None else expr & part
+    return expr
+
+
+def yearly_totals(root, by=('year',), years=None, unit_ids=None, user_id=None):
+    """
+    Flights, landings (flights_count, empty = 1), minutes and combat
+    applications grouped by `by` (any flights columns, e.g. year, unit_id,
+    flight_type, time_of_day). Reads only the columns involved.
+    """
+    by = list(by)
+    columns = list(dict.fromkeys(by + ['flights_count', 'flight_seconds', 'combat_applications']))
+    table = open_flights(root).to_table(columns=columns, filter=_filter(years, unit_ids, user_id))
+    landings = pc.if_else(pc.greater(pc.fill_null(table['flights_count'], 0), 0), table['flights_count'], 1)
+    table = table.append_column('landings', landings)
+    result = table.group_by(by).aggregate([
+        ('landings', 'sum'), ('flight_seconds', 'sum'), ('combat_applications', 'sum'), ('landings', 'count'),
+    ])
+    df = result.to_pandas().rename(columns={
+        'landings_sum': 'landings', 'flight_seconds_sum': 'seconds',
+        'combat_applications_sum': 'combat', 'landings_count': 'records',
+    })
+    df['minutes'] = (df.pop('seconds') // 60).astype(np.int64)
+    return df.sort_values(by).reset_index(drop=True)
+
+
+def year_over_year(root, years=None, unit_ids=None, user_id=None):
+    """Per-year totals with the change against the previous year."""
+    df = yearly_totals(root, ('year',), years, unit_ids, user_id).set_index('year')
+    for col in ('landings', 'minutes'):
+        df[f'{col}_change'] = df[col].diff()
+    return df
+
+
+# --- Benchmark ----------------------------------------------------------------
+
+def synthetic_batches(n, years=8, units=12, pilots_per_unit=30, seed=11):
+    rng = np.random.default_rng(seed)
+    first_year = datetime.date.today().year - years
+    types = np.array(['Ми-8', 'Л-39', 'МіГ-29', 'Су-27', 'Су-24'])
+    kinds = np.array(['Учбово-тренув.', 'Бойовий', 'Випробувальний', 'За методиками', 'У складі екіпажу'])
+    for lo in range(0, n, BATCH_ROWS):
+        m = min(BATCH_ROWS, n - lo)
+        year = rng.integers(first_year, first_year + years, m)
+        day = rng.integers(0, 365, m)
+        unit = rng.integers(0, units, m)
+        pilot = unit * pilots_per_unit + rng.integers(0, pilots_per_unit, m)
+        date = (pd.to_datetime(year.astype(str), format='%Y') + pd.to_timedelta(day, unit='D')).date
+        arrays = [
+            pa.array([f'f{lo + i}' for i in range(m)]),
+            pa.array([f'user-{p}' for p in pilot]),
+            pa.array(date, type=pa.date32()),
+            pa.array(types[rng.integers(0, len(types), m)]),
+            pa.array(np.where(rng.random(m) < 0.2, 'Н', 'Д')),
+            pa.array(np.where(rng.random(m) < 0.7, 'СМУ', 'ПМУ')),
+            pa.array(kinds[rng.integers(0, len(kinds), m)]),
+            pa.nulls(m, pa.string()),
+            pa.array(np.where(rng.random(m) < 0.5, 'КБП ВА', 'КЛВ')),
+            pa.array(rng.integers(600, 14400, m).astype(np.int32)),
+            pa.array(rng.integers(1, 4, m).astype(np.int32)),
+            pa.array(rng.integers(0, 2, m).astype(np.int32)),
+            pa.array(np.where(rng.random(m) < 0.5, 'КК', 'ЛЧ')),
+            pa.array(np.where(rng.random(m) < 0.9, None, 'Примітка до польоту')),
+            pa.array(year.astype(np.int16)),
+            pa.array([f'unit-{u}' for u in unit]),
+        ]
+        yield pa.RecordBatch.from_arrays(arrays, schema=FLIGHTS_SCHEMA)
+
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def bench(n):
+    tmp = tempfile.mkdtemp()
+    try:
+        root = os.path.join(tmp, 'archive')
+        csv_path = os.path.join(tmp, 'flights.csv')
+        t0 = time.perf_counter()
+        write_partitions(root, 'flights', FLIGHTS_SCHEMA, synthetic_batches(n))
+        t_write = time.perf_counter() - t0
+        with pa.csv.CSVWriter(csv_path, FLIGHTS_SCHEMA) as writer:
+            for batch in synthetic_batches(n):
+                writer.write_batch(batch)
+
+        this_year = datetime.date.today().year
+        years = [this_year - 2, this_year - 1]
+        t0 = time.perf_counter()
+        archive = year_over_year(root, years=years, unit_ids=['unit-3'])
+        t_archive = time.perf_counter() - t0
+
+        # Row-oriented baseline: every column of every row, filtered afterwards.
+        t0 = time.perf_counter()
+        rows = pd.read_csv(csv_path)
+        rows = rows[rows['year'].isin(years) & (rows['unit_id'] == 'unit-3')]
+        rows = rows.assign(landings=rows['flights_count'].where(rows['flights_count'] > 0, 1))
+        scan = rows.groupby('year').agg(landings=('landings', 'sum'), seconds=('flight_seconds', 'sum'))
+        t_scan = time.perf_counter() - t0
+        assert (scan['landings'].to_numpy() == archive['landings'].to_numpy()).all()
+        assert ((scan['seconds'] // 60).to_numpy() == archive['minutes'].to_numpy()).all()
+
+        print(f"{n} flights, 8 years x 12 units")
+        print(f"  export             : {t_write:6.2f} s")
+        print(f"  size parquet / csv : {_dir_size(root) / 1e6:6.1f} MB / {os.path.getsize(csv_path) / 1e6:6.1f} MB")
+        print(f"  year-over-year     : {t_archive * 1000:8.1f} ms archive, {t_scan * 1000:8.1f} ms row scan")
+        print(archive.to_string())
+    finally:
+        shutil.rmtree(tmp)
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Columnar archive of closed flight years")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_export = sub.add_parser('export', help="archive a closed year")
+    p_export.add_argument('--root', required=True)
+    p_export.add_argument('--year', type=int, required=True)
+    p_export.add_argument('--purge', action='store_true', help="delete the year from the online tables")
+    p_query = sub.add_parser('query', help="year-over-year totals from the archive")
+    p_query.add_argument('--root', required=True)
+    p_query.add_argument('--user')
+    p_query.add_argument('--unit', action='append')
+    p_bench = sub.add_parser('bench', help="archive vs row scan on synthetic data")
+    p_bench.add_argument('--flights', type=int, default=1000000)
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        bench(args.flights)
+        return
+    if args.command == 'query':
+        print(year_over_year(args.root, unit_ids=args.unit, user_id=args.user).to_string())
+        return
+
+    if args.year >= datetime.date.today().year:
+        raise SystemExit(f"{args.year} is not closed yet")
+    if args.purge and not purgeable(args.year):
+        raise SystemExit(f"{args.year} is still read by the app (last {APP_QUERY_YEARS} years) - not purging")
+    import psycopg2
+    dsn = os.environ.get('SUPABASE_DB_URL')
+    if not dsn:
+        raise SystemExit("SUPABASE_DB_URL is not set")
+    conn = psycopg2.connect(dsn)
+    try:
+        counts = export_year(conn, args.root, args.year)
+        print(f"{args.year}: " + ', '.join(f"{t} {n}" for t, n in counts.items()))
+        if args.purge:
+            print(f"  purged {purge_year(conn, args.root, args.year)} flights from the online tables")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+Bulk back-fill of historical flights into flights, flight_exercises and
+flight_crew.
+
+Main.js resolves every reference with its own request: the aircraft type by
+name (.eq('name', typePs).single()), the pilot by name, the exercises by
+document. Back-filling paper logs that way costs several round trips per
+row. This importer:
+
+  - loads users, aircraft_types, user_aircraft and exercises once into hash
+    maps (ReferenceCache) and resolves every row locally
+  - matches pilots by full name and by "Surname I.I." (ambiguous keys are
+    reported, not guessed), aircraft types by name, exercises by (document,
+    number); the "(3)" in Main.js labels like "12(3)" is the flight within a
+    multi-flight exercise (ExercisePicker variants) and maps to the same id
+  - generates flight ids client-side, so flights and their children go out
+    in dependency order - flights, then flight_exercises and flight_crew of
+    the same chunk - with one multi-row INSERT per table per chunk, one
+    transaction per chunk
+  - skips rows already in flights (same pilot, date, aircraft type, flight
+    time and flights count), so an interrupted import can be rerun
+  - prints throughput for the resolve and insert phases
+
+Input records are flight_log_import records (the Облік нальоту Main sheet) or
+any dicts with the same fields, optionally with 'exercises' ("12, 14(2)" or a
+list) and 'crew' ([{'name': ..., 'role': ...}]). Unlike Main.js, crew members
+get flight_crew rows only; no separate crew flights are created for history.
+
+Connection: SUPABASE_DB_URL (postgresql://...) from the environment.
+
+Usage:
+    python scripts/flight_bulk_import.py --dry-run
+    python scripts/flight_bulk_import.py --workbook docs/Облік\\ нальоту.xlsx --chunk 1000
+"""
+
+import argparse
+import collections
+import os
+import re
+import sys
+import time
+import uuid
+
+import aviation_time
+import flight_log_import
+
+CHUNK_SIZE = 500
+# Fields a flight cannot be imported without; flight_log_import leaves a
+# field out of the record (and lists it in record['issues']) when its cell
+# cannot be parsed.
+REQUIRED_FIELDS = ('date', 'flight_time')
+
+_SPACE_RE = re.compile(r'\s+')
+_EXERCISE_REF_RE = re.compile(r'(\d+[а-яіїєґa-z]?)(?:\s*\((\d+)\))?', re.IGNORECASE)
+
+
+def normalize_name(name):
+    """Case, spacing and apostrophe variants folded: "Кошель  С. М." -> "кошель с.м."."""
+    text = str(name).replace('’', "'").replace('ʼ', "'").replace('`', "'").lower()
+    text = _SPACE_RE.sub(' ', text).strip()
+    return re.sub(r'\.\s+(?=\S\.)', '.', text)
+
+
+def name_keys(name):
+    """Lookup keys of a person: the full name and "surname initials"."""
+    norm = normalize_name(name)
+    keys = {norm}
+    parts = norm.replace('.', ' ').split()
+    if len(parts) >= 2:
+        keys.add(parts[0] + ' ' + ''.join(p[0] + '.' for p in parts[1:]))
+    return keys
+
+
+def parse_exercise_refs(value):
+    """"Впр. 12(3), 14" / ['12', 14] -> [('12', '3'), ('14', None)]."""
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        value = ', '.join(str(v) for v in value)
+    return [(m.group(1).lower(), m.group(2)) for m in _EXERCISE_REF_RE.finditer(str(value))]
+
+
+def _duration_key(value):
+    return aviation_time.to_seconds(value) if value else 0
+
+
+class ReferenceCache:
+    """Reference tables as in-memory maps, loaded with one query each."""
+
+    def __init__(self, users, aircraft_types, user_aircraft, exercises):
+        self.users = {}
+        for user_id, name in users:
+            if not name:
+                continue
+            for key in name_keys(name):
+                # Two people sharing a key make it unusable.
+                self.users[key] = user_id if self.users.get(key, user_id) == user_id else None
+        self.aircraft = {normalize_name(name): type_id for type_id, name in aircraft_types if name}
+        self.user_aircraft = set(user_aircraft)
+        self.exercises = {}
+        for ex_id, document, number in exercises:
+            self.exercises[(normalize_name(document or ''), str(number).strip().lower())] = ex_id
+
+    @classmethod
+    def load(cls, cur):
+        cur.execute("SELECT id::text, name FROM users")
+        users = cur.fetchall()
+        cur.execute("SELECT id::text, name FROM aircraft_types")
+        aircraft_types = cur.fetchall()
+        cur.execute("SELECT user_id::text, aircraft_type_id::text FROM user_aircraft")
+        user_aircraft = cur.fetchall()
+        cur.execute("SELECT id::text, document, number::text FROM exercises")
+        exercises = cur.fetchall()
+        return cls(users, aircraft_types, user_aircraft, exercises)
+
+    def user(self, name):
+        ids = {self.users.get(key) for key in name_keys(name)} - {None}
+        return ids.pop() if len(ids) == 1 else None
+
+    def aircraft_type(self, name):
+        return self.aircraft.get(normalize_name(name)) if name else None
+
+    def exercise(self, document, number):
+        return self.exercises.get((normalize_name(document or ''), number))
+
+
+def resolve(records, refs):
+    """
+    Records -> (flights rows, flight_exercises rows, flight_crew rows, issues).
+
+    Rows are tuples in the column order of the INSERT statements below; a
+    record missing a required field, or whose pilot or aircraft type cannot
+    be resolved, is skipped and listed in issues.
+    """
+    flights, exercises, crew, issues = [], [], [], []
+    for record in records:
+        where = f"row {record.get('source_row', '?')}"
+        missing = [field for field in REQUIRED_FIELDS if record.get(field) is None]
+        if missing:
+            detail = '; '.join(record.get('issues', ())) or 'empty'
+            issues.append(f"{where}: no {', '.join(missing)} ({detail}), skipped")
+            continue
+        user_id = refs.user(record.get('user_name') or '')
+        type_id = refs.aircraft_type(record.get('aircraft_type'))
+        if user_id is None:
+            issues.append(f"{where}: pilot {record.get('user_name')!r} not found or ambiguous")
+            continue
+        if type_id is None:
+            issues.append(f"{where}: aircraft type {record.get('aircraft_type')!r} not found")
+            continue
+        if refs.user_aircraft and (user_id, type_id) not in refs.user_aircraft:
+            issues.append(f"{where}: {record.get('user_name')} has no {record.get('aircraft_type')} "
+                          f"in user_aircraft (imported anyway)")
+
+        flight_id = str(uuid.uuid4())
+        flights.append((
+            flight_id, user_id, record['date'], type_id, record.get('time_of_day'),
+            record.get('weather_conditions'), record.get('flight_type'), record.get('test_flight_topic'),
+            record.get('document_source'), record['flight_time'],
+            record.get('flights_count') or 1, record.get('combat_applications') or 0,
+            record.get('flight_purpose'), record.get('notes'),
+        ))
+        ex_ids = []
+        for number, _ in parse_exercise_refs(record.get('exercises')):
+            ex_id = refs.exercise(record.get('document_source'), number)
+            if ex_id is None:
+                issues.append(f"{where}: exercise {number} of {record.get('document_source')!r} not found")
+            elif ex_id not in ex_ids:
+                ex_ids.append(ex_id)
+        exercises.extend((flight_id, ex_id) for ex_id in ex_ids)
+        for member in record.get('crew') or ():
+            member_id = refs.user(member['name'])
+            crew.append((flight_id, member_id, None if member_id else member['name'], member.get('role')))
+    return flights, exercises, crew, issues
+
+
+FLIGHT_COLUMNS = ('id', 'user_id', 'date', 'aircraft_type_id', 'time_of_day', 'weather_conditions',
+                  'flight_type', 'test_flight_topic', 'document_source', 'flight_time', 'flights_count',
+                  'combat_applications', 'flight_purpose', 'notes')
+
+
+def existing_keys(cur, flights):
+    """Signatures (with multiplicity) of flights already in the table for the pilots/dates being imported."""
+    if not flights:
+        return collections.Counter()
+    user_ids = sorted({f[1] for f in flights})
+    dates = [f[2] for f in flights]
+    cur.execute("""
+        SELECT user_id::text, date::text, aircraft_type_id::text, flight_time::text, flights_count
+        FROM flights
+        WHERE user_id = ANY(%s::uuid[]) AND date BETWEEN %s AND %s
+    """, (user_ids, min(dates), max(dates)))
+    return collections.Counter((u, d, a, _duration_key(t), c or 1) for u, d, a, t, c in cur.fetchall())
+
+
+def _flight_key(row):
+    return row[1], row[2], row[3], _duration_key(row[9]), row[10]
+
+
+def insert_chunks(conn, flights, exercises, crew, chunk=CHUNK_SIZE):
+    """Insert parents then children, chunk by chunk. Returns flights inserted."""
+    from psycopg2.extras import execute_values
+
+    children = {}
+    for row in exercises:
+        children.setdefault(row[0], ([], []))[0].append(row)
+    for row in crew:
+        children.setdefault(row[0], ([], []))[1].append(row)
+
+    inserted = 0
+    for lo in range(0, len(flights), chunk):
+        part = flights[lo:lo + chunk]
+        ex_rows = [r for f in part for r in children.get(f[0], ([], []))[0]]
+        crew_rows = [r for f in part for r in children.get(f[0], ([], []))[1]]
+        with conn, conn.cursor() as cur:
+            execute_values(cur, f"INSERT INTO flights ({', '.join(FLIGHT_COLUMNS)}) VALUES %s", part,
+                           template='(%s::uuid, %s::uuid, %s, %s::uuid, %s, %s, %s, %s, %s, %s::interval, '
+                                    '%s, %s, %s, %s)', page_size=chunk)
+            if ex_rows:
+                execute_values(cur, "INSERT INTO flight_exercises (flight_id, exercise_id) VALUES %s",
+                               ex_rows, page_size=len(ex_rows))
+            if crew_rows:
+                execute_values(cur, "INSERT INTO flight_crew (flight_id, user_id, custom_name, role) VALUES %s",
+                               crew_rows, template='(%s::uuid, %s::uuid, %s, %s)', page_size=len(crew_rows))
+        inserted += len(part)
+    return inserted
+
+
+def import_records(conn, records, chunk=CHUNK_SIZE, dry_run=False, skip_existing=True):
+    """Resolve and insert records; returns a stats dict with timings."""
+    records = list(records)
+    stats = {'records': len(records)}
+
+    t0 = time.perf_counter()
+    with conn, conn.cursor() as cur:
+        refs = ReferenceCache.load(cur)
+    stats['load_s'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    flights, exercises, crew, issues = resolve(records, refs)
+    if skip_existing:
+        with conn, conn.cursor() as cur:
+            seen = existing_keys(cur, flights)
+        keep = []
+        for f in flights:
+            # Two identical flights on one day are legitimate: skip only as
+            # many copies as the table already holds.
+            if seen[_flight_key(f)] > 0:
+                seen[_flight_key(f)] -= 1
+            else:
+                keep.append(f)
+        stats['already_present'] = len(flights) - len(keep)
+        kept_ids = {f[0] for f in keep}
+        flights = keep
+        exercises = [r for r in exercises if r[0] in kept_ids]
+        crew = [r for r in crew if r[0] in kept_ids]
+    stats['resolve_s'] = time.perf_counter() - t0
+    stats['issues'] = issues
+
+    t0 = time.perf_counter()
+    stats['inserted'] = 0 if dry_run else insert_chunks(conn, flights, exercises, crew, chunk)
+    stats['insert_s'] = time.perf_counter() - t0
+    stats['resolved'] = len(flights)
+    stats['exercises'] = len(exercises)
+    stats['crew'] = len(crew)
+    return stats
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Bulk import historical flights")
+    parser.add_argument('--workbook', default=flight_log_import.WORKBOOK)
+    parser.add_argument('--sheet', default=flight_log_import.SHEET)
+    parser.add_argument('--chunk', type=int, default=CHUNK_SIZE, help="flights per INSERT/transaction")
+    parser.add_argument('--dry-run', action='store_true', help="resolve only, insert nothing")
+    parser.add_argument('--no-skip-existing', action='store_true', help="insert rows already in flights")
+    args = parser.parse_args()
+
+    import psycopg2
+    dsn = os.environ.get('SUPABASE_DB_URL')
+    if not dsn:
+        raise SystemExit("SUPABASE_DB_URL is not set")
+    conn = psycopg2.connect(dsn)
+    try:
+        stats = import_records(conn, flight_log_import.iter_flights(args.workbook, args.sheet),
+                               args.chunk, args.dry_run, not args.no_skip_existing)
+    finally:
+        conn.close()
+
+    n = stats['records']
+    print(f"{n} records: {stats['resolved']} to insert, {stats.get('already_present', 0)} already present, "
+          f"{stats['exercises']} exercises, {stats['crew']} crew")
+    print(f"  reference load : {stats['load_s']:6.2f} s")
+    print(f"  resolve        : {stats['resolve_s']:6.2f} s  ({n / max(stats['resolve_s'], 1e-9):8.0f} rows/s)")
+    if not args.dry_run:
+        rate = stats['inserted'] / max(stats['insert_s'], 1e-9)
+        print(f"  insert         : {stats['insert_s']:6.2f} s  ({rate:8.0f} flights/s)")
+    for issue in stats['issues']:
+        print(f"  {issue}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Streaming importer for the "Main" sheet of the Облік нальоту workbook.
+
+read_excel.py / read_excel_detailed.py open the workbook in full mode and
+call sheet.cell(row, col) for every cell, which keeps the whole workbook in
+memory and is slow on multi-year logs. This importer:
+
+  - opens the workbook read-only and streams rows with
+    iter_rows(values_only=True), so memory does not grow with the log
+  - finds the header row once (the row with "Дата" and "ПІБ") and compiles
+    it into a list of (column index, converter) pairs
+  - turns each data row straight into a `flights`-shaped dict and yields
+    them in batches
+
+Records carry the flights columns (date, time_of_day, weather_conditions,
+flight_type, flight_time as "HH:MM:SS", flights_count, combat_applications,
+document_source, flight_purpose, notes) plus fields that still need
+resolving or have no flights column: user_name (ПІБ without rank), rank,
+aircraft_type (name), test_flights_count / test_flight_time (the
+"Наліт на випроб" pair) and source_row. Cells that cannot be converted are
+left out of the record and listed in record['issues'].
+
+Usage:
+    python scripts/flight_log_import.py
+    python scripts/flight_log_import.py --bench --scale 50
+"""
+
+import argparse
+import datetime
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import openpyxl
+from openpyxl.utils import get_column_letter
+
+from aviation_time import format_interval, to_seconds
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKBOOK = os.path.join(BASE_DIR, "docs", "Облік нальоту.xlsx")
+SHEET = "Main"
+
+HEADER_SCAN_ROWS = 20
+BATCH_SIZE = 500
+
+_RANK_RE = re.compile(r'^(\S*[-/.]\S*)\s+(.+)$')
+_DATE_RE = re.compile(r'^(\d{1,2})\.(\d{1,2})\.(\d{4})$')
+
+
+def to_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    m = _DATE_RE.match(str(value).strip())
+    if not m:
+        raise ValueError(f"bad date: {value!r}")
+    return datetime.date(int(m.group(3)), int(m.group(2)), int(m.group(1))).isoformat()
+
+
+def to_int(value):
+    if value is None or value == '':
+        return 0
+    return int(round(float(value)))
+
+
+def to_text(value):
+    if value is None:
+        return None
+    text = str(value).strip()
+    return text or None
+
+
+def split_rank(pib):
+    """"п/п-к Потапов В.І." -> ("п/п-к", "Потапов В.І.")."""
+    pib = to_text(pib)
+    if pib is None:
+        return None, None
+    m = _RANK_RE.match(pib)
+    return (m.group(1), m.group(2)) if m else (None, pib)
+
+
+def _pib(value, record):
+    record['rank'], record['user_name'] = split_rank(value)
+
+
+def _time_day_mu(value, record):
+    # "ДСМУ" -> time_of_day "Д", weather_conditions "СМУ" (as Main.js does)
+    value = to_text(value)
+    record['time_of_day'] = value[0] if value else None
+    record['weather_conditions'] = value[1:] if value else None
+
+
+def _field(name, convert):
+    def setter(value, record):
+        record[name] = convert(value)
+    return setter
+
+
+# Header label -> setters for the column(s) it covers. A label merged over
+# several columns ("Наліт на випроб" = count + time) lists one per column.
+HEADER_FIELDS = {
+    'дата': [_field('date', to_date)],
+    'піб': [_pib],
+    'тип пс': [_field('aircraft_type', to_text)],
+    'час доби му': [_time_day_mu],
+    'в якості кого': [_field('flight_purpose', to_text)],
+    '№ кбп': [_field('document_source', to_text)],
+    'вид пол.': [_field('flight_type', to_text)],
+    'польотів': [_field('flights_count', to_int)],
+    'наліт': [_field('flight_time', lambda v: format_interval(to_seconds(v)))],
+    'наліт на випроб': [_field('test_flights_count', to_int),
+                        _field('test_flight_time', lambda v: format_interval(to_seconds(v)))],
+    'бойових заст.': [_field('combat_applications', to_int)],
+    'примітки': [_field('notes', to_text)],
+}
+REQUIRED = ('дата', 'піб', 'тип пс', 'наліт')
+
+
+def _label(value):
+    return ' '.join(str(value).split()).lower() if value is not None else ''
+
+
+class SheetSchema:
+    """Header row of a flight-log sheet, compiled to (column, setter) pairs."""
+
+    def __init__(self, header_row, header):
+        self.header_row = header_row
+        self.columns = []
+        found = set()
+        for col, value in enumerate(header):
+            setters = HEADER_FIELDS.get(_label(value))
+            if not setters or _label(value) in found:
+                continue
+            found.add(_label(value))
+            for offset, setter in enumerate(setters):
+                self.columns.append((col + offset, setter))
+        missing = [label for label in REQUIRED if label not in found]
+        if missing:
+            raise ValueError(f"header row {header_row} lacks columns: {', '.join(missing)}")
+        self.date_col = next(col for col, value in enumerate(header) if _label(value) == 'дата')
+
+    @classmethod
+    def detect(cls, rows, start_row=1, scan=HEADER_SCAN_ROWS):
+        """Find the header among the first `scan` rows of an iterator."""
+        for row_idx, row in enumerate(rows, start=start_row):
+            labels = {_label(v) for v in row}
+            if 'дата' in labels and 'піб' in labels:
+                return cls(row_idx, row)
+            if row_idx - start_row + 1 >= scan:
+                break
+        raise ValueError(f"no header row (with 'Дата' and 'ПІБ') in the first {scan} rows")
+
+    def convert(self, row, row_idx):
+        """Data row -> record, or None for rows without a date (blank/total rows)."""
+        if len(row) <= self.date_col or row[self.date_col] is None:
+            return None
+        record = {'source_row': row_idx}
+        for col, setter in self.columns:
+            try:
+                setter(row[col] if col < len(row) else None, record)
+            except ValueError as e:
+                # Hand-kept logs have notes typed into numeric columns; keep
+                # the row and let the caller decide what to do with it.
+                record.setdefault('issues', []).append(f"{get_column_letter(col + 1)}{row_idx}: {e}")
+        return record
+
+
+def iter_flights(path=WORKBOOK, sheet=SHEET):
+    """Stream flights-shaped records from the sheet, one at a time."""
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb[sheet].iter_rows(values_only=True)
+        schema = SheetSchema.detect(rows)
+        for row_idx, row in enumerate(rows, start=schema.header_row + 1):
+            record = schema.convert(row, row_idx)
+            if record is not None:
+                yield record
+    finally:
+        wb.close()
+
+
+def iter_flight_batches(path=WORKBOOK, sheet=SHEET, batch_size=BATCH_SIZE):
+    """Stream records in lists of up to `batch_size` (for bulk inserts)."""
+    batch = []
+    for record in iter_flights(path, sheet):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# --- Benchmark ---------------------------------------------------------------
+
+def legacy_read(path=WORKBOOK, sheet=SHEET):
+    """The read_excel.py approach: full load, cell() per row and column."""
+    wb = openpyxl.load_workbook(path, data_only=True)
+    ws = wb[sheet]
+    rows = []
+    for row_idx in range(5, ws.max_row + 1):
+        values = [ws.cell(row=row_idx, column=col).value for col in range(1, ws.max_column + 1)]
+        if values[0] is not None:
+            rows.append(values)
+    wb.close()
+    return rows
+
+
+def write_scaled_copy(path, scale, sheet=SHEET):
+    """Write a workbook whose sheet repeats the source's data rows `scale` times."""
+    src = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    rows = list(src[sheet].iter_rows(values_only=True))
+    src.close()
+    header, data = rows[:4], [r for r in rows[4:] if r[0] is not None]
+
+    out = openpyxl.Workbook(write_only=True)
+    ws = out.create_sheet(sheet)
+    for row in header:
+        ws.append(row)
+    for _ in range(scale):
+        for row in data:
+            ws.append(row)
+    fd, tmp = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    out.save(tmp)
+    return tmp, len(data) * scale
+
+
+def _measure(fn):
+    """(result, seconds, peak traced bytes); timed without tracemalloc overhead."""
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def bench(path, scale):
+    tmp, n = write_scaled_copy(path, scale)
+    try:
+        print(f"{n} data rows ({scale}x the source sheet)")
+        count, elapsed, peak = _measure(lambda: sum(len(b) for b in iter_flight_batches(tmp)))
+        print(f"  streaming   : {count / elapsed:8.0f} rows/s  {elapsed:6.2f} s  peak {peak / 1e6:6.1f} MB")
+        rows, elapsed, peak = _measure(lambda: len(legacy_read(tmp)))
+        print(f"  cell() loop : {rows / elapsed:8.0f} rows/s  {elapsed:6.2f} s  peak {peak / 1e6:6.1f} MB")
+    finally:
+        os.remove(tmp)
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Stream flights out of the Облік нальоту workbook")
+    parser.add_argument('--workbook', default=WORKBOOK)
+    parser.add_argument('--sheet', default=SHEET)
+    parser.add_argument('--bench', action='store_true', help="compare with the cell() loop")
+    parser.add_argument('--scale', type=int, default=20, help="repeat the data rows N times for --bench")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args.workbook, args.scale)
+        return
+
+    total = 0
+    issues = []
+    for batch in iter_flight_batches(args.workbook, args.sheet):
+        if total == 0:
+            for record in batch[:3]:
+                print(record)
+        total += len(batch)
+        issues.extend(i for record in batch for i in record.get('issues', ()))
+    print(f"\n{total} flights, {len(issues)} cells skipped")
+    for issue in issues:
+        print(f"  {issue}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+"""
+Flight-time and rest norm compliance (ПВП ДАУ, розділ II, глава 5 "Норми
+нальоту і відпочинку льотного складу"), over the whole flights table or one
+pilot after an insert.
+
+The app records flights but never checks them against the norms. Flights
+carry a date, a flight_time interval and Д/Н, not take-off times, so the
+checks work on flight days (льотні зміни):
+
+  - flight time per rolling window, summed per pilot, against a table of
+    limits: Norm(name, days, aircraft minutes, helicopter minutes), the
+    helicopter limit applying when a helicopter was flown in the window.
+    There are no built-in limits - which ones apply (the daily, weekly and
+    monthly norms of the unit's KBP, or п. 3/п. 5 of the ПВП for ferry
+    flights) depends on the unit and the kind of flying, so the table is
+    passed in: --norm DAYS=HOURS[:HELICOPTER_HOURS], or `norms` of check()
+  - rest between consecutive shifts at least REST_HOURS (п. 12). A gap is
+    measured only when both shifts have actual times (first take-off, last
+    landing); flights has none, so for database rows a gap that could be
+    short at nominal SHIFT_HOURS (in practice a night shift followed by a
+    day shift) is reported as 'unverifiable' - to check against the flight
+    log - never as a violation
+  - a window at NEAR of its limit or more, and a measured rest gap within
+    REST_MARGIN hours of the minimum, is a near-violation
+
+Batch: flights are collapsed to (pilot, day) rows sorted by pilot and day;
+a window's sum is the difference of two prefix sums, and because the rows
+are sorted the window starts form a monotone sequence - the two-pointer
+walk - found for all rows at once with searchsorted. After an insert,
+check_pilot() walks only the pilot's days around the new flight with an
+explicit two-pointer loop.
+
+NVG limits (п. 9) are not checked: flights has no NVG column.
+
+Connection for --db: SUPABASE_DB_URL (postgresql://...) from the environment.
+
+Usage:
+    python scripts/flight_norms.py --bench 2000000
+    python scripts/flight_norms.py --db --norm 1=10:8 --norm 7=30 --norm 30=90
+    python scripts/flight_norms.py --db --norm 1=10:8 --user <uuid> --date 2026-10-19
+"""
+
+import argparse
+import bisect
+import collections
+import datetime
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import aviation_time
+
+Norm = collections.namedtuple('Norm', 'name days aircraft_minutes helicopter_minutes')
+
+NEAR = 0.9                                 # share of a limit that counts as a near-violation
+REST_HOURS = 12                            # п. 12: break after taking part in the previous shift
+REST_MARGIN = 2                            # rest gap this close to the minimum is a near-violation
+SHIFT_HOURS = {'Д': (8, 17), 'Н': (18, 27), 'ДН': (8, 27)}   # nominal shift start / end, hours from midnight
+BENCH_NORMS = ['1=10:8', '7=8', '30=30']    # illustrative limits for --bench only
+HELICOPTER_PREFIXES = ('Ми-', 'Мі-', 'Ка-')
+
+VIOLATION, NEAR_VIOLATION, UNVERIFIABLE = 'violation', 'near', 'unverifiable'
+REST_NORM = 'відпочинок між змінами'
+EPOCH = np.datetime64('1970-01-01', 'D')
+
+
+def is_helicopter(names):
+    names = pd.Series(names, dtype=object).fillna('').astype(str)
+    return names.str.startswith(HELICOPTER_PREFIXES).to_numpy()
+
+
+def flight_days(user_ids, dates, minutes, time_of_day, helicopter, takeoff=None, landing=None):
+    """
+    Collapse flights to one row per (pilot, day), sorted by pilot and day.
+
+    `takeoff` / `landing` are the flights' actual times in minutes since
+    1970 (NaN where unknown), if any are recorded. Returns a dict of arrays:
+    user (codes), users (code -> id), day (days since 1970), minutes,
+    helicopter (any that day), shift ('Д' / 'Н' / 'ДН'), and start / end -
+    the shift's first take-off and last landing, NaN unless every flight
+    of the day has both.
+    """
+    user, users = pd.factorize(pd.Series(user_ids, dtype=object).astype(str))
+    users = np.asarray(users, dtype=object)
+    day = (np.asarray(dates, dtype='datetime64[D]') - EPOCH).astype(np.int64)
+    night = np.asarray(pd.Series(time_of_day, dtype=object).fillna('Д').astype(str).to_numpy() == 'Н')
+    key = user.astype(np.int64) << 32 | (day - day.min() if len(day) else day)
+    keys, inverse = np.unique(key, return_inverse=True)
+    n = len(keys)
+    first = np.zeros(n, dtype=np.int64)
+    first[inverse[::-1]] = np.arange(len(key))[::-1]
+    has_night = np.bincount(inverse, night, minlength=n) > 0
+    has_day = np.bincount(inverse, ~night, minlength=n) > 0
+    start = end = np.full(n, np.nan)
+    if takeoff is not None:
+        takeoff, landing = np.asarray(takeoff, dtype=float), np.asarray(landing, dtype=float)
+        untimed = np.bincount(inverse, np.isnan(takeoff) | np.isnan(landing), minlength=n) > 0
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(inverse, minlength=n))[:-1]])
+        start = np.fmin.reduceat(takeoff[order], bounds) if n else start
+        end = np.fmax.reduceat(landing[order], bounds) if n else end
+        start[untimed] = end[untimed] = np.nan
+    return {
+        'user': user[first], 'users': users, 'day': day[first],
+        'minutes': np.bincount(inverse, np.asarray(minutes, dtype=np.int64), minlength=n).astype(np.int64),
+        'helicopter': np.bincount(inverse, np.asarray(helicopter, dtype=bool), minlength=n) > 0,
+        'shift': np.where(has_day & has_night, 'ДН', np.where(has_night, 'Н', 'Д')),
+        'start': start, 'end': end,
+    }
+
+
+def window_sums(days, norm):
+    """Per (pilot, day) row: start day, flight minutes and limit of the window ending that day."""
+    user, day = days['user'], days['day']
+    base = day.min() if len(day) else 0
+    span = day.max() - base + norm.days + 1 if len(day) else 1       # windows never reach the previous pilot
+    key = user.astype(np.int64) * span + (day - base)
+    left = np.searchsorted(key, key - (norm.days - 1), side='left')     # first row inside the window
+    minutes = np.concatenate([[0], np.cumsum(days['minutes'])])
+    heli = np.concatenate([[0], np.cumsum(days['helicopter'])])
+    total = minutes[1:] - minutes[left]
+    limit = np.where(heli[1:] - heli[left] > 0, norm.helicopter_minutes, norm.aircraft_minutes)
+    return day[left], total, limit
+
+
+def rest_gaps(days):
+    """
+    Hours of rest before each (pilot, day) row after the pilot's previous
+    shift (inf for the first), and whether it was measured.
+
+    A gap is measured when both shifts have actual times; otherwise it is
+    the gap between nominal SHIFT_HOURS, which only says the rest may have
+    been short.
+    """
+    start = np.select([days['shift'] == s for s in SHIFT_HOURS], [SHIFT_HOURS[s][0] for s in SHIFT_HOURS])
+    end = np.select([days['shift'] == s for s in SHIFT_HOURS], [SHIFT_HOURS[s][1] for s in SHIFT_HOURS])
+    gap = np.full(len(start), np.inf)
+    measured = np.zeros(len(start), dtype=bool)
+    same = days['user'][1:] == days['user'][:-1]
+    nominal = (days['day'][1:] * 24 + start[1:]) - (days['day'][:-1] * 24 + end[:-1])
+    actual = (days['start'][1:] - days['end'][:-1]) / 60
+    measured[1:] = same & ~np.isnan(actual)
+    gap[1:] = np.where(same, np.where(measured[1:], actual, nominal), np.inf)
+    return gap, measured
+
+
+def rest_level(gap, measured):
+    """Level of a rest gap below REST_HOURS + REST_MARGIN."""
+    if not measured:
+        return UNVERIFIABLE
+    return VIOLATION if gap < REST_HOURS else NEAR_VIOLATION
+
+
+def _date(day):
+    return EPOCH + np.asarray(day, dtype='timedelta64[D]')
+
+
+def check(days, norms):
+    """
+    All violations, near-violations and unverifiable rest gaps as a frame
+    (user_id, norm, start, end, value, limit, level); `norms` is the table
+    of Norm limits.
+    """
+    frames = []
+    for norm in norms:
+        start, total, limit = window_sums(days, norm)
+        flagged = total >= NEAR * limit
+        frames.append(pd.DataFrame({
+            'user_id': days['users'][days['user'][flagged]], 'norm': norm.name,
+            'start': _date(start[flagged]), 'end': _date(days['day'][flagged]),
+            'value': total[flagged] / 60, 'limit': limit[flagged] / 60,
+            'level': np.where(total[flagged] > limit[flagged], VIOLATION, NEAR_VIOLATION)}))
+    gap, measured = rest_gaps(days)
+    idx = np.flatnonzero(gap < REST_HOURS + REST_MARGIN)
+    frames.append(pd.DataFrame({
+        'user_id': days['users'][days['user'][idx]], 'norm': REST_NORM,
+        'start': _date(days['day'][idx - 1]), 'end': _date(days['day'][idx]),
+        'value': gap[idx], 'limit': float(REST_HOURS),
+        'level': np.where(~measured[idx], UNVERIFIABLE,
+                          np.where(gap[idx] < REST_HOURS, VIOLATION, NEAR_VIOLATION))}))
+    out = pd.concat(frames, ignore_index=True)
+    return out.sort_values(['user_id', 'end', 'norm'], kind='stable').reset_index(drop=True)
+
+
+def check_pilot(day_rows, new_day, norms):
+    """
+    Windows and rest gaps of one pilot that contain `new_day` (days since 1970).
+
+    `day_rows` are the pilot's (day, minutes, helicopter, shift, start, end)
+    tuples sorted by day; only the days that can share a window with `new_day` are walked,
+    each norm as a two-pointer pass. Returns [(norm, start, end, value,
+    limit, level)].
+    """
+    reach = max((n.days for n in norms), default=1) + 1
+    first = bisect.bisect_left(day_rows, (new_day - reach,))
+    day_rows = day_rows[first:bisect.bisect_right(day_rows, (new_day + reach,))]
+    out = []
+    for norm in norms:
+        lo, total, heli = 0, 0, 0
+        for day, minutes, helicopter, *_ in day_rows:
+            total += minutes
+            heli += helicopter
+            while day_rows[lo][0] <= day - norm.days:
+                total -= day_rows[lo][1]
+                heli -= day_rows[lo][2]
+                lo += 1
+            if not new_day <= day < new_day + norm.days:
+                continue
+            limit = norm.helicopter_minutes if heli else norm.aircraft_minutes
+            if total >= NEAR * limit:
+                out.append((norm.name, day_rows[lo][0], day, total / 60, limit / 60,
+                            VIOLATION if total > limit else NEAR_VIOLATION))
+    for prev, cur in zip(day_rows, day_rows[1:]):
+        if prev[0] <= new_day + 1 and cur[0] >= new_day - 1 and new_day in (prev[0], cur[0]):
+            measured = not (np.isnan(cur[4]) or np.isnan(prev[5]))
+            if measured:
+                gap = (cur[4] - prev[5]) / 60
+            else:
+                gap = cur[0] * 24 + SHIFT_HOURS[cur[3]][0] - prev[0] * 24 - SHIFT_HOURS[prev[3]][1]
+            if gap < REST_HOURS + REST_MARGIN:
+                out.append((REST_NORM, prev[0], cur[0], gap, REST_HOURS, rest_level(gap, measured)))
+    return out
+
+
+def pilot_day_rows(days, code):
+    """(day, minutes, helicopter, shift, start, end) rows of one pilot code from flight_days()."""
+    lo, hi = np.searchsorted(days['user'], [code, code + 1])
+    return list(zip(days['day'][lo:hi].tolist(), days['minutes'][lo:hi].tolist(),
+                    days['helicopter'][lo:hi].tolist(), days['shift'][lo:hi].tolist(),
+                    days['start'][lo:hi].tolist(), days['end'][lo:hi].tolist()))
+
+
+# --- Database -----------------------------------------------------------------
+
+FLIGHTS_SQL = """
+    SELECT f.user_id::text, f.date, f.time_of_day, f.flight_time, a.name
+    FROM flights f
+    LEFT JOIN aircraft_types a ON a.id = f.aircraft_type_id
+    WHERE f.user_id IS NOT NULL AND f.date IS NOT NULL
+"""
+
+
+def load_days(cur, user_id=None, around=None, reach=0):
+    sql, params = FLIGHTS_SQL, []
+    if user_id:
+        sql += " AND f.user_id = %s AND f.date BETWEEN %s AND %s"
+        params = [user_id, around - datetime.timedelta(days=reach), around + datetime.timedelta(days=reach)]
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    if not rows:
+        return None
+    users, dates, tod, times, names = zip(*rows)
+    return flight_days(users, dates, aviation_time.parse_minutes(list(times)), tod, is_helicopter(names))
+
+
+# --- Benchmark ----------------------------------------------------------------
+
+def synthetic_flights(n, pilots=3000, years=3, seed=2):
+    """
+    Flights shaped like the log: 1-3 per flight day, 20-90 min, some ferry
+    days, 15% helicopter pilots; half the pilots have actual take-off and
+    landing times (day flights from 08:00, night flights from 19:00).
+    """
+    rng = np.random.default_rng(seed)
+    user = rng.integers(0, pilots, n)
+    day = rng.integers(0, 365 * years, n)
+    minutes = rng.integers(20, 90, n)
+    ferry = rng.random(n) < 0.002
+    minutes[ferry] = rng.integers(240, 560, ferry.sum())
+    dates = np.datetime64('2023-10-01') + day.astype('timedelta64[D]')
+    night = rng.random(n) < 0.25
+    takeoff = ((dates - EPOCH).astype(np.int64) * 1440 + np.where(night, 19 * 60, 8 * 60)
+               + rng.integers(0, 6 * 60, n)).astype(float)
+    takeoff[user % 2 == 1] = np.nan
+    return {
+        'user_ids': np.char.add('u', user.astype(str)),
+        'dates': dates,
+        'minutes': minutes,
+        'time_of_day': np.where(night, 'Н', 'Д'),
+        'helicopter': user % 7 == 0,
+        'takeoff': takeoff,
+        'landing': takeoff + minutes,
+    }
+
+
+def _reference(days, code, norms):
+    rows = pilot_day_rows(days, code)
+    return sorted(x for d in sorted({r[0] for r in rows}) for x in check_pilot(rows, d, norms)
+                  if x[0] != REST_NORM and x[2] == d)
+
+
+def bench(n, norms):
+    flights = synthetic_flights(n)
+    t0 = time.perf_counter()
+    days = flight_days(flights['user_ids'], flights['dates'], flights['minutes'], flights['time_of_day'],
+                       flights['helicopter'], flights['takeoff'], flights['landing'])
+    t1 = time.perf_counter()
+    result = check(days, norms)
+    t2 = time.perf_counter()
+    print(f"{n} flights, {len(days['users'])} pilots, {len(days['day'])} flight days")
+    print(f"  collapse to flight days : {(t1 - t0) * 1000:8.0f} ms")
+    print(f"  all windows + rest      : {(t2 - t1) * 1000:8.0f} ms "
+          f"({(t2 - t0) / n * 1e9:.0f} ns per flight overall)")
+    counts = result.groupby(['norm', 'level']).size()
+    for (norm, level), count in counts.items():
+        print(f"    {norm:26} {level:12} {count}")
+
+    # Per-insert path on a few pilots, checked against the batch result.
+    sample = range(0, len(days['users']), max(1, len(days['users']) // 50))
+    t0 = time.perf_counter()
+    calls, mismatches = 0, 0
+    for code in sample:
+        rows = pilot_day_rows(days, code)
+        for d in {r[0] for r in rows[::10]}:
+            check_pilot(rows, d, norms)
+            calls += 1
+        expected = sorted((r.norm, (r.start - EPOCH).days, (r.end - EPOCH).days, r.value, r.limit, r.level)
+                          for r in result[(result.user_id == days['users'][code]) &
+                                          (result.norm != REST_NORM)].itertuples())
+        mismatches += expected != _reference(days, code, norms)
+    per_call = (time.perf_counter() - t0) / max(calls, 1) * 1000
+    print(f"  per-insert check        : {per_call:.2f} ms per call (whole pilot history, {calls} calls); "
+          f"batch vs two-pointer mismatches on {len(sample)} pilots: {mismatches}")
+
+
+# --- Main ---------------------------------------------------------------------
+
+def _parse_norm(text):
+    """DAYS=HOURS[:HELICOPTER_HOURS] -> Norm."""
+    days, _, hours = text.partition('=')
+    aircraft, _, helicopter = hours.partition(':')
+    minutes = round(float(aircraft) * 60)
+    return Norm(f"наліт за {int(days)} діб", int(days), minutes,
+                round(float(helicopter) * 60) if helicopter else minutes)
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Flight-time and rest norm compliance")
+    parser.add_argument('--bench', type=int, metavar='FLIGHTS', help="check N synthetic flights")
+    parser.add_argument('--db', action='store_true', help="check the flights table")
+    parser.add_argument('--norm', action='append', type=_parse_norm, default=[],
+                        metavar='DAYS=HOURS[:HELICOPTER_HOURS]',
+                        help="rolling-window flight-time limit, e.g. 1=10:8 or 30=90 (repeatable)")
+    parser.add_argument('--user', help="check one pilot around --date (after an insert)")
+    parser.add_argument('--date', type=datetime.date.fromisoformat, default=datetime.date.today())
+    parser.add_argument('--near', action='store_true', help="also list near-violations and unverifiable rest gaps")
+    args = parser.parse_args()
+    norms = args.norm
+
+    if args.bench or not args.db:
+        bench(args.bench or 2000000, norms or [_parse_norm(n) for n in BENCH_NORMS])
+        return
+    if not norms:
+        parser.error("--db needs the limits to check: --norm DAYS=HOURS[:HELICOPTER_HOURS]")
+
+    import psycopg2
+    dsn = os.environ.get('SUPABASE_DB_URL')
+    if not dsn:
+        raise SystemExit("SUPABASE_DB_URL is not set")
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn, conn.cursor() as cur:
+            reach = max(n.days for n in norms) + 1
+            days = load_days(cur, args.user, args.date, reach)
+    finally:
+        conn.close()
+    if days is None:
+        print("Польотів немає")
+        return
+
+    if args.user:
+        new_day = (np.datetime64(args.date, 'D') - EPOCH).astype(int)
+        found = check_pilot(pilot_day_rows(days, 0), new_day, norms)
+        for norm, start, end, value, limit, level in found:
+            if level == VIOLATION or args.near:
+                print(f"  {level:12} {norm}: {_date(start)} - {_date(end)}: {value:.1f} (норма {limit:g})")
+        print(f"Перевірено {args.date}: {sum(1 for f in found if f[5] == VIOLATION)} порушень, "
+              f"{sum(1 for f in found if f[5] == UNVERIFIABLE)} перерв без часу зльоту/посадки")
+        return
+
+    result = check(days, norms)
+    unverifiable = (result['level'] == UNVERIFIABLE).sum()
+    if not args.near:
+        result = result[result['level'] == VIOLATION]
+    for row in result.itertuples():
+        print(f"  {row.user_id} {row.level:12} {row.norm}: {row.start} - {row.end}: "
+              f"{row.value:.1f} (норма {row.limit:g})")
+    violations = result[result['level'] == VIOLATION]
+    print(f"Порушень: {len(violations)}, пілотів: {violations['user_id'].nunique()}; "
+          f"перерв без часу зльоту/посадки (не перевірено): {unverifiable}")
+
+
+if __name__ == "__main__":
+    main()
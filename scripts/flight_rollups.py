@@ -0,0 +1,117 @@
+"""
+Incremental job for flight_monthly_rollups
+(supabase/migrations/2026101901_flight_monthly_rollups.sql).
+
+Each run, in one transaction:
+
+  1. takes the flights touched since the last run - new or corrected rows
+     in flight_updates_log, flights whose changed_at moved, and flights
+     deleted since (flight_deletions)
+  2. passes them to fn_apply_flight_rollups(), which subtracts each flight's
+     previous contribution and adds the current one (idempotent)
+  3. advances the watermarks in flight_rollup_state and prunes the
+     flight_deletions rows every job has passed
+
+The watermark loop is shared with break_sync.py (flight_sync.py).
+
+Changes newer than --settle seconds are left for the next run, so
+flight_exercises inserted right after a flight are already there when its
+category is decided, and rows from transactions that commit late are not
+skipped. Both watermarks are server time (logged_at, changed_at): the
+client's flights.updated_at comes from the device clock and can lag behind
+a watermark already passed. fn_flight_period_summary() reads the current
+month from flights directly, so the lag never shows in summaries of the
+current month.
+
+Connection: SUPABASE_DB_URL (postgresql://...) from the environment.
+
+Usage:
+    python scripts/flight_rollups.py sync
+    python scripts/flight_rollups.py sync --every 300
+    python scripts/flight_rollups.py rebuild
+    python scripts/flight_rollups.py summary --user <uuid> --from 2025-01-01 --to 2025-12-31
+"""
+
+import argparse
+import datetime
+import sys
+import time
+
+from flight_sync import connect, sync_changes
+
+CHUNK = 1000
+DEFAULT_SETTLE_SECONDS = 120
+
+
+def _apply(cur, flight_ids):
+    applied = 0
+    for i in range(0, len(flight_ids), CHUNK):
+        cur.execute("SELECT fn_apply_flight_rollups(%s::uuid[])", (flight_ids[i:i + CHUNK],))
+        applied += cur.fetchone()[0]
+    return applied
+
+
+def sync(conn, settle_seconds=DEFAULT_SETTLE_SECONDS):
+    """Apply all settled changes since the last run. Returns (touched, applied)."""
+    return sync_changes(conn, 'flight_rollup_state', _apply, settle_seconds)
+
+
+def rebuild(conn, settle_seconds=DEFAULT_SETTLE_SECONDS):
+    """Recompute every rollup from flights."""
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM flight_rollup_state WHERE id = 1 FOR UPDATE")
+        cur.execute("SELECT now() - make_interval(secs => %s)", (settle_seconds,))
+        upto = cur.fetchone()[0]
+        cur.execute("TRUNCATE flight_monthly_rollups, flight_rollup_contributions")
+        cur.execute("SELECT id FROM flights")
+        applied = _apply(cur, [str(row[0]) for row in cur.fetchall()])
+        cur.execute("""
+            UPDATE flight_rollup_state
+            SET last_log_at = %(upto)s, last_flight_at = %(upto)s, updated_at = now()
+            WHERE id = 1
+        """, {'upto': upto})
+    return applied
+
+
+def period_summary(conn, user_id, start, end):
+    """{(time_of_day, category): (flights, minutes)} for a pilot and date range."""
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT * FROM fn_flight_period_summary(%s, %s, %s)", (user_id, start, end))
+        return {(tod, cat): (int(cnt), int(mins)) for tod, cat, cnt, mins in cur.fetchall()}
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Maintain flight_monthly_rollups")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_sync = sub.add_parser('sync', help="apply changes since the last run")
+    p_sync.add_argument('--every', type=int, help="repeat every N seconds")
+    p_sync.add_argument('--settle', type=int, default=DEFAULT_SETTLE_SECONDS)
+    p_rebuild = sub.add_parser('rebuild', help="recompute all rollups")
+    p_rebuild.add_argument('--settle', type=int, default=DEFAULT_SETTLE_SECONDS)
+    p_summary = sub.add_parser('summary', help="period summary for one pilot")
+    p_summary.add_argument('--user', required=True)
+    p_summary.add_argument('--from', dest='start', type=datetime.date.fromisoformat, required=True)
+    p_summary.add_argument('--to', dest='end', type=datetime.date.fromisoformat, required=True)
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        if args.command == 'rebuild':
+            print(f"Rebuilt rollups from {rebuild(conn, args.settle)} flights")
+        elif args.command == 'summary':
+            for (tod, cat), (cnt, mins) in sorted(period_summary(conn, args.user, args.start, args.end).items()):
+                print(f"  {tod} {cat:9} {cnt:5} польотів  {mins // 60:02d}:{mins % 60:02d}")
+        else:
+            while True:
+                touched, applied = sync(conn, args.settle)
+                print(f"{datetime.datetime.now():%H:%M:%S} touched {touched} flights, applied {applied}")
+                if not args.every:
+                    break
+                time.sleep(args.every)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Shared plumbing of the incremental flight jobs: flight_rollups.py
+(supabase/migrations/2026101901_flight_monthly_rollups.sql) and
+break_sync.py (2026101906_flight_break_sync.sql).
+
+Both jobs follow the same server-time watermarks - flight_updates_log.logged_at
+for new or corrected rows, flights.changed_at for edits (exercises and crew
+changes touch it too), flight_deletions.deleted_at for deletions - each in
+its own state table (STATE_TABLES). sync_changes() is one run of either job:
+take the flights touched since the job's watermarks and up to --settle
+seconds ago, hand them to the job's apply function, advance the watermarks,
+all in one transaction.
+
+flight_deletions is the tombstone table both read. Each run prunes the rows
+older than the lowest last_flight_at of all STATE_TABLES, less
+DELETIONS_KEEP_DAYS: no persisted consumer needs them any more, and the
+margin covers readers without a state table (flight_time_index.refresh_from_db
+keeps its watermark in memory and must reload when it is older than that).
+A consumer that is added later goes into STATE_TABLES, or its deletions may
+be pruned before it reads them.
+
+Connection: SUPABASE_DB_URL (postgresql://...) from the environment.
+"""
+
+import os
+
+STATE_TABLES = ('flight_rollup_state', 'break_sync_state')
+DELETIONS_KEEP_DAYS = 7
+
+CHANGED_FLIGHTS_SQL = """
+    SELECT flight_id FROM flight_updates_log
+    WHERE logged_at > %(last_log_at)s AND logged_at <= %(upto)s AND flight_id IS NOT NULL
+    UNION
+    SELECT id FROM flights
+    WHERE changed_at > %(last_flight_at)s AND changed_at <= %(upto)s
+    UNION
+    SELECT flight_id FROM flight_deletions
+    WHERE deleted_at > %(last_flight_at)s AND deleted_at <= %(upto)s
+"""
+
+PRUNE_DELETIONS_SQL = f"""
+    DELETE FROM flight_deletions
+    WHERE deleted_at < (
+        SELECT min(last_flight_at) FROM (
+            {' UNION ALL '.join(f'SELECT last_flight_at FROM {table}' for table in STATE_TABLES)}
+        ) s
+    ) - make_interval(days => %s)
+"""
+
+
+def connect(dsn=None):
+    import psycopg2
+    dsn = dsn or os.environ.get('SUPABASE_DB_URL')
+    if not dsn:
+        raise SystemExit("SUPABASE_DB_URL is not set")
+    return psycopg2.connect(dsn)
+
+
+def prune_deletions(cur, keep_days=DELETIONS_KEEP_DAYS):
+    """Drop flight_deletions rows every consumer has passed; returns the count."""
+    cur.execute(PRUNE_DELETIONS_SQL, (keep_days,))
+    return cur.rowcount
+
+
+def sync_changes(conn, state_table, apply, settle_seconds):
+    """
+    One run of a job: `apply(cur, flight_ids)` for all settled changes since
+    the watermarks in `state_table`. Returns (touched, apply's result).
+    """
+    if state_table not in STATE_TABLES:
+        raise ValueError(f"unknown state table {state_table}")
+    with conn, conn.cursor() as cur:
+        cur.execute(f"SELECT last_log_at, last_flight_at FROM {state_table} WHERE id = 1 FOR UPDATE")
+        last_log_at, last_flight_at = cur.fetchone()
+        cur.execute("SELECT now() - make_interval(secs => %s)", (settle_seconds,))
+        upto = cur.fetchone()[0]
+
+        cur.execute(CHANGED_FLIGHTS_SQL, {'last_log_at': last_log_at, 'last_flight_at': last_flight_at,
+                                          'upto': upto})
+        flight_ids = [str(row[0]) for row in cur.fetchall()]
+        applied = apply(cur, flight_ids)
+
+        cur.execute(f"""
+            UPDATE {state_table}
+            SET last_log_at = GREATEST(last_log_at, %(upto)s),
+                last_flight_at = GREATEST(last_flight_at, %(upto)s),
+                updated_at = now()
+            WHERE id = 1
+        """, {'upto': upto})
+        prune_deletions(cur)
+    return len(flight_ids), applied
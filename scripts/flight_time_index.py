@@ -0,0 +1,367 @@
+"""
+In-memory flight-time index: total minutes and landings of a pilot between
+any two dates in O(log n).
+
+Questions like "flight time since the last medical commission" or "over the
+last 365 days" are answered today by scanning every flight of the pilot. Here
+each pilot gets two Fenwick (binary indexed) trees over days - minutes and
+landings per day - so
+
+  - a range total is two prefix sums: O(log days)
+  - inserting, editing or deleting a flight is one point update per tree:
+    O(log days); the index keeps each flight's current contribution, so an
+    edit subtracts the old values before adding the new ones
+  - a flight outside the tree's day span grows the span (doubling) and
+    rebuilds it in O(days), which is amortised over the years covered
+
+Minutes follow parseMin (seconds dropped); landings are flights_count, or 1
+when it is empty (as FlightSummary counts flights).
+
+Connection for --db: SUPABASE_DB_URL (postgresql://...) from the environment.
+
+Usage:
+    python scripts/flight_time_index.py --bench
+    python scripts/flight_time_index.py --db --user <uuid> --from 2025-03-01 --to 2026-02-28
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+import aviation_time
+from flight_sync import DELETIONS_KEEP_DAYS
+
+MIN_SPAN_DAYS = 366
+FETCH_ROWS = 50000
+
+
+def to_day(value):
+    """date / datetime / 'YYYY-MM-DD' -> proleptic ordinal day."""
+    if isinstance(value, datetime.datetime):
+        return value.date().toordinal()
+    if isinstance(value, datetime.date):
+        return value.toordinal()
+    return datetime.date.fromisoformat(str(value)[:10]).toordinal()
+
+
+class FenwickTree:
+    """Binary indexed tree over int64 values; positions are 0-based."""
+
+    def __init__(self, size=0, values=None):
+        if values is not None:
+            self.tree = np.zeros(len(values) + 1, dtype=np.int64)
+            self.tree[1:] = values
+            n = len(values)
+            # Linear-time build: push each node's sum to its parent.
+            for i in range(1, n + 1):
+                parent = i + (i & -i)
+                if parent <= n:
+                    self.tree[parent] += self.tree[i]
+        else:
+            self.tree = np.zeros(size + 1, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def add(self, pos, delta):
+        tree = self.tree
+        n = len(tree)
+        i = pos + 1
+        while i < n:
+            tree[i] += delta
+            i += i & -i
+
+    def prefix(self, pos):
+        """Sum of positions 0..pos (inclusive); 0 for pos < 0."""
+        tree = self.tree
+        i = min(pos + 1, len(tree) - 1)
+        total = 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return int(total)
+
+    def range_sum(self, lo, hi):
+        """Sum of positions lo..hi (inclusive)."""
+        if hi < lo:
+            return 0
+        return self.prefix(hi) - self.prefix(lo - 1)
+
+    def values(self):
+        """Per-position values (inverse of the linear build)."""
+        vals = self.tree[1:].copy()
+        n = len(vals)
+        for i in range(n, 0, -1):
+            parent = i + (i & -i)
+            if parent <= n:
+                vals[parent - 1] -= vals[i - 1]
+        return vals
+
+
+class PilotTimeline:
+    """Daily minutes and landings of one pilot, as two Fenwick trees."""
+
+    def __init__(self, first_day, span=MIN_SPAN_DAYS):
+        self.origin = first_day
+        self.minutes = FenwickTree(span)
+        self.landings = FenwickTree(span)
+
+    def _ensure(self, day):
+        span = len(self.minutes)
+        if self.origin <= day < self.origin + span:
+            return
+        lo = min(self.origin, day)
+        hi = max(self.origin + span, day + 1)
+        new_span = span
+        while new_span < hi - lo:
+            new_span *= 2
+        # Grow towards the side that overflowed, keep the other end.
+        new_origin = lo if day < self.origin else self.origin
+        shift = self.origin - new_origin
+        for name in ('minutes', 'landings'):
+            vals = np.zeros(new_span, dtype=np.int64)
+            vals[shift:shift + span] = getattr(self, name).values()
+            setattr(self, name, FenwickTree(values=vals))
+        self.origin = new_origin
+
+    def add(self, day, minutes, landings):
+        self._ensure(day)
+        pos = day - self.origin
+        if minutes:
+            self.minutes.add(pos, minutes)
+        if landings:
+            self.landings.add(pos, landings)
+
+    def total(self, first_day, last_day):
+        lo = max(first_day, self.origin) - self.origin
+        hi = min(last_day, self.origin + len(self.minutes) - 1) - self.origin
+        return self.minutes.range_sum(lo, hi), self.landings.range_sum(lo, hi)
+
+
+class FlightTimeIndex:
+    """Per-pilot timelines plus each flight's current contribution."""
+
+    def __init__(self):
+        self.pilots = {}
+        self.flights = {}   # flight_id -> (pilot, day, minutes, landings)
+
+    def __len__(self):
+        return len(self.flights)
+
+    def upsert(self, flight_id, pilot, date, minutes, landings=1):
+        """Insert or edit a flight: O(log days)."""
+        self.remove(flight_id)
+        day = to_day(date)
+        landings = landings or 1
+        timeline = self.pilots.get(pilot)
+        if timeline is None:
+            timeline = self.pilots[pilot] = PilotTimeline(day)
+        timeline.add(day, minutes, landings)
+        self.flights[flight_id] = (pilot, day, minutes, landings)
+
+    def remove(self, flight_id):
+        old = self.flights.pop(flight_id, None)
+        if old is not None:
+            pilot, day, minutes, landings = old
+            self.pilots[pilot].add(day, -minutes, -landings)
+
+    def total(self, pilot, start, end):
+        """(minutes, landings) of a pilot from start to end, both inclusive."""
+        timeline = self.pilots.get(pilot)
+        if timeline is None:
+            return 0, 0
+        return timeline.total(to_day(start), to_day(end))
+
+    def last_days(self, pilot, days, today=None):
+        """(minutes, landings) over the `days` days ending today."""
+        today = today or datetime.date.today()
+        return self.total(pilot, today - datetime.timedelta(days=days - 1), today)
+
+    @classmethod
+    def build(cls, rows):
+        """
+        Index from (flight_id, pilot, date, minutes, landings) rows.
+
+        Daily values are accumulated first and each tree is built in linear
+        time, instead of one O(log n) update per flight.
+        """
+        index = cls()
+        by_pilot = {}
+        for flight_id, pilot, date, minutes, landings in rows:
+            day = to_day(date)
+            landings = landings or 1
+            index.flights[flight_id] = (pilot, day, minutes, landings)
+            by_pilot.setdefault(pilot, []).append((day, minutes, landings))
+        for pilot, items in by_pilot.items():
+            arr = np.array(items, dtype=np.int64)
+            first = int(arr[:, 0].min())
+            span = max(MIN_SPAN_DAYS, int(arr[:, 0].max()) - first + 1)
+            timeline = PilotTimeline(first, span=0)
+            pos = arr[:, 0] - first
+            timeline.minutes = FenwickTree(values=np.bincount(pos, arr[:, 1], minlength=span).astype(np.int64))
+            timeline.landings = FenwickTree(values=np.bincount(pos, arr[:, 2], minlength=span).astype(np.int64))
+            index.pilots[pilot] = timeline
+        return index
+
+
+# --- Database -----------------------------------------------------------------
+
+FLIGHTS_SQL = """
+    SELECT id, user_id, date, flight_time, flights_count
+    FROM flights
+    WHERE user_id IS NOT NULL AND date IS NOT NULL
+"""
+
+
+def _db_rows(cur):
+    """Stream index rows from an executed cursor, parsing times one batch at a time."""
+    while True:
+        rows = cur.fetchmany(FETCH_ROWS)
+        if not rows:
+            break
+        minutes = aviation_time.parse_minutes([row[3] for row in rows])
+        for (flight_id, user_id, date, _, count), m in zip(rows, minutes.tolist()):
+            yield str(flight_id), str(user_id), date, m, count or 1
+
+
+def load_from_db(conn):
+    """Build the index from the flights table. Returns (index, watermark)."""
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT now()")
+            watermark = cur.fetchone()[0]
+        # Server-side cursor: the table is never held in memory as a whole.
+        with conn.cursor(name='flight_time_index') as cur:
+            cur.itersize = FETCH_ROWS
+            cur.execute(FLIGHTS_SQL)
+            return FlightTimeIndex.build(_db_rows(cur)), watermark
+
+
+def refresh_from_db(index, conn, since):
+    """
+    Apply flights changed or deleted after `since`. Returns the new watermark.
+
+    Both sides are read by server time - flights.changed_at and
+    flight_deletions.deleted_at (migration 2026101901) - so the cost follows
+    the number of changes, not the size of the table, and a skewed device
+    clock in the client's updated_at cannot hide an edit. flight_deletions
+    is pruned DELETIONS_KEEP_DAYS behind the sync jobs (flight_sync.py), so
+    an older `since` raises and the index has to be rebuilt (load_from_db).
+    """
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT now()")
+        watermark = cur.fetchone()[0]
+        if since < watermark - datetime.timedelta(days=DELETIONS_KEEP_DAYS):
+            raise ValueError(f"watermark {since} is older than the kept deletions; rebuild with load_from_db")
+        cur.execute("SELECT flight_id FROM flight_deletions WHERE deleted_at > %s", (since,))
+        for (flight_id,) in cur.fetchall():
+            index.remove(str(flight_id))
+        cur.execute(FLIGHTS_SQL + " AND changed_at > %s", (since,))
+        for flight_id, pilot, date, minutes, landings in _db_rows(cur):
+            index.upsert(flight_id, pilot, date, minutes, landings)
+    return watermark
+
+
+# --- Benchmark ----------------------------------------------------------------
+
+def synthetic_rows(n, pilots=60, years=6, seed=5):
+    """n flights over `years` years for `pilots` pilots."""
+    rng = np.random.default_rng(seed)
+    start = datetime.date(2026 - years, 1, 1).toordinal()
+    days = rng.integers(0, years * 365, n) + start
+    pilot = rng.integers(0, pilots, n)
+    minutes = rng.integers(10, 240, n)
+    landings = rng.integers(1, 4, n)
+    return [(i, f"p{pilot[i]}", datetime.date.fromordinal(int(days[i])), int(minutes[i]), int(landings[i]))
+            for i in range(n)]
+
+
+def naive_total(flights_by_pilot, pilot, start, end):
+    """What the app does now: scan every flight of the pilot."""
+    minutes = landings = 0
+    for date, m, landing in flights_by_pilot.get(pilot, ()):
+        if start <= date <= end:
+            minutes += m
+            landings += landing
+    return minutes, landings
+
+
+def bench(n, queries=2000):
+    rows = synthetic_rows(n)
+    by_pilot = {}
+    for _, pilot, date, minutes, landings in rows:
+        by_pilot.setdefault(pilot, []).append((date, minutes, landings))
+
+    t0 = time.perf_counter()
+    index = FlightTimeIndex.build(rows)
+    build = time.perf_counter() - t0
+
+    rnd = random.Random(1)
+    pilots = sorted(by_pilot)
+    first, last = min(r[2] for r in rows), max(r[2] for r in rows)
+    span = (last - first).days
+    asks = []
+    for _ in range(queries):
+        a = first + datetime.timedelta(days=rnd.randrange(span))
+        b = a + datetime.timedelta(days=rnd.randrange(1, 800))
+        asks.append((rnd.choice(pilots), a, b))
+
+    t0 = time.perf_counter()
+    fast = [index.total(p, a, b) for p, a, b in asks]
+    t_index = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    slow = [naive_total(by_pilot, p, a, b) for p, a, b in asks]
+    t_naive = time.perf_counter() - t0
+    assert fast == slow, "index and scan disagree"
+
+    t0 = time.perf_counter()
+    for i in range(queries):
+        _, pilot, date, minutes, landings = rows[rnd.randrange(n)]
+        index.upsert(rows[i][0], pilot, date + datetime.timedelta(days=3), minutes + 5, landings)
+    t_update = time.perf_counter() - t0
+
+    print(f"{n} flights, {len(pilots)} pilots, {span} days")
+    print(f"  build            : {build * 1000:8.1f} ms")
+    print(f"  index query      : {t_index / queries * 1e6:8.1f} us")
+    print(f"  naive scan query : {t_naive / queries * 1e6:8.1f} us  ({t_naive / t_index:.0f}x slower)")
+    print(f"  edit (upsert)    : {t_update / queries * 1e6:8.1f} us")
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Per-pilot flight-time range index")
+    parser.add_argument('--bench', action='store_true', help="compare with a scan on synthetic data")
+    parser.add_argument('--flights', type=int, default=200000, help="synthetic flights for --bench")
+    parser.add_argument('--db', action='store_true', help="build from the flights table")
+    parser.add_argument('--user', help="pilot (user_id) to query")
+    parser.add_argument('--from', dest='start', type=datetime.date.fromisoformat)
+    parser.add_argument('--to', dest='end', type=datetime.date.fromisoformat, default=datetime.date.today())
+    args = parser.parse_args()
+
+    if args.bench or not args.db:
+        bench(args.flights)
+        return
+
+    import psycopg2
+    dsn = os.environ.get('SUPABASE_DB_URL')
+    if not dsn:
+        raise SystemExit("SUPABASE_DB_URL is not set")
+    conn = psycopg2.connect(dsn)
+    try:
+        index, _ = load_from_db(conn)
+    finally:
+        conn.close()
+    print(f"{len(index)} flights, {len(index.pilots)} pilots")
+    if args.user:
+        start = args.start or args.end - datetime.timedelta(days=364)
+        minutes, landings = index.total(args.user, start, args.end)
+        print(f"  {start} - {args.end}: {minutes // 60}:{minutes % 60:02d}, {landings} посадок")
+
+
+if __name__ == "__main__":
+    main()
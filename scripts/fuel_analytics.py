@@ -0,0 +1,260 @@
+"""
+Fuel consumption analytics over fuel_records joined with flights and
+aircraft_types.
+
+Main.js writes a fuel_records row (airfield, fuel_amount) with a flight, but
+nothing reads them back. This module builds, in one vectorized pass per
+report:
+
+  - type_rates()      burn rate per aircraft type: total fuel / total flight
+                      hours, plus the median and spread of per-flight rates
+  - pilot_rates()     the same per pilot and type, with the ratio to the
+                      type's median rate
+  - outliers()        flights whose rate is far from their type's median by a
+                      robust z-score (median / MAD), with the reason
+  - monthly_totals()  fuel, flights and hours per month and aircraft type
+
+Amounts are held as int64 hundredths of the entered unit (FUEL_SCALE) and
+durations as int32 minutes, so sums are exact. Several fuel_records of one
+flight (refuelling at two airfields) are summed per flight first. Per-group
+sums use np.bincount over categorical codes; there are no per-row Python
+loops.
+
+Connection for --db: SUPABASE_DB_URL (postgresql://...) from the environment.
+
+Usage:
+    python scripts/fuel_analytics.py --bench 60000
+    python scripts/fuel_analytics.py --db --year 2025
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+FUEL_SCALE = 100            # fuel_amount 1.25 -> 125
+OUTLIER_Z = 3.5             # |robust z| above this is an outlier
+MAD_TO_SIGMA = 1.4826
+
+FUEL_SQL = """
+    SELECT fr.flight_id::text, fr.airfield, fr.fuel_amount, f.date, f.user_id::text, u.name,
+           at.name, COALESCE(floor(extract(epoch FROM f.flight_time) / 60), 0)::int, f.flights_count
+    FROM fuel_records fr
+    JOIN flights f ON f.id = fr.flight_id
+    LEFT JOIN users u ON u.id = f.user_id
+    LEFT JOIN aircraft_types at ON at.id = f.aircraft_type_id
+    WHERE f.date >= make_date(%(year)s, 1, 1) AND f.date < make_date(%(year)s + 1, 1, 1)
+"""
+FUEL_COLUMNS = ['flight_id', 'airfield', 'fuel_amount', 'date', 'user_id', 'pilot', 'aircraft_type',
+                'minutes', 'flights_count']
+
+
+def load_fuel(rows):
+    """
+    Per-flight fuel frame from FUEL_SQL rows (one row per fuel_record).
+
+    Columns: flight_id, date, pilot, aircraft_type (categorical), fuel
+    (int64, FUEL_SCALE units), minutes (int32), flights (int32), records
+    (fuel_records per flight).
+    """
+    raw = pd.DataFrame.from_records(rows, columns=FUEL_COLUMNS)
+    fuel = np.rint(pd.to_numeric(raw['fuel_amount'], errors='coerce').fillna(0).to_numpy() * FUEL_SCALE)
+    codes, flight_ids = pd.factorize(raw['flight_id'])
+    first = np.full(len(flight_ids), len(raw), dtype=np.int64)
+    np.minimum.at(first, codes, np.arange(len(raw)))
+    head = raw.iloc[first]
+    flights = pd.to_numeric(head['flights_count'], errors='coerce').fillna(0).to_numpy()
+    return pd.DataFrame({
+        'flight_id': flight_ids,
+        'date': pd.to_datetime(head['date']).to_numpy(),
+        'pilot': pd.Categorical(head['pilot'].fillna('').to_numpy()),
+        'aircraft_type': pd.Categorical(head['aircraft_type'].fillna('').to_numpy()),
+        'fuel': np.bincount(codes, weights=fuel, minlength=len(flight_ids)).astype(np.int64),
+        'minutes': head['minutes'].fillna(0).to_numpy().astype(np.int32),
+        'flights': np.where(flights > 0, flights, 1).astype(np.int32),
+        'records': np.bincount(codes, minlength=len(flight_ids)).astype(np.int32),
+    })
+
+
+def _per_hour(fuel, minutes):
+    """Fuel per flight hour (entered units), NaN where there is no flight time."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(minutes > 0, fuel / FUEL_SCALE / (minutes / 60.0), np.nan)
+
+
+def _group_sums(codes, n, **columns):
+    return {name: np.bincount(codes, weights=values, minlength=n) for name, values in columns.items()}
+
+
+def flight_rates(df):
+    """Per-flight burn rate with the robust z-score against the flight's aircraft type."""
+    rate = _per_hour(df['fuel'].to_numpy(), df['minutes'].to_numpy())
+    by_type = pd.Series(rate).groupby(df['aircraft_type'].cat.codes.to_numpy())
+    median = by_type.transform('median').to_numpy()
+    mad = pd.Series(np.abs(rate - median)).groupby(df['aircraft_type'].cat.codes.to_numpy()).transform('median')
+    scale = mad.to_numpy() * MAD_TO_SIGMA
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(scale > 0, (rate - median) / scale, 0.0)
+    return rate, median, z
+
+
+def type_rates(df):
+    """Per aircraft type: flights, hours, fuel, weighted rate, median and IQR of flight rates."""
+    codes = df['aircraft_type'].cat.codes.to_numpy()
+    n = len(df['aircraft_type'].cat.categories)
+    sums = _group_sums(codes, n, fuel=df['fuel'].to_numpy(), minutes=df['minutes'].to_numpy(),
+                       flights=df['flights'].to_numpy())
+    rate, _, _ = flight_rates(df)
+    quant = pd.Series(rate).groupby(codes).quantile([0.25, 0.5, 0.75]).unstack()
+    out = pd.DataFrame({
+        'flights': sums['flights'].astype(np.int64),
+        'hours': sums['minutes'] / 60.0,
+        'fuel': sums['fuel'] / FUEL_SCALE,
+        'rate': _per_hour(sums['fuel'], sums['minutes']),
+    }, index=pd.Index(df['aircraft_type'].cat.categories, name='aircraft_type'))
+    out['median_rate'] = quant[0.5].reindex(range(n)).to_numpy()
+    out['iqr'] = (quant[0.75] - quant[0.25]).reindex(range(n)).to_numpy()
+    return out[out['flights'] > 0]
+
+
+def pilot_rates(df):
+    """Per pilot and type: totals, weighted rate and its ratio to the type median."""
+    grouped = df.groupby(['pilot', 'aircraft_type'], observed=True)[['fuel', 'minutes', 'flights']].sum()
+    out = pd.DataFrame({
+        'flights': grouped['flights'],
+        'hours': grouped['minutes'] / 60.0,
+        'fuel': grouped['fuel'] / FUEL_SCALE,
+        'rate': _per_hour(grouped['fuel'].to_numpy(), grouped['minutes'].to_numpy()),
+    }, index=grouped.index)
+    medians = type_rates(df)['median_rate']
+    out['vs_type'] = out['rate'] / medians.reindex(out.index.get_level_values('aircraft_type')).to_numpy()
+    return out
+
+
+def outliers(df, threshold=OUTLIER_Z):
+    """Flights with a suspicious record: no flight time, no fuel, or |robust z| > threshold."""
+    rate, median, z = flight_rates(df)
+    reason = np.select(
+        [df['minutes'].to_numpy() <= 0, df['fuel'].to_numpy() <= 0, z > threshold, z < -threshold],
+        ['без нальоту', 'без палива', 'завищена витрата', 'занижена витрата'], default='')
+    mask = reason != ''
+    out = df.loc[mask, ['flight_id', 'date', 'pilot', 'aircraft_type', 'minutes']].copy()
+    out['fuel'] = df['fuel'].to_numpy()[mask] / FUEL_SCALE
+    out['rate'] = rate[mask]
+    out['type_median'] = median[mask]
+    out['z'] = z[mask]
+    out['reason'] = reason[mask]
+    return out.sort_values('z', key=np.abs, ascending=False).reset_index(drop=True)
+
+
+def monthly_totals(df):
+    """Fuel, flights and hours per month and aircraft type."""
+    month = df['date'].dt.to_period('M')
+    grouped = df.groupby([month.rename('month'), df['aircraft_type']], observed=True)[
+        ['fuel', 'minutes', 'flights']].sum()
+    return pd.DataFrame({
+        'flights': grouped['flights'],
+        'hours': grouped['minutes'] / 60.0,
+        'fuel': grouped['fuel'] / FUEL_SCALE,
+        'rate': _per_hour(grouped['fuel'].to_numpy(), grouped['minutes'].to_numpy()),
+    }, index=grouped.index)
+
+
+# --- Benchmark ----------------------------------------------------------------
+
+# Typical burn per flight hour for the synthetic data (entered units).
+SYNTHETIC_RATES = {'Ми-8': 700, 'Л-39': 550, 'МіГ-29': 3500, 'Су-27': 4000, 'Су-24': 4500}
+
+
+def synthetic_rows(n, pilots=120, year=2025, seed=7):
+    """FUEL_SQL-shaped rows: n flights, ~10% with a second fuel record, ~1% typos."""
+    rng = np.random.default_rng(seed)
+    types = np.array(list(SYNTHETIC_RATES))
+    base = np.array(list(SYNTHETIC_RATES.values()), dtype=float)
+    t = rng.integers(0, len(types), n)
+    minutes = rng.integers(20, 240, n)
+    fuel = base[t] * minutes / 60 * rng.normal(1.0, 0.08, n)
+    typo = rng.random(n) < 0.01
+    fuel[typo] *= rng.choice([0.1, 10.0], typo.sum())
+    second = rng.random(n) < 0.1
+    dates = pd.Timestamp(year, 1, 1) + pd.to_timedelta(rng.integers(0, 365, n), unit='D')
+    frame = pd.DataFrame({
+        'flight_id': [f'f{i}' for i in range(n)],
+        'airfield': 'Основний',
+        'fuel_amount': np.round(np.where(second, fuel / 2, fuel), 2),
+        'date': dates,
+        'user_id': rng.integers(0, pilots, n).astype(str),
+        'pilot': None,
+        'aircraft_type': types[t],
+        'minutes': minutes,
+        'flights_count': 1,
+    })
+    frame['pilot'] = 'Пілот ' + frame['user_id']
+    extra = frame[second].assign(airfield='Запасний')
+    rows = pd.concat([frame, extra], ignore_index=True)
+    return list(rows.itertuples(index=False, name=None)), int(typo.sum())
+
+
+def bench(n):
+    rows, typos = synthetic_rows(n)
+    t0 = time.perf_counter()
+    df = load_fuel(rows)
+    t1 = time.perf_counter()
+    types = type_rates(df)
+    pilots = pilot_rates(df)
+    flagged = outliers(df)
+    months = monthly_totals(df)
+    t2 = time.perf_counter()
+    print(f"{len(rows)} fuel records, {len(df)} flights, {df['pilot'].nunique()} pilots")
+    print(f"  load               : {(t1 - t0) * 1000:7.1f} ms")
+    print(f"  all four reports   : {(t2 - t1) * 1000:7.1f} ms "
+          f"({len(pilots)} pilot/type rows, {len(months)} month/type rows)")
+    print(f"  outliers           : {len(flagged)} flagged, {typos} typos seeded")
+    print(types.round(1).to_string())
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Fuel consumption analytics")
+    parser.add_argument('--bench', type=int, metavar='N', help="run the reports on N synthetic flights")
+    parser.add_argument('--db', action='store_true', help="read fuel_records from the database")
+    parser.add_argument('--year', type=int, default=pd.Timestamp.today().year)
+    args = parser.parse_args()
+
+    if args.bench or not args.db:
+        bench(args.bench or 60000)
+        return
+
+    import psycopg2
+    dsn = os.environ.get('SUPABASE_DB_URL')
+    if not dsn:
+        raise SystemExit("SUPABASE_DB_URL is not set")
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(FUEL_SQL, {'year': args.year})
+            df = load_fuel(cur.fetchall())
+    finally:
+        conn.close()
+    if df.empty:
+        print(f"No fuel records in {args.year}")
+        return
+
+    pd.set_option('display.width', 160)
+    print(f"Витрата палива за {args.year} рік\n")
+    print(type_rates(df).round(1).to_string())
+    print("\nПо пілотах:")
+    print(pilot_rates(df).round(2).to_string())
+    print("\nПо місяцях:")
+    print(monthly_totals(df).round(1).to_string())
+    flagged = outliers(df)
+    print(f"\nПідозрілі записи: {len(flagged)}")
+    if len(flagged):
+        print(flagged.head(50).round(2).to_string())
+
+
+if __name__ == "__main__":
+    main()
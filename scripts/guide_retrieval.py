@@ -0,0 +1,199 @@
+"""
+Local model of the guide Q&A retrieval pipeline.
+
+Mirrors what scripts/ingest-docs.mjs and the `ask` edge function do - chunk the
+documents, embed the chunks, search them by cosine similarity - but runs
+entirely offline so chunking and indexing choices can be measured:
+
+  - chunk_text() is a line-for-line port of chunkText() in ingest-docs.mjs
+  - HashingEmbedder is a deterministic stand-in for text-embedding-3-small
+    (hashed word stems and stem bigrams), good enough to compare variants
+  - ChunkIndex stores vectors in any embedding_quant format, partitioned
+    by document so doc_aliases filters shrink the candidate set
+"""
+
+import os
+import re
+import zlib
+
+import numpy as np
+
+import doc_aliases
+import embedding_quant
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DOCS_DIR = os.path.join(BASE_DIR, "docs")
+
+# Text documents from the DOCUMENTS list in ingest-docs.mjs that can be read
+# without Word/Excel converters.
+DOCUMENTS = [
+    {'title': 'КБП ВА 2022', 'sourceFile': 'KBP-VA-2022.txt'},
+    {'title': 'КЛПВ-24', 'sourceFile': 'KLPV-24.md'},
+    {'title': 'ПЛВР (Положення про ЛВР)', 'sourceFile': 'PLVR.md'},
+    {'title': 'ПВП ДАУ', 'sourceFile': 'PVP-DAU.md'},
+]
+
+_MD_ESCAPE_RE = re.compile(r'\\(.)')
+_MD_NOISE_RE = re.compile(r'<a id="[^"]*"></a>|__|\*')
+_SPACE_RE = re.compile(r'\s+')
+_WORD_RE = re.compile(r'\w+')
+
+
+def normalize_text(text):
+    """Lowercase, drop markdown escapes/anchors and collapse whitespace."""
+    text = _MD_ESCAPE_RE.sub(r'\1', text)
+    text = _MD_NOISE_RE.sub('', text)
+    return _SPACE_RE.sub(' ', text).strip().lower()
+
+
+def load_documents(docs_dir=DOCS_DIR, documents=DOCUMENTS):
+    """Read the available source documents as (title, text) pairs."""
+    loaded = []
+    for doc in documents:
+        path = os.path.join(docs_dir, doc['sourceFile'])
+        if not os.path.exists(path):
+            print(f"  SKIP: file not found - {doc['sourceFile']}")
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            loaded.append((doc['title'], f.read()))
+    return loaded
+
+
+def chunk_text(text, max_chars=2000, overlap=300):
+    """Split text into overlapping chunks (same rules as ingest-docs.mjs)."""
+    text = re.sub(r'\n{3,}', '\n\n', text.replace('\r\n', '\n')).strip()
+
+    if len(text) <= max_chars:
+        return [text]
+
+    chunks = []
+    start = 0
+
+    while start < len(text):
+        end = start + max_chars
+
+        if end < len(text):
+            # Try to break at paragraph boundary (JS lastIndexOf(s, end) also
+            # matches at `end` itself, hence the + len(s) bound)
+            paragraph_break = text.rfind('\n\n', 0, end + 2)
+            if paragraph_break > start + max_chars * 0.5:
+                end = paragraph_break
+            else:
+                # Try sentence boundary
+                sentence_break = text.rfind('. ', 0, end + 2)
+                if sentence_break > start + max_chars * 0.5:
+                    end = sentence_break + 1
+        else:
+            end = len(text)
+
+        chunk = text[start:end].strip()
+        if len(chunk) > 50:
+            chunks.append(chunk)
+
+        start = end - overlap
+        if start < 0:
+            start = 0
+        if end >= len(text):
+            break
+
+    return chunks
+
+
+def build_chunks(documents, max_chars=2000, overlap=300):
+    """Chunk every (title, text) document into {'document', 'text'} rows."""
+    rows = []
+    for title, text in documents:
+        for chunk in chunk_text(text, max_chars, overlap):
+            rows.append({'document': title, 'text': chunk})
+    return rows
+
+
+class HashingEmbedder:
+    """
+    Deterministic offline stand-in for the OpenAI embedding model.
+
+    Features are word stems (first 5 letters, which absorbs most Ukrainian
+    inflection) and stem bigrams, hashed into `dims` signed buckets with
+    sublinear term frequency.
+    """
+
+    def __init__(self, dims=1024, stem=5):
+        self.dims = dims
+        self.stem = stem
+
+    def features(self, text):
+        stems = [w[:self.stem] for w in _WORD_RE.findall(normalize_text(text)) if len(w) > 1]
+        return stems + [a + ' ' + b for a, b in zip(stems, stems[1:])]
+
+    def embed(self, texts):
+        out = np.zeros((len(texts), self.dims), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.fromiter((zlib.crc32(f.encode('utf-8')) for f in self.features(text)),
+                                 dtype=np.uint32)
+            if hashes.size == 0:
+                continue
+            buckets = (hashes % self.dims).astype(np.int64)
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            vec = np.zeros(self.dims, dtype=np.float32)
+            np.add.at(vec, buckets, signs)
+            out[row] = np.sign(vec) * np.log1p(np.abs(vec))
+        return embedding_quant.normalize(out)
+
+
+class ChunkIndex:
+    """
+    Vector index over chunk rows, partitioned by document.
+
+    Each document's chunks are encoded (in an embedding_quant format) as a
+    separate partition, so a search restricted to some documents never
+    touches the vectors of the others.
+    """
+
+    def __init__(self, chunks, vectors, fmt='float32'):
+        self.chunks = chunks
+        self.partitions = {}
+        documents = np.array([c['document'] for c in chunks])
+        for title in dict.fromkeys(documents.tolist()):
+            rows = np.flatnonzero(documents == title)
+            self.partitions[title] = (rows, embedding_quant.encode(vectors[rows], fmt))
+
+    @classmethod
+    def build(cls, chunks, embedder, fmt='float32'):
+        return cls(chunks, embedder.embed([c['text'] for c in chunks]), fmt)
+
+    def titles(self):
+        return list(self.partitions)
+
+    def nbytes(self):
+        return sum(embedding_quant.index_nbytes(index) for _, index in self.partitions.values())
+
+    def candidates(self, documents=None):
+        """Number of chunks a search over `documents` has to score."""
+        selected = self.partitions if not documents else [d for d in documents if d in self.partitions]
+        return sum(len(self.partitions[d][0]) for d in selected)
+
+    def search(self, query_vector, k=10, documents=None):
+        """
+        Return [(chunk_idx, score)] for the top-k chunks.
+
+        `documents` restricts the search to those titles' partitions; None
+        searches all of them.
+        """
+        selected = list(self.partitions) if not documents else [d for d in documents if d in self.partitions]
+        if not selected:
+            return []
+        rows = []
+        scores = []
+        for title in selected:
+            part_rows, index = self.partitions[title]
+            rows.append(part_rows)
+            scores.append(embedding_quant.score(index, query_vector)[0])
+        rows = np.concatenate(rows)
+        scores = np.concatenate(scores)
+        top = embedding_quant.top_k(scores, k)[0]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def search_question(self, question, embedder, k=10, matcher=None):
+        """Embed a question and search only the documents it names (if any)."""
+        documents = doc_aliases.resolve_documents(question, self.titles(), matcher)
+        return self.search(embedder.embed([question]), k, documents), documents
@@ -0,0 +1,320 @@
+"""
+Compiled multi-level header schemas for merged-cell Excel reports.
+
+read_excel_detailed.py decodes the three header rows (4-6) of "Підсумки" by
+hand: it prints the merged ranges and then hardcodes "C-E: В період",
+"F-H: З початку 2025 року", "I-L: Випроб. польоти". Here the header block is
+read once and compiled into
+
+    (group, subgroup, metric) -> column index (0-based)
+
+  - the block starts at the row holding the anchor label ("Тип ПС") and ends
+    at the last row of the merged ranges that start on that row (A4:A6 -> 4-6)
+  - merged ranges are expanded; read-only worksheets do not expose them, so
+    they are read from the sheet XML inside the .xlsx
+  - non-text cells in the header (the period dates in D4/E4) are parameters
+    of their group, not labels; a group label also covers the empty cells to
+    its right until the next label
+  - each column's distinct labels, top to bottom, give (group, subgroup,
+    metric); missing levels are None
+
+Schemas are cached by layout signature (header band labels with digits
+folded + the merged ranges crossing it), and the file -> schema step by
+(path, size, mtime), so a new year's workbook with the same layout reuses the
+compiled schema with its own period dates, and a changed layout needs no code
+edits. find() matches labels by case-insensitive substring, so
+find('наліт', group='з початку') keeps working when the year in the label
+changes.
+
+Usage:
+    python scripts/header_schema.py
+    python scripts/header_schema.py --workbook other.xlsx --sheet Підсумки
+"""
+
+import argparse
+import copy
+import hashlib
+import os
+import posixpath
+import re
+import sys
+import zipfile
+from xml.etree import ElementTree
+
+import numpy as np
+import openpyxl
+from openpyxl.utils import get_column_letter, range_boundaries
+
+from aviation_time import cell_minutes, format_minutes
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKBOOK = os.path.join(BASE_DIR, "docs", "Облік нальоту.xlsx")
+SHEET = "Підсумки"
+ANCHOR = "тип пс"
+HEADER_SCAN_ROWS = 30
+
+_NS = {
+    'm': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships',
+}
+_MERGE_TAG = '{%s}mergeCell' % _NS['m']
+_DIGITS_RE = re.compile(r'\d+')
+
+
+def _norm(label):
+    return ' '.join(str(label).split()).lower()
+
+
+def _is_label(value):
+    return isinstance(value, str) and value.strip() != ''
+
+
+def sheet_xml_path(zf, sheet):
+    """Path of a sheet's XML part inside the .xlsx zip."""
+    workbook = ElementTree.fromstring(zf.read('xl/workbook.xml'))
+    rels = ElementTree.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+    targets = {r.get('Id'): r.get('Target') for r in rels.findall('rel:Relationship', _NS)}
+    for node in workbook.find('m:sheets', _NS):
+        if node.get('name') == sheet:
+            target = targets[node.get('{%s}id' % _NS['r'])]
+            return target.lstrip('/') if target.startswith('/') else posixpath.join('xl', target)
+    raise KeyError(f"no sheet {sheet!r} in workbook")
+
+
+def read_merged_ranges(path, sheet):
+    """
+    Merged ranges of a sheet as (min_col, min_row, max_col, max_row), 1-based.
+
+    Streams the sheet XML (mergeCells come after sheetData) and clears parsed
+    elements, so memory stays flat on large sheets.
+    """
+    ranges = []
+    with zipfile.ZipFile(path) as zf:
+        with zf.open(sheet_xml_path(zf, sheet)) as f:
+            for _, elem in ElementTree.iterparse(f):
+                if elem.tag == _MERGE_TAG:
+                    ranges.append(range_boundaries(elem.get('ref')))
+                elem.clear()
+    return ranges
+
+
+def header_band(rows, merged, first_row, anchor=ANCHOR):
+    """(top, bottom) rows of the header: the anchor row to the end of the merges starting on it."""
+    top = next((first_row + i for i, row in enumerate(rows)
+                if any(_is_label(v) and _norm(v) == anchor for v in row)), None)
+    if top is None:
+        raise ValueError(f"no header row with {anchor!r} in the first {len(rows)} rows")
+    return top, max([r[3] for r in merged if r[1] == top] + [top])
+
+
+class HeaderSchema:
+    """Compiled (group, subgroup, metric) -> column mapping of one header block."""
+
+    def __init__(self, rows, merged, first_row, anchor=ANCHOR):
+        """
+        `rows` are the sheet's first rows as value tuples (row `first_row`
+        first), `merged` its merged ranges as (min_col, min_row, max_col, max_row).
+        """
+        top, bottom = header_band(rows, merged, first_row, anchor)
+        block = [list(rows[r - first_row]) if r - first_row < len(rows) else [] for r in range(top, bottom + 1)]
+        width = max((i + 1 for row in block for i, v in enumerate(row) if v is not None), default=0)
+        block = [row + [None] * (width - len(row)) for row in block]
+
+        # Expand merged ranges inside the block to their top-left value.
+        spans = set()
+        for min_col, min_row, max_col, max_row in merged:
+            if max_row < top or min_row > bottom:
+                continue
+            value = block[min_row - top][min_col - 1] if min_row >= top and min_col <= width else None
+            for r in range(max(min_row, top), min(max_row, bottom) + 1):
+                for c in range(min_col, min(max_col, width) + 1):
+                    block[r - top][c - 1] = value
+                    spans.add((r, c))
+
+        # Non-text cells are parameters of the group to their left; labels in
+        # all but the last row cover the empty cells to their right.
+        self.param_cells = {}
+        levels = []
+        for r, row in enumerate(block):
+            filled = []
+            current = None
+            for c, value in enumerate(row):
+                if _is_label(value):
+                    current = value.strip()
+                    filled.append(current)
+                    continue
+                if value is not None and current is not None:
+                    self.param_cells.setdefault(current, []).append((top + r, c))
+                fill_right = r < len(block) - 1 and (top + r, c + 1) not in spans
+                filled.append(current if fill_right else None)
+                if not fill_right:
+                    current = None
+            levels.append(filled)
+
+        self.header_rows = (top, bottom)
+        self.first_data_row = bottom + 1
+        self.params = self._read_params(rows, first_row)
+        self.columns = {}
+        self.labels = []
+        for c in range(width):
+            path = []
+            for level in levels:
+                label = level[c]
+                if label is not None and (not path or path[-1] != label):
+                    path.append(label)
+            if not path:
+                self.labels.append(None)
+                continue
+            if len(path) == 1:
+                key = (None, None, path[0])
+            elif len(path) == 2:
+                key = (path[0], None, path[1])
+            else:
+                key = (path[0], ' / '.join(path[1:-1]), path[-1])
+            self.labels.append(key)
+            self.columns.setdefault(key, c)
+
+    def _read_params(self, rows, first_row):
+        return {group: [rows[r - first_row][c] for r, c in cells]
+                for group, cells in self.param_cells.items()}
+
+    def with_params(self, rows, first_row):
+        """
+        Copy of the schema carrying the parameter values of another sheet with
+        the same layout. Labels keep the compiled sheet's text (the year in
+        'З початку 2025 року' may differ), which find() does not depend on.
+        """
+        schema = copy.copy(self)
+        schema.params = self._read_params(rows, first_row)
+        return schema
+
+    def find(self, metric, group=None, subgroup=None):
+        """
+        Column index whose labels contain the given fragments (case-insensitive).
+
+        An exact metric label wins over longer ones ('наліт' over 'наліт МЛВ').
+
+        `subgroup=''` requires the column to have no subgroup. Raises KeyError
+        when nothing or more than one column matches.
+        """
+        def ok(label, want):
+            if want is None:
+                return True
+            if want == '':
+                return label is None
+            return label is not None and _norm(want) in _norm(label)
+
+        hits = [(key, c) for key, c in self.columns.items()
+                if ok(key[2], metric) and ok(key[0], group) and ok(key[1], subgroup)]
+        exact = [(key, c) for key, c in hits if _norm(key[2]) == _norm(metric)]
+        hits = [c for _, c in (exact or hits)]
+        if len(hits) != 1:
+            what = f"metric={metric!r} group={group!r} subgroup={subgroup!r}"
+            raise KeyError(f"{len(hits)} columns match {what}")
+        return hits[0]
+
+    def describe(self):
+        lines = []
+        for key, c in sorted(self.columns.items(), key=lambda kv: kv[1]):
+            lines.append(f"  {get_column_letter(c + 1):>2}  " + ' / '.join(k or '-' for k in key))
+        for group, values in self.params.items():
+            lines.append(f"  params[{group!r}] = {values}")
+        return '\n'.join(lines)
+
+
+def layout_signature(rows, merged, first_row, anchor=ANCHOR):
+    """
+    Hash of the header band and the merged ranges crossing it: equal layouts
+    share a schema. Titles above the band and data rows below it are left
+    out; digits in labels are folded ('З початку 2025 року' matches 2026) and
+    other cells count by type only, so dates and numbers do not change it.
+    """
+    top, bottom = header_band(rows, merged, first_row, anchor)
+    h = hashlib.sha1(repr((top, bottom)).encode('utf-8'))
+    for row in rows[top - first_row:bottom - first_row + 1]:
+        cells = [_DIGITS_RE.sub('#', _norm(v)) if _is_label(v) else type(v).__name__ for v in row]
+        while cells and cells[-1] == 'NoneType':
+            cells.pop()
+        h.update(repr(cells).encode('utf-8'))
+    h.update(repr(sorted(r for r in merged if r[1] <= bottom and r[3] >= top)).encode('utf-8'))
+    return h.hexdigest()
+
+
+_schemas = {}   # layout signature -> HeaderSchema
+_files = {}     # (path, size, mtime, sheet, anchor) -> HeaderSchema with that file's params
+
+
+def load_schema(path=WORKBOOK, sheet=SHEET, anchor=ANCHOR, scan=HEADER_SCAN_ROWS):
+    """Compiled schema of a sheet, from cache when the file or layout is known."""
+    stat = os.stat(path)
+    file_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, sheet, anchor)
+    schema = _files.get(file_key)
+    if schema is not None:
+        return schema
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = list(wb[sheet].iter_rows(min_row=1, max_row=scan, values_only=True))
+    finally:
+        wb.close()
+    merged = [r for r in read_merged_ranges(path, sheet) if r[1] <= scan]
+    signature = layout_signature(rows, merged, 1, anchor)
+    schema = _schemas.get(signature)
+    if schema is None:
+        schema = _schemas[signature] = HeaderSchema(rows, merged, 1, anchor)
+    else:
+        # Same layout, but the period dates are this workbook's own.
+        schema = schema.with_params(rows, 1)
+    _files[file_key] = schema
+    return schema
+
+
+def load_block(path=WORKBOOK, sheet=SHEET, schema=None, stop_label=None):
+    """
+    Data rows under the header as a 2-D numpy object array.
+
+    Reading stops at the first row whose first cell is empty, or whose first
+    cell contains `stop_label` (e.g. 'всього' to drop the totals row).
+    """
+    schema = schema or load_schema(path, sheet)
+    width = len(schema.labels)
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        out = []
+        for row in wb[sheet].iter_rows(min_row=schema.first_data_row, max_col=width, values_only=True):
+            first = row[0] if row else None
+            if first is None or (stop_label and _norm(first).find(_norm(stop_label)) >= 0):
+                break
+            out.append(tuple(row) + (None,) * (width - len(row)))
+    finally:
+        wb.close()
+    block = np.empty((len(out), width), dtype=object)
+    for i, row in enumerate(out):
+        block[i] = row
+    return block
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Compile the multi-level header of a report sheet")
+    parser.add_argument('--workbook', default=WORKBOOK)
+    parser.add_argument('--sheet', default=SHEET)
+    parser.add_argument('--anchor', default=ANCHOR, help="label that marks the header row")
+    args = parser.parse_args()
+
+    schema = load_schema(args.workbook, args.sheet, _norm(args.anchor))
+    print(f"{args.sheet}: header rows {schema.header_rows[0]}-{schema.header_rows[1]}")
+    print(schema.describe())
+
+    block = load_block(args.workbook, args.sheet, schema, stop_label='всього')
+    types = block[:, schema.find('тип пс')]
+    hours = block[:, schema.find('наліт', group='з початку', subgroup='')]
+    print("\nНаліт з початку року:")
+    for t, h in zip(types, hours):
+        # Excel stores durations as day fractions; round to whole minutes.
+        print(f"  {t:8} {format_minutes(round(cell_minutes(h)))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Batched, idempotent fan-out of deadline alerts into notifications
+(supabase/migrations/2026101904_notification_fanout.sql).
+
+The first versions of check-deadlines and deadline_scheduler.py wrote one
+notification per alert, each after a "does it exist yet" query against
+metadata. Here a whole run is a few statements:
+
+  1. every alert gets a deterministic key,
+     user|type|condition|aircraft|deadline_date (plus |threshold for the
+     scheduler's 7/3/1-day warnings only); duplicates within the batch
+     collapse
+  2. the keys go into notification_alerts in chunks of CHUNK rows with
+     INSERT ... ON CONFLICT DO NOTHING RETURNING - only alerts never sent
+     before come back
+  3. the new alerts are collapsed into one digest per user per day and
+     upserted into notifications by dedupe_key in chunks; a later run on
+     the same day appends its lines to that day's digest, and the digest's
+     metadata.alerts is recounted from notification_alerts (no JSON
+     functions, so the statement is the same in both databases)
+
+Both steps run in the caller's transaction, so a rerun after a crash sends
+nothing twice. check-deadlines claims its keys in the same ledger before
+it writes, so neither service repeats what the other sent. prune() drops
+ledger rows older than RETENTION_DAYS; digest_key is indexed for the
+per-digest count (2026101908_notification_alerts_retention.sql). The statements are plain multi-row VALUES with ON CONFLICT,
+which Postgres and SQLite (3.35+) both accept; `placeholder` selects the
+DB-API parameter style.
+
+Usage:
+    python scripts/notification_fanout.py --demo 20000
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import sqlite3
+import sys
+import time
+
+CHUNK = 1000
+DIGEST_TYPE = 'deadline_digest'
+DIGEST_TITLE = 'Нагадування про терміни'
+CONDITION_FIELDS = ('mu_condition', 'lp_type', 'commission_type_id', 'check_type')
+# Thresholds only the scheduler sends; its 15-day warning and expiry notice
+# share check-deadlines' keys, so either service sends them once.
+KEYED_THRESHOLDS = (7, 3, 1)
+# A key is needed while the alert could be sent again: warnings start 15
+# days before a deadline, and an expired deadline is not processed again.
+RETENTION_DAYS = 90
+
+Alert = collections.namedtuple('Alert', 'user_id type title body metadata')
+
+
+def alert_key(alert):
+    """Deterministic dedupe key of an alert (matches the migration's backfill)."""
+    meta = alert.metadata
+    condition = next((str(meta[f]) for f in CONDITION_FIELDS if meta.get(f) is not None), '')
+    parts = [str(alert.user_id), alert.type, condition, str(meta.get('aircraft_type_id') or ''),
+             str(meta.get('deadline_date', ''))]
+    if meta.get('threshold') in KEYED_THRESHOLDS:
+        parts.append(str(meta['threshold']))
+    return '|'.join(parts)
+
+
+def digest_key(user_id, day):
+    return f"{DIGEST_TYPE}|{user_id}|{day}"
+
+
+def digest_lines(alerts):
+    """Digest body lines: expired first, then by deadline date."""
+    ordered = sorted(alerts, key=lambda a: (not a.type.endswith('_expired'), a.metadata.get('deadline_date', '')))
+    return '\n'.join(f"• {a.title}: {a.body}" for a in ordered)
+
+
+def _chunks(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _values(width, count, placeholder):
+    row = '(' + ', '.join([placeholder] * width) + ')'
+    return ', '.join([row] * count)
+
+
+def fan_out(cur, alerts, day, placeholder='%s', chunk=CHUNK):
+    """
+    Record `alerts` and write the day's digests; returns (new alerts, digests, statements).
+
+    `day` is the digest date (date or ISO string). Runs inside the caller's
+    transaction.
+    """
+    day = str(day)
+    by_key = {}
+    for alert in alerts:
+        by_key.setdefault(alert_key(alert), alert)
+    statements = 0
+
+    fresh = []
+    rows = [(key, str(a.user_id), a.type, digest_key(a.user_id, day)) for key, a in by_key.items()]
+    for part in _chunks(rows, chunk):
+        cur.execute(
+            f"INSERT INTO notification_alerts (dedupe_key, user_id, type, digest_key) "
+            f"VALUES {_values(4, len(part), placeholder)} "
+            f"ON CONFLICT (dedupe_key) DO NOTHING RETURNING dedupe_key",
+            [v for row in part for v in row])
+        fresh.extend(by_key[r[0]] for r in cur.fetchall())
+        statements += 1
+
+    per_user = collections.defaultdict(list)
+    for alert in fresh:
+        per_user[str(alert.user_id)].append(alert)
+    digests = []
+    for part in _chunks(list(per_user.items()), chunk):
+        # Alerts already in each digest from earlier runs today, plus these.
+        keys = [digest_key(user_id, day) for user_id, _ in part]
+        cur.execute(
+            f"SELECT digest_key, count(*) FROM notification_alerts "
+            f"WHERE digest_key IN ({', '.join([placeholder] * len(keys))}) GROUP BY digest_key", keys)
+        counts = dict(cur.fetchall())
+        statements += 1
+        rows = [(user_id, DIGEST_TITLE, digest_lines(items), DIGEST_TYPE,
+                 json.dumps({'digest_date': day, 'alerts': counts[key]}, ensure_ascii=False), key)
+                for (user_id, items), key in zip(part, keys)]
+        cur.execute(
+            f"INSERT INTO notifications (user_id, title, body, type, metadata, dedupe_key) "
+            f"VALUES {_values(6, len(rows), placeholder)} "
+            f"ON CONFLICT (dedupe_key) DO UPDATE SET body = notifications.body || {placeholder} || excluded.body, "
+            f"metadata = excluded.metadata",
+            [v for row in rows for v in row] + ['\n'])
+        statements += 1
+        digests.extend(rows)
+    return len(fresh), len(digests), statements
+
+
+def prune(cur, today, placeholder='%s', keep_days=RETENTION_DAYS):
+    """Delete ledger rows older than `keep_days` before `today`; returns the count."""
+    cutoff = today - datetime.timedelta(days=keep_days)
+    cur.execute(f"DELETE FROM notification_alerts WHERE created_at < {placeholder}", [str(cutoff)])
+    return cur.rowcount
+
+
+# --- Demo ---------------------------------------------------------------------
+
+SQLITE_SCHEMA = """
+    CREATE TABLE notifications (
+      id INTEGER PRIMARY KEY, user_id TEXT, title TEXT, body TEXT, type TEXT, metadata TEXT,
+      dedupe_key TEXT UNIQUE, created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE notification_alerts (
+      dedupe_key TEXT PRIMARY KEY, user_id TEXT NOT NULL, type TEXT NOT NULL, digest_key TEXT,
+      created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX idx_notification_alerts_digest ON notification_alerts(digest_key);
+"""
+
+
+class CountingCursor:
+    """DB-API cursor wrapper that counts statements (round trips)."""
+
+    def __init__(self, cur):
+        self.cur = cur
+        self.count = 0
+
+    def execute(self, sql, params=()):
+        self.count += 1
+        return self.cur.execute(sql, params)
+
+    def fetchall(self):
+        return self.cur.fetchall()
+
+    @property
+    def rowcount(self):
+        return self.cur.rowcount
+
+
+def synthetic_alerts(n, users=500, seed=11):
+    import random
+    rng = random.Random(seed)
+    kinds = [('mu', 'mu_condition', ['ДПМУ', 'ДСМУ', 'НПМУ']), ('lp', 'lp_type', ['малі_висоти', 'група']),
+             ('commission', 'commission_type_id', ['1', '2']), ('check', 'check_type', ['Техніка пілотування'])]
+    alerts = []
+    for _ in range(n):
+        source, field, values = rng.choice(kinds)
+        expired = rng.random() < 0.3
+        deadline = f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        metadata = {field: rng.choice(values), 'deadline_date': deadline}
+        if source in ('mu', 'lp'):
+            metadata['aircraft_type_id'] = f"ac{rng.randint(1, 4)}"
+        alerts.append(Alert(f"user-{rng.randrange(users)}", f"{source}_{'expired' if expired else 'warning'}",
+                            'Термін закінчився' if expired else 'Термін закінчується',
+                            f"{metadata[field]} - {deadline}", metadata))
+    return alerts
+
+
+def demo(n):
+    conn = sqlite3.connect(':memory:')
+    conn.executescript(SQLITE_SCHEMA)
+    alerts = synthetic_alerts(n)
+    for run, batch in (('first run', alerts), ('rerun (same alerts)', alerts),
+                       ('later run (+10%)', alerts + synthetic_alerts(n // 10, seed=12))):
+        cur = CountingCursor(conn.cursor())
+        t0 = time.perf_counter()
+        with conn:
+            new, digests, _ = fan_out(cur, batch, '2026-10-19', placeholder='?')
+        elapsed = time.perf_counter() - t0
+        print(f"  {run:20}: {len(batch):6} alerts -> {new:6} new, {digests:4} digests, "
+              f"{cur.count:3} statements, {elapsed * 1000:7.1f} ms")
+    total = conn.execute("SELECT count(*), sum(length(body) - length(replace(body, char(10), '')) + 1), "
+                         "sum(json_extract(metadata, '$.alerts')) FROM notifications").fetchone()
+    print(f"  notifications: {total[0]} digests holding {total[1]} alert lines, metadata counts {total[2]} "
+          f"({conn.execute('SELECT count(*) FROM notification_alerts').fetchone()[0]} distinct alerts)")
+    with conn:
+        conn.execute("UPDATE notification_alerts SET created_at = '2026-06-01 08:00:00' WHERE rowid % 2 = 0")
+        pruned = prune(conn.cursor(), datetime.date(2026, 10, 19), placeholder='?')
+    print(f"  prune older than {RETENTION_DAYS} days: {pruned} ledger rows deleted")
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Deadline alert fan-out")
+    parser.add_argument('--demo', type=int, default=20000, metavar='ALERTS',
+                        help="run against an in-memory SQLite database")
+    args = parser.parse_args()
+    print(f"Fan-out of {args.demo} alerts (SQLite in memory, chunks of {CHUNK}):")
+    demo(args.demo)
+
+
+if __name__ == "__main__":
+    main()
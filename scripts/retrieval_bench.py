@@ -0,0 +1,220 @@
+"""
+Retrieval benchmark for the guide Q&A pipeline.
+
+Runs the curated question set (retrieval_questions.json - questions with the
+passages of ПВП ДАУ, КБП ВА and КЛПВ that should answer them) against several
+chunking / index format / document filter variants (none, aliases detected in
+the question by doc_aliases, or the known source document) and reports, per
+variant:
+
+  recall@1/5/10  - share of questions with a relevant chunk in the top k
+  mrr            - mean reciprocal rank of the first relevant chunk
+  avg_candidates - chunks scored per question (partition size after filtering)
+  build_s        - chunking + embedding + index build time
+  index_bytes    - resident size of the stored vectors
+  peak_mem_bytes - peak Python allocation while building
+  p50_ms/p99_ms  - per-question latency (embed + search)
+
+A chunk is relevant when it belongs to the question's document and contains
+one of the expected passages (compared after normalize_text()).
+
+Embeddings come from the offline HashingEmbedder, so absolute numbers are
+lower than with OpenAI embeddings, but variants are comparable with each other
+and between runs.
+
+Usage:
+    python scripts/retrieval_bench.py --output bench.json
+    python scripts/retrieval_bench.py --baseline bench.json   # exit 1 on regression
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import doc_aliases
+import guide_retrieval
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+QUESTIONS_FILE = os.path.join(SCRIPT_DIR, "retrieval_questions.json")
+
+CHUNKINGS = [(1000, 200), (2000, 300), (3000, 500)]
+FORMATS = ['float32', 'int8']
+FILTERS = ['none', 'alias', 'document']
+KS = (1, 5, 10)
+
+# Metrics where a lower value is a regression, and where a higher one is.
+HIGHER_IS_BETTER = ['recall@1', 'recall@5', 'recall@10', 'mrr']
+LOWER_IS_BETTER = ['p99_ms', 'index_bytes']
+# Sub-millisecond timings are noisy on shared CI runners.
+LATENCY_SLACK_MS = 5.0
+
+
+def load_questions(path=QUESTIONS_FILE):
+    with open(path, 'r', encoding='utf-8') as f:
+        questions = json.load(f)
+    for q in questions:
+        q['expected_norm'] = [guide_retrieval.normalize_text(e) for e in q['expected']]
+    return questions
+
+
+def relevance(chunks, question):
+    """Boolean mask of chunks that answer the question."""
+    mask = np.zeros(len(chunks), dtype=bool)
+    for i, chunk in enumerate(chunks):
+        if chunk['document'] != question['document']:
+            continue
+        text = chunk.get('norm') or guide_retrieval.normalize_text(chunk['text'])
+        mask[i] = any(e in text for e in question['expected_norm'])
+    return mask
+
+
+def variant_name(max_chars, overlap, fmt, doc_filter):
+    return f"c{max_chars}-o{overlap}-{fmt}-{doc_filter}"
+
+
+def run_variant(chunks, vectors, questions, embedder, fmt, doc_filter, chunk_seconds):
+    """Build one index and evaluate every question against it."""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    index = guide_retrieval.ChunkIndex(chunks, vectors, fmt)
+    build_s = chunk_seconds + time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    max_k = max(KS)
+    hits = {k: 0 for k in KS}
+    reciprocal_ranks = []
+    latencies = []
+    unanswerable = []
+    candidates = []
+
+    for q in questions:
+        relevant = q['relevant']
+        if not relevant.any():
+            unanswerable.append(q['id'])
+
+        # The alias variant asks the question_alias wording where there is one
+        # (the same question naming its document); the others keep the original.
+        text = q.get('question_alias', q['question']) if doc_filter == 'alias' else q['question']
+        started = time.perf_counter()
+        query = embedder.embed([text])
+        if doc_filter == 'document':
+            documents = [q['document']]
+        elif doc_filter == 'alias':
+            documents = doc_aliases.resolve_documents(text, index.titles())
+        else:
+            documents = None
+        results = index.search(query, max_k, documents)
+        latencies.append((time.perf_counter() - started) * 1000)
+        candidates.append(index.candidates(documents))
+
+        ranks = [rank for rank, (idx, _) in enumerate(results, start=1) if relevant[idx]]
+        first = ranks[0] if ranks else None
+        for k in KS:
+            hits[k] += int(first is not None and first <= k)
+        reciprocal_ranks.append(1.0 / first if first else 0.0)
+
+    n = len(questions)
+    result = {f'recall@{k}': round(hits[k] / n, 4) for k in KS}
+    result.update({
+        'mrr': round(float(np.mean(reciprocal_ranks)), 4),
+        'chunks': len(chunks),
+        'avg_candidates': round(float(np.mean(candidates)), 1),
+        'build_s': round(build_s, 3),
+        'index_bytes': int(index.nbytes()),
+        'peak_mem_bytes': int(peak),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+    })
+    if unanswerable:
+        result['unanswerable'] = unanswerable
+    return result
+
+
+def run_benchmark(documents, questions, chunkings=CHUNKINGS, formats=FORMATS, filters=FILTERS):
+    embedder = guide_retrieval.HashingEmbedder()
+    variants = {}
+
+    for max_chars, overlap in chunkings:
+        # Chunking and embedding are shared by all formats/filters of a size.
+        t0 = time.perf_counter()
+        chunks = guide_retrieval.build_chunks(documents, max_chars, overlap)
+        vectors = embedder.embed([c['text'] for c in chunks])
+        chunk_seconds = time.perf_counter() - t0
+
+        for c in chunks:
+            c['norm'] = guide_retrieval.normalize_text(c['text'])
+        for q in questions:
+            q['relevant'] = relevance(chunks, q)
+
+        for fmt in formats:
+            for doc_filter in filters:
+                name = variant_name(max_chars, overlap, fmt, doc_filter)
+                print(f"  {name} ...", file=sys.stderr)
+                variants[name] = run_variant(chunks, vectors, questions, embedder,
+                                             fmt, doc_filter, chunk_seconds)
+    return variants
+
+
+def compare_to_baseline(current, baseline, max_drop=0.02, max_slowdown=2.0):
+    """Return human-readable regressions of `current` against `baseline`."""
+    problems = []
+    for name, cur in current['variants'].items():
+        base = baseline.get('variants', {}).get(name)
+        if base is None:
+            continue
+        for metric in HIGHER_IS_BETTER:
+            if metric in base and cur[metric] < base[metric] - max_drop:
+                problems.append(f"{name}: {metric} {base[metric]} -> {cur[metric]}")
+        for metric in LOWER_IS_BETTER:
+            slack = LATENCY_SLACK_MS if metric.endswith('_ms') else 0
+            if metric in base and base[metric] and cur[metric] > base[metric] * max_slowdown + slack:
+                problems.append(f"{name}: {metric} {base[metric]} -> {cur[metric]}")
+    return problems
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Guide retrieval benchmark")
+    parser.add_argument('--docs-dir', default=guide_retrieval.DOCS_DIR)
+    parser.add_argument('--questions', default=QUESTIONS_FILE)
+    parser.add_argument('--quick', action='store_true', help="only the default ingest settings (2000/300)")
+    parser.add_argument('--output', help="write JSON results to this file")
+    parser.add_argument('--baseline', help="compare against a previous JSON result")
+    parser.add_argument('--max-drop', type=float, default=0.02, help="allowed recall/MRR drop")
+    args = parser.parse_args()
+
+    documents = guide_retrieval.load_documents(args.docs_dir)
+    questions = load_questions(args.questions)
+    chunkings = [(2000, 300)] if args.quick else CHUNKINGS
+
+    report = {
+        'questions': len(questions),
+        'documents': [title for title, _ in documents],
+        'variants': run_benchmark(documents, questions, chunkings),
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        problems = compare_to_baseline(report, baseline, args.max_drop)
+        if problems:
+            print("\nREGRESSIONS:", file=sys.stderr)
+            for p in problems:
+                print(f"  {p}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Squadron flight-shift scheduler: shares a shift's sorties across pilots and
+aircraft types so that as many currencies as possible stay valid.
+
+training_plan_solver.py plans one pilot at a time; a commander has a fixed
+number of sorties per aircraft type per shift and every pilot can fly only
+so many (4 for class 3, 5 otherwise, as in training-planner). Here:
+
+  - targets come from break_engine.compute(): lapsed cells (red) need one
+    control and one training flight, cells lapsing within --horizon days
+    (yellow) need one training flight (a training flight gives the full
+    extension); gray cells (never flown) only with --include-gray
+  - every (pilot, aircraft) gets the candidate sorties of its KBP document
+    from training_plan_solver.candidates(), restricted to the bits it needs
+  - objective: number of currencies whose required bits are all covered
+  - a lazy greedy fills the shift by gain per flight (partial progress on a
+    currency counts PARTIAL of its value so control/training pairs get
+    started), then ruin-and-recreate local search - drop a few random
+    sorties, refill greedily, keep the result unless it is worse - runs
+    until the time budget is spent; every improvement is logged to the
+    objective trace as (ms, objective)
+
+Connection for --db: SUPABASE_DB_URL (postgresql://...) from the environment.
+
+Usage:
+    python scripts/shift_scheduler.py --bench 120
+    python scripts/shift_scheduler.py --db --slots "Су-27=8,Ми-8=6" --budget 2
+"""
+
+import argparse
+import collections
+import datetime
+import heapq
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+import break_engine
+from training_plan_solver import FLIGHTS_PER_SHIFT, Exercise, Requirements, candidates
+
+PARTIAL = 0.4          # value of a half-restored currency in the greedy score (not in the objective)
+RUIN = (1, 3)          # local search drops this many sorties per move
+DEFAULT_BUDGET = 1.0   # seconds of local search
+
+Unit = collections.namedtuple('Unit', 'user_id pilot aircraft_type_id aircraft need currencies sorties')
+Choice = collections.namedtuple('Choice', 'unit sortie')
+
+
+def build_units(grid, exercises, horizon=break_engine.WARN_DAYS, include_gray=False):
+    """(pilot, aircraft) units with their target currencies and candidate sorties."""
+    lapsed = grid['status'] == break_engine.RED
+    if include_gray:
+        lapsed |= grid['status'] == break_engine.GRAY
+    soon = (grid['status'] != break_engine.RED) & (grid['days_left'] > 0) & (grid['days_left'] <= horizon)
+    targets = grid[lapsed | soon].assign(lapsed=lapsed[lapsed | soon])
+    units = []
+    for (user_id, aircraft_id), cells in targets.groupby(['user_id', 'aircraft_type_id'], sort=False):
+        lp_cells = cells[cells['kind'] == 'lp']
+        documents = lp_cells['kbp_document'].dropna()
+        document = documents.mode().iloc[0] if len(documents) else break_engine.KBP_ORDER[0]
+        req = Requirements(lp_cells['condition'], cells.loc[cells['kind'] == 'mu', 'condition'])
+        need, currencies = 0, []
+        for cell in cells.itertuples():
+            mask = req.mask([cell.condition], False)
+            if cell.lapsed:
+                mask |= req.mask([cell.condition], True)
+            need |= mask
+            currencies.append(mask)
+        sorties = [s._replace(mask=s.mask & need) for s in candidates(exercises.get(document, []), req)
+                   if s.mask & need]
+        if sorties:
+            units.append(Unit(user_id, cells['pilot'].iloc[0], aircraft_id, cells['aircraft'].iloc[0],
+                              need, currencies, sorties))
+    return units
+
+
+def _restored(unit, covered):
+    return sum(1 for m in unit.currencies if m & ~covered == 0)
+
+
+def _potential(unit, covered):
+    total = 0.0
+    for m in unit.currencies:
+        done = bin(m & covered).count('1')
+        total += 1.0 if done == bin(m).count('1') else PARTIAL * done / bin(m).count('1')
+    return total
+
+
+class Shift:
+    """Assignment state: chosen sorties per unit, flights per pilot and per aircraft type."""
+
+    def __init__(self, units, slots, pilot_flights):
+        self.units = units
+        self.slots = dict(slots)
+        self.pilot_flights = pilot_flights
+        self.chosen = [[] for _ in units]
+        self.covered = [0] * len(units)
+        self.used_slots = collections.Counter()
+        self.used_flights = collections.Counter()
+
+    def fits(self, u, sortie):
+        unit = self.units[u]
+        return (self.used_slots[unit.aircraft_type_id] + sortie.cost <= self.slots.get(unit.aircraft_type_id, 0)
+                and self.used_flights[unit.user_id] + sortie.cost <= self.pilot_flights[unit.user_id])
+
+    def gain(self, u, sortie):
+        unit, covered = self.units[u], self.covered[u]
+        return (_potential(unit, covered | sortie.mask) - _potential(unit, covered)) / sortie.cost
+
+    def add(self, u, sortie):
+        unit = self.units[u]
+        self.chosen[u].append(sortie)
+        self.covered[u] |= sortie.mask
+        self.used_slots[unit.aircraft_type_id] += sortie.cost
+        self.used_flights[unit.user_id] += sortie.cost
+
+    def remove(self, u, index):
+        unit = self.units[u]
+        sortie = self.chosen[u].pop(index)
+        covered = 0
+        for s in self.chosen[u]:
+            covered |= s.mask
+        self.covered[u] = covered
+        self.used_slots[unit.aircraft_type_id] -= sortie.cost
+        self.used_flights[unit.user_id] -= sortie.cost
+
+    def objective(self):
+        return sum(_restored(unit, c) for unit, c in zip(self.units, self.covered))
+
+    def score(self):
+        """Objective, then partial progress and fewer flights as tie-breaks."""
+        return (self.objective(), sum(_potential(unit, c) for unit, c in zip(self.units, self.covered)),
+                -sum(self.used_slots.values()))
+
+    def snapshot(self):
+        return [list(c) for c in self.chosen], list(self.covered), self.used_slots.copy(), self.used_flights.copy()
+
+    def restore(self, snap):
+        self.chosen, self.covered, self.used_slots, self.used_flights = \
+            [list(c) for c in snap[0]], list(snap[1]), snap[2].copy(), snap[3].copy()
+
+    def fill(self, units=None):
+        """Lazy greedy: add the best feasible sortie by gain per flight until nothing helps."""
+        heap = [(-self.gain(u, s), u, i) for u in (units if units is not None else range(len(self.units)))
+                for i, s in enumerate(self.units[u].sorties)]
+        heapq.heapify(heap)
+        while heap:
+            neg, u, i = heapq.heappop(heap)
+            sortie = self.units[u].sorties[i]
+            if not self.fits(u, sortie):
+                continue                     # capacity only shrinks while filling
+            gain = self.gain(u, sortie)
+            if gain <= 1e-12:
+                continue
+            if heap and gain < -heap[0][0] - 1e-12:
+                heapq.heappush(heap, (-gain, u, i))
+                continue
+            self.add(u, sortie)
+
+    def assignment(self):
+        return [Choice(self.units[u], s) for u in range(len(self.units)) for s in self.chosen[u]]
+
+
+def schedule(units, slots, pilot_flights, budget=DEFAULT_BUDGET, seed=0):
+    """Greedy shift plan improved by ruin-and-recreate for `budget` seconds; returns (shift, trace)."""
+    rng = random.Random(seed)
+    t0 = time.perf_counter()
+    shift = Shift(units, slots, pilot_flights)
+    shift.fill()
+    best = shift.score()
+    trace = [((time.perf_counter() - t0) * 1000, best[0])]
+    by_aircraft = collections.defaultdict(list)
+    by_pilot = collections.defaultdict(list)
+    for u, unit in enumerate(units):
+        by_aircraft[unit.aircraft_type_id].append(u)
+        by_pilot[unit.user_id].append(u)
+
+    while time.perf_counter() - t0 < budget:
+        placed = [(u, i) for u in range(len(units)) for i in range(len(shift.chosen[u]))]
+        if not placed:
+            break
+        snap = shift.snapshot()
+        touched = set()
+        for u, i in sorted(rng.sample(placed, min(len(placed), rng.randint(*RUIN))), reverse=True):
+            shift.remove(u, i)
+            touched.update(by_aircraft[units[u].aircraft_type_id])
+            touched.update(by_pilot[units[u].user_id])
+        shift.fill(touched)
+        score = shift.score()
+        if score >= best:
+            if score[0] > best[0]:
+                trace.append(((time.perf_counter() - t0) * 1000, score[0]))
+            best = score
+        else:
+            shift.restore(snap)
+    return shift, trace
+
+
+def pilot_capacity(grid):
+    classes = grid.drop_duplicates('user_id').set_index('user_id')['military_class']
+    return {u: FLIGHTS_PER_SHIFT.get(int(c), 5) for u, c in classes.items()}
+
+
+def sequential(units, slots, pilot_flights):
+    """Baseline: pilots by number of targets, each gets a whole greedy plan while capacity lasts."""
+    shift = Shift(units, slots, pilot_flights)
+    for u in sorted(range(len(units)), key=lambda u: -len(units[u].currencies)):
+        shift.fill([u])
+    return shift
+
+
+# --- Benchmark ----------------------------------------------------------------
+
+def synthetic_exercises(t, per_document=40, seed=4):
+    """KBP exercises over each document's LP types, plus the MU exercises 28/29."""
+    rng = np.random.default_rng(seed)
+    out = {}
+    for document, lp in t.lp_periods.dropna(subset=['kbp_document']).groupby('kbp_document')['condition']:
+        lp = lp.unique()
+        exercises = []
+        for i in range(per_document):
+            k = min(len(lp), rng.choice([1, 1, 2, 2, 3]))
+            exercises.append(Exercise(f'{document}-{i}', str(i + 1), f'Вправа {i + 1}',
+                                      list(rng.choice(lp, k, replace=False)), int(rng.choice([1, 1, 1, 2])),
+                                      bool(rng.random() < 0.4)))
+        exercises.append(Exercise(f'{document}-28', '28', 'Контрольний політ у хмарах', [], 1, True))
+        exercises.append(Exercise(f'{document}-29', '29', 'Політ у хмарах з заходом на посадку', [], 1, False))
+        out[document] = exercises
+    return out
+
+
+def bench(pilots, budget):
+    today = datetime.date(2026, 10, 19)
+    t = break_engine.synthetic_tables(pilots, today=today)
+    grid = break_engine.compute(t, today)
+    t0 = time.perf_counter()
+    units = build_units(grid, synthetic_exercises(t))
+    build = time.perf_counter() - t0
+    per_type = collections.Counter(u.aircraft_type_id for u in units)
+    slots = {a: max(2, n) for a, n in per_type.items()}          # about one sortie per pilot and type
+    flights = pilot_capacity(grid)
+    targets = sum(len(u.currencies) for u in units)
+    print(f"{pilots} pilots, {len(units)} pilot/aircraft units, {targets} lapsed or lapsing currencies, "
+          f"{sum(slots.values())} sorties in the shift (units built in {build * 1000:.0f} ms)")
+
+    base = sequential(units, slots, flights)
+    print(f"  pilot by pilot       : {base.objective():4} currencies kept")
+    for b in (0.0, budget / 10, budget):
+        t0 = time.perf_counter()
+        shift, trace = schedule(units, slots, flights, budget=b)
+        elapsed = (time.perf_counter() - t0) * 1000
+        print(f"  greedy + {b:4.1f} s search: {shift.objective():4} currencies kept, "
+              f"{sum(shift.used_slots.values())} sorties, {elapsed:6.0f} ms")
+    print("  objective trace (ms, currencies): " + ', '.join(f"({ms:.0f}, {v})" for ms, v in trace))
+
+
+# --- Main ---------------------------------------------------------------------
+
+def _parse_slots(text, aircraft):
+    by_name = dict(zip(aircraft['aircraft'], aircraft['aircraft_type_id']))
+    slots = {}
+    for part in filter(None, (p.strip() for p in text.split(','))):
+        name, _, count = part.partition('=')
+        if name.strip() not in by_name:
+            raise SystemExit(f"Unknown aircraft type {name.strip()!r}")
+        slots[by_name[name.strip()]] = int(count)
+    return slots
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Squadron flight-shift scheduler")
+    parser.add_argument('--bench', type=int, metavar='PILOTS', help="schedule a synthetic squadron")
+    parser.add_argument('--db', action='store_true', help="schedule from the database")
+    parser.add_argument('--slots', default='', help="sorties per aircraft type, e.g. \"Су-27=8,Ми-8=6\"")
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET, help="local search seconds")
+    parser.add_argument('--horizon', type=int, default=break_engine.WARN_DAYS,
+                        help="also keep currencies lapsing within this many days")
+    parser.add_argument('--include-gray', action='store_true', help="also target never-flown currencies")
+    args = parser.parse_args()
+
+    if args.bench or not args.db:
+        bench(args.bench or 120, args.budget)
+        return
+
+    import psycopg2
+    dsn = os.environ.get('SUPABASE_DB_URL')
+    if not dsn:
+        raise SystemExit("SUPABASE_DB_URL is not set")
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn, conn.cursor() as cur:
+            t = break_engine.BreakTables.load(cur)
+            cur.execute("SELECT document, id, number::text, name, lp_types, flights_count, is_control "
+                        "FROM exercises ORDER BY document, number")
+            exercises = collections.defaultdict(list)
+            for document, *row in cur.fetchall():
+                exercises[document].append(Exercise(*row))
+    finally:
+        conn.close()
+
+    grid = break_engine.compute(t, datetime.date.today())
+    slots = _parse_slots(args.slots, t.aircraft)
+    if not slots:
+        raise SystemExit("--slots is required with --db")
+    units = build_units(grid, exercises, args.horizon, args.include_gray)
+    shift, trace = schedule(units, slots, pilot_capacity(grid), budget=args.budget)
+    for choice in sorted(shift.assignment(), key=lambda c: (c.unit.aircraft, c.unit.pilot,
+                                                            not c.sortie.exercise.is_control)):
+        ex = choice.sortie.exercise
+        mu = f" у {choice.sortie.mu}" if choice.sortie.mu else ''
+        print(f"  {choice.unit.aircraft:8} {choice.unit.pilot:24} {ex.number:>6} x{choice.sortie.cost} "
+              f"{'КОНТР.' if ex.is_control else 'ТРЕН. '}{mu}")
+    print(f"Збережено допусків: {shift.objective()} з {sum(len(u.currencies) for u in units)}, "
+          f"вильотів: {sum(shift.used_slots.values())} з {sum(slots.values())}")
+    print("Хід оптимізації (мс, допуски): " + ', '.join(f"({ms:.0f}, {v})" for ms, v in trace))
+
+
+if __name__ == "__main__":
+    main()
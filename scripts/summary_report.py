@@ -0,0 +1,337 @@
+"""
+Підсумки report writer: the "Облік нальоту" summary layout, generated from
+flight_aggregates.sheet_summary() for any number of pilots and aircraft
+types.
+
+The sheet is written with xlsxwriter in constant_memory mode: each row is
+flushed to disk as soon as the next one starts, so memory stays flat no
+matter how many pilots the brigade has. The layout follows the workbook:
+
+  - "Додаток 1" and the merged title line
+  - the three header rows: №, (ПІБ,) Тип ПС merged down, "В період" with
+    the period dates, "З початку <year> року" over the year columns and
+    "Випроб. польоти (з них МЛВ)" over the test columns
+  - one row per aircraft type; per pilot they are followed by a "Всього"
+    row (SUM formulas with cached values) and the sheet ends with
+    brigade totals per aircraft type and the "Виконано за період" line
+  - flight times as [h]:mm durations
+
+In constant_memory mode xlsxwriter only accepts merges that start on the
+row being written, and merge_range() pads the whole area with blanks, which
+flushes the current row early. Merges within one row use merge_range();
+the vertical ones (№, Тип ПС, the period metrics) are written cell by cell
+in row order and registered afterwards through Worksheet.merge, which ties
+the script to xlsxwriter 3.x (checked at import).
+
+Usage:
+    python scripts/summary_report.py --out Підсумки.xlsx
+    python scripts/summary_report.py --out brigade.xlsx --by-pilot --from 2026-01-01 --to 2026-01-31
+    python scripts/summary_report.py --bench 400
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import xlsxwriter
+from xlsxwriter.utility import xl_rowcol_to_cell
+
+import aviation_time
+import flight_aggregates
+import flight_log_import
+
+# Worksheet.merge layout used by _register_merge().
+XLSXWRITER_MERGE = '3.'
+if not xlsxwriter.__version__.startswith(XLSXWRITER_MERGE):
+    raise ImportError(f"summary_report needs xlsxwriter {XLSXWRITER_MERGE}x, found {xlsxwriter.__version__}")
+
+# Metric columns in Підсумки order.
+PERIOD_METRICS = [('period_flights', 'польотів'), ('period_minutes', 'наліт'), ('period_combat', 'бой заст')]
+YEAR_METRICS = [('year_flights', 'польотів'), ('year_minutes', 'наліт'), ('year_combat', 'бой заст')]
+TEST_METRICS = [('test_flights', 'польотів'), ('test_minutes', 'наліт'),
+                ('mlv_flights', 'пол.МЛВ'), ('mlv_minutes', 'наліт МЛВ')]
+METRICS = [m for m, _ in PERIOD_METRICS + YEAR_METRICS + TEST_METRICS]
+
+TITLE = "Підсумки льотної підготовки станом на {date:%d.%m.%Y}"
+HEADER_TOP = 3          # 0-based row of the first header row (row 4 in Excel)
+MINUTES_PER_DAY = aviation_time.MINUTES_PER_DAY
+
+
+def _formats(wb):
+    base = {'font_name': 'Times New Roman', 'font_size': 11, 'border': 1, 'valign': 'vcenter'}
+    return {
+        'title': wb.add_format({'font_name': 'Times New Roman', 'font_size': 12, 'bold': True, 'align': 'center'}),
+        'note': wb.add_format({'font_name': 'Times New Roman', 'font_size': 11, 'align': 'right'}),
+        'header': wb.add_format({**base, 'bold': True, 'align': 'center', 'text_wrap': True}),
+        'subheader': wb.add_format({**base, 'align': 'center', 'text_wrap': True}),
+        'date': wb.add_format({**base, 'bold': True, 'align': 'center', 'num_format': 'dd.mm.yyyy'}),
+        'text': wb.add_format(base),
+        'count': wb.add_format({**base, 'align': 'center', 'num_format': '0'}),
+        'time': wb.add_format({**base, 'align': 'center', 'num_format': '[h]:mm'}),
+        'total_text': wb.add_format({**base, 'bold': True}),
+        'total_count': wb.add_format({**base, 'bold': True, 'align': 'center', 'num_format': '0'}),
+        'total_time': wb.add_format({**base, 'bold': True, 'align': 'center', 'num_format': '[h]:mm'}),
+        'footer': wb.add_format({'font_name': 'Times New Roman', 'font_size': 11, 'bold': True}),
+        'footer_time': wb.add_format({'font_name': 'Times New Roman', 'font_size': 11, 'bold': True,
+                                      'num_format': '[h]:mm'}),
+    }
+
+
+def header_ranges(key_labels, period, year):
+    """
+    Header cells as (first_row, first_col, last_row, last_col, value, format)
+    relative to HEADER_TOP, for key columns followed by the metric columns.
+    """
+    k = len(key_labels)
+    cells = [(0, c, 2, c, label, 'header') for c, label in enumerate(key_labels)]
+    cells.append((0, k, 0, k, 'В період', 'header'))
+    cells.append((0, k + 1, 0, k + 1, period[0], 'date'))
+    cells.append((0, k + 2, 0, k + 2, period[1], 'date'))
+    for i, (_, label) in enumerate(PERIOD_METRICS):
+        cells.append((1, k + i, 2, k + i, label, 'subheader'))
+    y = k + len(PERIOD_METRICS)
+    cells.append((0, y, 0, y + len(YEAR_METRICS) + len(TEST_METRICS) - 1, f'З початку {year} року', 'header'))
+    for i, (_, label) in enumerate(YEAR_METRICS):
+        cells.append((1, y + i, 2, y + i, label, 'subheader'))
+    t = y + len(YEAR_METRICS)
+    cells.append((1, t, 1, t + len(TEST_METRICS) - 1, 'Випроб. польоти (з них МЛВ)', 'subheader'))
+    for i, (_, label) in enumerate(TEST_METRICS):
+        cells.append((2, t + i, 2, t + i, label, 'subheader'))
+    return cells
+
+
+def write_header(ws, fmt, cells, top=HEADER_TOP):
+    """
+    Write header cells strictly in row order. Merges within one row go
+    through merge_range() on their row; merges down several rows are
+    registered once their cells are written.
+    """
+    last = max(c[2] for c in cells)
+    for r in range(last + 1):
+        for r1, c1, r2, c2, value, style in sorted(cells, key=lambda c: c[1]):
+            if not r1 <= r <= r2:
+                continue
+            if r1 == r2 and c1 != c2:
+                ws.merge_range(top + r, c1, top + r, c2, value, fmt[style])
+                continue
+            for c in range(c1, c2 + 1):
+                if r == r1 and c == c1:
+                    ws.write(top + r, c, value, fmt[style])
+                else:
+                    ws.write_blank(top + r, c, None, fmt[style])
+    for r1, c1, r2, c2, _, _ in cells:
+        if r1 != r2:
+            _register_merge(ws, top + r1, c1, top + r2, c2)
+    return top + last + 1
+
+
+def _register_merge(ws, first_row, first_col, last_row, last_col):
+    # xlsxwriter has no public call for this: merge_range() pads every row of
+    # the area, and in constant_memory mode writing a later row flushes the
+    # current one, so A4:A6 would leave rows 4-5 half written. The cells are
+    # already written in row order; only the <mergeCell> entry is missing,
+    # which is what merge_range() itself appends to Worksheet.merge
+    # (xlsxwriter 3.x, see XLSXWRITER_MERGE).
+    ws.merge.append([first_row, first_col, last_row, last_col])
+
+
+def _metric_cells(ws, row, col, values, fmt, total=False):
+    for i, metric in enumerate(METRICS):
+        value = values[metric]
+        if metric in flight_aggregates.MINUTE_METRICS:
+            ws.write_number(row, col + i, value / MINUTES_PER_DAY, fmt['total_time' if total else 'time'])
+        else:
+            ws.write_number(row, col + i, value, fmt['total_count' if total else 'count'])
+
+
+def _sum_row(ws, row, col, first, last, totals, fmt):
+    for i, metric in enumerate(METRICS):
+        ref = f"{xl_rowcol_to_cell(first, col + i)}:{xl_rowcol_to_cell(last, col + i)}"
+        value = totals[metric]
+        if metric in flight_aggregates.MINUTE_METRICS:
+            ws.write_formula(row, col + i, f"=SUM({ref})", fmt['total_time'], value / MINUTES_PER_DAY)
+        else:
+            ws.write_formula(row, col + i, f"=SUM({ref})", fmt['total_count'], value)
+
+
+def write_summary(path, summary, period, year, by_pilot=False, as_of=None):
+    """
+    Write a Підсумки sheet from sheet_summary() output.
+
+    `summary` is indexed by aircraft_type, or by (pilot, aircraft_type) when
+    `by_pilot`; `period` is (start, end); `year` labels the year columns.
+    Returns the number of data rows written.
+    """
+    as_of = as_of or datetime.date.today()
+    key_labels = ['№', 'ПІБ', 'Тип ПС'] if by_pilot else ['№', 'Тип ПС']
+    k = len(key_labels)
+    width = k + len(METRICS)
+    if by_pilot:
+        # A pilot's aircraft types without any flights in the year are noise.
+        summary = summary[summary[METRICS].to_numpy().any(axis=1)]
+    values = summary[METRICS].to_numpy(dtype=np.int64)
+
+    wb = xlsxwriter.Workbook(path, {'constant_memory': True})
+    try:
+        fmt = _formats(wb)
+        ws = wb.add_worksheet('Підсумки')
+        ws.set_column(0, 0, 7)
+        ws.set_column(1, k - 1, 22 if by_pilot else 10)
+        ws.set_column(k - 1, k - 1, 10)
+        ws.set_column(k, width - 1, 11.5)
+
+        ws.write(0, width - 1, 'Додаток 1', fmt['note'])
+        ws.merge_range(1, 0, 1, width - 3, TITLE.format(date=as_of), fmt['title'])
+        start, end = [pd.Timestamp(d).to_pydatetime() for d in period]
+        row = write_header(ws, fmt, header_ranges(key_labels, (start, end), year))
+        ws.freeze_panes(row, k)
+
+        written = 0
+        if by_pilot:
+            pilots = summary.index.get_level_values(0)
+            types = summary.index.get_level_values(1)
+            bounds = np.flatnonzero(np.r_[True, pilots[1:] != pilots[:-1], True])
+            for n, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:]), start=1):
+                first = row
+                for i in range(lo, hi):
+                    if i == lo:
+                        ws.write_string(row, 0, f'{n}.', fmt['text'])
+                        ws.write_string(row, 1, str(pilots[i]), fmt['text'])
+                    else:
+                        ws.write_blank(row, 0, None, fmt['text'])
+                        ws.write_blank(row, 1, None, fmt['text'])
+                    ws.write_string(row, 2, str(types[i]), fmt['text'])
+                    _metric_cells(ws, row, k, dict(zip(METRICS, values[i])), fmt)
+                    row += 1
+                    written += 1
+                ws.write_blank(row, 0, None, fmt['total_text'])
+                ws.write_blank(row, 1, None, fmt['total_text'])
+                ws.write_string(row, 2, 'Всього', fmt['total_text'])
+                _sum_row(ws, row, k, first, row - 1, dict(zip(METRICS, values[lo:hi].sum(axis=0))), fmt)
+                row += 1
+            by_type = summary.groupby(level=1, observed=True)[METRICS].sum()
+            row += 1
+            ws.write_string(row, 0, 'Всього по бригаді:', fmt['footer'])
+            row += 1
+        else:
+            by_type = summary[METRICS]
+
+        first = row
+        for n, (aircraft, totals) in enumerate(by_type.iterrows(), start=1):
+            ws.write_string(row, 0, f'{n}.', fmt['text'])
+            if by_pilot:
+                ws.write_blank(row, 1, None, fmt['text'])
+            ws.write_string(row, k - 1, str(aircraft), fmt['text'])
+            _metric_cells(ws, row, k, totals, fmt)
+            row += 1
+            if not by_pilot:
+                written += 1
+        grand = by_type.sum()
+        ws.write_string(row, 0, '  Всього', fmt['total_text'])
+        for c in range(1, k):
+            ws.write_blank(row, c, None, fmt['total_text'])
+        _sum_row(ws, row, k, first, row - 1, grand, fmt)
+        total_row = row
+
+        row += 1
+        ws.write_string(row, 0, 'Виконано за період:', fmt['footer'])
+        ws.write_string(row, k + 3, 'Польотів - ', fmt['footer'])
+        ws.write_formula(row, k + 4, f"={xl_rowcol_to_cell(total_row, k)}", fmt['footer'],
+                         int(grand['period_flights']))
+        ws.write_string(row, k + 5, 'Наліт -', fmt['footer'])
+        ws.write_formula(row, k + 6, f"={xl_rowcol_to_cell(total_row, k + 1)}", fmt['footer_time'],
+                         grand['period_minutes'] / MINUTES_PER_DAY)
+    finally:
+        wb.close()
+    return written
+
+
+def report_from_workbook(path, out, start, end, by_pilot=False):
+    """Підсумки for [start, end] from the workbook's Main sheet."""
+    df = flight_aggregates.load_flights(flight_log_import.iter_flights(path))
+    year_start = pd.Timestamp(pd.Timestamp(start).year, 1, 1)
+    by = ('pilot', 'aircraft_type') if by_pilot else ('aircraft_type',)
+    summary = flight_aggregates.sheet_summary(df, start, end, year_start, by=by)
+    return write_summary(out, summary, (start, end), year_start.year, by_pilot)
+
+
+# --- Benchmark ---------------------------------------------------------------
+
+def openpyxl_write(path, summary):
+    """Baseline: the same rows as openpyxl cell objects, saved at the end."""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for r, (key, totals) in enumerate(summary[METRICS].iterrows(), start=7):
+        ws.cell(row=r, column=1, value=f'{r - 6}.')
+        ws.cell(row=r, column=2, value=str(key[0]))
+        ws.cell(row=r, column=3, value=str(key[1]))
+        for c, metric in enumerate(METRICS, start=4):
+            cell = ws.cell(row=r, column=c, value=int(totals[metric]))
+            if metric in flight_aggregates.MINUTE_METRICS:
+                cell.value = totals[metric] / MINUTES_PER_DAY
+                cell.number_format = '[h]:mm'
+    wb.save(path)
+
+
+def _measure(fn):
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def bench(pilots, flights_per_pilot=600):
+    df = flight_aggregates.synthetic_flights(pilots * flights_per_pilot, pilots=pilots)
+    t0 = time.perf_counter()
+    summary = flight_aggregates.sheet_summary(df, '2025-12-01', '2025-12-31', '2025-01-01',
+                                              by=('pilot', 'aircraft_type'))
+    aggregate = time.perf_counter() - t0
+    fd, out = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        print(f"{pilots} pilots, {len(df)} flights, {len(summary)} pilot/type rows")
+        print(f"  sheet_summary      : {aggregate:6.2f} s")
+        elapsed, peak = _measure(lambda: write_summary(out, summary, ('2025-12-01', '2025-12-31'), 2025,
+                                                       by_pilot=True))
+        print(f"  constant_memory    : {elapsed:6.2f} s  peak {peak / 1e6:6.1f} MB  "
+              f"({os.path.getsize(out) / 1e3:.0f} kB)")
+        elapsed, peak = _measure(lambda: openpyxl_write(out, summary))
+        print(f"  openpyxl cells     : {elapsed:6.2f} s  peak {peak / 1e6:6.1f} MB")
+    finally:
+        os.remove(out)
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Write the Підсумки report from flight data")
+    parser.add_argument('--workbook', default=flight_aggregates.WORKBOOK, help="source workbook (Main sheet)")
+    parser.add_argument('--out', default='Підсумки.xlsx')
+    parser.add_argument('--from', dest='start', type=datetime.date.fromisoformat)
+    parser.add_argument('--to', dest='end', type=datetime.date.fromisoformat)
+    parser.add_argument('--by-pilot', action='store_true', help="one block per pilot plus brigade totals")
+    parser.add_argument('--bench', type=int, metavar='PILOTS', help="time a synthetic brigade report")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args.bench)
+        return
+
+    end = args.end or datetime.date.today()
+    start = args.start or end.replace(day=1)
+    rows = report_from_workbook(args.workbook, args.out, start, end, args.by_pilot)
+    print(f"{args.out}: {rows} rows, period {start:%d.%m.%Y} - {end:%d.%m.%Y}")
+
+
+if __name__ == "__main__":
+    main()
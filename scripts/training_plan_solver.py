@@ -0,0 +1,346 @@
+"""
+Minimum-flight plan for restoring lapsed LP / MU currencies (weighted set
+cover), in place of the hand-built plan in the training-planner edge
+function.
+
+training-planner takes, per expired LP type, the first control exercise
+whose *first* lp_type matches and up to five training exercises, plus
+28(2) / 29(2) for all expired MU conditions at once. That is neither
+minimal (an exercise restoring three LP types is counted per type) nor
+always complete (a type that is never anyone's first lp_type gets no
+control flight). Here the same rule - every lapsed currency needs one
+control and one training flight - is solved as a set cover:
+
+  - requirements are bits: (LP type | MU condition) x (control, training)
+  - a candidate sortie is an exercise of the KBP document, optionally flown
+    in one lapsed MU condition (complexing: the sortie then also restores
+    that condition in the exercise's mode), costing the exercise's
+    flights_count; can_complex() decides which pairs are allowed, and a
+    sortie restores at most one MU condition (one weather per flight)
+  - dominated candidates (covering a subset for no less) are dropped
+  - greedy cover (best new bits per flight) gives the first plan and an
+    upper bound; branch-and-bound on the requirement with the fewest
+    candidates, pruned by cost + lower bound, proves or improves it when
+    the instance is small enough (EXACT_CANDIDATES, NODE_LIMIT)
+
+The lower bound is the larger of: the cheapest candidate for the hardest
+uncovered requirement, and the uncovered bit count over the best
+bits-per-flight ratio.
+
+Connection for --db: SUPABASE_DB_URL (postgresql://...) from the environment.
+
+Usage:
+    python scripts/training_plan_solver.py --bench 200
+    python scripts/training_plan_solver.py --db --pilot "Кошель С.М." --aircraft Су-27
+"""
+
+import argparse
+import collections
+import datetime
+import os
+import sys
+import time
+
+import numpy as np
+
+EXACT_CANDIDATES = 80           # branch-and-bound only below this many candidates
+NODE_LIMIT = 200000             # and gives up (keeping the greedy plan) after this many nodes
+# MU-only exercises, number -> is_control; training-planner labels them 28(2) / 29(2)
+MU_RESTORE = {'28(2)': True, '28': True, '29(2)': False, '29': False}
+FLIGHTS_PER_SHIFT = {3: 4}      # training-planner: class 3 pilots fly 4 per shift, others 5
+
+Exercise = collections.namedtuple('Exercise', 'id number name lp_types flights_count is_control')
+Sortie = collections.namedtuple('Sortie', 'exercise mu mask cost')
+Plan = collections.namedtuple('Plan', 'sorties flights lower_bound optimal target uncovered nodes')
+
+
+def can_complex(exercise, mu):
+    """Whether `exercise` may be flown in MU condition `mu` (any LP exercise, by default)."""
+    return True
+
+
+class Requirements:
+    """Bit numbering of (currency, mode) requirements."""
+
+    def __init__(self, lp_types, mu_conditions):
+        self.names = [(c, mode) for c in list(lp_types) + list(mu_conditions) for mode in ('control', 'training')]
+        self.bit = {name: 1 << i for i, name in enumerate(self.names)}
+        self.lp = set(lp_types)
+        self.mu = set(mu_conditions)
+        self.full = (1 << len(self.names)) - 1
+
+    def mask(self, currencies, is_control):
+        mode = 'control' if is_control else 'training'
+        m = 0
+        for c in currencies:
+            m |= self.bit.get((c, mode), 0)
+        return m
+
+    def describe(self, mask):
+        return [f"{c} ({'контр.' if mode == 'control' else 'трен.'})" for (c, mode), b in self.bit.items()
+                if mask & b]
+
+
+def candidates(exercises, req, complex_mu=True):
+    """Candidate sorties over the requirement bits, dominated ones removed."""
+    out = []
+    for ex in exercises:
+        lp_mask = req.mask(ex.lp_types or (), ex.is_control)
+        cost = max(int(ex.flights_count or 1), 1)
+        restore = MU_RESTORE.get(str(ex.number).replace(' ', ''))
+        if restore is not None:
+            for mu in req.mu:
+                out.append(Sortie(ex, mu, lp_mask | req.mask([mu], restore), cost))
+            continue
+        if lp_mask:
+            out.append(Sortie(ex, None, lp_mask, cost))
+            if complex_mu:
+                out.extend(Sortie(ex, mu, lp_mask | req.mask([mu], ex.is_control), cost)
+                           for mu in req.mu if can_complex(ex, mu))
+    # Cheapest first, then widest: a candidate is dominated by an earlier one covering a superset.
+    out.sort(key=lambda s: (s.cost, -bin(s.mask).count('1')))
+    kept = []
+    for s in out:
+        if not any(k.cost <= s.cost and s.mask & ~k.mask == 0 for k in kept):
+            kept.append(s)
+    return kept
+
+
+def _bits(x):
+    return bin(x).count('1')
+
+
+def greedy(cands, target):
+    chosen, covered, cost = [], 0, 0
+    while covered & target != target:
+        best = max(cands, key=lambda s: (_bits(s.mask & target & ~covered) / s.cost, -s.cost), default=None)
+        if best is None or not best.mask & target & ~covered:
+            break
+        chosen.append(best)
+        covered |= best.mask
+        cost += best.cost
+    return chosen, cost, covered
+
+
+def lower_bound(cands, uncovered, by_bit):
+    """Admissible bound on the cost of covering `uncovered`."""
+    if not uncovered:
+        return 0
+    hardest = 0
+    bits = uncovered
+    while bits:
+        b = bits & -bits
+        bits ^= b
+        hardest = max(hardest, min((s.cost for s in by_bit[b]), default=0))
+    ratio = max(_bits(s.mask & uncovered) / s.cost for s in cands)
+    return max(hardest, int(np.ceil(_bits(uncovered) / ratio - 1e-9)))
+
+
+def solve(exercises, lp_types, mu_conditions, complex_mu=True):
+    """Minimum-flights plan restoring `lp_types` and `mu_conditions` (each: one control + one training)."""
+    req = Requirements(lp_types, mu_conditions)
+    cands = candidates(exercises, req, complex_mu)
+    reachable = 0
+    for s in cands:
+        reachable |= s.mask
+    target = req.full & reachable
+    chosen, best_cost, _ = greedy(cands, target)
+    by_bit = {1 << i: [s for s in cands if s.mask >> i & 1] for i in range(len(req.names))}
+    root_bound = lower_bound(cands, target, by_bit)
+    best = list(chosen)
+    nodes = 0
+    optimal = best_cost == root_bound
+
+    if not optimal and len(cands) <= EXACT_CANDIDATES:
+        for b in by_bit:
+            by_bit[b].sort(key=lambda s: (-_bits(s.mask) / s.cost, s.cost))
+        stack = [(0, 0, [])]
+        while stack and nodes < NODE_LIMIT:
+            covered, cost, path = stack.pop()
+            nodes += 1
+            uncovered = target & ~covered
+            if not uncovered:
+                if cost < best_cost:
+                    best_cost, best = cost, path
+                continue
+            if cost + lower_bound(cands, uncovered, by_bit) >= best_cost:
+                continue
+            # Branch on the uncovered requirement with the fewest candidates.
+            options = None
+            bits = uncovered
+            while bits:
+                b = bits & -bits
+                bits ^= b
+                if options is None or len(by_bit[b]) < len(options):
+                    options = by_bit[b]
+            for s in reversed(options):
+                if cost + s.cost < best_cost:
+                    stack.append((covered | s.mask, cost + s.cost, path + [s]))
+        optimal = not stack or nodes < NODE_LIMIT
+
+    order = sorted(best, key=lambda s: (not s.exercise.is_control, str(s.exercise.number)))
+    return Plan(order, best_cost, root_bound, optimal, target, req.describe(req.full & ~reachable), nodes), req
+
+
+def plan_items(plan, req):
+    """training-planner FlightPlanItem dicts for a plan."""
+    items = []
+    for s in plan.sorties:
+        ex = s.exercise
+        items.append({
+            'exercise_id': ex.id, 'number': ex.number, 'name': ex.name, 'lp_types': list(ex.lp_types or ()),
+            'flights_count': s.cost, 'is_control': bool(ex.is_control),
+            'restores': req.describe(s.mask),
+            'complexes_with': [s.mu] if s.mu else [],
+        })
+    return items
+
+
+# --- training-planner baseline ------------------------------------------------
+
+def current_plan(exercises, lp_types, mu_conditions):
+    """The plan training-planner builds (same selection rules), as [(exercise, flights, restores)]."""
+    expired = set(lp_types)
+    plan, used = [], set()
+    ordered = sorted(exercises, key=lambda e: str(e.number))
+    for e in ordered:
+        primary = (e.lp_types or [None])[0]
+        if e.is_control and primary in expired and primary not in used and set(e.lp_types) & expired:
+            plan.append((e, 1, [lp for lp in e.lp_types if lp in expired]))
+            used.add(primary)
+    training = 0
+    for e in ordered:
+        primary = (e.lp_types or [None])[0]
+        if not e.is_control and primary in expired and training < 5:
+            plan.append((e, max(int(e.flights_count or 1), 1), [lp for lp in e.lp_types if lp in expired]))
+            training += 1
+    if mu_conditions:
+        plan.append((Exercise(31, '28(2)', 'Контрольний політ у хмарах', [], 1, True), 1, list(mu_conditions)))
+        plan.append((Exercise(32, '29(2)', 'Політ у хмарах з заходом на посадку', [], 1, False), 1,
+                     list(mu_conditions)))
+    return plan
+
+
+def _current_coverage(plan, req):
+    covered = 0
+    for e, _, restores in plan:
+        covered |= req.mask(restores, e.is_control)
+    return covered
+
+
+# --- Benchmark ----------------------------------------------------------------
+
+def synthetic_exercises(lp_count=16, exercises=60, seed=4):
+    rng = np.random.default_rng(seed)
+    lp = [f'лп_{i}' for i in range(lp_count)]
+    out = []
+    for i in range(exercises):
+        k = rng.choice([1, 1, 2, 2, 3])
+        out.append(Exercise(i + 1, str(i + 1), f'Вправа {i + 1}', list(rng.choice(lp, k, replace=False)),
+                            int(rng.choice([1, 1, 1, 2, 3])), bool(rng.random() < 0.4)))
+    out.append(Exercise(900, '28(2)', 'Контрольний політ у хмарах', [], 1, True))
+    out.append(Exercise(901, '29(2)', 'Політ у хмарах з заходом на посадку', [], 1, False))
+    return out, lp
+
+
+def bench(instances, seed=8):
+    from break_engine import MU_TYPES
+    exercises, lp = synthetic_exercises()
+    rng = np.random.default_rng(seed)
+    stats = collections.Counter()
+    solve_times, exact_times = [], []
+    for _ in range(instances):
+        lapsed_lp = list(rng.choice(lp, rng.integers(2, 9), replace=False))
+        lapsed_mu = list(rng.choice(MU_TYPES, rng.integers(0, 3), replace=False))
+        t0 = time.perf_counter()
+        plan, req = solve(exercises, lapsed_lp, lapsed_mu)
+        solve_times.append(time.perf_counter() - t0)
+        (exact_times if plan.nodes else []).append(solve_times[-1])
+
+        current = current_plan(exercises, lapsed_lp, lapsed_mu)
+        current_flights = sum(f for _, f, _ in current)
+        complete = _current_coverage(current, req) & plan.target == plan.target
+        stats['instances'] += 1
+        stats['solver flights'] += plan.flights
+        stats['current flights'] += current_flights
+        stats['current complete'] += complete
+        stats['optimal'] += plan.optimal
+        stats['solver better'] += plan.flights < current_flights or not complete
+
+    times = np.array(solve_times) * 1000
+    print(f"{instances} plans, {len(exercises)} exercises, 2-8 lapsed LP types, 0-2 lapsed MU conditions")
+    print(f"  solve time          : median {np.median(times):.2f} ms, p95 {np.percentile(times, 95):.2f} ms, "
+          f"max {times.max():.2f} ms ({len(exact_times)} needed branch-and-bound)")
+    print(f"  proven optimal      : {stats['optimal']} / {instances}")
+    print(f"  flights (solver)    : {stats['solver flights'] / instances:.2f} per plan, always complete")
+    print(f"  flights (current)   : {stats['current flights'] / instances:.2f} per plan, complete in "
+          f"{stats['current complete']} / {instances}")
+    print(f"  solver fewer flights or complete where current is not: {stats['solver better']} / {instances}")
+
+
+# --- Main ---------------------------------------------------------------------
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    parser = argparse.ArgumentParser(description="Minimum-flight training plan")
+    parser.add_argument('--bench', type=int, metavar='N', help="solve N synthetic plans")
+    parser.add_argument('--db', action='store_true', help="plan for a pilot from the database")
+    parser.add_argument('--pilot', help="pilot name (users.name)")
+    parser.add_argument('--aircraft', help="aircraft type name")
+    parser.add_argument('--document', default='КБП ВА', help="KBP document of the exercises")
+    parser.add_argument('--no-complex-mu', action='store_true', help="do not complex MU conditions into LP sorties")
+    args = parser.parse_args()
+
+    if args.bench or not args.db:
+        bench(args.bench or 200)
+        return
+    if not args.pilot:
+        raise SystemExit("--pilot is required with --db")
+
+    import psycopg2
+    import break_engine
+    dsn = os.environ.get('SUPABASE_DB_URL')
+    if not dsn:
+        raise SystemExit("SUPABASE_DB_URL is not set")
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn, conn.cursor() as cur:
+            tables = break_engine.BreakTables.load(cur)
+            cur.execute("SELECT id, number::text, name, lp_types, flights_count, is_control FROM exercises "
+                        "WHERE document = %s ORDER BY number", (args.document,))
+            exercises = [Exercise(*row) for row in cur.fetchall()]
+            user = tables.users[tables.users['name'] == args.pilot]
+            if user.empty:
+                raise SystemExit(f"Pilot {args.pilot!r} not found")
+            military_class = int(user['military_class'].fillna(0).iloc[0] or 3)
+    finally:
+        conn.close()
+
+    grid = break_engine.compute(tables, datetime.date.today())
+    grid = grid[(grid['pilot'] == args.pilot) & ((grid['status'] == break_engine.RED) |
+                                                  (grid['status'] == break_engine.GRAY))]
+    if args.aircraft:
+        grid = grid[grid['aircraft'] == args.aircraft]
+    lapsed_lp = sorted(set(grid.loc[(grid['kind'] == 'lp') & (grid['kbp_document'] == args.document), 'condition']))
+    lapsed_mu = sorted(set(grid.loc[grid['kind'] == 'mu', 'condition']))
+    print(f"{args.pilot}: lapsed LP {', '.join(lapsed_lp) or '-'}; MU {', '.join(lapsed_mu) or '-'}")
+
+    t0 = time.perf_counter()
+    plan, req = solve(exercises, lapsed_lp, lapsed_mu, complex_mu=not args.no_complex_mu)
+    elapsed = (time.perf_counter() - t0) * 1000
+    for item in plan_items(plan, req):
+        kind = 'КОНТРОЛЬНИЙ' if item['is_control'] else 'ТРЕНУВАЛЬНИЙ'
+        mu = f" у {item['complexes_with'][0]}" if item['complexes_with'] else ''
+        print(f"  {item['number']:>6} x{item['flights_count']} {kind}{mu}: {item['name']} -> "
+              f"{', '.join(item['restores'])}")
+    shifts = max(1, -(-plan.flights // FLIGHTS_PER_SHIFT.get(military_class, 5)))
+    print(f"Польотів: {plan.flights} (нижня межа {plan.lower_bound}, "
+          f"{'оптимально' if plan.optimal else 'без доведення оптимальності'}), змін: {shifts}, {elapsed:.1f} ms")
+    if plan.uncovered:
+        print(f"Немає вправ у {args.document} для: {', '.join(plan.uncovered)}")
+    current = current_plan(exercises, lapsed_lp, lapsed_mu)
+    print(f"training-planner склав би {sum(f for _, f, _ in current)} польотів")
+
+
+if __name__ == "__main__":
+    main()
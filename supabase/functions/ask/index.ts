@@ -26,6 +26,44 @@ const SYSTEM_PROMPT = `Ти — експерт-консультант з кер
 
 ВАЖЛИВО: Не вигадуй інформацію яка відсутня в контексті. Краще сказати "не знайшов" ніж дати неточну відповідь.`;
 
+// Псевдоніми документів → префікс назви в таблиці documents.
+// Тримати в синхроні з scripts/doc_aliases.py.
+const DOCUMENT_ALIASES: { titlePrefix: string; aliases: string[] }[] = [
+  { titlePrefix: "КБП ВА", aliases: ["кбп ва 2022", "кбп ва", "кбпва", "ва"] },
+  { titlePrefix: "КБП БА/РА", aliases: ["кбп ба/ра 2021", "кбп ба/ра", "кбп ба", "кбп ра", "ба/ра"] },
+  { titlePrefix: "КБП-В-2018", aliases: ["кбп-в-2018", "кбп-в", "кбпв-18", "кбпв"] },
+  { titlePrefix: "КЛПВ-24", aliases: ["клпв-24", "клпв"] },
+  { titlePrefix: "ПЛВР", aliases: ["плвр", "положення про лвр", "положення про льотно-випробувальну роботу"] },
+  { titlePrefix: "ПВП ДАУ", aliases: ["пвп дау", "пвп", "правила виконання польотів державної авіації"] },
+];
+
+// "-" не згортається: "кбп в" — це ще й "КБП" + прийменник "в", тож КБП-В
+// впізнається лише як "КБП-В" / "КБПВ".
+const foldAlias = (s: string) => s.toLowerCase().replace(/[\s\/.]+/g, " ").trim();
+
+// Всі форми компілюються один раз в один автомат (довші першими, тільки цілі слова),
+// тож "кбп ва" не плутається з "кбп-в", а "ва" — з "вантаж".
+const ALIAS_PREFIX = new Map<string, string>();
+for (const doc of DOCUMENT_ALIASES) {
+  for (const alias of doc.aliases) ALIAS_PREFIX.set(foldAlias(alias), doc.titlePrefix);
+}
+const ALIAS_RE = new RegExp(
+  `(?<![\\p{L}\\p{N}_])(${[...ALIAS_PREFIX.keys()]
+    .sort((a, b) => b.length - a.length)
+    .map((a) => a.replace(/[.*+?^${}()|[\]\\]/g, "\\$&"))
+    .join("|")})(?![\\p{L}\\p{N}_])`,
+  "gu"
+);
+
+/** Префікси назв документів, які користувач явно вказав у питанні */
+function detectDocumentPrefixes(question: string): string[] {
+  const prefixes = new Set<string>();
+  for (const m of foldAlias(question).matchAll(ALIAS_RE)) {
+    prefixes.add(ALIAS_PREFIX.get(m[1])!);
+  }
+  return [...prefixes];
+}
+
 Deno.serve(async (req: Request) => {
   if (req.method === "OPTIONS") {
     return new Response(null, {
@@ -69,6 +107,11 @@ Deno.serve(async (req: Request) => {
     const embData = await embRes.json();
     const embedding = embData.data[0].embedding;
 
+    // Якщо користувач назвав документ — шукаємо лише в його фрагментах,
+    // замість того щоб просити модель ігнорувати решту.
+    const prefixes = detectDocumentPrefixes(question);
+    if (prefixes.length > 0) console.log("Document filter:", prefixes.join(", "));
+
     const supabase = createClient(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY);
     const { data: chunks, error: searchError } = await supabase.rpc(
       "match_document_chunks_hybrid",
@@ -78,6 +121,7 @@ Deno.serve(async (req: Request) => {
         match_threshold: 0.22,
         match_count: 15,
         keyword_weight: 0.4,
+        document_prefixes: prefixes.length > 0 ? prefixes : null,
       }
     );
 
@@ -0,0 +1,224 @@
+-- Помісячні зведення нальоту (пілот, тип ПС, місяць, категорія, час доби)
+-- Оновлюються інкрементно скриптом scripts/flight_rollups.py за flight_updates_log.
+-- Категорії — як FlightSummary.categorize: test / crew / control / training.
+
+-- Категорія польоту (та сама логіка, що в FlightSummary.js)
+CREATE OR REPLACE FUNCTION fn_flight_category(p_flight_id uuid, p_flight_type text)
+RETURNS text AS $$
+  SELECT CASE
+    WHEN p_flight_type = 'Випробувальний' THEN 'test'
+    WHEN p_flight_type = 'У складі екіпажу' THEN 'crew'
+    WHEN EXISTS (
+      SELECT 1 FROM flight_exercises fe
+      JOIN exercises e ON e.id = fe.exercise_id
+      WHERE fe.flight_id = p_flight_id AND e.is_control = true
+    ) THEN 'control'
+    ELSE 'training'
+  END;
+$$ LANGUAGE sql STABLE;
+
+CREATE TABLE IF NOT EXISTS flight_monthly_rollups (
+  user_id uuid NOT NULL,
+  aircraft_type_id uuid NOT NULL,
+  month date NOT NULL,                 -- перше число місяця
+  category text NOT NULL,              -- test / crew / control / training
+  time_of_day text NOT NULL,           -- 'Д' / 'Н'
+  flights_count integer NOT NULL DEFAULT 0,
+  minutes integer NOT NULL DEFAULT 0,  -- як parseMin: години*60 + хвилини
+  updated_at timestamptz DEFAULT now(),
+  PRIMARY KEY (user_id, month, aircraft_type_id, category, time_of_day)
+);
+
+-- Внесок кожного польоту в зведення: при зміні польоту старий внесок
+-- віднімається, новий додається. Без FK — видалений політ лишає тут рядок,
+-- за яким джоба знімає його внесок.
+CREATE TABLE IF NOT EXISTS flight_rollup_contributions (
+  flight_id uuid PRIMARY KEY,
+  user_id uuid NOT NULL,
+  aircraft_type_id uuid NOT NULL,
+  month date NOT NULL,
+  category text NOT NULL,
+  time_of_day text NOT NULL,
+  flights_count integer NOT NULL,
+  minutes integer NOT NULL
+);
+
+-- Позначки часу для інкрементної обробки. flights.updated_at ставить клієнт
+-- (годинник пристрою), тож джоби читають changed_at — час сервера, який
+-- тригери оновлюють при будь-якій зміні польоту, його вправ чи запису журналу.
+ALTER TABLE flight_updates_log ADD COLUMN IF NOT EXISTS logged_at timestamptz NOT NULL DEFAULT now();
+CREATE INDEX IF NOT EXISTS idx_flight_updates_log_logged_at ON flight_updates_log(logged_at);
+ALTER TABLE flights ADD COLUMN IF NOT EXISTS changed_at timestamptz NOT NULL DEFAULT now();
+CREATE INDEX IF NOT EXISTS idx_flights_changed_at ON flights(changed_at);
+
+CREATE OR REPLACE FUNCTION trg_flights_changed_at()
+RETURNS trigger AS $$
+BEGIN
+  NEW.changed_at := now();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_flights_changed_at ON flights;
+CREATE TRIGGER trg_flights_changed_at BEFORE INSERT OR UPDATE ON flights
+  FOR EACH ROW EXECUTE FUNCTION trg_flights_changed_at();
+
+-- Видалені польоти: джоби знімають їхні внески за deleted_at, без
+-- порівняння з усією таблицею flights
+CREATE TABLE IF NOT EXISTS flight_deletions (
+  flight_id uuid NOT NULL,
+  deleted_at timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_flight_deletions_deleted_at ON flight_deletions(deleted_at);
+
+CREATE OR REPLACE FUNCTION trg_flights_deleted()
+RETURNS trigger AS $$
+BEGIN
+  INSERT INTO flight_deletions (flight_id) SELECT id FROM old_rows;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_flights_deleted ON flights;
+CREATE TRIGGER trg_flights_deleted AFTER DELETE ON flights
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT
+  EXECUTE FUNCTION trg_flights_deleted();
+
+-- Зміна вправ польоту змінює його категорію
+CREATE OR REPLACE FUNCTION trg_flight_exercises_touch()
+RETURNS trigger AS $$
+BEGIN
+  UPDATE flights SET changed_at = now()
+  WHERE id IN (SELECT flight_id FROM changed_rows);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_flight_exercises_touch_ins ON flight_exercises;
+DROP TRIGGER IF EXISTS trg_flight_exercises_touch_del ON flight_exercises;
+CREATE TRIGGER trg_flight_exercises_touch_ins AFTER INSERT ON flight_exercises
+  REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT
+  EXECUTE FUNCTION trg_flight_exercises_touch();
+CREATE TRIGGER trg_flight_exercises_touch_del AFTER DELETE ON flight_exercises
+  REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT
+  EXECUTE FUNCTION trg_flight_exercises_touch();
+
+-- Виправлення запису журналу (corrected_lp, confirmed) — теж зміна польоту
+CREATE OR REPLACE FUNCTION trg_flight_updates_log_touch()
+RETURNS trigger AS $$
+BEGIN
+  IF row(NEW.*) IS DISTINCT FROM row(OLD.*) THEN
+    NEW.logged_at := now();
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_flight_updates_log_touch ON flight_updates_log;
+CREATE TRIGGER trg_flight_updates_log_touch BEFORE UPDATE ON flight_updates_log
+  FOR EACH ROW EXECUTE FUNCTION trg_flight_updates_log_touch();
+
+CREATE TABLE IF NOT EXISTS flight_rollup_state (
+  id integer PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+  last_log_at timestamptz NOT NULL DEFAULT '-infinity',
+  last_flight_at timestamptz NOT NULL DEFAULT '-infinity',
+  updated_at timestamptz DEFAULT now()
+);
+INSERT INTO flight_rollup_state (id) VALUES (1) ON CONFLICT DO NOTHING;
+
+-- Перерахувати внески заданих польотів (ідемпотентно: повторний виклик
+-- для того самого польоту нічого не змінює). Повертає кількість польотів.
+CREATE OR REPLACE FUNCTION fn_apply_flight_rollups(p_flight_ids uuid[])
+RETURNS integer AS $$
+DECLARE
+  v_count integer;
+BEGIN
+  -- 1. Зняти старі внески
+  WITH old AS (
+    DELETE FROM flight_rollup_contributions c
+    WHERE c.flight_id = ANY(p_flight_ids)
+    RETURNING c.user_id, c.aircraft_type_id, c.month, c.category, c.time_of_day, c.flights_count, c.minutes
+  ), agg AS (
+    SELECT user_id, aircraft_type_id, month, category, time_of_day,
+           sum(flights_count) AS flights_count, sum(minutes) AS minutes
+    FROM old
+    GROUP BY 1, 2, 3, 4, 5
+  )
+  UPDATE flight_monthly_rollups r
+  SET flights_count = r.flights_count - agg.flights_count,
+      minutes = r.minutes - agg.minutes,
+      updated_at = now()
+  FROM agg
+  WHERE r.user_id = agg.user_id AND r.aircraft_type_id = agg.aircraft_type_id
+    AND r.month = agg.month AND r.category = agg.category AND r.time_of_day = agg.time_of_day;
+
+  -- 2. Порахувати нові внески з поточних даних flights
+  INSERT INTO flight_rollup_contributions
+    (flight_id, user_id, aircraft_type_id, month, category, time_of_day, flights_count, minutes)
+  SELECT
+    f.id,
+    f.user_id,
+    f.aircraft_type_id,
+    date_trunc('month', f.date)::date,
+    fn_flight_category(f.id, f.flight_type),
+    CASE WHEN f.time_of_day = 'Н' THEN 'Н' ELSE 'Д' END,
+    COALESCE(NULLIF(f.flights_count, 0), 1),
+    COALESCE(floor(extract(epoch FROM f.flight_time) / 60), 0)::integer
+  FROM flights f
+  WHERE f.id = ANY(p_flight_ids)
+    AND f.user_id IS NOT NULL AND f.aircraft_type_id IS NOT NULL AND f.date IS NOT NULL;
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+
+  -- 3. Додати їх у зведення
+  INSERT INTO flight_monthly_rollups
+    (user_id, aircraft_type_id, month, category, time_of_day, flights_count, minutes)
+  SELECT user_id, aircraft_type_id, month, category, time_of_day, sum(flights_count), sum(minutes)
+  FROM flight_rollup_contributions
+  WHERE flight_id = ANY(p_flight_ids)
+  GROUP BY 1, 2, 3, 4, 5
+  ON CONFLICT (user_id, month, aircraft_type_id, category, time_of_day) DO UPDATE
+  SET flights_count = flight_monthly_rollups.flights_count + EXCLUDED.flights_count,
+      minutes = flight_monthly_rollups.minutes + EXCLUDED.minutes,
+      updated_at = now();
+
+  DELETE FROM flight_monthly_rollups WHERE flights_count = 0 AND minutes = 0;
+  RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Підсумок пілота за довільний період: повні місяці — зі зведень,
+-- неповні місяці на краях діапазону та поточний місяць — з flights
+-- (з тим самим відбором, що й внески: без типу ПС політ не враховується).
+CREATE OR REPLACE FUNCTION fn_flight_period_summary(p_user_id uuid, p_start date, p_end date)
+RETURNS TABLE (time_of_day text, category text, flights_count bigint, minutes bigint) AS $$
+  WITH bounds AS (
+    SELECT
+      CASE WHEN p_start = date_trunc('month', p_start)::date THEN p_start
+           ELSE (date_trunc('month', p_start) + interval '1 month')::date END AS full_from,
+      LEAST(
+        CASE WHEN p_end = (date_trunc('month', p_end) + interval '1 month - 1 day')::date
+             THEN (date_trunc('month', p_end) + interval '1 month')::date
+             ELSE date_trunc('month', p_end)::date END,
+        date_trunc('month', now())::date
+      ) AS full_to
+  ),
+  rolled AS (
+    SELECT r.time_of_day, r.category, r.flights_count::bigint, r.minutes::bigint
+    FROM flight_monthly_rollups r, bounds b
+    WHERE r.user_id = p_user_id AND r.month >= b.full_from AND r.month < b.full_to
+  ),
+  edges AS (
+    SELECT
+      CASE WHEN f.time_of_day = 'Н' THEN 'Н' ELSE 'Д' END,
+      fn_flight_category(f.id, f.flight_type),
+      COALESCE(NULLIF(f.flights_count, 0), 1)::bigint,
+      COALESCE(floor(extract(epoch FROM f.flight_time) / 60), 0)::bigint
+    FROM flights f, bounds b
+    WHERE f.user_id = p_user_id AND f.date BETWEEN p_start AND p_end
+      AND f.aircraft_type_id IS NOT NULL
+      AND (f.date < b.full_from OR f.date >= b.full_to)
+  )
+  SELECT x.time_of_day, x.category, sum(x.flights_count)::bigint, sum(x.minutes)::bigint
+  FROM (SELECT * FROM rolled UNION ALL SELECT * FROM edges) AS x(time_of_day, category, flights_count, minutes)
+  GROUP BY 1, 2;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,215 @@
+-- Індекс термінів: по рядку на кожен термін (перерва МУ/ЛП, комісія, річна
+-- перевірка), впорядкований за датою закінчення. Тригери на таблицях дат
+-- перераховують рядки пілота при кожній зміні, тож check-deadlines читає
+-- діапазоном лише ті терміни, що закінчуються в найближчі 15 днів і ще не
+-- мають відповідного повідомлення, замість повного перегляду таблиць.
+-- Правила розрахунку — ті самі, що були в check-deadlines.
+
+CREATE TABLE IF NOT EXISTS deadline_index (
+  id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+  user_id uuid NOT NULL,
+  source text NOT NULL,                  -- mu / lp / commission / check (префікс типу повідомлення)
+  subject_key text NOT NULL,             -- умова/вид/тип комісії + '|' + тип ПС
+  subject_name text NOT NULL,            -- назва для тексту повідомлення
+  aircraft_name text NOT NULL DEFAULT '',
+  expiry_date date NOT NULL,
+  metadata jsonb NOT NULL,               -- metadata повідомлення, як у check-deadlines
+  notified_stage smallint NOT NULL DEFAULT 0,  -- 0 — нічого, 1 — попередження, 2 — закінчився
+  updated_at timestamptz DEFAULT now(),
+  UNIQUE (source, user_id, subject_key, expiry_date)
+);
+
+-- Щоденний запит: expiry_date <= сьогодні + 15 серед ще не закритих термінів
+CREATE INDEX IF NOT EXISTS idx_deadline_index_pending
+  ON deadline_index(expiry_date) WHERE notified_stage < 2;
+CREATE INDEX IF NOT EXISTS idx_deadline_index_user ON deadline_index(user_id, source);
+
+-- Терміни пілотів (NULL — усіх) з одного джерела
+CREATE OR REPLACE FUNCTION fn_deadline_rows(p_users uuid[], p_source text)
+RETURNS TABLE (user_id uuid, subject_key text, subject_name text, aircraft_name text,
+               expiry_date date, metadata jsonb) AS $$
+  WITH mu AS (
+    SELECT m.user_id, m.mu_condition, m.aircraft_type_id, at.name AS aircraft_name,
+           m.last_date + COALESCE(NULLIF((
+             SELECT p.days FROM break_periods_mu p
+             WHERE p.mu_condition = m.mu_condition
+               AND p.military_class = COALESCE(NULLIF(u.military_class, 0), 3)
+             LIMIT 1), 0), 30) AS expiry_date
+    FROM mu_break_dates m
+    LEFT JOIN users u ON u.id = m.user_id
+    LEFT JOIN aircraft_types at ON at.id = m.aircraft_type_id
+    WHERE p_source = 'mu' AND m.user_id IS NOT NULL AND m.last_date IS NOT NULL
+      AND (p_users IS NULL OR m.user_id = ANY(p_users))
+  ),
+  lp AS (
+    SELECT l.user_id, l.lp_type, l.aircraft_type_id, at.name AS aircraft_name,
+           COALESCE((SELECT p.lp_type FROM break_periods_lp p
+                     WHERE p.lp_type_normalized = l.lp_type AND p.lp_type IS NOT NULL
+                     LIMIT 1), l.lp_type) AS lp_name,
+           -- Місяці як JS setMonth(): 31.01 + 1 міс. = 03.03 (без обрізання до кінця місяця)
+           (date_trunc('month', l.last_date) + make_interval(months => COALESCE(NULLIF((
+             SELECT p.months FROM break_periods_lp p
+             WHERE p.lp_type_normalized = l.lp_type
+               AND COALESCE(NULLIF(p.military_class, 0), 3) = COALESCE(NULLIF(u.military_class, 0), 3)
+             LIMIT 1), 0), 6)))::date + (extract(day FROM l.last_date)::int - 1) AS expiry_date
+    FROM lp_break_dates l
+    LEFT JOIN users u ON u.id = l.user_id
+    LEFT JOIN aircraft_types at ON at.id = l.aircraft_type_id
+    WHERE p_source = 'lp' AND l.user_id IS NOT NULL AND l.last_date IS NOT NULL
+      AND (p_users IS NULL OR l.user_id = ANY(p_users))
+  )
+  SELECT mu.user_id, mu.mu_condition || '|' || COALESCE(mu.aircraft_type_id::text, ''), mu.mu_condition,
+         COALESCE(mu.aircraft_name, ''), mu.expiry_date,
+         jsonb_build_object('mu_condition', mu.mu_condition, 'aircraft_type_id', mu.aircraft_type_id,
+                            'deadline_date', mu.expiry_date::text)
+  FROM mu
+  UNION ALL
+  SELECT lp.user_id, lp.lp_type || '|' || COALESCE(lp.aircraft_type_id::text, ''), lp.lp_name,
+         COALESCE(lp.aircraft_name, ''), lp.expiry_date,
+         jsonb_build_object('lp_type', lp.lp_type, 'aircraft_type_id', lp.aircraft_type_id,
+                            'deadline_date', lp.expiry_date::text)
+  FROM lp
+  UNION ALL
+  SELECT c.user_id, COALESCE(c.commission_type_id::text, '') || '|', COALESCE(ct.name, 'Комісія'), '',
+         c.expiry_date,
+         jsonb_build_object('commission_type_id', c.commission_type_id, 'deadline_date', c.expiry_date::text)
+  FROM commission_dates c
+  LEFT JOIN commission_types ct ON ct.id = c.commission_type_id
+  WHERE p_source = 'commission' AND c.user_id IS NOT NULL AND c.expiry_date IS NOT NULL
+    AND (p_users IS NULL OR c.user_id = ANY(p_users))
+  UNION ALL
+  SELECT ch.user_id, COALESCE(ch.check_type, '') || '|', COALESCE(ch.check_type, ''), '', ch.expiry_date,
+         jsonb_build_object('check_type', ch.check_type, 'deadline_date', ch.expiry_date::text)
+  FROM annual_checks ch
+  WHERE p_source = 'check' AND ch.user_id IS NOT NULL AND ch.expiry_date IS NOT NULL
+    AND (p_users IS NULL OR ch.user_id = ANY(p_users));
+$$ LANGUAGE sql STABLE;
+
+-- Привести індекс пілотів (NULL — усіх) до поточних даних джерела.
+-- Рядок з незміненою датою лишається разом зі своїм notified_stage;
+-- нова дата — новий рядок зі stage 0 (новий цикл повідомлень).
+CREATE OR REPLACE FUNCTION fn_refresh_deadlines(p_users uuid[], p_source text)
+RETURNS void AS $$
+BEGIN
+  WITH fresh AS (
+    SELECT DISTINCT ON (r.user_id, r.subject_key, r.expiry_date) r.*
+    FROM fn_deadline_rows(p_users, p_source) r
+  ), stale AS (
+    DELETE FROM deadline_index d
+    WHERE d.source = p_source AND (p_users IS NULL OR d.user_id = ANY(p_users))
+      AND NOT EXISTS (
+        SELECT 1 FROM fresh f
+        WHERE f.user_id = d.user_id AND f.subject_key = d.subject_key AND f.expiry_date = d.expiry_date
+      )
+  )
+  INSERT INTO deadline_index (user_id, source, subject_key, subject_name, aircraft_name, expiry_date, metadata)
+  SELECT user_id, p_source, subject_key, subject_name, aircraft_name, expiry_date, metadata
+  FROM fresh
+  ON CONFLICT (source, user_id, subject_key, expiry_date) DO UPDATE
+  SET subject_name = EXCLUDED.subject_name,
+      aircraft_name = EXCLUDED.aircraft_name,
+      metadata = EXCLUDED.metadata,
+      updated_at = now()
+  WHERE (deadline_index.subject_name, deadline_index.aircraft_name, deadline_index.metadata)
+        IS DISTINCT FROM (EXCLUDED.subject_name, EXCLUDED.aircraft_name, EXCLUDED.metadata);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Тригер на таблицях дат: один перерахунок на оператор для всіх зачеплених
+-- пілотів (масовий імпорт не перераховує пілота на кожному рядку).
+CREATE OR REPLACE FUNCTION trg_deadline_dates_changed()
+RETURNS trigger AS $$
+DECLARE
+  v_users uuid[];
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    SELECT array_agg(DISTINCT user_id) INTO v_users FROM new_rows WHERE user_id IS NOT NULL;
+  ELSIF TG_OP = 'DELETE' THEN
+    SELECT array_agg(DISTINCT user_id) INTO v_users FROM old_rows WHERE user_id IS NOT NULL;
+  ELSE
+    SELECT array_agg(DISTINCT s.user_id) INTO v_users
+    FROM (SELECT user_id FROM new_rows UNION SELECT user_id FROM old_rows) s
+    WHERE s.user_id IS NOT NULL;
+  END IF;
+  IF v_users IS NOT NULL THEN
+    PERFORM fn_refresh_deadlines(v_users, TG_ARGV[0]);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+  t record;
+BEGIN
+  FOR t IN SELECT * FROM (VALUES
+    ('mu_break_dates', 'mu'), ('lp_break_dates', 'lp'),
+    ('commission_dates', 'commission'), ('annual_checks', 'check')) AS v(tbl, src)
+  LOOP
+    EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_deadlines_ins ON %1$I', t.tbl);
+    EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_deadlines_upd ON %1$I', t.tbl);
+    EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_deadlines_del ON %1$I', t.tbl);
+    EXECUTE format('CREATE TRIGGER trg_%1$s_deadlines_ins AFTER INSERT ON %1$I
+                    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT
+                    EXECUTE FUNCTION trg_deadline_dates_changed(%2$L)', t.tbl, t.src);
+    EXECUTE format('CREATE TRIGGER trg_%1$s_deadlines_upd AFTER UPDATE ON %1$I
+                    REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows FOR EACH STATEMENT
+                    EXECUTE FUNCTION trg_deadline_dates_changed(%2$L)', t.tbl, t.src);
+    EXECUTE format('CREATE TRIGGER trg_%1$s_deadlines_del AFTER DELETE ON %1$I
+                    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT
+                    EXECUTE FUNCTION trg_deadline_dates_changed(%2$L)', t.tbl, t.src);
+  END LOOP;
+END $$;
+
+-- Зміна класності пілота змінює його періоди перерв
+CREATE OR REPLACE FUNCTION trg_deadline_class_changed()
+RETURNS trigger AS $$
+DECLARE
+  v_users uuid[];
+BEGIN
+  SELECT array_agg(n.id) INTO v_users
+  FROM new_rows n JOIN old_rows o ON o.id = n.id
+  WHERE n.military_class IS DISTINCT FROM o.military_class;
+  IF v_users IS NOT NULL THEN
+    PERFORM fn_refresh_deadlines(v_users, 'mu');
+    PERFORM fn_refresh_deadlines(v_users, 'lp');
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_users_deadlines ON users;
+CREATE TRIGGER trg_users_deadlines AFTER UPDATE ON users
+  REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows FOR EACH STATEMENT
+  EXECUTE FUNCTION trg_deadline_class_changed();
+
+-- Зміна нормативів перерв — перерахунок усіх пілотів (таблиці рідко змінюються)
+CREATE OR REPLACE FUNCTION trg_deadline_periods_changed()
+RETURNS trigger AS $$
+BEGIN
+  PERFORM fn_refresh_deadlines(NULL, TG_ARGV[0]);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_break_periods_mu_deadlines ON break_periods_mu;
+CREATE TRIGGER trg_break_periods_mu_deadlines AFTER INSERT OR UPDATE OR DELETE ON break_periods_mu
+  FOR EACH STATEMENT EXECUTE FUNCTION trg_deadline_periods_changed('mu');
+DROP TRIGGER IF EXISTS trg_break_periods_lp_deadlines ON break_periods_lp;
+CREATE TRIGGER trg_break_periods_lp_deadlines AFTER INSERT OR UPDATE OR DELETE ON break_periods_lp
+  FOR EACH STATEMENT EXECUTE FUNCTION trg_deadline_periods_changed('lp');
+
+-- Початкове заповнення
+SELECT fn_refresh_deadlines(NULL, s) FROM unnest(ARRAY['mu', 'lp', 'commission', 'check']) AS s;
+
+-- Уже надіслані повідомлення: щоб після міграції не надіслати їх повторно
+UPDATE deadline_index d SET notified_stage = 2
+WHERE EXISTS (
+  SELECT 1 FROM notifications n
+  WHERE n.user_id = d.user_id AND n.type = d.source || '_expired' AND n.metadata @> d.metadata
+);
+UPDATE deadline_index d SET notified_stage = 1
+WHERE d.notified_stage = 0 AND EXISTS (
+  SELECT 1 FROM notifications n
+  WHERE n.user_id = d.user_id AND n.type = d.source || '_warning' AND n.metadata @> d.metadata
+);
@@ -0,0 +1,32 @@
+-- Планувальник попереджень (scripts/deadline_scheduler.py): попередження
+-- за 15, 7, 3, 1 день та в день закінчення терміну з deadline_index.
+-- Зміни в deadline_index надходять у планувальник через NOTIFY, контрольна
+-- точка — останній оброблений день — дає змогу після перезапуску надіслати
+-- пропущене і не дублювати надіслане.
+
+-- Повідомлення про нові та видалені терміни (зміна дати — це новий рядок)
+CREATE OR REPLACE FUNCTION trg_deadline_index_notify()
+RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    PERFORM pg_notify('deadline_index', json_build_object('op', 'delete', 'id', OLD.id)::text);
+  ELSE
+    PERFORM pg_notify('deadline_index', json_build_object('op', 'upsert', 'id', NEW.id)::text);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_deadline_index_notify ON deadline_index;
+CREATE TRIGGER trg_deadline_index_notify AFTER INSERT OR DELETE OR UPDATE OF expiry_date ON deadline_index
+  FOR EACH ROW EXECUTE FUNCTION trg_deadline_index_notify();
+
+CREATE TABLE IF NOT EXISTS deadline_scheduler_state (
+  id integer PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+  last_day date NOT NULL DEFAULT current_date - 1,   -- попередження до цього дня включно надіслані
+  last_change_at timestamptz NOT NULL DEFAULT now(), -- зміни deadline_index до цього моменту враховані
+  updated_at timestamptz DEFAULT now()
+);
+INSERT INTO deadline_scheduler_state (id) VALUES (1) ON CONFLICT DO NOTHING;
+
+CREATE INDEX IF NOT EXISTS idx_deadline_index_updated_at ON deadline_index(updated_at);
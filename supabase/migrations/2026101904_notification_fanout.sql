@@ -0,0 +1,32 @@
+-- Пакетне розсилання нагадувань про терміни (scripts/notification_fanout.py).
+-- Кожне нагадування має детермінований ключ
+-- користувач|тип|умова|тип ПС|deadline_date[|поріг 7/3/1]; журнал
+-- notification_alerts з цим ключем як PRIMARY KEY робить повторний запуск
+-- безпечним (INSERT ... ON CONFLICT DO NOTHING). Нові нагадування
+-- збираються в одне зведене повідомлення на користувача на день.
+
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS dedupe_key text;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_notifications_dedupe_key ON notifications(dedupe_key);
+
+CREATE TABLE IF NOT EXISTS notification_alerts (
+  dedupe_key text PRIMARY KEY,
+  user_id uuid NOT NULL,
+  type text NOT NULL,
+  digest_key text,                       -- notifications.dedupe_key зведення, куди потрапило
+  created_at timestamptz DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_notification_alerts_user ON notification_alerts(user_id, created_at);
+
+-- Уже надіслані check-deadlines повідомлення — у журнал, щоб не повторювати
+INSERT INTO notification_alerts (dedupe_key, user_id, type)
+SELECT DISTINCT
+  concat_ws('|', n.user_id, n.type,
+            COALESCE(n.metadata->>'mu_condition', n.metadata->>'lp_type',
+                     n.metadata->>'commission_type_id', n.metadata->>'check_type', ''),
+            COALESCE(n.metadata->>'aircraft_type_id', ''),
+            n.metadata->>'deadline_date')
+    || CASE WHEN n.metadata->>'threshold' IN ('7', '3', '1') THEN '|' || (n.metadata->>'threshold') ELSE '' END,
+  n.user_id, n.type
+FROM notifications n
+WHERE n.metadata ? 'deadline_date' AND n.user_id IS NOT NULL
+ON CONFLICT (dedupe_key) DO NOTHING;
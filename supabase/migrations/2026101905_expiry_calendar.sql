@@ -0,0 +1,199 @@
+-- Календар закінчення термінів підрозділу по тижнях: перерви МУ/ЛП, комісії
+-- та річні перевірки з deadline_index. Рядок — (підрозділ, тиждень) з
+-- лічильниками за джерелами та стислим списком термінів. Тригери на
+-- deadline_index і users перераховують лише зачеплені тижні, тож огляд
+-- командира — один виклик fn_expiry_calendar замість запитів по кожному пілоту.
+--
+-- Дати перерв МУ/ЛП тут — дати check-deadlines (fn_deadline_rows), а не
+-- екранів BreaksMU/BreaksLP: клас за замовчуванням 3 (на екранах 2), періоди
+-- ЛП у календарних місяцях (на екранах місяць = 30 днів), контрольні польоти
+-- (last_control_date + 10) не враховуються. Тож тут термін може бути раніше,
+-- ніж показує екран перерв; відповідь fn_expiry_calendar позначає це полем
+-- break_rules = 'check-deadlines'.
+
+CREATE TABLE IF NOT EXISTS expiry_calendar (
+  unit_id uuid,                          -- users.unit_id (NULL — пілоти без підрозділу)
+  week_start date NOT NULL,              -- понеділок
+  mu_count integer NOT NULL DEFAULT 0,
+  lp_count integer NOT NULL DEFAULT 0,
+  commission_count integer NOT NULL DEFAULT 0,
+  check_count integer NOT NULL DEFAULT 0,
+  -- [[user_id, джерело, назва, тип ПС, дата], ...] за датою
+  items jsonb NOT NULL DEFAULT '[]',
+  updated_at timestamptz DEFAULT now(),
+  UNIQUE NULLS NOT DISTINCT (unit_id, week_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_expiry_calendar_week ON expiry_calendar(week_start);
+-- Вибірка термінів тижня (idx_deadline_index_pending покриває лише незакриті)
+CREATE INDEX IF NOT EXISTS idx_deadline_index_expiry ON deadline_index(expiry_date);
+
+-- Перерахувати пари (підрозділ, тиждень): p_units[i] з p_weeks[i]
+CREATE OR REPLACE FUNCTION fn_refresh_expiry_calendar(p_units uuid[], p_weeks date[])
+RETURNS void AS $$
+BEGIN
+  WITH keys AS (
+    SELECT DISTINCT k.unit_id, k.week_start
+    FROM unnest(p_units, p_weeks) AS k(unit_id, week_start)
+    WHERE k.week_start IS NOT NULL
+  ), fresh AS (
+    SELECT k.unit_id, k.week_start,
+           count(*) FILTER (WHERE d.source = 'mu') AS mu_count,
+           count(*) FILTER (WHERE d.source = 'lp') AS lp_count,
+           count(*) FILTER (WHERE d.source = 'commission') AS commission_count,
+           count(*) FILTER (WHERE d.source = 'check') AS check_count,
+           jsonb_agg(jsonb_build_array(d.user_id, d.source, d.subject_name, d.aircraft_name, d.expiry_date)
+                     ORDER BY d.expiry_date, d.user_id, d.source, d.subject_key) AS items
+    FROM keys k
+    JOIN deadline_index d ON d.expiry_date >= k.week_start AND d.expiry_date < k.week_start + 7
+    JOIN users u ON u.id = d.user_id AND u.unit_id IS NOT DISTINCT FROM k.unit_id
+    GROUP BY k.unit_id, k.week_start
+  ), emptied AS (
+    DELETE FROM expiry_calendar c
+    USING keys k
+    WHERE c.unit_id IS NOT DISTINCT FROM k.unit_id AND c.week_start = k.week_start
+      AND NOT EXISTS (
+        SELECT 1 FROM fresh f WHERE f.unit_id IS NOT DISTINCT FROM k.unit_id AND f.week_start = k.week_start
+      )
+  )
+  INSERT INTO expiry_calendar (unit_id, week_start, mu_count, lp_count, commission_count, check_count, items)
+  SELECT unit_id, week_start, mu_count, lp_count, commission_count, check_count, items
+  FROM fresh
+  ON CONFLICT (unit_id, week_start) DO UPDATE
+  SET mu_count = EXCLUDED.mu_count,
+      lp_count = EXCLUDED.lp_count,
+      commission_count = EXCLUDED.commission_count,
+      check_count = EXCLUDED.check_count,
+      items = EXCLUDED.items,
+      updated_at = now()
+  WHERE expiry_calendar.items IS DISTINCT FROM EXCLUDED.items;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Тригер на deadline_index: тижні старих і нових дат зачеплених рядків.
+-- Оновлення лише notified_stage (планувальник повідомлень) календар не змінює.
+CREATE OR REPLACE FUNCTION trg_expiry_calendar_deadlines()
+RETURNS trigger AS $$
+DECLARE
+  v_units uuid[];
+  v_weeks date[];
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    SELECT array_agg(u.unit_id), array_agg(s.week_start) INTO v_units, v_weeks
+    FROM (SELECT DISTINCT user_id, date_trunc('week', expiry_date)::date AS week_start FROM new_rows) s
+    JOIN users u ON u.id = s.user_id;
+  ELSIF TG_OP = 'DELETE' THEN
+    SELECT array_agg(u.unit_id), array_agg(s.week_start) INTO v_units, v_weeks
+    FROM (SELECT DISTINCT user_id, date_trunc('week', expiry_date)::date AS week_start FROM old_rows) s
+    JOIN users u ON u.id = s.user_id;
+  ELSE
+    SELECT array_agg(u.unit_id), array_agg(s.week_start) INTO v_units, v_weeks
+    FROM (
+      SELECT n.user_id, date_trunc('week', n.expiry_date)::date AS week_start
+      FROM new_rows n JOIN old_rows o ON o.id = n.id
+      WHERE (n.expiry_date, n.subject_name, n.aircraft_name, n.user_id)
+            IS DISTINCT FROM (o.expiry_date, o.subject_name, o.aircraft_name, o.user_id)
+      UNION
+      SELECT o.user_id, date_trunc('week', o.expiry_date)::date
+      FROM new_rows n JOIN old_rows o ON o.id = n.id
+      WHERE (n.expiry_date, n.subject_name, n.aircraft_name, n.user_id)
+            IS DISTINCT FROM (o.expiry_date, o.subject_name, o.aircraft_name, o.user_id)
+    ) s
+    JOIN users u ON u.id = s.user_id;
+  END IF;
+  IF v_weeks IS NOT NULL THEN
+    PERFORM fn_refresh_expiry_calendar(v_units, v_weeks);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_deadline_index_calendar_ins ON deadline_index;
+DROP TRIGGER IF EXISTS trg_deadline_index_calendar_upd ON deadline_index;
+DROP TRIGGER IF EXISTS trg_deadline_index_calendar_del ON deadline_index;
+CREATE TRIGGER trg_deadline_index_calendar_ins AFTER INSERT ON deadline_index
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT
+  EXECUTE FUNCTION trg_expiry_calendar_deadlines();
+CREATE TRIGGER trg_deadline_index_calendar_upd AFTER UPDATE ON deadline_index
+  REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows FOR EACH STATEMENT
+  EXECUTE FUNCTION trg_expiry_calendar_deadlines();
+CREATE TRIGGER trg_deadline_index_calendar_del AFTER DELETE ON deadline_index
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT
+  EXECUTE FUNCTION trg_expiry_calendar_deadlines();
+
+-- Переведення пілота в інший підрозділ: його тижні в старому й новому
+CREATE OR REPLACE FUNCTION trg_expiry_calendar_unit_changed()
+RETURNS trigger AS $$
+DECLARE
+  v_units uuid[];
+  v_weeks date[];
+BEGIN
+  SELECT array_agg(s.unit_id), array_agg(s.week_start) INTO v_units, v_weeks
+  FROM (
+    SELECT DISTINCT x.unit_id, date_trunc('week', d.expiry_date)::date AS week_start
+    FROM new_rows n
+    JOIN old_rows o ON o.id = n.id AND o.unit_id IS DISTINCT FROM n.unit_id
+    JOIN deadline_index d ON d.user_id = n.id
+    CROSS JOIN LATERAL (VALUES (o.unit_id), (n.unit_id)) AS x(unit_id)
+  ) s;
+  IF v_weeks IS NOT NULL THEN
+    PERFORM fn_refresh_expiry_calendar(v_units, v_weeks);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_users_expiry_calendar ON users;
+CREATE TRIGGER trg_users_expiry_calendar AFTER UPDATE ON users
+  REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows FOR EACH STATEMENT
+  EXECUTE FUNCTION trg_expiry_calendar_unit_changed();
+
+-- Календар підрозділу з дочірніми (NULL — усі): прострочене одним блоком,
+-- далі p_weeks тижнів від поточного. Імена пілотів — один раз у "users".
+CREATE OR REPLACE FUNCTION fn_expiry_calendar(p_unit uuid DEFAULT NULL, p_weeks integer DEFAULT 12)
+RETURNS jsonb AS $$
+  WITH RECURSIVE tree AS (
+    SELECT id FROM units WHERE id = p_unit
+    UNION ALL
+    SELECT u.id FROM units u JOIN tree t ON u.parent_id = t.id
+  ), rows AS (
+    SELECT c.*
+    FROM expiry_calendar c
+    WHERE (p_unit IS NULL OR c.unit_id IN (SELECT id FROM tree))
+      AND c.week_start < date_trunc('week', current_date)::date + 7 * p_weeks
+  ), items AS (
+    SELECT r.week_start, i.item
+    FROM rows r, jsonb_array_elements(r.items) AS i(item)
+  ), current_items AS (
+    -- Поточний тиждень: лише терміни від сьогодні, минулі дні — у простроченому
+    SELECT CASE WHEN (item->>4)::date < current_date THEN NULL ELSE week_start END AS week_start, item
+    FROM items
+  ), weeks AS (
+    SELECT week_start,
+           jsonb_build_object(
+             'week', week_start,
+             'mu', count(*) FILTER (WHERE item->>1 = 'mu'),
+             'lp', count(*) FILTER (WHERE item->>1 = 'lp'),
+             'commission', count(*) FILTER (WHERE item->>1 = 'commission'),
+             'check', count(*) FILTER (WHERE item->>1 = 'check'),
+             'items', jsonb_agg(item ORDER BY item->>4, item->>0)) AS bucket
+    FROM current_items
+    GROUP BY week_start
+  )
+  SELECT jsonb_build_object(
+    'today', current_date,
+    'break_rules', 'check-deadlines',     -- МУ/ЛП за правилами check-deadlines, див. вище
+    'overdue', COALESCE((SELECT bucket FROM weeks WHERE week_start IS NULL), '{}'::jsonb),
+    'weeks', COALESCE((SELECT jsonb_agg(bucket ORDER BY week_start) FROM weeks WHERE week_start IS NOT NULL),
+                      '[]'::jsonb),
+    'users', COALESCE((SELECT jsonb_object_agg(u.id, u.name) FROM users u
+                       WHERE u.id IN (SELECT (item->>0)::uuid FROM items)), '{}'::jsonb)
+  );
+$$ LANGUAGE sql STABLE;
+
+-- Початкове заповнення
+SELECT fn_refresh_expiry_calendar(array_agg(s.unit_id), array_agg(s.week_start))
+FROM (
+  SELECT DISTINCT u.unit_id, date_trunc('week', d.expiry_date)::date AS week_start
+  FROM deadline_index d JOIN users u ON u.id = d.user_id
+) s;
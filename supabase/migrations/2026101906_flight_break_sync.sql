@@ -0,0 +1,308 @@
+-- Інкрементний перерахунок mu_break_dates / lp_break_dates за польотами.
+-- Оновлюється скриптом scripts/break_sync.py за flight_updates_log,
+-- flights.changed_at і flight_deletions.
+-- Кожен політ лишає внески: (пілот, МУ/ЛП, умова/вид, тип ПС, дата, вид
+-- продовження). Дата перерви ключа — найбільша дата серед його внесків,
+-- тож після зміни чи видалення польоту перераховуються лише ключі цього
+-- польоту, кожен одним спуском по індексу, без повного перерахунку історії.
+-- Дати, внесені вручну (не з польотів), зберігаються як окремі внески.
+
+CREATE TABLE IF NOT EXISTS flight_break_contributions (
+  id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+  flight_id uuid,                        -- NULL — дата, внесена вручну
+  user_id uuid NOT NULL,
+  kind text NOT NULL,                    -- mu / lp
+  condition text NOT NULL,               -- mu_condition / lp_type
+  aircraft_type_id uuid,
+  extension text NOT NULL,               -- full → last_date, control → last_control_date
+  flight_date date NOT NULL
+);
+
+-- Максимальна дата ключа — один спуск по індексу
+CREATE INDEX IF NOT EXISTS idx_flight_break_contributions_key
+  ON flight_break_contributions(user_id, kind, condition, aircraft_type_id, extension, flight_date);
+CREATE INDEX IF NOT EXISTS idx_flight_break_contributions_flight
+  ON flight_break_contributions(flight_id) WHERE flight_id IS NOT NULL;
+-- Одна ручна дата на ключ і вид продовження
+CREATE UNIQUE INDEX IF NOT EXISTS idx_flight_break_contributions_manual
+  ON flight_break_contributions(user_id, kind, condition, aircraft_type_id, extension) NULLS NOT DISTINCT
+  WHERE flight_id IS NULL;
+
+CREATE TABLE IF NOT EXISTS break_sync_state (
+  id integer PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+  last_log_at timestamptz NOT NULL DEFAULT '-infinity',
+  last_flight_at timestamptz NOT NULL DEFAULT '-infinity',
+  updated_at timestamptz DEFAULT now()
+);
+INSERT INTO break_sync_state (id) VALUES (1) ON CONFLICT DO NOTHING;
+
+-- Внески польотів з поточних даних, за правилами клієнта (Main.js).
+-- Вид продовження — як getExtensionType: Контрольний → control, У складі
+-- екіпажу → не продовжує, На випробування / За методиками ЛВ → control з
+-- інструктором в екіпажі, інші → full. Члени екіпажу з обліковим записом
+-- отримують ті самі умови МУ і види ЛП: Інструктор / Штурман → full,
+-- Правий пілот → control, інші ролі не продовжують.
+-- Умови МУ — detected_mu з flight_updates_log, а без запису в журналі —
+-- час доби + метеоумови польоту. Види ЛП — з журналу (corrected_lp, якщо
+-- пілот виправив), а без запису — з lp_types вправ польоту.
+CREATE OR REPLACE FUNCTION fn_flight_break_rows(p_flight_ids uuid[])
+RETURNS TABLE (flight_id uuid, user_id uuid, kind text, condition text, aircraft_type_id uuid,
+               extension text, flight_date date) AS $$
+  WITH f AS (
+    SELECT f.id, f.user_id, f.aircraft_type_id, f.date,
+           COALESCE(f.time_of_day, '') || COALESCE(f.weather_conditions, '') AS mu_condition,
+           CASE
+             WHEN f.flight_type = 'Контрольний' THEN 'control'
+             WHEN f.flight_type = 'У складі екіпажу' THEN 'none'
+             WHEN f.flight_type IN ('На випробування', 'За методиками ЛВ') AND EXISTS (
+               SELECT 1 FROM flight_crew fc WHERE fc.flight_id = f.id AND fc.role = 'Інструктор'
+             ) THEN 'control'
+             ELSE 'full'
+           END AS extension
+    FROM flights f
+    WHERE f.id = ANY(p_flight_ids) AND f.user_id IS NOT NULL AND f.date IS NOT NULL
+  ), log AS (
+    SELECT DISTINCT ON (l.flight_id) l.flight_id, l.detected_mu AS mu_conditions,
+           CASE WHEN l.confirmed IS FALSE AND l.corrected_lp IS NOT NULL THEN l.corrected_lp
+                ELSE l.detected_lp END AS lp_types
+    FROM flight_updates_log l
+    WHERE l.flight_id = ANY(p_flight_ids)
+    ORDER BY l.flight_id, l.logged_at DESC
+  ), members AS (
+    SELECT f.id AS flight_id, f.user_id, f.extension FROM f
+    UNION
+    SELECT fc.flight_id, fc.user_id,
+           CASE fc.role
+             WHEN 'Інструктор' THEN 'full'
+             WHEN 'Штурман' THEN 'full'
+             WHEN 'Правий пілот' THEN 'control'
+             ELSE 'none'
+           END
+    FROM flight_crew fc
+    JOIN f ON f.id = fc.flight_id
+    WHERE fc.user_id IS NOT NULL
+  ), mu AS (
+    SELECT f.id AS flight_id, c.condition
+    FROM f
+    CROSS JOIN LATERAL (
+      SELECT unnest(log.mu_conditions) FROM log WHERE log.flight_id = f.id
+      UNION
+      SELECT f.mu_condition WHERE NOT EXISTS (SELECT 1 FROM log WHERE log.flight_id = f.id)
+    ) AS c(condition)
+    WHERE c.condition IN ('ДПМУ', 'ДСМУ', 'ДВМП', 'НПМУ', 'НСМУ', 'НВМП')
+  ), lp AS (
+    SELECT f.id AS flight_id, c.condition
+    FROM f
+    CROSS JOIN LATERAL (
+      SELECT unnest(log.lp_types) FROM log WHERE log.flight_id = f.id
+      UNION
+      SELECT unnest(e.lp_types)
+      FROM flight_exercises fe JOIN exercises e ON e.id = fe.exercise_id
+      WHERE fe.flight_id = f.id AND NOT EXISTS (SELECT 1 FROM log WHERE log.flight_id = f.id)
+    ) AS c(condition)
+    WHERE c.condition IS NOT NULL AND c.condition <> ''
+  )
+  SELECT f.id, m.user_id, 'mu', mu.condition, f.aircraft_type_id, m.extension, f.date
+  FROM f
+  JOIN members m ON m.flight_id = f.id
+  JOIN mu ON mu.flight_id = f.id
+  WHERE m.extension <> 'none'
+  UNION
+  SELECT f.id, m.user_id, 'lp', lp.condition, f.aircraft_type_id, m.extension, f.date
+  FROM f
+  JOIN members m ON m.flight_id = f.id
+  JOIN lp ON lp.flight_id = f.id
+  WHERE m.extension <> 'none';
+$$ LANGUAGE sql STABLE;
+
+-- Зміна екіпажу польоту змінює внески його членів
+DROP TRIGGER IF EXISTS trg_flight_crew_touch_ins ON flight_crew;
+DROP TRIGGER IF EXISTS trg_flight_crew_touch_del ON flight_crew;
+CREATE TRIGGER trg_flight_crew_touch_ins AFTER INSERT ON flight_crew
+  REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT
+  EXECUTE FUNCTION trg_flight_exercises_touch();
+CREATE TRIGGER trg_flight_crew_touch_del AFTER DELETE ON flight_crew
+  REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT
+  EXECUTE FUNCTION trg_flight_exercises_touch();
+
+-- Перерахувати внески заданих польотів і дати їхніх ключів (ідемпотентно).
+-- Повертає кількість перерахованих ключів.
+CREATE OR REPLACE FUNCTION fn_apply_flight_breaks(p_flight_ids uuid[])
+RETURNS integer AS $$
+DECLARE
+  v_count integer;
+BEGIN
+  CREATE TEMP TABLE IF NOT EXISTS _break_keys (
+    user_id uuid, kind text, condition text, aircraft_type_id uuid
+  ) ON COMMIT DROP;
+  CREATE TEMP TABLE IF NOT EXISTS _break_key_dates (
+    user_id uuid, kind text, condition text, aircraft_type_id uuid, last_date date, last_control_date date
+  ) ON COMMIT DROP;
+  TRUNCATE _break_keys, _break_key_dates;
+
+  -- 1. Зняти старі внески, запам'ятавши їхні ключі
+  WITH old AS (
+    DELETE FROM flight_break_contributions c
+    WHERE c.flight_id = ANY(p_flight_ids)
+    RETURNING c.user_id, c.kind, c.condition, c.aircraft_type_id
+  )
+  INSERT INTO _break_keys SELECT DISTINCT * FROM old;
+
+  -- 2. Додати нові внески з поточних даних польотів
+  WITH fresh AS (
+    INSERT INTO flight_break_contributions
+      (flight_id, user_id, kind, condition, aircraft_type_id, extension, flight_date)
+    SELECT r.flight_id, r.user_id, r.kind, r.condition, r.aircraft_type_id, r.extension, r.flight_date
+    FROM fn_flight_break_rows(p_flight_ids) r
+    RETURNING user_id, kind, condition, aircraft_type_id
+  )
+  INSERT INTO _break_keys
+  SELECT DISTINCT f.* FROM fresh f
+  WHERE NOT EXISTS (
+    SELECT 1 FROM _break_keys k
+    WHERE k.user_id = f.user_id AND k.kind = f.kind AND k.condition = f.condition
+      AND k.aircraft_type_id IS NOT DISTINCT FROM f.aircraft_type_id
+  );
+  SELECT count(*) INTO v_count FROM _break_keys;
+
+  -- 3. Дата ключа — найбільша дата його внесків (спуск по індексу)
+  INSERT INTO _break_key_dates
+  SELECT k.user_id, k.kind, k.condition, k.aircraft_type_id,
+         (SELECT max(c.flight_date) FROM flight_break_contributions c
+          WHERE c.user_id = k.user_id AND c.kind = k.kind AND c.condition = k.condition
+            AND c.aircraft_type_id IS NOT DISTINCT FROM k.aircraft_type_id AND c.extension = 'full'),
+         (SELECT max(c.flight_date) FROM flight_break_contributions c
+          WHERE c.user_id = k.user_id AND c.kind = k.kind AND c.condition = k.condition
+            AND c.aircraft_type_id IS NOT DISTINCT FROM k.aircraft_type_id AND c.extension = 'control')
+  FROM _break_keys k;
+
+  -- 4. Записати дати ключів; власні записи не є ручними датами
+  PERFORM set_config('app.break_sync', 'on', true);
+
+  UPDATE mu_break_dates m
+  SET last_date = d.last_date, last_control_date = d.last_control_date
+  FROM _break_key_dates d
+  WHERE d.kind = 'mu' AND m.user_id = d.user_id AND m.mu_condition = d.condition
+    AND m.aircraft_type_id IS NOT DISTINCT FROM d.aircraft_type_id
+    AND (m.last_date, m.last_control_date) IS DISTINCT FROM (d.last_date, d.last_control_date);
+  INSERT INTO mu_break_dates (user_id, mu_condition, aircraft_type_id, last_date, last_control_date)
+  SELECT d.user_id, d.condition, d.aircraft_type_id, d.last_date, d.last_control_date
+  FROM _break_key_dates d
+  WHERE d.kind = 'mu' AND (d.last_date IS NOT NULL OR d.last_control_date IS NOT NULL)
+    AND NOT EXISTS (
+      SELECT 1 FROM mu_break_dates m
+      WHERE m.user_id = d.user_id AND m.mu_condition = d.condition
+        AND m.aircraft_type_id IS NOT DISTINCT FROM d.aircraft_type_id
+    );
+
+  UPDATE lp_break_dates l
+  SET last_date = d.last_date, last_control_date = d.last_control_date
+  FROM _break_key_dates d
+  WHERE d.kind = 'lp' AND l.user_id = d.user_id AND l.lp_type = d.condition
+    AND l.aircraft_type_id IS NOT DISTINCT FROM d.aircraft_type_id
+    AND (l.last_date, l.last_control_date) IS DISTINCT FROM (d.last_date, d.last_control_date);
+  INSERT INTO lp_break_dates (user_id, lp_type, aircraft_type_id, last_date, last_control_date)
+  SELECT d.user_id, d.condition, d.aircraft_type_id, d.last_date, d.last_control_date
+  FROM _break_key_dates d
+  WHERE d.kind = 'lp' AND (d.last_date IS NOT NULL OR d.last_control_date IS NOT NULL)
+    AND NOT EXISTS (
+      SELECT 1 FROM lp_break_dates l
+      WHERE l.user_id = d.user_id AND l.lp_type = d.condition
+        AND l.aircraft_type_id IS NOT DISTINCT FROM d.aircraft_type_id
+    );
+
+  -- Ключ без жодного внеску (видалено останній політ) — рядок не потрібен
+  DELETE FROM mu_break_dates m USING _break_keys k
+  WHERE k.kind = 'mu' AND m.user_id = k.user_id AND m.mu_condition = k.condition
+    AND m.aircraft_type_id IS NOT DISTINCT FROM k.aircraft_type_id
+    AND m.last_date IS NULL AND m.last_control_date IS NULL;
+  DELETE FROM lp_break_dates l USING _break_keys k
+  WHERE k.kind = 'lp' AND l.user_id = k.user_id AND l.lp_type = k.condition
+    AND l.aircraft_type_id IS NOT DISTINCT FROM k.aircraft_type_id
+    AND l.last_date IS NULL AND l.last_control_date IS NULL;
+
+  PERFORM set_config('app.break_sync', 'off', true);
+  RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Ручні зміни дат (екрани перерв, виправлення пілота) — внески без польоту.
+-- Записи самого fn_apply_flight_breaks і записи з тригерів flights
+-- (pg_trigger_depth() > 1) ручними не вважаються. Не вважаються ними й
+-- дати, які пояснює політ цього користувача на цьому типі ПС у цей день:
+-- так клієнт після збереження польоту дублює його дату через
+-- upsert_lp_break / upsert_mu_break, а внесок дає сам політ, тож після
+-- видалення польоту дата відкочується.
+CREATE OR REPLACE FUNCTION trg_break_dates_manual()
+RETURNS trigger AS $$
+DECLARE
+  v_condition text;
+  v_ext record;
+BEGIN
+  IF pg_trigger_depth() > 1 OR current_setting('app.break_sync', true) = 'on' THEN
+    RETURN NULL;
+  END IF;
+  v_condition := CASE WHEN TG_ARGV[0] = 'mu' THEN to_jsonb(NEW)->>'mu_condition' ELSE to_jsonb(NEW)->>'lp_type' END;
+  IF NEW.user_id IS NULL OR v_condition IS NULL THEN
+    RETURN NULL;
+  END IF;
+  FOR v_ext IN
+    SELECT * FROM (VALUES
+      ('full', NEW.last_date, CASE WHEN TG_OP = 'UPDATE' THEN OLD.last_date END),
+      ('control', NEW.last_control_date, CASE WHEN TG_OP = 'UPDATE' THEN OLD.last_control_date END)
+    ) AS v(extension, new_date, old_date)
+  LOOP
+    CONTINUE WHEN TG_OP = 'UPDATE' AND v_ext.new_date IS NOT DISTINCT FROM v_ext.old_date;
+    CONTINUE WHEN v_ext.new_date IS NOT NULL AND EXISTS (
+      SELECT 1 FROM flights f
+      WHERE f.user_id = NEW.user_id AND f.date = v_ext.new_date
+        AND f.aircraft_type_id IS NOT DISTINCT FROM NEW.aircraft_type_id
+    );
+    DELETE FROM flight_break_contributions c
+    WHERE c.flight_id IS NULL AND c.user_id = NEW.user_id AND c.kind = TG_ARGV[0]
+      AND c.condition = v_condition AND c.aircraft_type_id IS NOT DISTINCT FROM NEW.aircraft_type_id
+      AND c.extension = v_ext.extension;
+    IF v_ext.new_date IS NOT NULL THEN
+      INSERT INTO flight_break_contributions (flight_id, user_id, kind, condition, aircraft_type_id, extension, flight_date)
+      VALUES (NULL, NEW.user_id, TG_ARGV[0], v_condition, NEW.aircraft_type_id, v_ext.extension, v_ext.new_date);
+    END IF;
+  END LOOP;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_mu_break_dates_manual ON mu_break_dates;
+CREATE TRIGGER trg_mu_break_dates_manual AFTER INSERT OR UPDATE OF last_date, last_control_date ON mu_break_dates
+  FOR EACH ROW EXECUTE FUNCTION trg_break_dates_manual('mu');
+DROP TRIGGER IF EXISTS trg_lp_break_dates_manual ON lp_break_dates;
+CREATE TRIGGER trg_lp_break_dates_manual AFTER INSERT OR UPDATE OF last_date, last_control_date ON lp_break_dates
+  FOR EACH ROW EXECUTE FUNCTION trg_break_dates_manual('lp');
+
+-- Початкове заповнення: внески всіх польотів (таблиці перерв не змінюються)
+INSERT INTO flight_break_contributions (flight_id, user_id, kind, condition, aircraft_type_id, extension, flight_date)
+SELECT r.flight_id, r.user_id, r.kind, r.condition, r.aircraft_type_id, r.extension, r.flight_date
+FROM fn_flight_break_rows(ARRAY(SELECT id FROM flights)) r
+WHERE NOT EXISTS (SELECT 1 FROM flight_break_contributions c WHERE c.flight_id IS NOT NULL);
+
+-- Дати, яких польоти не пояснюють (пізніші за всі польоти ключа), — ручні
+INSERT INTO flight_break_contributions (flight_id, user_id, kind, condition, aircraft_type_id, extension, flight_date)
+SELECT NULL, b.user_id, b.kind, b.condition, b.aircraft_type_id, b.extension, b.flight_date
+FROM (
+  SELECT user_id, 'mu' AS kind, mu_condition AS condition, aircraft_type_id, 'full' AS extension, last_date AS flight_date
+  FROM mu_break_dates
+  UNION ALL
+  SELECT user_id, 'mu', mu_condition, aircraft_type_id, 'control', last_control_date FROM mu_break_dates
+  UNION ALL
+  SELECT user_id, 'lp', lp_type, aircraft_type_id, 'full', last_date FROM lp_break_dates
+  UNION ALL
+  SELECT user_id, 'lp', lp_type, aircraft_type_id, 'control', last_control_date FROM lp_break_dates
+) b
+WHERE b.user_id IS NOT NULL AND b.condition IS NOT NULL AND b.flight_date IS NOT NULL
+  AND b.flight_date > COALESCE((
+    SELECT max(c.flight_date) FROM flight_break_contributions c
+    WHERE c.user_id = b.user_id AND c.kind = b.kind AND c.condition = b.condition
+      AND c.aircraft_type_id IS NOT DISTINCT FROM b.aircraft_type_id AND c.extension = b.extension
+  ), '-infinity'::date)
+ON CONFLICT DO NOTHING;
+
+UPDATE break_sync_state SET last_log_at = now(), last_flight_at = now(), updated_at = now() WHERE id = 1;
@@ -0,0 +1,54 @@
+-- Гібридний пошук фрагментів з фільтром за документом (supabase/functions/ask).
+-- Якщо користувач назвав документ ("в КБП ВА", "у ПВП"), ask передає
+-- префікси назв у document_prefixes, і top-k обирається лише серед
+-- фрагментів цих документів, а не обрізається після пошуку по всіх.
+-- Без префіксів (NULL) — пошук по всіх документах, як і раніше.
+-- Оцінка: (1 - keyword_weight) × косинусна подібність + keyword_weight ×
+-- ранг повнотекстового збігу; фрагмент проходить за порогом подібності
+-- або за наявності ключових слів.
+
+-- Нова сигнатура замість старої: перевантаження з тими самими іменованими
+-- параметрами PostgREST не розрізнить.
+DO $$
+DECLARE
+  v_fn regprocedure;
+BEGIN
+  FOR v_fn IN SELECT p.oid::regprocedure FROM pg_proc p WHERE p.proname = 'match_document_chunks_hybrid' LOOP
+    EXECUTE format('DROP FUNCTION %s', v_fn);
+  END LOOP;
+END;
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_document_chunks_document ON document_chunks(document_id);
+
+CREATE OR REPLACE FUNCTION match_document_chunks_hybrid(
+  query_embedding vector,
+  query_text text,
+  match_threshold float DEFAULT 0.2,
+  match_count integer DEFAULT 10,
+  keyword_weight float DEFAULT 0.3,
+  document_prefixes text[] DEFAULT NULL
+)
+RETURNS TABLE (id uuid, document_id uuid, chunk_text text, chunk_index integer, paragraph_ref text,
+               similarity float, keyword_rank float, score float) AS $$
+  WITH q AS (
+    SELECT websearch_to_tsquery('simple', query_text) AS tsq
+  ), scored AS (
+    SELECT c.id, c.document_id, c.chunk_text, c.chunk_index, c.paragraph_ref,
+           (1 - (c.embedding <=> query_embedding))::float AS similarity,
+           ts_rank_cd(to_tsvector('simple', c.chunk_text), q.tsq)::float AS keyword_rank
+    FROM document_chunks c
+    CROSS JOIN q
+    WHERE document_prefixes IS NULL
+       OR c.document_id IN (
+         SELECT d.id FROM documents d
+         WHERE EXISTS (SELECT 1 FROM unnest(document_prefixes) p WHERE starts_with(d.title, p))
+       )
+  )
+  SELECT s.id, s.document_id, s.chunk_text, s.chunk_index, s.paragraph_ref, s.similarity, s.keyword_rank,
+         (1 - keyword_weight) * s.similarity + keyword_weight * least(s.keyword_rank, 1.0) AS score
+  FROM scored s
+  WHERE s.similarity >= match_threshold OR s.keyword_rank > 0
+  ORDER BY score DESC
+  LIMIT match_count;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,22 @@
+-- Журнал notification_alerts (2026101904): індекс для підрахунку зведень
+-- і термін зберігання.
+-- fan_out() рахує рядки зведення за digest_key на кожну порцію; без
+-- індексу це послідовне сканування всього журналу, що лише росте.
+CREATE INDEX IF NOT EXISTS idx_notification_alerts_digest ON notification_alerts(digest_key);
+CREATE INDEX IF NOT EXISTS idx_notification_alerts_created_at ON notification_alerts(created_at);
+
+-- Ключ потрібен, доки повідомлення можуть повторити: попередження
+-- надсилаються не раніше ніж за 15 днів до терміну, а після закінчення
+-- рядок deadline_index має notified_stage = 2 і більше не обробляється.
+-- Старші за p_keep_days рядки видаляє scripts/deadline_scheduler.py раз на
+-- день (notification_fanout.prune()); функція — для ручного запуску.
+CREATE OR REPLACE FUNCTION fn_prune_notification_alerts(p_keep_days integer DEFAULT 90)
+RETURNS integer AS $$
+DECLARE
+  v_deleted integer;
+BEGIN
+  DELETE FROM notification_alerts WHERE created_at < now() - make_interval(days => p_keep_days);
+  GET DIAGNOSTICS v_deleted = ROW_COUNT;
+  RETURN v_deleted;
+END;
+$$ LANGUAGE plpgsql;
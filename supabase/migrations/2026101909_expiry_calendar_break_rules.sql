@@ -0,0 +1,254 @@
+-- Календар термінів (2026101905): дати перерв МУ/ЛП за правилами екранів
+-- BreaksMU/BreaksLP (scripts/break_engine.py), а не check-deadlines.
+--
+-- deadline_index.expiry_date лишається датою check-deadlines (клас 3 за
+-- замовчуванням, календарні місяці ЛП, без контрольних польотів) — від неї
+-- залежать повідомлення. Поруч — calendar_date, дата, яку показує екран
+-- перерв:
+--   - МУ: last_date + дні періоду для класу пілота (без класу — 2; немає
+--     періоду — немає терміну за тренуванням)
+--   - ЛП: last_date + місяці × 30; період — для класу пілота або без класу,
+--     з документа КБП типу ПС (aircraft_kbp_mapping, без КЛПВ) або без
+--     документа; якщо таких кілька — найкоротший
+--   - контрольний політ: last_control_date + 10; термін — пізніша з дат
+--   - комісії та перевірки — та сама дата, що й expiry_date
+-- Рядок без жодної дати (немає періоду і контрольного польоту) у календар
+-- не потрапляє. Тригери deadline_index уже перераховують пілота при зміні
+-- дат, класу та нормативів, тож calendar_date оновлюється разом з ними.
+--
+-- Прострочене в fn_expiry_calendar — лише за останні p_overdue_days днів.
+
+ALTER TABLE deadline_index ADD COLUMN IF NOT EXISTS calendar_date date;
+CREATE INDEX IF NOT EXISTS idx_deadline_index_calendar ON deadline_index(calendar_date);
+
+-- Дати перерв пілотів (NULL — усіх) за правилами екранів, ключ як у fn_deadline_rows
+CREATE OR REPLACE FUNCTION fn_break_calendar_dates(p_users uuid[], p_source text)
+RETURNS TABLE (user_id uuid, subject_key text, calendar_date date) AS $$
+  SELECT m.user_id, m.mu_condition || '|' || COALESCE(m.aircraft_type_id::text, ''),
+         GREATEST(m.last_date + NULLIF((
+                    SELECT p.days FROM break_periods_mu p
+                    WHERE p.mu_condition = m.mu_condition
+                      AND p.military_class = COALESCE(NULLIF(u.military_class, 0), 2)
+                    LIMIT 1), 0),
+                  m.last_control_date + 10)
+  FROM mu_break_dates m
+  LEFT JOIN users u ON u.id = m.user_id
+  WHERE p_source = 'mu' AND m.user_id IS NOT NULL AND m.last_date IS NOT NULL
+    AND (p_users IS NULL OR m.user_id = ANY(p_users))
+  UNION ALL
+  SELECT l.user_id, l.lp_type || '|' || COALESCE(l.aircraft_type_id::text, ''),
+         GREATEST(l.last_date + 30 * NULLIF((
+                    SELECT p.months FROM break_periods_lp p
+                    WHERE p.lp_type_normalized = l.lp_type
+                      AND (p.military_class IS NULL OR p.military_class = COALESCE(NULLIF(u.military_class, 0), 2))
+                      AND (l.aircraft_type_id IS NULL OR p.kbp_document IS NULL OR p.kbp_document IN (
+                        SELECT k.kbp_document FROM aircraft_kbp_mapping k
+                        WHERE k.aircraft_type_id = l.aircraft_type_id AND k.kbp_document <> 'КЛПВ'))
+                      AND p.months > 0
+                    ORDER BY p.months
+                    LIMIT 1), 0),
+                  l.last_control_date + 10)
+  FROM lp_break_dates l
+  LEFT JOIN users u ON u.id = l.user_id
+  WHERE p_source = 'lp' AND l.user_id IS NOT NULL AND l.last_date IS NOT NULL
+    AND (p_users IS NULL OR l.user_id = ANY(p_users));
+$$ LANGUAGE sql STABLE;
+
+-- Як у 2026101902, плюс calendar_date. Зміна лише calendar_date (контрольний
+-- політ) не змінює updated_at: для планувальника повідомлень термін той самий.
+CREATE OR REPLACE FUNCTION fn_refresh_deadlines(p_users uuid[], p_source text)
+RETURNS void AS $$
+BEGIN
+  WITH fresh AS (
+    SELECT DISTINCT ON (r.user_id, r.subject_key, r.expiry_date) r.*,
+           CASE WHEN p_source IN ('mu', 'lp') THEN c.calendar_date ELSE r.expiry_date END AS calendar_date
+    FROM fn_deadline_rows(p_users, p_source) r
+    LEFT JOIN fn_break_calendar_dates(p_users, p_source) c
+      ON c.user_id = r.user_id AND c.subject_key = r.subject_key
+  ), stale AS (
+    DELETE FROM deadline_index d
+    WHERE d.source = p_source AND (p_users IS NULL OR d.user_id = ANY(p_users))
+      AND NOT EXISTS (
+        SELECT 1 FROM fresh f
+        WHERE f.user_id = d.user_id AND f.subject_key = d.subject_key AND f.expiry_date = d.expiry_date
+      )
+  )
+  INSERT INTO deadline_index (user_id, source, subject_key, subject_name, aircraft_name, expiry_date, metadata,
+                              calendar_date)
+  SELECT user_id, p_source, subject_key, subject_name, aircraft_name, expiry_date, metadata, calendar_date
+  FROM fresh
+  ON CONFLICT (source, user_id, subject_key, expiry_date) DO UPDATE
+  SET subject_name = EXCLUDED.subject_name,
+      aircraft_name = EXCLUDED.aircraft_name,
+      metadata = EXCLUDED.metadata,
+      calendar_date = EXCLUDED.calendar_date,
+      updated_at = CASE
+        WHEN (deadline_index.subject_name, deadline_index.aircraft_name, deadline_index.metadata)
+             IS DISTINCT FROM (EXCLUDED.subject_name, EXCLUDED.aircraft_name, EXCLUDED.metadata)
+        THEN now() ELSE deadline_index.updated_at END
+  WHERE (deadline_index.subject_name, deadline_index.aircraft_name, deadline_index.metadata,
+         deadline_index.calendar_date)
+        IS DISTINCT FROM (EXCLUDED.subject_name, EXCLUDED.aircraft_name, EXCLUDED.metadata,
+                          EXCLUDED.calendar_date);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Перерахувати пари (підрозділ, тиждень) за calendar_date
+CREATE OR REPLACE FUNCTION fn_refresh_expiry_calendar(p_units uuid[], p_weeks date[])
+RETURNS void AS $$
+BEGIN
+  WITH keys AS (
+    SELECT DISTINCT k.unit_id, k.week_start
+    FROM unnest(p_units, p_weeks) AS k(unit_id, week_start)
+    WHERE k.week_start IS NOT NULL
+  ), fresh AS (
+    SELECT k.unit_id, k.week_start,
+           count(*) FILTER (WHERE d.source = 'mu') AS mu_count,
+           count(*) FILTER (WHERE d.source = 'lp') AS lp_count,
+           count(*) FILTER (WHERE d.source = 'commission') AS commission_count,
+           count(*) FILTER (WHERE d.source = 'check') AS check_count,
+           jsonb_agg(jsonb_build_array(d.user_id, d.source, d.subject_name, d.aircraft_name, d.calendar_date)
+                     ORDER BY d.calendar_date, d.user_id, d.source, d.subject_key) AS items
+    FROM keys k
+    JOIN deadline_index d ON d.calendar_date >= k.week_start AND d.calendar_date < k.week_start + 7
+    JOIN users u ON u.id = d.user_id AND u.unit_id IS NOT DISTINCT FROM k.unit_id
+    GROUP BY k.unit_id, k.week_start
+  ), emptied AS (
+    DELETE FROM expiry_calendar c
+    USING keys k
+    WHERE c.unit_id IS NOT DISTINCT FROM k.unit_id AND c.week_start = k.week_start
+      AND NOT EXISTS (
+        SELECT 1 FROM fresh f WHERE f.unit_id IS NOT DISTINCT FROM k.unit_id AND f.week_start = k.week_start
+      )
+  )
+  INSERT INTO expiry_calendar (unit_id, week_start, mu_count, lp_count, commission_count, check_count, items)
+  SELECT unit_id, week_start, mu_count, lp_count, commission_count, check_count, items
+  FROM fresh
+  ON CONFLICT (unit_id, week_start) DO UPDATE
+  SET mu_count = EXCLUDED.mu_count,
+      lp_count = EXCLUDED.lp_count,
+      commission_count = EXCLUDED.commission_count,
+      check_count = EXCLUDED.check_count,
+      items = EXCLUDED.items,
+      updated_at = now()
+  WHERE expiry_calendar.items IS DISTINCT FROM EXCLUDED.items;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Тригер на deadline_index: тижні старих і нових calendar_date зачеплених рядків
+CREATE OR REPLACE FUNCTION trg_expiry_calendar_deadlines()
+RETURNS trigger AS $$
+DECLARE
+  v_units uuid[];
+  v_weeks date[];
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    SELECT array_agg(u.unit_id), array_agg(s.week_start) INTO v_units, v_weeks
+    FROM (SELECT DISTINCT user_id, date_trunc('week', calendar_date)::date AS week_start FROM new_rows) s
+    JOIN users u ON u.id = s.user_id;
+  ELSIF TG_OP = 'DELETE' THEN
+    SELECT array_agg(u.unit_id), array_agg(s.week_start) INTO v_units, v_weeks
+    FROM (SELECT DISTINCT user_id, date_trunc('week', calendar_date)::date AS week_start FROM old_rows) s
+    JOIN users u ON u.id = s.user_id;
+  ELSE
+    SELECT array_agg(u.unit_id), array_agg(s.week_start) INTO v_units, v_weeks
+    FROM (
+      SELECT n.user_id, date_trunc('week', n.calendar_date)::date AS week_start
+      FROM new_rows n JOIN old_rows o ON o.id = n.id
+      WHERE (n.calendar_date, n.subject_name, n.aircraft_name, n.user_id)
+            IS DISTINCT FROM (o.calendar_date, o.subject_name, o.aircraft_name, o.user_id)
+      UNION
+      SELECT o.user_id, date_trunc('week', o.calendar_date)::date
+      FROM new_rows n JOIN old_rows o ON o.id = n.id
+      WHERE (n.calendar_date, n.subject_name, n.aircraft_name, n.user_id)
+            IS DISTINCT FROM (o.calendar_date, o.subject_name, o.aircraft_name, o.user_id)
+    ) s
+    JOIN users u ON u.id = s.user_id;
+  END IF;
+  IF v_weeks IS NOT NULL THEN
+    PERFORM fn_refresh_expiry_calendar(v_units, v_weeks);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Переведення пілота в інший підрозділ: його тижні в старому й новому
+CREATE OR REPLACE FUNCTION trg_expiry_calendar_unit_changed()
+RETURNS trigger AS $$
+DECLARE
+  v_units uuid[];
+  v_weeks date[];
+BEGIN
+  SELECT array_agg(s.unit_id), array_agg(s.week_start) INTO v_units, v_weeks
+  FROM (
+    SELECT DISTINCT x.unit_id, date_trunc('week', d.calendar_date)::date AS week_start
+    FROM new_rows n
+    JOIN old_rows o ON o.id = n.id AND o.unit_id IS DISTINCT FROM n.unit_id
+    JOIN deadline_index d ON d.user_id = n.id
+    CROSS JOIN LATERAL (VALUES (o.unit_id), (n.unit_id)) AS x(unit_id)
+    WHERE d.calendar_date IS NOT NULL
+  ) s;
+  IF v_weeks IS NOT NULL THEN
+    PERFORM fn_refresh_expiry_calendar(v_units, v_weeks);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Календар підрозділу з дочірніми (NULL — усі): прострочене за останні
+-- p_overdue_days днів одним блоком, далі p_weeks тижнів від поточного.
+-- Старіші прострочені терміни — на екранах перерв, комісій і перевірок.
+DROP FUNCTION IF EXISTS fn_expiry_calendar(uuid, integer);
+CREATE OR REPLACE FUNCTION fn_expiry_calendar(p_unit uuid DEFAULT NULL, p_weeks integer DEFAULT 12,
+                                              p_overdue_days integer DEFAULT 90)
+RETURNS jsonb AS $$
+  WITH RECURSIVE tree AS (
+    SELECT id FROM units WHERE id = p_unit
+    UNION ALL
+    SELECT u.id FROM units u JOIN tree t ON u.parent_id = t.id
+  ), rows AS (
+    SELECT c.*
+    FROM expiry_calendar c
+    WHERE (p_unit IS NULL OR c.unit_id IN (SELECT id FROM tree))
+      AND c.week_start >= date_trunc('week', current_date - p_overdue_days)::date
+      AND c.week_start < date_trunc('week', current_date)::date + 7 * p_weeks
+  ), items AS (
+    SELECT r.week_start, i.item
+    FROM rows r, jsonb_array_elements(r.items) AS i(item)
+    WHERE (i.item->>4)::date >= current_date - p_overdue_days
+  ), current_items AS (
+    -- Поточний тиждень: лише терміни від сьогодні, минулі дні — у простроченому
+    SELECT CASE WHEN (item->>4)::date < current_date THEN NULL ELSE week_start END AS week_start, item
+    FROM items
+  ), weeks AS (
+    SELECT week_start,
+           jsonb_build_object(
+             'week', week_start,
+             'mu', count(*) FILTER (WHERE item->>1 = 'mu'),
+             'lp', count(*) FILTER (WHERE item->>1 = 'lp'),
+             'commission', count(*) FILTER (WHERE item->>1 = 'commission'),
+             'check', count(*) FILTER (WHERE item->>1 = 'check'),
+             'items', jsonb_agg(item ORDER BY item->>4, item->>0)) AS bucket
+    FROM current_items
+    GROUP BY week_start
+  )
+  SELECT jsonb_build_object(
+    'today', current_date,
+    'overdue_since', current_date - p_overdue_days,
+    'overdue', COALESCE((SELECT bucket FROM weeks WHERE week_start IS NULL), '{}'::jsonb),
+    'weeks', COALESCE((SELECT jsonb_agg(bucket ORDER BY week_start) FROM weeks WHERE week_start IS NOT NULL),
+                      '[]'::jsonb),
+    'users', COALESCE((SELECT jsonb_object_agg(u.id, u.name) FROM users u
+                       WHERE u.id IN (SELECT (item->>0)::uuid FROM items)), '{}'::jsonb)
+  );
+$$ LANGUAGE sql STABLE;
+
+-- Заповнення calendar_date і перебудова календаря за новими датами
+SELECT fn_refresh_deadlines(NULL, s) FROM unnest(ARRAY['mu', 'lp', 'commission', 'check']) AS s;
+DELETE FROM expiry_calendar;
+SELECT fn_refresh_expiry_calendar(array_agg(s.unit_id), array_agg(s.week_start))
+FROM (
+  SELECT DISTINCT u.unit_id, date_trunc('week', d.calendar_date)::date AS week_start
+  FROM deadline_index d JOIN users u ON u.id = d.user_id
+  WHERE d.calendar_date IS NOT NULL
+) s;
@@ -0,0 +1,41 @@
+-- Ручні зміни дат перерв (2026101906): записом синхронізації вважається
+-- лише запис із встановленим app.break_sync (fn_apply_flight_breaks) або з
+-- тригерів flights (pg_trigger_depth() > 1). Раніше дата, яку "пояснював"
+-- політ цього пілота на цьому типі ПС у той самий день, ручною не
+-- вважалась — і виправлення командира на дату польоту потім перезаписувалось
+-- синхронізацією. Тепер кожен інший запис — ручний внесок без польоту.
+-- Дати, які клієнт дублює після збереження польоту (upsert_lp_break /
+-- upsert_mu_break), теж стають ручними: після видалення такого польоту дата
+-- лишається, доки її не виправлять на екрані перерв.
+CREATE OR REPLACE FUNCTION trg_break_dates_manual()
+RETURNS trigger AS $$
+DECLARE
+  v_condition text;
+  v_ext record;
+BEGIN
+  IF pg_trigger_depth() > 1 OR current_setting('app.break_sync', true) = 'on' THEN
+    RETURN NULL;
+  END IF;
+  v_condition := CASE WHEN TG_ARGV[0] = 'mu' THEN to_jsonb(NEW)->>'mu_condition' ELSE to_jsonb(NEW)->>'lp_type' END;
+  IF NEW.user_id IS NULL OR v_condition IS NULL THEN
+    RETURN NULL;
+  END IF;
+  FOR v_ext IN
+    SELECT * FROM (VALUES
+      ('full', NEW.last_date, CASE WHEN TG_OP = 'UPDATE' THEN OLD.last_date END),
+      ('control', NEW.last_control_date, CASE WHEN TG_OP = 'UPDATE' THEN OLD.last_control_date END)
+    ) AS v(extension, new_date, old_date)
+  LOOP
+    CONTINUE WHEN TG_OP = 'UPDATE' AND v_ext.new_date IS NOT DISTINCT FROM v_ext.old_date;
+    DELETE FROM flight_break_contributions c
+    WHERE c.flight_id IS NULL AND c.user_id = NEW.user_id AND c.kind = TG_ARGV[0]
+      AND c.condition = v_condition AND c.aircraft_type_id IS NOT DISTINCT FROM NEW.aircraft_type_id
+      AND c.extension = v_ext.extension;
+    IF v_ext.new_date IS NOT NULL THEN
+      INSERT INTO flight_break_contributions (flight_id, user_id, kind, condition, aircraft_type_id, extension, flight_date)
+      VALUES (NULL, NEW.user_id, TG_ARGV[0], v_condition, NEW.aircraft_type_id, v_ext.extension, v_ext.new_date);
+    END IF;
+  END LOOP;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -1,4 +1,5 @@
 import { supabase } from './supabase';
+import { fetchExpiryCalendar } from './web/src/lib/expiryCalendar';
 
 const MU_TYPES = ['ДПМУ', 'ДСМУ', 'ДВМП', 'НПМУ', 'НСМУ', 'НВМП'];
 
@@ -866,3 +867,8 @@ export async function updateCommissionDateInSupabase(pib, category, dateStr) {
     return { ok: false, error: String(error.message || error) };
   }
 }
+
+// Календар закінчення термінів підрозділу по тижнях (спільна реалізація — expiryCalendar.js)
+export function getExpiryCalendarFromSupabase(unitId = null, weeks = 12, overdueDays = 90) {
+  return fetchExpiryCalendar(supabase, { formatDate, colorFor: computeColorFromExpiry }, unitId, weeks, overdueDays);
+}
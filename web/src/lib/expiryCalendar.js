@@ -0,0 +1,43 @@
+// Календар закінчення термінів підрозділу (з дочірніми) по тижнях — один запит
+// fn_expiry_calendar (міграції 2026101905, 2026101909). Спільний для
+// застосунку (supabaseData.js у корені) і веб-версії (web/src/lib/supabaseData.js):
+// кожен передає свій клієнт supabase та форматування дат і кольорів.
+// Пункти: [user_id, джерело (mu/lp/commission/check), назва, тип ПС, дата];
+// дати МУ/ЛП — за правилами екранів перерв. Прострочене — лише за останні
+// overdueDays днів (overdueSince).
+export async function fetchExpiryCalendar(supabase, { formatDate, colorFor }, unitId = null, weeks = 12,
+                                          overdueDays = 90) {
+  try {
+    const { data, error } = await supabase.rpc('fn_expiry_calendar', {
+      p_unit: unitId,
+      p_weeks: weeks,
+      p_overdue_days: overdueDays,
+    });
+    if (error) throw error;
+
+    const users = data?.users || {};
+    const toEntries = (items) => (items || []).map(([userId, source, name, aircraft, date]) => ({
+      pilot: users[userId] || '',
+      user_id: userId,
+      source,
+      name,
+      aircraft,
+      date: formatDate(date),
+      color: colorFor(date),
+    }));
+
+    return {
+      ok: true,
+      overdueSince: formatDate(data?.overdue_since),
+      overdue: toEntries(data?.overdue?.items),
+      weeks: (data?.weeks || []).map(w => ({
+        week: formatDate(w.week),
+        counts: { mu: w.mu, lp: w.lp, commission: w.commission, check: w.check },
+        entries: toEntries(w.items),
+      })),
+    };
+  } catch (error) {
+    console.error('getExpiryCalendarFromSupabase error:', error);
+    return { ok: false, error: String(error.message || error) };
+  }
+}
@@ -1,4 +1,5 @@
 import { supabase } from './supabase';
+import { fetchExpiryCalendar } from './expiryCalendar';
 
 const MU_TYPES = ['ДПМУ', 'ДСМУ', 'ДВМП', 'НПМУ', 'НСМУ', 'НВМП'];
 
@@ -1383,3 +1384,8 @@ export async function deleteCommissionDateById(userId, categoryName, aircraftTyp
     return { ok: false, error: String(error.message || error) };
   }
 }
+
+// Календар закінчення термінів підрозділу по тижнях (спільна реалізація — expiryCalendar.js)
+export function getExpiryCalendarFromSupabase(unitId = null, weeks = 12, overdueDays = 90) {
+  return fetchExpiryCalendar(supabase, { formatDate, colorFor: computeColorFromExpiry }, unitId, weeks, overdueDays);
+}